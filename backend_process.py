@@ -8,9 +8,11 @@ import win32com.client as win32
 # 導入必要的模組
 from db_access import get_customer_bank_and_email, get_clearing_detail, get_today_trade_detail, check_each01, read_today_bargain_and_execute, get_400_conn
 from file_reader import load_quote
-from file_generator import generate_trade_notice_template
+from file_generator import mask_customer_name
+from trade_notice_batch import build_notice_jobs, render_trade_notices
 from format_utils import cusid_to_padded, strip_whitespace
-from envs import trade_notice_dir, bargain_upload_file_path
+from envs import bargain_upload_file_path
+from task_runner import TaskCancelled, get_task_runner
 import numpy as np
 import os
 
@@ -70,6 +72,7 @@ def send_today_trade_email(output_text_edit, parent):
         df_sell_prdids = df_today_trade[(df_today_trade['解約契約編號'].notna()) & (df_today_trade['履約方式'] == '現金結算')]['原單契約編號'].unique()
         conn = get_400_conn()
         exp_qty = len(pd.read_sql(f"""SELECT SEQNO FROM FSPFLIB.ASSURR WHERE DUEDATE = '{tday_str}' AND CANTYPE = '0'""", conn)) # 提解契約
+        conn.close()
 
         print(df_today_bargain)
         # 查詢 ASPROD 表，找出這些 PRDID 且 TXTYPE == 'ASO' 的記錄
@@ -219,8 +222,30 @@ def send_bargain_trade_email(output_text_edit, parent):
         output_text_edit.append(f"✗ 執行寄信程式時發生錯誤：{e}\n")
         QMessageBox.critical(parent, "錯誤", f"執行寄信程式時發生錯誤：{e}")
 
-def generate_today_detail(output_text_edit, parent):
-    """產檔: 產今日成交明細（依客戶ID分檔）"""
+def generate_today_detail(output_text_edit, parent, button=None):
+    """產檔: 產今日成交明細（依客戶ID分檔）
+
+    查詢、產檔與寄信在背景執行，進度訊息逐筆寫回 output_text_edit；執行期間停用 button。
+    """
+    def _on_progress(percent, message):
+        output_text_edit.append(message)
+
+    def _on_error(message):
+        output_text_edit.append(f"✗ 產檔過程發生錯誤：{message}\n")
+        QMessageBox.critical(parent, "錯誤", f"產檔過程發生錯誤：{message}")
+
+    get_task_runner().submit(
+        run_today_detail, name="今日交易明細", pass_task=True,
+        on_progress=_on_progress, on_error=_on_error, disable=[button],
+        on_result=lambda _: QMessageBox.information(parent, "提示", "今日成交明細產檔及寄信完成！"),
+    )
+
+
+def run_today_detail(task):
+    """（背景執行）產今日成交明細並寄信；進度以 task.report 回報，可由 task.cancel() 在客戶之間中止"""
+    # Excel/Outlook 的 COM 物件需在使用的執行緒內初始化
+    import pythoncom
+    pythoncom.CoInitialize()
     try:
         # 由表格取出 DataFrame
         tday = datetime.today()
@@ -241,62 +266,46 @@ def generate_today_detail(output_text_edit, parent):
         df_today_bargain = df_today_bargain.merge(df_quote[['CB代號', 'CB名稱']], left_on='CB代號', right_on='CB代號', how='left')
         df_each01 = check_each01()
         
-        # 用於累積所有客戶的交割資訊
-        all_clearing_info_list = []
-        
-        for who in cusid_list:
-            df_today_trade_person = df_today_trade[df_today_trade['客戶ID'] == who]
-            df_today_bargain_person = df_today_bargain[df_today_bargain['客戶ID'] == who]
-            df_today_clearing_money_person = df_today_clearing_money[df_today_clearing_money['CUSID'] == who]
-            cus_info_person = cus_info_all[cus_info_all['CUSID'] == who]
-            
-            # 檢查 df_each01 中是否有該客戶的資料
-            df_each01_filtered = df_each01[df_each01['CUSID'] == who]
-            if len(df_each01_filtered) > 0:
-                ifbankok_person = df_each01_filtered['IFBANKOK'].values[0]
+        # 依客戶分組後以行程池平行產生交易通知（Excel + PDF）
+        jobs = build_notice_jobs(cusid_list, df_today_trade, df_today_bargain, df_today_clearing_money,
+                                 cus_info_all, df_each01, tday_str, tday_plus_1, tday_plus_2)
+
+        def _notice_done(done, total, result):
+            if result['PDF']:
+                task.report(done * 100 // total, f"✓ PDF檔產出完成：{result['PDF']}\n")
             else:
-                # 如果找不到該客戶，使用預設值 'N'
-                ifbankok_person = 'N'
-            
-            excel_path, pdf_path, df_clearing_info = generate_trade_notice_template(
-                cus_id=who,
-                cus_info=cus_info_person,
-                df_today_trade=df_today_trade_person,
-                df_today_clearing_money=df_today_clearing_money_person,
-                tday_str=tday_str,
-                df_today_bargain=df_today_bargain_person,
-                tday_plus_1=tday_plus_1,
-                tday_plus_2=tday_plus_2,
-                ifbankok=ifbankok_person,
-            )
-            
-            # 累積交割資訊
-            if not df_clearing_info.empty:
-                all_clearing_info_list.append(df_clearing_info)
-        
-        #if excel_path:
-        #    output_text_edit.append(f"✓ Excel檔產出完成：{excel_path}\n")
-            if pdf_path:
-                output_text_edit.append(f"✓ PDF檔產出完成：{pdf_path}\n")
+                task.report(done * 100 // total, f"✗ {result['客戶ID']} 交易通知產生失敗：{result['錯誤']}\n")
+
+        df_summary, df_all_clearing_info = render_trade_notices(jobs, progress=_notice_done, is_cancelled=lambda: task.is_cancelled)
+        task.check_cancelled()
+        failed = df_summary[df_summary['狀態'] != '成功']
+        task.report(100, f"交易通知產生完成：成功 {len(df_summary) - len(failed)} 筆，失敗 {len(failed)} 筆\n")
+        for _, row in failed.iterrows():
+            task.report(-1, f"  ✗ {row['客戶ID']}：{row['錯誤']}\n")
 
         # 所有客戶處理完後，統一保存交割資訊
-        if all_clearing_info_list:
-            df_all_clearing_info = pd.concat(all_clearing_info_list, ignore_index=True)
+        if not df_all_clearing_info.empty:
             clearing_info_path = r'\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\交割資訊.xlsx'
             df_all_clearing_info.to_excel(clearing_info_path, index=False)
-            output_text_edit.append(f"✓ 交割資訊已統一保存：{clearing_info_path}\n")
+            task.report(-1, f"✓ 交割資訊已統一保存：{clearing_info_path}\n")
         
-        QMessageBox.information(parent, "提示", "今日成交明細產檔完成！開始寄信")
+        task.report(-1, "今日成交明細產檔完成！開始寄信\n")
         
         df_customer_money = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\交割資訊.xlsx')
         df_customer_money = df_customer_money[['客戶ID', '交割日期', '交割總額', '收付', '交割方式']]
 
         #尚未完工，要將寄出的人避開不要再寄一次
         df_have_been_send_emails = pd.DataFrame(columns=['CUSID', 'EMAIL'])
+        money_parts = {k: g for k, g in df_customer_money.groupby('客戶ID', sort=False)}
+        info_parts = {k: g for k, g in cus_info_all.groupby('CUSID', sort=False)}
+        notices = {r['客戶ID']: r for r in df_summary.to_dict('records') if r['狀態'] == '成功'}
         for who in cusid_list:
-            df_customer_money_person = df_customer_money[df_customer_money['客戶ID'] == who]
-            df_customer_money_person.drop(columns=['客戶ID'], inplace=True)
-            cus_info_person = cus_info_all[cus_info_all['CUSID'] == who]
+            task.check_cancelled()
+            if who not in notices:
+                # 交易通知沒有產生成功就沒有附件可寄，列在上方失敗清單中
+                continue
+            df_customer_money_person = money_parts.get(who, df_customer_money.iloc[0:0]).drop(columns=['客戶ID'])
+            cus_info_person = info_parts.get(who, cus_info_all.iloc[0:0])
             to = cus_info_person['EMAIL'].values[0]
             subject = f"統一證券CBAS_當日成交明細_{tday_str}"
             
@@ -376,26 +385,29 @@ def generate_today_detail(output_text_edit, parent):
             </body>
             </html>
             """
-            cusname_full = cus_info_person['CUSNAME'].values[0][0] + 'Ｏ' + cus_info_person['CUSNAME'].values[0][-1]
+            cusname_full = mask_customer_name(cus_info_person['CUSNAME'].values[0])
             cusEmail = cus_info_person['EMAIL'].values[0][:4]
+            # 附件直接用產檔回傳的路徑
+            notice = notices[who]
             if cusname_full in ['劉Ｏ漢', '劉Ｏ餘', '陳Ｏ美']:
-                attpath = rf'{trade_notice_dir}\{tday_str}\EXCEL\{tday_str}_統一證券CBAS成交明細_{cusname_full}_{cusEmail}.xlsx'
+                attpath = notice['Excel']
             else:
-                attpath = rf'{trade_notice_dir}\{tday_str}\PDF\{tday_str}_統一證券CBAS成交明細_{cusname_full}_{cusEmail}.pdf'
+                attpath = notice['PDF']
             print("寄出信件: ", cusname_full, cusEmail, subject, to, attpath)
             send_email(body=None, subject=subject, to=to, attpath=attpath, html_body=html_body)
             
 
         
+    except TaskCancelled:
+        raise
     except Exception as e:
         exc_type, exc_value, exc_tb = sys.exc_info()
         tb = traceback.extract_tb(exc_tb)
         if tb:
-            lineno = tb[-1].lineno
-            output_text_edit.append(f"✗ 產檔過程發生錯誤：{e}（第 {lineno} 行）\n")
-        else:
-            output_text_edit.append(f"✗ 產檔過程發生錯誤：{e}\n")
-        QMessageBox.critical(parent, "錯誤", f"產檔過程發生錯誤：{e}")
+            raise RuntimeError(f"{e}（第 {tb[-1].lineno} 行）") from e
+        raise
+    finally:
+        pythoncom.CoUninitialize()
 
 def generate_trade_confirmation(output_text_edit, parent):
     """產檔: 產交易確認書"""
@@ -0,0 +1,253 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+import pandas as pd
+from openpyxl import load_workbook
+from format_utils import format_date, convert_to_chinese_amount
+from envs import bargain_pdf_path, remote_files
+from pdf_renderer import convert_to_pdf, excel_batch
+
+SETTLEMENT_TEMPLATE_PATH = remote_files['settlement_template']
+TRADING_TEMPLATE_PATH = remote_files['trading_template']
+
+# 同時產生議價單據的執行緒數（主要在等網路磁碟寫檔與 Excel 轉檔）
+BARGAIN_DOC_MAX_WORKERS = 4
+
+MANIFEST_COLUMNS = ['單據編號', '客戶ID', '客戶名稱', '文件', 'Excel', 'PDF', '狀態', '錯誤']
+
+
+def trading_slip_symbols(buy_or_sell) -> dict:
+    """成交單左上角的勾選框（買進/賣出/營業處所議價）"""
+    if buy_or_sell == '買':
+        return {'A4': '☑ 自營買進', 'A5': '☐ 自營賣出', 'G4': '☑ 營業處所議價'}
+    if buy_or_sell == '賣':
+        return {'A4': '☐ 自營買進', 'A5': '☑ 自營賣出', 'G4': '☑ 營業處所議價'}
+    return {}
+
+
+def settlement_voucher_cells(row: dict) -> dict:
+    """給付結算憑單要填入的儲存格 {位址: 值}"""
+    cells = {
+        'B4': row.get('客戶名稱', ''),
+        'B5': row.get('集保帳號', ''),
+        'I4': format_date(row.get('成交日期', '')),
+        'I5': format_date(row.get('交割日期', '')),
+        'A7': row.get('單據編號', ''),
+        'C7': f"{row.get('CB代號', '')}{row.get('CB名稱', '')}",
+        'E7': row.get('議價張數', ''),
+        'I7': row.get('議價金額', ''),
+    }
+    if row.get('買/賣', '') == '買':
+        cells.update({
+            'B7': '買斷', 'G7': '收',
+            'F15': f"{row.get('銀行', '')}{row.get('分行', '')}", 'F17': row.get('銀行帳號', ''),
+            'B15': '', 'B17': '',
+            'I15': row.get('議價金額', ''), 'I18': row.get('議價金額', ''), 'I19': row.get('議價金額', ''),
+        })
+    elif row.get('買/賣', '') == '賣':
+        cells.update({
+            'B7': '賣斷', 'G7': '付',
+            'F15': '', 'F17': '',
+            'B15': f"{row.get('銀行', '')}{row.get('分行', '')}", 'B17': row.get('銀行帳號', ''),
+            'D15': row.get('議價金額', ''), 'D18': row.get('議價金額', ''), 'D19': row.get('議價金額', ''),
+        })
+    try:
+        cells['D7'] = int(float(row.get('議價張數', 0))) * 100000
+    except Exception:
+        cells['D7'] = 0
+    return cells
+
+
+def trading_slip_cells(row: dict) -> dict:
+    """可轉債買賣成交單要填入的儲存格 {位址: 值}"""
+    cells = trading_slip_symbols(row.get('買/賣', ''))
+    amount = str(row.get('議價金額', '')).replace(',', '').replace(' ', '')
+    cells.update({
+        'A7': f"交易對手：{row.get('客戶名稱', '')}",
+        'D7': f"集保帳號：{row.get('集保帳號', '')}",
+        'I4': row.get('單據編號', ''),
+        'I6': format_date(row.get('成交日期', '')),
+        'I7': format_date(row.get('交割日期', '')),
+        'B8': row.get('通訊地址', ''),
+        'I8': row.get('客戶ID', ''),
+        'A12': f"{row.get('CB代號', '')}{row.get('CB名稱', '')}",
+        'B12': row.get('議價張數', ''),
+        'C12': row.get('議價價格', ''),
+        'E12': row.get('議價金額', ''),
+        'I12': row.get('議價金額', ''),
+        'I17': row.get('議價金額', ''),
+        'B18': convert_to_chinese_amount(amount),
+    })
+    return cells
+
+
+class DocumentTemplate:
+    """單據範本：只讀一次範本檔，每個執行緒保留一份載入好的活頁簿重複套用
+
+    addresses 為任何一種單據可能寫入的儲存格；每次套用時沒給值的位址還原成範本原值，
+    因此同一份活頁簿連續產生多張單據也不會殘留上一張的內容。
+    """
+
+    def __init__(self, kind: str, template_path: str, sheet_name: str, addresses, build_cells):
+        self.kind = kind
+        self.template_path = template_path
+        self.sheet_name = sheet_name
+        self.addresses = tuple(addresses)
+        self.build_cells = build_cells
+        self._lock = threading.Lock()
+        self._content = None
+        self._mtime = None
+        self._local = threading.local()
+
+    def _template_bytes(self):
+        """回傳 (版本, 範本內容)；範本檔更新（mtime 變動）時重新讀取"""
+        try:
+            mtime = os.path.getmtime(self.template_path)
+        except OSError:
+            mtime = self._mtime
+        with self._lock:
+            if self._content is None or mtime != self._mtime:
+                with open(self.template_path, 'rb') as f:
+                    self._content = f.read()
+                self._mtime = mtime
+            return self._mtime, self._content
+
+    def _workbook(self):
+        version, content = self._template_bytes()
+        cached = getattr(self._local, 'cached', None)
+        if cached is None or cached[0] != version:
+            wb = load_workbook(BytesIO(content))
+            ws = wb[self.sheet_name]
+            defaults = {addr: ws[addr].value for addr in self.addresses}
+            cached = (version, wb, defaults)
+            self._local.cached = cached
+        return cached[1], cached[2]
+
+    def render(self, row: dict):
+        """把一筆議價資料套進範本，回傳填好的活頁簿（同一執行緒下一次 render 會覆寫它）"""
+        wb, defaults = self._workbook()
+        ws = wb[self.sheet_name]
+        cells = self.build_cells(row)
+        for addr in self.addresses:
+            ws[addr] = cells.get(addr, defaults[addr])
+        return wb
+
+
+SETTLEMENT_VOUCHER = DocumentTemplate(
+    '給付憑證', SETTLEMENT_TEMPLATE_PATH, '給付',
+    ('B4', 'B5', 'I4', 'I5', 'A7', 'B7', 'C7', 'D7', 'E7', 'G7', 'I7',
+     'B15', 'D15', 'F15', 'I15', 'B17', 'F17', 'D18', 'I18', 'D19', 'I19'),
+    settlement_voucher_cells)
+
+TRADING_SLIP = DocumentTemplate(
+    '成交單', TRADING_TEMPLATE_PATH, '買賣',
+    ('A4', 'A5', 'G4', 'I4', 'I6', 'A7', 'D7', 'I7', 'B8', 'I8',
+     'A12', 'B12', 'C12', 'E12', 'I12', 'I17', 'B18'),
+    trading_slip_cells)
+
+
+def _is_blank(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+class BargainDocumentFactory:
+    """議價單據產生器：給付結算憑單與買賣成交單（Excel + PDF）"""
+
+    def __init__(self, output_root: str = bargain_pdf_path, max_workers: int = BARGAIN_DOC_MAX_WORKERS):
+        self.output_root = output_root
+        self.max_workers = max_workers
+
+    def output_dir(self) -> str:
+        output_dir = os.path.join(self.output_root, datetime.now().strftime('%Y%m%d'))
+        os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    def render_document(self, template: DocumentTemplate, row: dict, output_dir: str = None) -> dict:
+        """產生單一份單據，回傳 manifest 的一列"""
+        entry = {'單據編號': row.get('單據編號', ''), '客戶ID': row.get('客戶ID', ''),
+                 '客戶名稱': row.get('客戶名稱', ''), '文件': template.kind,
+                 'Excel': None, 'PDF': None, '狀態': '失敗', '錯誤': ''}
+        try:
+            output_dir = output_dir or self.output_dir()
+            filename = f"{template.kind}_{row.get('客戶名稱', 'Unknown')}_{row.get('單據編號', '')}.xlsx"
+            filepath = os.path.join(output_dir, filename)
+            wb = template.render(row)
+            wb.save(filepath)
+            entry['Excel'] = filepath
+            entry['PDF'] = convert_to_pdf(filepath, filepath.replace('.xlsx', '.pdf'), workbook=wb)
+            if entry['PDF'] is None:
+                entry['錯誤'] = 'PDF 轉檔失敗'
+            else:
+                entry['狀態'] = '成功'
+        except Exception as e:
+            print(f"產生{template.kind}時發生錯誤: {e}")
+            entry['錯誤'] = str(e)
+        return entry
+
+    def _render_rows(self, rows, output_dir) -> list:
+        """在同一個執行緒依序產生多筆議價的兩份單據（需要 Excel 轉檔時共用一個 Excel）"""
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pythoncom = None
+        try:
+            entries = []
+            with excel_batch():
+                for row in rows:
+                    entries.append(self.render_document(SETTLEMENT_VOUCHER, row, output_dir))
+                    entries.append(self.render_document(TRADING_SLIP, row, output_dir))
+            return entries
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def render_all(self, df_bargain: pd.DataFrame) -> pd.DataFrame:
+        """依 process_bargain_records 的輸出（或議價表格資料）產生所有單據
+
+        整列空白的資料略過；回傳 manifest（每筆議價兩列：給付憑證、成交單，依輸入順序）。
+        """
+        if df_bargain is None or df_bargain.empty:
+            return pd.DataFrame(columns=MANIFEST_COLUMNS)
+        rows = [row for row in df_bargain.to_dict('records')
+                if not all(_is_blank(value) for value in row.values())]
+        if not rows:
+            return pd.DataFrame(columns=MANIFEST_COLUMNS)
+
+        output_dir = self.output_dir()
+        workers = max(1, min(self.max_workers, len(rows)))
+        if workers == 1:
+            entries = self._render_rows(rows, output_dir)
+        else:
+            # 依序切成 workers 段，各段在自己的執行緒與活頁簿上產生，最後照原順序合併
+            size = -(-len(rows) // workers)
+            chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                results = list(executor.map(lambda chunk: self._render_rows(chunk, output_dir), chunks))
+            entries = [entry for chunk_entries in results for entry in chunk_entries]
+        return pd.DataFrame(entries, columns=MANIFEST_COLUMNS)
+
+
+_bargain_document_factory = None
+
+
+def get_bargain_document_factory() -> BargainDocumentFactory:
+    """取得共用的 BargainDocumentFactory（範本快取跟著行程保留）"""
+    global _bargain_document_factory
+    if _bargain_document_factory is None:
+        _bargain_document_factory = BargainDocumentFactory()
+    return _bargain_document_factory
+
+
+def generate_bargain_documents(df_bargain: pd.DataFrame) -> pd.DataFrame:
+    """一次產生整批議價交易的給付結算憑單與買賣成交單，回傳產出檔案清單"""
+    return get_bargain_document_factory().render_all(df_bargain)
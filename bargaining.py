@@ -1,14 +1,15 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 import os
-from openpyxl import load_workbook
-from db_access import get_customer_info, get_customer_inventory
-from format_utils import format_date, convert_to_chinese_amount, strip_trailing_zeros, next_business_day, strip_whitespace
+from db_access import get_customer_info, get_customer_inventory, get_400_conn
+from format_utils import strip_trailing_zeros_column, strip_whitespace, get_business_calendar
 from file_reader import read_quote_excel, read_vip_list, read_vip_quote
-import pyodbc
-from decimal import Decimal, ROUND_HALF_UP
-from envs import bargain_pdf_path, bargain_upload_file_path
+from pricing import premium_per_hundred
+from envs import bargain_upload_file_path
+from remote_cache import cached_path, remote_path
+from exercise_allocator import create_exercise_allocation, sort_exercise_contracts
+from pdf_renderer import convert_to_pdf
+from bargain_documents import SETTLEMENT_VOUCHER, TRADING_SLIP, get_bargain_document_factory, trading_slip_symbols
 
 
 
@@ -44,13 +45,9 @@ def process_bargain_records(bargain_df: pd.DataFrame, df_quote: pd.DataFrame) ->
         df_bargain_con.loc[:, '通訊地址'] = df_bargain_con.get('ADDRESS2')
         #向量化操作（更高效）
         try:
-            df_bargain_con.loc[:, '交割日期'] = df_bargain_con.apply(
-                lambda row: next_business_day(
-                    pd.to_datetime(row['成交日期'], format='%Y%m%d'), 
-                    int(row['T+?交割'])
-                ).strftime('%Y%m%d'), 
-                axis=1
-            )
+            trade_dates = pd.to_datetime(df_bargain_con['成交日期'].astype(str), format='%Y%m%d')
+            t_plus = pd.to_numeric(df_bargain_con['T+?交割']).astype(int)
+            df_bargain_con.loc[:, '交割日期'] = get_business_calendar().next_business_days(trade_dates, t_plus).dt.strftime('%Y%m%d')
         except Exception as e:
             print(f"計算交割日期發生錯誤: {e}")
             df_bargain_con.loc[:, '交割日期'] = ''
@@ -90,126 +87,37 @@ def preserve_special_symbols(ws, buy_or_sell) -> None:
     #    cell = ws[cell_addr]
     #    if cell.value and isinstance(cell.value, str) and cell.value.startswith('R'):
     #        cell.value = cell.value.replace('R', '☑ ', 1)
-    if buy_or_sell == '買':
-        ws['A4'] = '☑ 自營買進'
-        ws['A5'] = '☐ 自營賣出'
-        ws['G4'] = '☑ 營業處所議價'
-    elif buy_or_sell == '賣':
-        ws['A4'] = '☐ 自營買進'
-        ws['A5'] = '☑ 自營賣出'
-        ws['G4'] = '☑ 營業處所議價'
-
-
-def save_as_pdf(excel_path, pdf_path=None):
-    """將議價交易 Excel 檔案轉換為 PDF"""
-    try:
-        import win32com.client
-        
-        excel = win32com.client.Dispatch("Excel.Application")
-        excel.Visible = False
-        excel.DisplayAlerts = False
-        
-        workbook = excel.Workbooks.Open(excel_path)
-        
-        if pdf_path is None:
-            pdf_path = excel_path.replace('.xlsx', '.pdf')
-        
-        workbook.ExportAsFixedFormat(0, pdf_path)
-        workbook.Close(False)
-        excel.Quit()
-        
-        print(f"✓ 議價交易 PDF 已產生：{pdf_path}")
-        return pdf_path
-        
-    except Exception as e:
-        print(f"❌ 轉換 PDF 失敗：{e}")
+    for cell_addr, value in trading_slip_symbols(buy_or_sell).items():
+        ws[cell_addr] = value
+
+
+def save_as_pdf(excel_path, pdf_path=None, workbook=None):
+    """將議價交易 Excel 檔案轉換為 PDF（轉檔方式見 envs.pdf_backend；workbook 為已填好的 openpyxl 活頁簿）"""
+    if pdf_path is None:
+        pdf_path = excel_path.replace('.xlsx', '.pdf')
+
+    result = convert_to_pdf(excel_path, pdf_path, workbook=workbook)
+    if result is None:
+        print(f"❌ 轉換 PDF 失敗：{excel_path}")
         return None
+    print(f"✓ 議價交易 PDF 已產生：{result}")
+    return result
 
 
 def generate_settlement_voucher(row: dict) -> str:
     """生成櫃檯買賣合併債券給付結算憑單暨交付清單，回傳輸出檔路徑。"""
-    template_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\議價模板_給付.xlsx"
-    wb = load_workbook(template_path)
-    ws = wb['給付']
-    ws['B4'] = row.get('客戶名稱', '')
-    ws['B5'] = row.get('集保帳號', '')
-    ws['I4'] = format_date(row.get('成交日期', ''))
-    ws['I5'] = format_date(row.get('交割日期', ''))
-    ws['A7'] = row.get('單據編號', '')
-    ws['C7'] = f"{row.get('CB代號', '')}{row.get('CB名稱', '')}"
-    ws['E7'] = row.get('議價張數', '')
-    ws['I7'] = row.get('議價金額', '')
-
-    if row.get('買/賣', '') == '買':
-        ws['B7'] = '買斷'
-        ws['G7'] = '收'
-        ws['F15'] = f"{row.get('銀行', '')}{row.get('分行', '')}"
-        ws['F17'] = row.get('銀行帳號', '')
-        ws['B15'] = ''
-        ws['B17'] = ''
-        ws['I15'] = row.get('議價金額', '')
-        ws['I18'] = row.get('議價金額', '')
-        ws['I19'] = row.get('議價金額', '')
-    elif row.get('買/賣', '') == '賣':
-        ws['B7'] = '賣斷'
-        ws['G7'] = '付'
-        ws['F15'] = ''
-        ws['F17'] = ''
-        ws['B15'] = f"{row.get('銀行', '')}{row.get('分行', '')}"
-        ws['B17'] = row.get('銀行帳號', '')
-        ws['D15'] = row.get('議價金額', '')
-        ws['D18'] = row.get('議價金額', '')
-        ws['D19'] = row.get('議價金額', '')
-    
-    try:
-        ws['D7'] = int(float(row.get('議價張數', 0))) * 100000
-    except Exception:
-        ws['D7'] = 0
-    
-    tday = datetime.now().strftime('%Y%m%d')
-    output_dir = os.path.join(bargain_pdf_path, tday)
-    os.makedirs(output_dir, exist_ok=True)
-    filename = f"給付憑證_{row.get('客戶名稱', 'Unknown')}_{row.get('單據編號', '')}.xlsx"
-    filepath = os.path.join(output_dir, filename)
-    wb.save(filepath)
-    save_as_pdf(filepath)
-    return filepath
+    factory = get_bargain_document_factory()
+    return factory.render_document(SETTLEMENT_VOUCHER, row)['Excel']
 
 
 def generate_trading_slip(row: dict) -> str:
     """生成櫃台買賣可轉債買賣成交單，回傳輸出檔路徑。"""
-    template_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\議價模板_買賣.xlsx"
-    wb = load_workbook(template_path)
-    ws = wb['買賣']
-    buy_or_sell = row.get('買/賣', '')
-    preserve_special_symbols(ws, buy_or_sell)
-    ws['A7'] = f"交易對手：{row.get('客戶名稱', '')}"
-    ws['D7'] = f"集保帳號：{row.get('集保帳號', '')}"
-    ws['I4'] = row.get('單據編號', '')
-    ws['I6'] = format_date(row.get('成交日期', ''))
-    ws['I7'] = format_date(row.get('交割日期', ''))
-    ws['B8'] = row.get('通訊地址', '')
-    ws['I8'] = row.get('客戶ID', '')
-    ws['A12'] = f"{row.get('CB代號', '')}{row.get('CB名稱', '')}"
-    ws['B12'] = row.get('議價張數', '')
-    ws['C12'] = row.get('議價價格', '')
-    ws['E12'] = row.get('議價金額', '')
-    ws['I12'] = row.get('議價金額', '')
-    ws['I17'] = row.get('議價金額', '')
-    amount = str(row.get('議價金額', '')).replace(',', '').replace(' ', '')
-    ws['B18'] = convert_to_chinese_amount(amount)
-    tday = datetime.now().strftime('%Y%m%d')
-    output_dir = os.path.join(bargain_pdf_path, tday)
-    os.makedirs(output_dir, exist_ok=True)
-    filename = f"成交單_{row.get('客戶名稱', 'Unknown')}_{row.get('單據編號', '')}.xlsx"
-    filepath = os.path.join(output_dir, filename)
-    wb.save(filepath)
-    save_as_pdf(filepath)
-    return filepath
+    factory = get_bargain_document_factory()
+    return factory.render_document(TRADING_SLIP, row)['Excel']
 
 def generate_bargain_upload_file(df_bargain):
     """產生議價交易上傳檔"""
-    df_template = pd.read_excel(r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\議價檔ASBARG上傳檔.xlsx")
+    df_template = pd.read_excel(cached_path(remote_path('asbarg_template')))
     df_fill = df_template.iloc[0:0]
     df_fill['TXDATE'] = df_bargain['成交日期']
     df_fill['SETDAT'] = df_bargain['交割日期']
@@ -230,6 +138,167 @@ def generate_bargain_upload_file(df_bargain):
     df_fill.to_excel(filepath, index=False)
     return df_fill
     
+VIP_ALLOCATION_DTYPE = np.dtype([('trade_row', np.int64), ('quote_row', np.int64), ('qty', np.int64)])
+
+
+def _parse_vip_qty_limit(qty_raw):
+    """VIP_Quote 張數：空白 = 無上限（回傳 inf），無法解析也視為無上限"""
+    try:
+        if qty_raw is None or str(qty_raw).strip() == '' or (isinstance(qty_raw, float) and pd.isna(qty_raw)):
+            return np.inf
+        return float(int(float(qty_raw)))
+    except (ValueError, TypeError):
+        return np.inf
+
+
+def allocate_vip_quote(trade_keys: pd.Series, trade_qty: np.ndarray, df_vip_quote_all: pd.DataFrame) -> np.ndarray:
+    """把每筆成交張數依序分配到同 (客戶ID, CB代號) 的特殊報價額度（短約=Y 優先，其餘依檔案順序）
+
+    每筆成交各自從額度開頭分配（額度不在成交之間累計扣除）。以累積額度 cumsum 後 clip 計算每段可吸收張數，
+    回傳 VIP_ALLOCATION_DTYPE 陣列：trade_row 為成交列位置、quote_row 為 df_vip_quote_all 的列位置、qty 為分配張數，
+    依 (trade_row, 額度順序) 排序。
+    """
+    has_short_col = '短約' in df_vip_quote_all.columns
+    df_tr = pd.DataFrame({
+        'key': (df_vip_quote_all['客戶ID'].map(lambda v: str(v).strip()) + '\x00'
+                + df_vip_quote_all['CB代號'].map(lambda v: str(v).strip())).to_numpy(),
+        'valid': ((df_vip_quote_all['客戶ID'].map(lambda v: str(v).strip()) != '')
+                  & (df_vip_quote_all['CB代號'].map(lambda v: str(v).strip()) != '')).to_numpy(),
+        'limit': (df_vip_quote_all['張數'].map(_parse_vip_qty_limit).to_numpy(dtype=float)
+                  if '張數' in df_vip_quote_all.columns else np.full(len(df_vip_quote_all), np.inf)),
+        'short_rank': (df_vip_quote_all['短約'].map(lambda v: 0 if str(v).strip().upper() == 'Y' else 1).to_numpy()
+                       if has_short_col else np.ones(len(df_vip_quote_all), dtype=int)),
+        'quote_row': np.arange(len(df_vip_quote_all)),
+    })
+    df_tr = df_tr[df_tr['valid']].sort_values(['key', 'short_rank', 'quote_row'], kind='stable')
+    # 每段額度 [cap_start, cap_end)；張數 <= 0 的額度不吸收任何張數
+    df_tr['cap'] = df_tr['limit'].clip(lower=0)
+    df_tr['cap_end'] = df_tr.groupby('key')['cap'].cumsum()
+    df_tr['cap_start'] = df_tr.groupby('key')['cap_end'].shift(fill_value=0)
+
+    df_tq = pd.DataFrame({'key': trade_keys.to_numpy(), 'trade_row': np.arange(len(trade_keys)), 'trade_qty': trade_qty})
+    df_tq = df_tq[df_tq['trade_qty'] > 0]
+    pairs = df_tq.merge(df_tr[['key', 'quote_row', 'short_rank', 'cap_start', 'cap']], on='key', how='inner')
+    pairs['qty'] = np.minimum(np.maximum(pairs['trade_qty'] - pairs['cap_start'], 0), pairs['cap'])
+    pairs = pairs[pairs['qty'] > 0].sort_values(['trade_row', 'short_rank', 'quote_row'], kind='stable')
+
+    allocations = np.empty(len(pairs), dtype=VIP_ALLOCATION_DTYPE)
+    allocations['trade_row'] = pairs['trade_row'].to_numpy()
+    allocations['quote_row'] = pairs['quote_row'].to_numpy()
+    allocations['qty'] = pairs['qty'].to_numpy()
+    return allocations
+
+
+def split_vip_quote_quantities(df_trade: pd.DataFrame, df_vip_quote_all: pd.DataFrame) -> pd.DataFrame:
+    """依特殊報價 (VIP_Quote) 拆單：每段額度產生一列（帶入利率%/手續費），額度吸收不完的張數另成一列走一般規則。
+
+    被拆的成交列移到最後（依原順序，各自的 VIP 段在前、剩餘段在後）。
+    各列使用的額度張數記在 VIP報價張數 欄；產檔後扣減 VIP_Quote.csv 時以表格上（可能已被修改）的該欄為準。
+    """
+    if df_vip_quote_all.empty or not all(col in df_vip_quote_all.columns for col in ['客戶ID', '利率%', '手續費', 'CB代號']):
+        return df_trade
+
+    trade_keys = (df_trade['客戶ID'].map(lambda v: str(v).strip()) + '\x00'
+                  + df_trade['CB代號'].map(lambda v: str(v).strip()))
+    trade_qty_col = pd.to_numeric(df_trade['成交張數'], errors='coerce')
+    trade_qty = trade_qty_col.fillna(0).to_numpy(dtype=float).astype(np.int64)
+    allocations = allocate_vip_quote(trade_keys, trade_qty, df_vip_quote_all)
+    if len(allocations) == 0:
+        return df_trade
+
+    # 剩餘張數（特殊報價無法吸收完）→ 進入一般規則
+    split_rows = np.unique(allocations['trade_row'])
+    taken = np.bincount(allocations['trade_row'], weights=allocations['qty'], minlength=len(df_trade)).astype(np.int64)
+    remaining = trade_qty[split_rows] - taken[split_rows]
+    rest_rows = split_rows[remaining > 0]
+
+    # 一次展開：VIP 段 (order=0) 與剩餘段 (order=1)，依成交列位置排序
+    seg_rows = np.concatenate([allocations['trade_row'], rest_rows])
+    seg_qty = np.concatenate([allocations['qty'], remaining[remaining > 0]])
+    seg_quote = np.concatenate([allocations['quote_row'], np.full(len(rest_rows), -1)])
+    order = np.lexsort((np.concatenate([np.zeros(len(allocations)), np.ones(len(rest_rows))]), seg_rows))
+    seg_rows, seg_qty, seg_quote = seg_rows[order], seg_qty[order], seg_quote[order]
+    is_vip = seg_quote >= 0
+
+    df_seg = df_trade.iloc[seg_rows].copy()
+    df_seg['成交張數'] = seg_qty
+    avg_price = pd.to_numeric(df_seg['成交均價'], errors='coerce').to_numpy(dtype=float)
+    has_price = ~np.isnan(avg_price)
+    if has_price.any():
+        if '成交金額' not in df_seg.columns:
+            df_seg['成交金額'] = np.nan
+        df_seg['成交金額'] = np.where(has_price, np.round(seg_qty * avg_price * 1000, 0), df_seg['成交金額'].to_numpy())
+
+    quote_idx = np.where(is_vip, seg_quote, 0)
+    rate = pd.to_numeric(df_vip_quote_all['利率%'].iloc[quote_idx].map(lambda v: float(v) if pd.notna(v) else np.nan)).to_numpy(dtype=float)
+    fee = pd.to_numeric(df_vip_quote_all['手續費'].iloc[quote_idx].map(lambda v: float(v) if pd.notna(v) else np.nan)).to_numpy(dtype=float)
+    if '短約' in df_vip_quote_all.columns:
+        short = df_vip_quote_all['短約'].iloc[quote_idx].map(lambda v: 'Y' if str(v).strip().upper() == 'Y' else 'N').to_numpy()
+    else:
+        short = np.full(len(seg_rows), 'N', dtype=object)
+    df_seg['最終利率'] = np.where(is_vip, rate, np.nan)
+    df_seg['最終手續費'] = np.where(is_vip, fee, np.nan)
+    df_seg['VIP報價張數'] = np.where(is_vip, seg_qty, 0)
+    df_seg['_短約'] = np.where(is_vip, short, 'N')
+
+    keep = np.ones(len(df_trade), dtype=bool)
+    keep[split_rows] = False
+    return pd.concat([df_trade[keep], df_seg], ignore_index=True)
+
+
+SPECIAL_FEE_IDS = ['H122699830', 'H123326603', 'P220839691']
+
+# 最終利率 / 最終手續費 的優先順序規則表（特殊報價已在拆單時先填入）
+# 依序套用，每條規則只填入目標欄位仍為空值、且條件成立的列：(規則名稱, 目標欄位, 條件, 值)
+FEE_RATE_RULES = [
+    ('VIP不限張數低利率', '最終利率', lambda c: c['is_vip'] & c['vip_low_rate'], lambda c: c['低履約利率']),
+    ('VIP80元手續費', '最終手續費', lambda c: c['is_vip'] & c['vip_fee_80'], lambda c: 80),
+    ('VIP不限張數低手續費', '最終手續費', lambda c: c['is_vip'] & c['vip_low_fee'], lambda c: 100),
+    ('特殊ID利率', '最終利率', lambda c: c['is_special'], lambda c: c['低履約利率']),
+    ('特殊ID手續費', '最終手續費', lambda c: c['is_special'], lambda c: 60),
+    ('基礎利率', '最終利率', lambda c: c['all'],
+     lambda c: np.where(c['STORQTY'] >= 200, c['低履約利率'], c['履約利率'])),
+    ('基礎手續費', '最終手續費', lambda c: c['all'],
+     lambda c: np.select([(c['STORQTY'] >= 200) | (c['成交張數'] >= 10), c['SRC'] == 'E'], [100, 110], default=c['default_fee'])),
+]
+
+
+def _fee_rate_context(df_trade: pd.DataFrame, vip_list_dict: dict, default_fee) -> dict:
+    """整理規則表需要的整欄資料（numpy 陣列）"""
+    cus_ids = df_trade['客戶ID'].astype(str)
+
+    def vip_flag(col):
+        return cus_ids.map({k: v.get(col) for k, v in vip_list_dict.items()}).eq('Y').to_numpy()
+
+    return {
+        'all': np.ones(len(df_trade), dtype=bool),
+        'is_vip': cus_ids.isin(list(vip_list_dict.keys())).to_numpy(),
+        'vip_low_rate': vip_flag('不限張數低利率'),
+        'vip_fee_80': vip_flag('80元手續費'),
+        'vip_low_fee': vip_flag('不限張數低手續費'),
+        'is_special': cus_ids.isin(SPECIAL_FEE_IDS).to_numpy(),
+        'STORQTY': df_trade['STORQTY'].to_numpy(dtype=float),
+        '成交張數': pd.to_numeric(df_trade['成交張數'], errors='coerce').to_numpy(dtype=float),
+        '履約利率': df_trade['履約利率'].to_numpy(dtype=float),
+        '低履約利率': df_trade['低履約利率'].to_numpy(dtype=float),
+        'SRC': df_trade['SRC'].to_numpy(dtype=object) if 'SRC' in df_trade.columns else np.full(len(df_trade), '', dtype=object),
+        'default_fee': default_fee,
+    }
+
+
+def apply_fee_rate_rules(df_trade: pd.DataFrame, vip_list_dict: dict, default_fee, rules=FEE_RATE_RULES) -> pd.DataFrame:
+    """依規則表整欄填入 最終利率 / 最終手續費（已有值的列不覆蓋）"""
+    ctx = _fee_rate_context(df_trade, vip_list_dict, default_fee)
+    n = len(df_trade)
+    for _, target, condition, value in rules:
+        current = pd.to_numeric(df_trade[target], errors='coerce').to_numpy(dtype=float)
+        mask = np.isnan(current) & np.broadcast_to(condition(ctx), (n,))
+        if mask.any():
+            values = np.broadcast_to(np.asarray(value(ctx), dtype=float), (n,))
+            df_trade[target] = np.where(mask, values, current)
+    return df_trade
+
+
 def calculate_new_trade_batch(trade_data: pd.DataFrame, settle_date, default_fee: int = 150) -> pd.DataFrame:
     """統一的新作買進批次計算 - 使用獨立模組讀取資料
 
@@ -279,106 +348,14 @@ def calculate_new_trade_batch(trade_data: pd.DataFrame, settle_date, default_fee
         sellback = pd.to_datetime(df_trade['賣回日'], format='%Y%m%d').dt.normalize()
         df_trade['年期_app'] = ((sellback - settle).dt.days + 1) / 365
         
-    # 特殊ID處理
-        special_ids = ['H122699830', 'H123326603', 'P220839691']
+    # 初始化最終利率/手續費
         df_trade['最終利率'] = np.nan
         df_trade['最終手續費'] = np.nan
         df_trade['VIP報價張數'] = 0
         df_trade['_短約'] = 'N'
 
     # 1. 檢查特殊報價（支援多筆同 key、張數上限與拆單；短約=Y 優先）
-        if not df_vip_quote_all.empty and all(col in df_vip_quote_all.columns for col in ['客戶ID', 'CB代號', '利率%', '手續費']):
-            has_qty_col = '張數' in df_vip_quote_all.columns
-            has_short_col = '短約' in df_vip_quote_all.columns
-
-            # 將同 (客戶ID, CB代號) 的多筆設定分組，並依「短約=Y 優先」排序
-            vip_quotes_by_key = {}
-            for _, vip_row in df_vip_quote_all.iterrows():
-                cus_id_v = str(vip_row.get('客戶ID', '')).strip()
-                cb_code_v = str(vip_row.get('CB代號', '')).strip()
-                if not cus_id_v or not cb_code_v:
-                    continue
-                qty_raw = vip_row.get('張數') if has_qty_col else None
-                try:
-                    if qty_raw is None or str(qty_raw).strip() == '' or (isinstance(qty_raw, float) and pd.isna(qty_raw)):
-                        qty_limit = None
-                    else:
-                        qty_limit = int(float(qty_raw))
-                except (ValueError, TypeError):
-                    qty_limit = None
-                short_flag = 'N'
-                if has_short_col:
-                    short_raw = str(vip_row.get('短約', 'N')).strip().upper()
-                    short_flag = 'Y' if short_raw == 'Y' else 'N'
-                entry = {
-                    '短約': short_flag,
-                    '利率%': vip_row.get('利率%'),
-                    '手續費': vip_row.get('手續費'),
-                    '張數': qty_limit,
-                }
-                vip_quotes_by_key.setdefault((cus_id_v, cb_code_v), []).append(entry)
-            # 短約=Y 優先排在前面
-            for k in vip_quotes_by_key:
-                vip_quotes_by_key[k].sort(key=lambda e: 0 if e['短約'] == 'Y' else 1)
-
-            new_rows = []
-            rows_to_drop = []
-            for idx, row in df_trade.iterrows():
-                key = (str(row.get('客戶ID', '')).strip(), str(row.get('CB代號', '')).strip())
-                if key not in vip_quotes_by_key:
-                    continue
-                trade_qty = int(row['成交張數']) if pd.notna(row['成交張數']) else 0
-                if trade_qty <= 0:
-                    continue
-
-                avg_price = pd.to_numeric(row.get('成交均價'), errors='coerce')
-                remaining = trade_qty
-                matched_segments = []
-                for entry in vip_quotes_by_key[key]:
-                    if remaining <= 0:
-                        break
-                    qty_limit = entry['張數']
-                    take = remaining if qty_limit is None else min(remaining, qty_limit)
-                    if take <= 0:
-                        continue
-                    matched_segments.append((take, entry))
-                    remaining -= take
-
-                if not matched_segments:
-                    continue
-
-                # 產生 VIP 套用的新 row
-                for take, entry in matched_segments:
-                    nr = row.copy()
-                    nr['成交張數'] = take
-                    if pd.notna(avg_price):
-                        nr['成交金額'] = round(take * avg_price * 1000, 0)
-                    if pd.notna(entry['利率%']):
-                        nr['最終利率'] = float(entry['利率%'])
-                    if pd.notna(entry['手續費']):
-                        nr['最終手續費'] = float(entry['手續費'])
-                    nr['VIP報價張數'] = take
-                    nr['_短約'] = entry['短約']
-                    new_rows.append(nr)
-
-                # 剩餘張數（特殊報價無法吸收完）→ 進入一般規則
-                if remaining > 0:
-                    rest = row.copy()
-                    rest['成交張數'] = remaining
-                    if pd.notna(avg_price):
-                        rest['成交金額'] = round(remaining * avg_price * 1000, 0)
-                    rest['VIP報價張數'] = 0
-                    rest['_短約'] = 'N'
-                    rest['最終利率'] = np.nan
-                    rest['最終手續費'] = np.nan
-                    new_rows.append(rest)
-
-                rows_to_drop.append(idx)
-
-            if rows_to_drop:
-                df_trade = df_trade.drop(rows_to_drop)
-            if new_rows:
-                df_trade = pd.concat([df_trade, pd.DataFrame(new_rows)], ignore_index=True)
+        df_trade = split_vip_quote_quantities(df_trade, df_vip_quote_all)
 
         # 確保 _短約 欄位完整
         if '_短約' not in df_trade.columns:
@@ -386,47 +363,14 @@ def calculate_new_trade_batch(trade_data: pd.DataFrame, settle_date, default_fee
         df_trade['_短約'] = df_trade['_短約'].fillna('N').astype(str).replace({'': 'N', 'nan': 'N'})
 
 
-    # 2. 檢查VIP名單
+    # 2~4. VIP名單 → 特殊ID → 基礎規則（依 FEE_RATE_RULES 的順序整欄套用）
+        vip_list_dict = {}
         if not df_vip_list.empty and all(col in df_vip_list.columns for col in ['客戶ID', '不限張數低手續費', '不限張數低利率']):
             vip_list_cols = ['不限張數低手續費', '不限張數低利率']
             if '80元手續費' in df_vip_list.columns:
                 vip_list_cols.append('80元手續費')
             vip_list_dict = df_vip_list.set_index('客戶ID')[vip_list_cols].to_dict('index')
-
-            for idx, row in df_trade.iterrows():
-                cus_id = str(row['客戶ID'])
-                if pd.isna(df_trade.loc[idx, '最終利率']) or pd.isna(df_trade.loc[idx, '最終手續費']):
-                    if cus_id in vip_list_dict:
-                        vip_info = vip_list_dict[cus_id]
-                        if pd.isna(df_trade.loc[idx, '最終利率']) and vip_info.get('不限張數低利率') == 'Y':
-                            df_trade.loc[idx, '最終利率'] = row['低履約利率']
-                        if pd.isna(df_trade.loc[idx, '最終手續費']):
-                            if vip_info.get('80元手續費') == 'Y':
-                                df_trade.loc[idx, '最終手續費'] = 80
-                            elif vip_info.get('不限張數低手續費') == 'Y':
-                                df_trade.loc[idx, '最終手續費'] = 100
-        
-    # 3. 檢查特殊ID
-        for idx, row in df_trade.iterrows():
-            cus_id = str(row['客戶ID'])
-            need_process = (pd.isna(df_trade.loc[idx, '最終利率']) or pd.isna(df_trade.loc[idx, '最終手續費']) or str(df_trade.loc[idx, '最終手續費']) == 'nan' or str(df_trade.loc[idx, '最終手續費']) == '')
-            if need_process and cus_id in special_ids:
-                if pd.isna(df_trade.loc[idx, '最終利率']):
-                    df_trade.loc[idx, '最終利率'] = row['低履約利率']
-                if (pd.isna(df_trade.loc[idx, '最終手續費']) or str(df_trade.loc[idx, '最終手續費']) == 'nan' or str(df_trade.loc[idx, '最終手續費']) == ''):
-                            df_trade.loc[idx, '最終手續費'] = 60
-        
-    # 4. 基礎規則
-        for idx, row in df_trade.iterrows():
-            if pd.isna(df_trade.loc[idx, '最終利率']):
-                df_trade.loc[idx, '最終利率'] = row['低履約利率'] if row['STORQTY'] >= 200 else row['履約利率']
-            if pd.isna(df_trade.loc[idx, '最終手續費']):
-                if row['STORQTY'] >= 200 or row['成交張數'] >= 10:
-                        df_trade.loc[idx, '最終手續費'] = 100
-                elif row.get('SRC', '') == 'E':
-                    df_trade.loc[idx, '最終手續費'] = 110
-                else:
-                    df_trade.loc[idx, '最終手續費'] = default_fee
+        df_trade = apply_fee_rate_rules(df_trade, vip_list_dict, default_fee)
         
     # 最終處理
         df_trade['最終手續費'] = pd.to_numeric(df_trade['最終手續費'], errors='coerce').astype(int)
@@ -434,15 +378,10 @@ def calculate_new_trade_batch(trade_data: pd.DataFrame, settle_date, default_fee
         df_trade['成交均價'] = np.round(df_trade['成交均價'], 11)
         
         def calc_unit_premium(df_trade):
-            prem100 = (
-                df_trade['最終利率'] * df_trade['年期_app']
-                - (df_trade['賣回價'] - 100)
-                + df_trade['最終手續費'] / 1000
-            )
-
-            # 權利金百元價：固定到 2 位
-            df_trade['權利金百元價'] = prem100.apply(
-                lambda x: float(Decimal(str(x)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+            # 權利金百元價 = 最終利率 × 年期 − (賣回價 − 100) + 手續費/1000，以定點數精確四捨五入到 2 位
+            sellback = pd.to_datetime(df_trade['賣回日'], format='%Y%m%d').dt.normalize()
+            df_trade['權利金百元價'] = premium_per_hundred(
+                df_trade['最終利率'], (sellback - settle).dt.days + 1, df_trade['賣回價'], df_trade['最終手續費']
             )
 
             # 單位權利金 = (成交均價 - 100) + 權利金百元價
@@ -460,9 +399,9 @@ def calculate_new_trade_batch(trade_data: pd.DataFrame, settle_date, default_fee
         #問題出在strip_trailing_zeros
         #df_trade['單位權利金'] = df_trade['單位權利金'].astype(str)
         #print(df_trade['單位權利金'])
-        df_trade['單位權利金'] = df_trade['單位權利金'].apply(lambda x: strip_trailing_zeros(x))
+        df_trade['單位權利金'] = strip_trailing_zeros_column(df_trade['單位權利金'])
         print(df_trade['單位權利金'])
-        df_trade['成交均價'] = df_trade['成交均價'].apply(lambda x: strip_trailing_zeros(x))
+        df_trade['成交均價'] = strip_trailing_zeros_column(df_trade['成交均價'])
         return df_trade
         
     except Exception as e:
@@ -503,7 +442,7 @@ def bargain_sell(bargain_data_sell):
 def fetch_exercise_contracts(cus_id: str, cb_code: str, trade_date: str, exercise_qty: str, price: str, settlement_date: str) -> pd.DataFrame:
     """從資料庫獲取履約契約資訊並進行智能排序分配"""
     exercise_qty = int(exercise_qty)
-    conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
+    conn = get_400_conn()
     
     # 補齊客戶ID到12位
     db_cusid_length = 12
@@ -564,10 +503,7 @@ def fetch_exercise_contracts(cus_id: str, cb_code: str, trade_date: str, exercis
     df_contracts['賣回日'] = pd.to_datetime(df_contracts['賣回日'], format='%Y%m%d', errors='coerce')
     
     # 智能排序：原利率(高→低)、成交日期(早→晚)、庫存張數(少→多)
-    df_contracts_sorted = df_contracts.sort_values(
-        by=['原利率', '原成交日期', '庫存張數'], 
-        ascending=[False, True, True]
-    ).reset_index(drop=True)
+    df_contracts_sorted = sort_exercise_contracts(df_contracts, date_col='原成交日期', keys=[])
     
     # 創建 df_exe 進行履約分配
     df_exe = create_exercise_allocation(df_contracts_sorted, exercise_qty, settlement_date)
@@ -619,77 +555,3 @@ def fetch_exercise_contracts(cus_id: str, cb_code: str, trade_date: str, exercis
     
     print(f"已將 {len(df_exe)} 筆實物履約添加到提解賣出分頁！")
     return df_exe
-
-def create_exercise_allocation(df_contracts_sorted, exercise_qty, settlement_date):
-    """創建 df_exe 進行履約分配"""
-    df_exe = df_contracts_sorted.copy()
-    # Convert settlement_date from string to timestamp if it's a string
-    if isinstance(settlement_date, str):
-        settlement_date = pd.to_datetime(settlement_date, format='%Y%m%d')
-
-    
-    try:
-        tday = datetime.now().strftime('%Y%m%d')
-        df_had_sold = pd.read_csv(rf"\\10.72.228.83\CBAS_Logs\{tday}\AfterClose\ASCCSV02.csv")
-        df_exe = pd.merge(df_exe, df_had_sold, left_on='原單契約編號', right_on='PRDID', how='left')
-        df_exe['今日賣出張數'] = df_exe['DEUQTY'].fillna(0)  # 填充 NaN 值
-    except Exception as e:
-        print(f"讀取已賣出資料時發生錯誤: {e}")
-        df_exe['今日賣出張數'] = 0
-
-    try:
-        # 添加履約相關欄位
-        df_exe['此契約履約張數'] = 0
-        df_exe['原庫存張數'] = df_exe['庫存張數'].copy()
-        df_exe['剩餘張數'] = df_exe['庫存張數'].copy() - df_exe['今日賣出張數']
-        df_exe['履約價'] = 0.0
-        df_exe['年期'] = 0.0
-        
-        remaining_qty = exercise_qty
-        
-        for idx, row in df_exe.iterrows():
-            if remaining_qty <= 0:
-                break
-            
-            available_qty = int(row['庫存張數'])
-            exercise_this_contract = min(remaining_qty, available_qty)
-            
-            # 更新履約張數
-            df_exe.at[idx, '此契約履約張數'] = exercise_this_contract
-            remaining_contract_qty = available_qty - exercise_this_contract
-            df_exe.at[idx, '剩餘張數'] = remaining_contract_qty
-            df_exe.at[idx, '解約類別'] = '2' if remaining_contract_qty == 0 else '1'
-            df_exe.at[idx, '履約方式'] = '2'
-            
-            # 計算年期 = (賣回日 - 交割日) / 365
-            if pd.notna(row['賣回日']):
-                years = ((row['賣回日'] - settlement_date).days + 1)/ 365
-                df_exe.at[idx, '年期'] = max(years, 0)  # 確保年期不為負
-            else:
-                df_exe.at[idx, '年期'] = 0
-            
-            # 計算履約價 = round(賣回價 - (100 * 年期 * 原利率), 2)
-            exercise_price = round(
-                row['賣回價'] - (100 * df_exe.at[idx, '年期'] * row['原利率']/100), 2
-            )
-            df_exe.at[idx, '履約價'] = exercise_price
-            
-            remaining_qty -= exercise_this_contract
-            
-            print(f"契約{idx+1}: 原利率={row['原利率']:.4f}, 可用={available_qty}張, 履約={exercise_this_contract}張, 履約價={exercise_price:.2f}")
-        
-        if remaining_qty > 0:
-            print(f"⚠️  客戶可履約張數不足，缺少 {remaining_qty} 張")
-        else:
-            print(f"✅ 履約分配完成！")
-        
-        # 只返回有履約的契約
-        df_exe_filtered = df_exe[df_exe['此契約履約張數'] > 0].reset_index(drop=True)
-    except Exception as e:
-        print(f"履約分配時發生錯誤: {e}")
-        # 當發生錯誤時，返回空的 DataFrame 而不是不完整的 df_exe
-        return pd.DataFrame()
-
-    return df_exe_filtered
-
-
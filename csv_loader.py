@@ -0,0 +1,123 @@
+import codecs
+import os
+import threading
+import pandas as pd
+
+# 依序嘗試的編碼（與原本各處的迴圈相同）
+CSV_ENCODINGS = ('utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950')
+# 判斷編碼時讀取的檔頭大小
+SNIFF_BYTES = 64 * 1024
+
+
+class CsvSchema:
+    """一種 CSV 檔的欄位定義
+
+    Args:
+        name: 檔案名稱（訊息用）
+        columns: 標準欄位（空白表格與 select 時的欄位順序）
+        dtype: 傳給 pd.read_csv 的 dtype
+        defaults: 檔案缺少該欄時補上的預設值 {欄位: 值}
+        fill: 空白（NaN、''、'nan'）時改填的值 {欄位: 值}
+        select: True 時只回傳 columns 內的欄位
+    """
+
+    def __init__(self, name: str, columns, dtype=None, defaults=None, fill=None, select: bool = False):
+        self.name = name
+        self.columns = list(columns)
+        self.dtype = dtype
+        self.defaults = dict(defaults or {})
+        self.fill = dict(fill or {})
+        self.select = select
+
+    def empty(self) -> pd.DataFrame:
+        return pd.DataFrame(columns=self.columns)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for col, value in self.defaults.items():
+            if col not in df.columns:
+                df[col] = value
+        for col, value in self.fill.items():
+            if col in df.columns:
+                df[col] = df[col].fillna(value).astype(str).replace({'': value, 'nan': value})
+        return df[self.columns] if self.select else df
+
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _signature(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def sniff_encoding(path: str, candidates=CSV_ENCODINGS) -> str:
+    """讀檔頭判斷編碼：回傳第一個能解碼檔頭的編碼"""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    final = len(head) < SNIFF_BYTES
+    for encoding in candidates:
+        try:
+            # 檔頭可能切在多位元組字元中間，未讀完整個檔案時不要求結尾完整
+            codecs.getincrementaldecoder(encoding)().decode(head, final=final)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise UnicodeDecodeError('csv', head[:1], 0, 1, f"無法判斷 {path} 的編碼")
+
+
+def csv_encoding(path: str) -> str:
+    """取得檔案的編碼；同一路徑在檔案沒變動（mtime/size 相同）前沿用上次的結果"""
+    signature = _signature(path)
+    with _encodings_lock:
+        cached = _encodings.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    encoding = sniff_encoding(path)
+    with _encodings_lock:
+        _encodings[path] = (signature, encoding)
+    return encoding
+
+
+def read_csv_file(path: str, schema: CsvSchema = None, **kwargs) -> pd.DataFrame:
+    """以偵測到的編碼讀取 CSV（只讀一次），再套用 schema 補欄位
+
+    檔頭之後才出現無法解碼的內容時，改用後面的編碼整檔重試；檔案不存在時拋出 FileNotFoundError。
+    """
+    if schema is not None and schema.dtype is not None:
+        kwargs.setdefault('dtype', schema.dtype)
+    encoding = csv_encoding(path)
+    candidates = [encoding] + [e for e in CSV_ENCODINGS if CSV_ENCODINGS.index(e) > CSV_ENCODINGS.index(encoding)]
+    for i, encoding in enumerate(candidates):
+        try:
+            df = pd.read_csv(path, encoding=encoding, **kwargs)
+        except UnicodeDecodeError:
+            if i == len(candidates) - 1:
+                raise
+            continue
+        if i > 0:
+            with _encodings_lock:
+                _encodings[path] = (_signature(path), encoding)
+        return schema.apply(df) if schema is not None else df
+
+
+def load_csv(path: str, schema: CsvSchema) -> pd.DataFrame:
+    """讀取 CSV；檔案不存在或無法解碼時回傳 schema 的空白表格"""
+    try:
+        return read_csv_file(path, schema)
+    except (UnicodeDecodeError, FileNotFoundError):
+        print(f"無法讀取 {path}，將創建空的{schema.name}")
+        return schema.empty()
+
+
+VIP_LIST_COLUMNS = ['客戶ID', '客戶名稱', '不限張數低手續費', '不限張數低利率', '80元手續費']
+VIP_QUOTE_COLUMNS = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '利率%', '手續費', '張數', '短約', '備註']
+CUSTOMER_LIST_COLUMNS = ['客戶ID', '客戶名稱']
+PENALTY_SETTINGS_COLUMNS = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '賠償金張數', '提前履約賠償金', '備註']
+
+VIP_LIST_SCHEMA = CsvSchema('VIP 名單', VIP_LIST_COLUMNS, defaults={'80元手續費': ''})
+VIP_QUOTE_SCHEMA = CsvSchema('VIP 報價', VIP_QUOTE_COLUMNS, dtype=str,
+                             defaults={'張數': '', '短約': 'N', '備註': ''}, fill={'短約': 'N'}, select=True)
+CUSTOMER_LIST_SCHEMA = CsvSchema('客戶清單', CUSTOMER_LIST_COLUMNS)
+PENALTY_SETTINGS_SCHEMA = CsvSchema('罰金設定', PENALTY_SETTINGS_COLUMNS, dtype=str,
+                                    defaults={col: '' for col in PENALTY_SETTINGS_COLUMNS}, select=True)
@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from envs import local_cache_dir
+from format_utils import strip_trailing_zeros_column
+from remote_cache import cached_path, remote_path
+
+# ASCCSV02.csv（盤後解約/賣出明細）依欄位順序對應的中文欄名
+ASCCSV02_COLUMNS = [
+    '原單契約編號', '客戶ID', 'CB代號', '交易日期', '交割日期', '解約類別', '履約方式',
+    '履約張數', '成交均價', '履約利率', '賣回日', '賣回價', '選擇權到期日', '提前履約賠償金', '履約價', '選擇權交割單價', '交割總金額', '錄音時間'
+]
+SNAPSHOT_DIR = os.path.join(local_cache_dir, 'snapshots')
+
+
+def _strip_ids(series: pd.Series) -> pd.Series:
+    return series.where(series.isna(), series.astype(str).str.strip())
+
+
+def _normalize_asccsv02(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = ASCCSV02_COLUMNS  # 只改欄位名稱，不動內容
+    df['原單契約編號'] = _strip_ids(df['原單契約編號'])
+    df['客戶ID'] = _strip_ids(df['客戶ID'])
+    df['CB代號'] = strip_trailing_zeros_column(df['CB代號']).astype(str)
+    return df
+
+
+def _normalize_buy_match(df: pd.DataFrame) -> pd.DataFrame:
+    df['CUSID'] = _strip_ids(df['CUSID'])
+    df['CBCODE'] = strip_trailing_zeros_column(df['CBCODE']).astype(str)
+    return df
+
+
+# 每日盤後檔：remote_files 名稱 -> 欄位正規化
+SNAPSHOT_SOURCES = {
+    'asccsv02': _normalize_asccsv02,
+    'buy_match': _normalize_buy_match,
+}
+
+
+def _write_snapshot(df: pd.DataFrame, folder: str, source_key):
+    """每欄一個 .npy：數值欄保留原型別，文字欄存成定長字串加上缺值遮罩，讀取時都能以 mmap 載入"""
+    tmp = f"{folder}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if values.dtype.kind in 'biuf':
+            np.save(os.path.join(tmp, f"c{i}.npy"), values.to_numpy())
+            columns.append([str(col), 'num'])
+        else:
+            mask = values.isna().to_numpy()
+            text = np.array(['' if m else str(v) for v, m in zip(values, mask)], dtype=str)
+            np.save(os.path.join(tmp, f"c{i}.npy"), text)
+            np.save(os.path.join(tmp, f"c{i}_na.npy"), mask)
+            columns.append([str(col), 'str'])
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'source': list(source_key), 'rows': len(df), 'columns': columns}, f, ensure_ascii=False)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+
+
+def _read_snapshot(folder: str, source_key):
+    """讀取快照；不存在或與來源檔版本不符時回傳 None"""
+    try:
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('source') != list(source_key):
+        return None
+    data = {}
+    for i, (col, kind) in enumerate(meta['columns']):
+        values = np.load(os.path.join(folder, f"c{i}.npy"), mmap_mode='r')
+        if kind == 'str':
+            mask = np.load(os.path.join(folder, f"c{i}_na.npy"), mmap_mode='r')
+            values = values.astype(object)
+            values[mask] = np.nan
+        data[col] = values
+    return pd.DataFrame(data, columns=[col for col, _ in meta['columns']], index=pd.RangeIndex(meta['rows']))
+
+
+class DailySnapshotStore:
+    """每日盤後檔（BuyMatch.csv、ASCCSV02.csv）的欄式快照
+
+    每個交易日的檔案只解析一次：統一欄名與型別（ID 去空白、CB代號 strip_trailing_zeros）後，
+    在 snapshot_dir/日期/名稱 寫成每欄一個 .npy 的快照，之後（包含其他行程、重新開啟程式）直接以 mmap 載入。
+    來源檔 mtime/size 變動時重建。get() 回傳副本，呼叫端可自由修改。
+    """
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        # (名稱, 日期) -> (來源版本, DataFrame)
+        self._frames = {}
+
+    def get(self, name: str, tday: str = None) -> pd.DataFrame:
+        """取得指定日期（YYYYMMDD，預設今天）的盤後檔；來源檔不存在時拋出 FileNotFoundError"""
+        tday = tday or datetime.now().strftime('%Y%m%d')
+        local = cached_path(remote_path(name, tday=tday))
+        st = os.stat(local)
+        source_key = (os.path.basename(local), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._frames.get((name, tday))
+            if cached is None or cached[0] != source_key:
+                folder = os.path.join(self.snapshot_dir, tday, name)
+                df = _read_snapshot(folder, source_key)
+                if df is None:
+                    df = SNAPSHOT_SOURCES[name](pd.read_csv(local, encoding='utf-8-sig'))  # 使用 utf-8-sig 以支援 BOM
+                    try:
+                        _write_snapshot(df, folder, source_key)
+                    except OSError as e:
+                        print(f"寫入盤後檔快照時發生錯誤: {e}")
+                cached = (source_key, df)
+                self._frames[(name, tday)] = cached
+            return cached[1].copy()
+
+
+_snapshot_store = None
+_snapshot_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> DailySnapshotStore:
+    """取得共用的 DailySnapshotStore"""
+    global _snapshot_store
+    with _snapshot_store_lock:
+        if _snapshot_store is None:
+            _snapshot_store = DailySnapshotStore()
+        return _snapshot_store
+
+
+def load_asccsv02(tday: str = None) -> pd.DataFrame:
+    """當日 ASCCSV02.csv（欄名已改為 ASCCSV02_COLUMNS）"""
+    return get_snapshot_store().get('asccsv02', tday)
+
+
+def load_buy_match(tday: str = None) -> pd.DataFrame:
+    """當日 BuyMatch.csv（CUSID 去空白、CBCODE 已 strip_trailing_zeros）"""
+    return get_snapshot_store().get('buy_match', tday)
+
+
+def sold_qty_by_contract(tday: str = None) -> pd.Series:
+    """當日 ASCCSV02 依原單契約編號加總的履約（賣出）張數"""
+    df_sell = load_asccsv02(tday)
+    return df_sell.groupby('原單契約編號')['履約張數'].sum()
@@ -1,15 +1,17 @@
 import pandas as pd
 import pyodbc
-from format_utils import strip_whitespace, next_business_day, prev_business_day
+from format_utils import strip_whitespace, next_business_day, prev_business_day, get_business_calendar
 from datetime import datetime
 import numpy as np
+from db_pool import ConnectionPool
+from pricing import exercise_price
+from concurrent.futures import ThreadPoolExecutor
 
-def get_400_conn():
-    conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
-    return conn
+def _connect_400():
+    return pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
 
-def get_631_conn():
-    conn = pyodbc.connect(
+def _connect_631():
+    return pyodbc.connect(
         driver='ODBC Driver 18 for SQL Server',
         server='10.72.228.139',
         user='sa',
@@ -17,7 +19,62 @@ def get_631_conn():
         database='CBAS',
         TrustServerCertificate='yes'
     )
-    return conn
+
+# AS/400 與 SQL Server 共用連線池：get_400_conn()/get_631_conn() 借出的連線 close() 時會歸還而非斷線
+pool_400 = ConnectionPool(_connect_400, name='AS400', min_size=1, max_size=8, ping_sql='SELECT 1 FROM SYSIBM.SYSDUMMY1')
+pool_631 = ConnectionPool(_connect_631, name='SQL631', min_size=0, max_size=4, ping_sql='SELECT 1')
+
+def get_400_conn():
+    """從連線池借出 AS/400 連線，用完請 close()（或改用 with pool_400.connection() as conn）"""
+    return pool_400.acquire()
+
+def get_631_conn():
+    """從連線池借出 SQL Server 連線，用完請 close()"""
+    return pool_631.acquire()
+
+def get_pool_stats() -> dict:
+    """連線池監控數據"""
+    return {'AS400': pool_400.stats(), 'SQL631': pool_631.stats()}
+
+def rtrim_select(*columns, table: str = None) -> str:
+    """產生 SELECT 欄位清單，CHAR 欄位在資料庫端先 RTRIM 去掉補位空白，減少傳輸量與之後 strip 的工作量
+
+    rtrim_select('CUSID', 'CUSNAME') -> 'RTRIM(CUSID) AS CUSID, RTRIM(CUSNAME) AS CUSNAME'
+    """
+    prefix = f"{table}." if table else ''
+    return ', '.join(f"RTRIM({prefix}{col}) AS {col}" for col in columns)
+
+IN_LIST_CHUNK_SIZE = 500
+
+def bulk_lookup(sql_template: str, keys, params=(), columns=None, pool=None,
+                chunk_size: int = IN_LIST_CHUNK_SIZE, max_workers: int = 4) -> pd.DataFrame:
+    """以參數化 IN 查詢批次取資料，避免把上千個 ID 串成超長 SQL 字串
+
+    sql_template 中以 {in_list} 標示 IN (...) 內容，例如
+        "SELECT ... FROM FSPFLIB.ASPROD WHERE PRDID IN ({in_list})"
+    keys 去重後切成固定大小的區塊，最後一塊（只有一塊時也一樣）以最後一個 key 補齊到 chunk_size，
+    不論 key 數多少 SQL 字串都相同，資料庫只需 prepare 一次；多個區塊時以連線池中的多條連線同時查詢後合併。
+    params 為 IN 清單之前的其他參數（依 ? 出現順序）。
+    """
+    pool = pool_400 if pool is None else pool
+    keys = list(dict.fromkeys(k for k in keys if k is not None and not (isinstance(k, float) and np.isnan(k))))
+    if not keys:
+        return pd.DataFrame(columns=columns) if columns is not None else pd.DataFrame()
+
+    chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    chunks[-1] = chunks[-1] + [chunks[-1][-1]] * (chunk_size - len(chunks[-1]))
+    sql = sql_template.format(in_list=', '.join(['?'] * chunk_size))
+
+    def run_chunk(chunk):
+        with pool.connection() as conn:
+            return pd.read_sql(sql, conn, params=list(params) + list(chunk))
+
+    if len(chunks) == 1:
+        frames = [run_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks), pool.max_size)) as executor:
+            frames = list(executor.map(run_chunk, chunks))
+    return pd.concat(frames, ignore_index=True)
 
 def get_customer_info(cusid_list_padded: list[str]) -> pd.DataFrame:
     """Fetch customer info for a list of padded CUSID (12-char).
@@ -27,39 +84,30 @@ def get_customer_info(cusid_list_padded: list[str]) -> pd.DataFrame:
         return pd.DataFrame(columns=[
             'CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO', 'ADDRESS2'
         ])
-    conn = None
     try:
-        conn = get_400_conn()
-        cusid_list = "','".join(cusid_list_padded)
-        sql_query = (
+        df = bulk_lookup(
             "SELECT CUSID, CUSNAME, BNKNAME, BNKBRH, BNKACTNO, CENTERNO, ADDRESS2 "
-            f"FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y' AND CUSID IN ('{cusid_list}')"
+            "FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y' AND CUSID IN ({in_list})",
+            cusid_list_padded,
+            columns=['CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO', 'ADDRESS2']
         )
-        df = pd.read_sql(sql_query, conn)
         return strip_whitespace(df)
     except Exception as e:
         print(f"get_customer_info 發生錯誤: {e}")
         return pd.DataFrame(columns=[
             'CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO', 'ADDRESS2'
         ])
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except Exception:
-            pass
 
 def get_customer_inventory() -> pd.DataFrame:
     """Fetch customer inventory data from database.
     Returns columns: CUSID, STORQTY
     """
-    conn = None
     try:
-        conn = get_400_conn()
-        df_cus_inventory = strip_whitespace(pd.read_sql(
-            "SELECT CUSID, SUM(STORQTY) as STORQTY FROM FSPFLIB.ASPROD GROUP BY CUSID", 
-            conn
-        ))
+        with pool_400.connection() as conn:
+            df_cus_inventory = strip_whitespace(pd.read_sql(
+                "SELECT CUSID, SUM(STORQTY) as STORQTY FROM FSPFLIB.ASPROD GROUP BY CUSID", 
+                conn
+            ))
         
         if df_cus_inventory.empty:
             print("警告：客戶庫存查詢結果為空")
@@ -78,17 +126,14 @@ def get_customer_inventory() -> pd.DataFrame:
 def get_expired_contracts_db(target_date: str) -> pd.DataFrame:
     """從資料庫取得指定日期到期的契約及客戶名稱"""
     try:
-        conn = get_400_conn()
-
-        # 取得指定日期到期的契約及客戶名稱（一次JOIN查詢）
-        df_expired = strip_whitespace(pd.read_sql(f"""
-            SELECT a.*, c.CUSNAME
-            FROM FSPFLIB.ASPROD a
-            LEFT JOIN FSPFLIB.FSPCS0M c ON a.CUSID = c.CUSID
-            WHERE a.STORQTY > 0 AND a.OPTEXDT = '{target_date}'
-        """, conn))
-
-        conn.close()
+        with pool_400.connection() as conn:
+            # 取得指定日期到期的契約及客戶名稱（一次JOIN查詢）
+            df_expired = strip_whitespace(pd.read_sql(f"""
+                SELECT a.*, c.CUSNAME
+                FROM FSPFLIB.ASPROD a
+                LEFT JOIN FSPFLIB.FSPCS0M c ON a.CUSID = c.CUSID
+                WHERE a.STORQTY > 0 AND a.OPTEXDT = '{target_date}'
+            """, conn))
         return df_expired
     except Exception as e:
         print(f"取得到期契約時發生錯誤: {e}")
@@ -102,7 +147,7 @@ def get_cbas_customers() -> pd.DataFrame:
     try:
         conn = get_400_conn()
         df_cusname = strip_whitespace(pd.read_sql(
-            "SELECT CUSID, CUSNAME FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y'", 
+            f"SELECT {rtrim_select('CUSID', 'CUSNAME')} FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y'",
             conn
         ))
         return df_cusname
@@ -119,12 +164,11 @@ def get_cbas_customers() -> pd.DataFrame:
 def get_contracts_from_sell_table(df_sell: pd.DataFrame) -> pd.DataFrame:
     """從賣出表格中取得合約資料"""
     try:
-        conn = get_400_conn()
         contracts = df_sell['原單契約編號'].unique().tolist()
-        contracts_str = "','".join(contracts)
-        df_contracts = strip_whitespace(pd.read_sql(
-            f"SELECT PRDID, CBTUPRM, OPTTYPE, QPRICE FROM FSPFLIB.ASPROD WHERE PRDID IN ('{contracts_str}')", 
-            conn
+        df_contracts = strip_whitespace(bulk_lookup(
+            "SELECT PRDID, CBTUPRM, OPTTYPE, QPRICE FROM FSPFLIB.ASPROD WHERE PRDID IN ({in_list})",
+            contracts,
+            columns=['PRDID', 'CBTUPRM', 'OPTTYPE', 'QPRICE']
         ))
         df_contracts.rename(columns={'PRDID': '原單契約編號', 'CBTUPRM': '原單位權利金', 'OPTTYPE': '選擇權型態', 'QPRICE': '報價方式'}, inplace=True)
         return df_contracts
@@ -133,11 +177,11 @@ def get_contracts_from_sell_table(df_sell: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 def get_631_Monitor_Fill():
-    conn = get_631_conn()
-    df_monitor_fill = pd.read_sql(
-        "SELECT * FROM dbo.RPT_Monitor_Fill", 
-        conn
-    )
+    with pool_631.connection() as conn:
+        df_monitor_fill = pd.read_sql(
+            "SELECT * FROM dbo.RPT_Monitor_Fill", 
+            conn
+        )
     return df_monitor_fill
 
 def get_customer_bank_and_email(cusid_list: list[str]) -> pd.DataFrame:
@@ -145,22 +189,20 @@ def get_customer_bank_and_email(cusid_list: list[str]) -> pd.DataFrame:
     Returns columns: CUSID, CUSNAME, BNKNAME, BNKBRH, BNKACTNO, CENTERNO, ADDRESS2, CELLPHONE
     """
     cusid_list_padded = [cusid.ljust(12) for cusid in cusid_list]
-    conn = get_400_conn()
-    cusid_list = "','".join(cusid_list_padded)
-    sql_query = (
-        "SELECT CUSID, CUSNAME, BNKNAME, BNKBRH, BNKACTNO, CENTERNO, EMAIL, CELLPHONE "
-        f"FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y' AND CUSID IN ('{cusid_list}')"
+    df = bulk_lookup(
+        f"SELECT {rtrim_select('CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO', 'EMAIL', 'CELLPHONE')} "
+        "FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y' AND CUSID IN ({in_list})",
+        cusid_list_padded,
+        columns=['CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO', 'EMAIL', 'CELLPHONE']
     )
-    df = pd.read_sql(sql_query, conn)
     return strip_whitespace(df)
   
 def get_trust_info(cusid_list: list[str]):
     cusid_list_padded = [cusid.ljust(12) for cusid in cusid_list]
-    cusid_list = "','".join(cusid_list_padded)
-    conn = get_400_conn()
-    df_trust_info = pd.read_sql(
-        f"SELECT CUSID, TRUSTEE, TRUSTNM, TRUSTTEL FROM FSPFLIB.FSPCS1M WHERE TRUTYPE = 'T' AND CUSID in ('{cusid_list}')", 
-        conn
+    df_trust_info = bulk_lookup(
+        "SELECT CUSID, TRUSTEE, TRUSTNM, TRUSTTEL FROM FSPFLIB.FSPCS1M WHERE TRUTYPE = 'T' AND CUSID in ({in_list})",
+        cusid_list_padded,
+        columns=['CUSID', 'TRUSTEE', 'TRUSTNM', 'TRUSTTEL']
     )
     return strip_whitespace(df_trust_info)
 
@@ -273,17 +315,15 @@ def get_today_trade_detail(tday_str):
 
     prdids = df_today_trade_sell['PRDID_SELL'].unique().tolist()
     
-    if prdids:
-        prdids_str = "', '".join(str(x) for x in prdids)
-        df_qty_left = pd.read_sql(
-            f"SELECT PRDID as PRDID_QTY_LEFT, STORQTY as QTY_LEFT FROM FSPFLIB.ASPROD WHERE PRDID IN ('{prdids_str}')", conn
-        ) # 剩餘庫存
-        prdid_asw = pd.read_sql(
-            f"SELECT PRDID FROM FSPFLIB.ASPROD WHERE PRDID IN ('{prdids_str}') AND TXTYPE = 'ASW'", conn
-        ) # ASW契約
-    else:
-        df_qty_left = pd.DataFrame(columns=['PRDID_QTY_LEFT', 'QTY_LEFT'])
-        prdid_asw = pd.DataFrame(columns=['PRDID'])
+    prdids = [str(x) for x in prdids]
+    df_qty_left = bulk_lookup(
+        "SELECT PRDID as PRDID_QTY_LEFT, STORQTY as QTY_LEFT FROM FSPFLIB.ASPROD WHERE PRDID IN ({in_list})",
+        prdids, columns=['PRDID_QTY_LEFT', 'QTY_LEFT']
+    ) # 剩餘庫存
+    prdid_asw = bulk_lookup(
+        "SELECT PRDID FROM FSPFLIB.ASPROD WHERE PRDID IN ({in_list}) AND TXTYPE = 'ASW'",
+        prdids, columns=['PRDID']
+    ) # ASW契約
 
     # 將 df_today_trade_sell 中 PRDID_SELL 有在 prdid_asw['PRDID'] 裡的資料篩掉
     if not prdid_asw.empty and 'PRDID_SELL' in df_today_trade_sell.columns and 'PRDID' in prdid_asw.columns:
@@ -338,6 +378,7 @@ def get_today_trade_detail(tday_str):
     df_today_bargain = pd.read_sql(f"""
         SELECT TXDATE, CUSID, ORDERNO, SETDAT, TXBS, STKID, MTHQTY, PRICE, MTHAMT FROM FSPFLIB.ASBARG WHERE TXDATE = '{tday_str}'
     """, conn)
+    conn.close()
     df_today_bargain = df_today_bargain.rename(columns={
         'TXDATE': '成交日',
         'CUSID': '客戶ID',
@@ -359,12 +400,13 @@ def calculate_exercise_price(df_today_trade_sell):
     df_today_trade_sell['DUEPAYDT'] = pd.to_datetime(df_today_trade_sell['DUEPAYDT'], format='%Y%m%d')
     
     # 計算履約價
-    df_today_trade_sell['履約價'] = round(df_today_trade_sell['CBTPPRI'] - (df_today_trade_sell['CANRATE'] * (df_today_trade_sell['CBTPDT'] - df_today_trade_sell['DUEPAYDT'] + pd.Timedelta(days=1)).dt.days / 365), 2)
+    days = (df_today_trade_sell['CBTPDT'] - df_today_trade_sell['DUEPAYDT'] + pd.Timedelta(days=1)).dt.days
+    df_today_trade_sell['履約價'] = exercise_price(df_today_trade_sell['CBTPPRI'], df_today_trade_sell['CANRATE'], days)
     return df_today_trade_sell
 
 def check_each01():
-    conn = get_400_conn()
-    df_each01 = strip_whitespace(pd.read_sql("SELECT * FROM fspflib.FSPEACH01", conn))
+    with pool_400.connection() as conn:
+        df_each01 = strip_whitespace(pd.read_sql("SELECT * FROM fspflib.FSPEACH01", conn))
     ad = df_each01['ADMARK'].fillna('').astype(str).str.strip()
     rc = df_each01['RCODE'].fillna('').astype(str).str.strip()
 
@@ -383,25 +425,27 @@ def check_each01():
     ]
 
     df_each01['IFBANKOK'] = np.select(conditions, choices, default='未壓A')
-    conn.close()
     return df_each01
 
 def read_today_bargain_and_execute():
     tday_str = datetime.today().strftime("%Y%m%d")
     #tday_str = '20251204'
-    df_today_bargain = pd.read_sql(f"""
-        SELECT TXDATE, CUSID, ORDERNO, SETDAT, TXBS, STKID, MTHQTY, PRICE, MTHAMT FROM FSPFLIB.ASBARG WHERE TXDATE = '{tday_str}'
-    """, get_400_conn())
+    with pool_400.connection() as conn:
+        df_today_bargain = pd.read_sql(f"""
+            SELECT TXDATE, CUSID, ORDERNO, SETDAT, TXBS, STKID, MTHQTY, PRICE, MTHAMT FROM FSPFLIB.ASBARG WHERE TXDATE = '{tday_str}'
+        """, conn)
+        df_cbname = strip_whitespace(pd.read_sql(f"""
+            SELECT BDE010, BDE015 FROM FSPFLIB.ASBDEM
+        """, conn))
+        df_today_execute = strip_whitespace(pd.read_sql(f"""
+            SELECT SEQNO, PRDID, CUSID, CBCODE, DUEDATE, DUEPAYDT, PERPRICE, DEUQTY, SETTTOT FROM FSPFLIB.ASSURR WHERE DUEDATE = '{tday_str}' AND CANMODE = '2'
+        """, conn))
 
     df_today_bargain = strip_whitespace(df_today_bargain)
     cuslist = df_today_bargain['CUSID'].unique().tolist()
     cus_info_all = strip_whitespace(get_customer_bank_and_email(cuslist))
     df_today_bargain = df_today_bargain.merge(cus_info_all[['CUSID', 'CUSNAME', 'BNKNAME', 'BNKBRH', 'BNKACTNO', 'CENTERNO']], left_on='CUSID', right_on='CUSID', how='left')
 
-    df_cbname = strip_whitespace(pd.read_sql(f"""
-        SELECT BDE010, BDE015 FROM FSPFLIB.ASBDEM
-    """, get_400_conn()))
-
     df_today_bargain = df_today_bargain.merge(df_cbname, left_on='STKID', right_on='BDE010', how='left')
 
     df_today_bargain = df_today_bargain.rename(columns={
@@ -422,15 +466,14 @@ def read_today_bargain_and_execute():
         'BDE015': 'CB名稱',
     })
 
-    # 計算成交日到交割日之間的business day數，使用 next_business_day 作為依據
+    # 計算成交日到交割日之間的business day數，以共用工作日曆的 bisect 查詢取代逐日 next_business_day
+    business_calendar = get_business_calendar()
     def calc_t_plus(row, start_col, end_col):
         start_day = pd.to_datetime(row[start_col])
         end_day = pd.to_datetime(row[end_col])
-        t_plus = 0
-        while start_day < end_day:
-            start_day = next_business_day(start_day, 1)
-            t_plus += 1
-        return f'T+{t_plus}'
+        if pd.isna(start_day) or pd.isna(end_day):
+            return 'T+0'
+        return f'T+{business_calendar.business_days_between(start_day, end_day)}'
     df_today_bargain['T+?'] = df_today_bargain.apply(lambda row: calc_t_plus(row, '成交日', '交割日'), axis=1)
     df_today_bargain['標的'] = df_today_bargain['CB代號'].astype(str) + ' ' + df_today_bargain['CB名稱'].astype(str)
     df_today_bargain['銀行帳號'] = df_today_bargain['銀行'].astype(str) + df_today_bargain['分行'].astype(str) + df_today_bargain['銀行帳號'].astype(str)
@@ -445,9 +488,6 @@ def read_today_bargain_and_execute():
     df_today_bargain = df_today_bargain[['客戶ID', '統一證買進/賣出', '交易對手', '單據編號', '集保帳號', '標的', '張數', '價格', '金額', '銀行帳號', '交割日', 'T+?']]
 
 #==================================實物履約=================================
-    df_today_execute = strip_whitespace(pd.read_sql(f"""
-        SELECT SEQNO, PRDID, CUSID, CBCODE, DUEDATE, DUEPAYDT, PERPRICE, DEUQTY, SETTTOT FROM FSPFLIB.ASSURR WHERE DUEDATE = '{tday_str}' AND CANMODE = '2'
-    """, get_400_conn()))
     cuslist = df_today_execute['CUSID'].unique().tolist()
     cus_info_all = strip_whitespace(get_customer_bank_and_email(cuslist))
     df_today_execute = df_today_execute.merge(cus_info_all[['CUSID', 'CUSNAME']], left_on='CUSID', right_on='CUSID', how='left')
@@ -0,0 +1,250 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """等待連線逾時（連線池已滿且沒有連線被歸還）"""
+
+
+class PooledConnection:
+    """包裝實際的 DB 連線：close() 會把連線還回連線池而不是真的斷線，
+    其餘屬性（cursor、commit、rollback...）直接轉給原始連線，因此可直接交給 pd.read_sql 使用。
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+        self._returned = False
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._raw)
+
+    def discard(self):
+        """連線已損壞時呼叫，直接斷線不放回連線池"""
+        if not self._returned:
+            self._returned = True
+            self._pool._release(self._raw, broken=True)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # 呼叫端忘了 close 時的保險，避免連線池被借光
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """執行緒安全的連線池
+
+    Args:
+        factory: 建立新連線的函式（例如 lambda: pyodbc.connect('DSN=PSCDB', ...)）
+        min_size: 閒置回收時至少保留的連線數，warm() 也會先建好這個數量
+        max_size: 同時存在的連線上限，超過時 acquire 會等待
+        idle_timeout: 閒置超過此秒數的連線會被關閉（保留 min_size 條）
+        ping_sql: 健康檢查用的 SQL，None 表示不檢查
+        ping_interval: 連線閒置超過此秒數才在借出前做健康檢查
+        checkout_timeout: 借連線最多等待的秒數
+    """
+
+    def __init__(self, factory, name='pool', min_size=0, max_size=5, idle_timeout=300,
+                 ping_sql='SELECT 1', ping_interval=30, checkout_timeout=30):
+        self.factory = factory
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_sql = ping_sql
+        self.ping_interval = ping_interval
+        self.checkout_timeout = checkout_timeout
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []  # [(raw_conn, 歸還時間)]，尾端為最近歸還
+        self._in_use = 0
+        self._pending = 0  # 正在建立中的連線數
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'created': 0,
+            'closed': 0,
+            'ping_failures': 0,
+        }
+
+    # ---- 借出 / 歸還 ----
+    def acquire(self, timeout=None) -> PooledConnection:
+        """借出一條連線；用完後呼叫 close()（或用 connection() 的 with 區塊）歸還"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        wait_start = None
+        while True:
+            raw = None
+            create = False
+            with self._cond:
+                self._evict_idle_locked()
+                while not self._idle and self._in_use + self._pending + len(self._idle) >= self.max_size:
+                    if not waited:
+                        waited = True
+                        wait_start = time.monotonic()
+                        self._stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['wait_seconds'] += time.monotonic() - wait_start
+                        raise PoolTimeout(f"{self.name} 連線池等待逾時（上限 {self.max_size} 條）")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    self._in_use += 1
+                else:
+                    self._pending += 1
+                    create = True
+            if create:
+                try:
+                    raw = self.factory()
+                except Exception:
+                    with self._cond:
+                        self._pending -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._pending -= 1
+                    self._in_use += 1
+                    self._stats['created'] += 1
+            elif not self._is_healthy(raw, returned_at):
+                # 壞掉的連線丟棄後重新借
+                self._release(raw, broken=True)
+                continue
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['wait_seconds'] += time.monotonic() - wait_start
+            return PooledConnection(self, raw)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ... 離開區塊自動歸還"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            # 歸還時會 rollback 未提交的交易，rollback 失敗即視為壞連線丟棄
+            conn.close()
+
+    def _release(self, raw, broken=False):
+        if not broken:
+            try:
+                # 歸還前清掉未提交的交易，避免下一個使用者看到殘留狀態
+                raw.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._stats['closed'] += 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+        if broken:
+            self._close_raw(raw)
+
+    # ---- 健康檢查 / 回收 ----
+    def _is_healthy(self, raw, returned_at) -> bool:
+        if self.ping_sql is None or time.monotonic() - returned_at < self.ping_interval:
+            return True
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.ping_sql)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"{self.name} 連線健康檢查失敗，重新建立連線: {e}")
+            with self._cond:
+                self._stats['ping_failures'] += 1
+            return False
+
+    def _evict_idle_locked(self):
+        if self.idle_timeout is None:
+            return
+        now = time.monotonic()
+        total = self._in_use + self._pending + len(self._idle)
+        keep = []
+        evicted = []
+        # 從最舊的開始回收，至少保留 min_size 條（含借出中的）
+        for raw, returned_at in self._idle:
+            if now - returned_at > self.idle_timeout and total > self.min_size:
+                evicted.append(raw)
+                total -= 1
+            else:
+                keep.append((raw, returned_at))
+        if evicted:
+            self._idle = keep
+            self._stats['closed'] += len(evicted)
+            for raw in evicted:
+                self._close_raw(raw)
+
+    def evict_idle(self):
+        """手動回收閒置過久的連線"""
+        with self._cond:
+            self._evict_idle_locked()
+
+    def warm(self):
+        """預先建立 min_size 條連線"""
+        with self._cond:
+            missing = self.min_size - (self._in_use + self._pending + len(self._idle))
+            self._pending += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                raw = self.factory()
+            except Exception as e:
+                print(f"{self.name} 預先建立連線失敗: {e}")
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify()
+                continue
+            with self._cond:
+                self._pending -= 1
+                self._idle.append((raw, time.monotonic()))
+                self._stats['created'] += 1
+                self._cond.notify()
+
+    def close_all(self):
+        """關閉所有閒置連線（借出中的連線歸還後仍會放回連線池）"""
+        with self._cond:
+            idle = [raw for raw, _ in self._idle]
+            self._idle = []
+            self._stats['closed'] += len(idle)
+        for raw in idle:
+            self._close_raw(raw)
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """監控用計數：借出次數、等待次數/秒數、建立/關閉連線數、目前借出與閒置數"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+            stats['idle'] = len(self._idle)
+            stats['max_size'] = self.max_size
+        return stats
@@ -1,6 +1,39 @@
+import os
+import tempfile
+
 #trade_notice_dir = r"C:\Py_Project\CBAS_Trading_Maker_v2\當日成交明細"
 trade_notice_dir = r"\\10.72.228.112\cbas業務公用區\!!!交易作業區!!!\客戶部位表(對帳單)\庫存部位\歷史交易明細通知"
 bargain_pdf_path = r'\\10.72.228.112\cbas業務結算公用區\歷史買賣成交單、給付結算憑單'
 bargain_upload_file_path = r'\\10.72.228.112\cbas業務公用區\!!!交易作業區!!!\議價交易'
 i_realized_file_path = r'\\10.72.228.112\cbas業務公用區\CBAS軟體'
-upload_file_path = r'\\10.72.228.112\cbas業務公用區\CBAS上傳檔'
\ No newline at end of file
+upload_file_path = r'\\10.72.228.112\cbas業務公用區\CBAS上傳檔'
+# Excel 轉 PDF 的方式：auto（有 reportlab 就直接產生 PDF，否則用 Excel）/ reportlab / excel
+pdf_backend = "auto"
+# reportlab 轉檔用的中文字型：字型檔（.ttf/.ttc）或字型目錄；空白時搜尋 Windows 字型目錄與 Linux 的 /usr/share/fonts、~/.fonts
+pdf_font_path = ""
+
+# 網路磁碟上的輸入檔與範本（集中設定；含 {tday} 的路徑以 remote_cache.remote_path(名稱, tday='YYYYMMDD') 帶入日期）
+cbas_share_dir = r"\\10.72.228.112\cbas業務公用區"
+cbas_maker_dir = cbas_share_dir + r"\CBAS_Trading_Maker"
+cbas_log_dir = r"\\10.72.228.83\CBAS_Logs"
+remote_files = {
+    'quote': cbas_share_dir + r"\統一證CBAS報價表_內部.xlsm",
+    'vip_list': cbas_maker_dir + r"\VIP_List.csv",
+    'vip_quote': cbas_maker_dir + r"\VIP_Quote.csv",
+    'customer_list': cbas_maker_dir + r"\Customer_List.csv",
+    'penalty_settings': cbas_maker_dir + r"\Penalty_Settings.csv",
+    'recording': cbas_maker_dir + r"\錄音檔.xlsx",
+    'bargain_detail': cbas_maker_dir + r"\議價明細.xlsx",
+    'asbarg_template': cbas_maker_dir + r"\議價檔ASBARG上傳檔.xlsx",
+    'settlement_template': cbas_maker_dir + r"\議價模板_給付.xlsx",
+    'trading_template': cbas_maker_dir + r"\議價模板_買賣.xlsx",
+    'notice_logo': cbas_maker_dir + r"\figs\unipsg.png",
+    'temp_dir': cbas_maker_dir + r"\temp",
+    'asw_buy': cbas_share_dir + r"\CLN\ASW\新作上傳檔-ASW-B.xlsx",
+    'audit_quota': cbas_share_dir + r"\稽核\{tmonth}月內稽\CBOQTA{tday}.csv",
+    'daily_dir': cbas_maker_dir + r"\{tday}",
+    'buy_match': cbas_log_dir + r"\{tday}\AfterClose\BuyMatch.csv",
+    'asccsv02': cbas_log_dir + r"\{tday}\AfterClose\ASCCSV02.csv",
+}
+# 網路磁碟檔案的本機快取目錄
+local_cache_dir = os.path.join(os.environ.get('LOCALAPPDATA') or tempfile.gettempdir(), 'CBAS_Trading_Maker', 'remote_cache')
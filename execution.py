@@ -1,10 +1,11 @@
+import re
 import pandas as pd
-import pyodbc
 from datetime import datetime
 from PyQt5.QtWidgets import QMessageBox, QTableWidgetItem
 from PyQt5.QtGui import QColor
-from db_access import strip_whitespace
+from db_access import strip_whitespace, bulk_lookup
 from format_utils import strip_trailing_zeros
+from exercise_allocator import EXERCISE_KEYS, EXERCISE_REQUEST_COLUMNS, allocate_exercise, sort_exercise_contracts
 
 
 def setup_exercise_input_search(input_cus_id, input_cb_code, df_quote, get_customer_list_func):
@@ -147,6 +148,10 @@ def query_exercise_info(input_cus_id, input_cb_code, input_exercise_qty, input_s
         # 查詢資料庫獲取相關契約資訊
         result_data = fetch_exercise_contracts_func(cus_id, cb_code, exercise_qty_int, settlement_date, df_quote)
         
+        # 檢查是否有庫存不足的情況（查無契約時只顯示查無資料）
+        if not result_data.empty:
+            warn_exercise_shortage(None, [(cus_id, cb_code, exercise_qty_int, settlement_date)], result_data)
+        
         if result_data.empty:
             QMessageBox.information(None, "查詢結果", "沒有找到符合條件的契約資料！")
             table_exercise_result.setRowCount(0)
@@ -161,164 +166,149 @@ def query_exercise_info(input_cus_id, input_cb_code, input_exercise_qty, input_s
         QMessageBox.critical(None, "查詢失敗", f"發生錯誤：{e}")
 
 
-def fetch_exercise_contracts(cus_id: str, cb_code: str, exercise_qty: int, settlement_date: datetime, df_quote: pd.DataFrame) -> pd.DataFrame:
-    """從資料庫獲取履約契約資訊並進行智能排序分配"""
+EXERCISE_RESULT_COLUMNS = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '原單契約編號', '原利率', '交易日期', '交割日期', '成交日期', '履約價', '賣出金額', '原庫存張數', '今日賣出張數', '履約張數', '履約後剩餘張數', '解約類別', '履約方式']
+ASPROD_EXERCISE_COLUMNS = ['CUSID', 'PRDID', 'CBCODE', 'STORQTY', 'TRDATE', 'PERRATE', 'CBTPPRI', 'CBTPDT']
+
+
+def _exercise_request_frame(requests) -> pd.DataFrame:
+    """(客戶ID, CB代號, 履約張數, 交割日) 清單轉為 allocate_exercise 的需求表"""
+    df_requests = pd.DataFrame(list(requests), columns=EXERCISE_REQUEST_COLUMNS)
+    df_requests['客戶ID'] = df_requests['客戶ID'].astype(str).str.strip()
+    df_requests['CB代號'] = df_requests['CB代號'].astype(str).str.strip()
+    df_requests['履約張數'] = pd.to_numeric(df_requests['履約張數'], errors='coerce').fillna(0).astype(int)
+    df_requests['交割日期'] = [pd.to_datetime(v, format='%Y%m%d') if isinstance(v, str) else pd.Timestamp(v)
+                           for v in df_requests['交割日期']]
+    return df_requests
+
+
+def parse_exercise_requests(text: str, default_settlement_date: datetime):
+    """解析貼上的履約清單（每行：客戶ID、CB代號、履約張數[、交割日 YYYYMMDD]，以 Tab、逗號或空白分隔）
+
+    回傳 (需求清單, 錯誤訊息清單)；「客戶ID - 名稱」格式只取 ID，無法解析張數的標題列略過。
+    """
+    requests, errors = [], []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        fields = [f for f in re.split(r'[\t,，]+|\s{2,}', line.strip()) if f.strip()]
+        if len(fields) < 3:
+            fields = line.split()
+        fields = [f.split(" - ")[0].strip() for f in fields]
+        if len(fields) < 3:
+            errors.append(f"第 {line_no} 行欄位不足：{line.strip()}")
+            continue
+        cus_id, cb_code, qty_text = fields[:3]
+        try:
+            qty = int(float(qty_text.replace(',', '')))
+        except ValueError:
+            if line_no == 1:
+                continue  # 標題列
+            errors.append(f"第 {line_no} 行履約張數不是數字：{qty_text}")
+            continue
+        if qty <= 0:
+            errors.append(f"第 {line_no} 行履約張數必須大於0")
+            continue
+        settlement_date = default_settlement_date
+        if len(fields) > 3:
+            try:
+                settlement_date = pd.to_datetime(fields[3].replace('/', '').replace('-', ''), format='%Y%m%d').to_pydatetime()
+            except ValueError:
+                errors.append(f"第 {line_no} 行交割日格式錯誤：{fields[3]}")
+                continue
+        requests.append((cus_id, cb_code, qty, settlement_date))
+    return requests, errors
+
+
+def fetch_exercise_contracts_batch(requests, df_quote: pd.DataFrame) -> pd.DataFrame:
+    """批次查詢履約契約並分配：一次（依 IN 清單分塊）撈出所有客戶的 ASPROD 庫存與客戶名稱，再整批分配
+
+    requests 為 (客戶ID, CB代號, 履約張數, 交割日) 清單；回傳合併後的履約結果（欄位同 EXERCISE_RESULT_COLUMNS），
+    可直接顯示在查詢結果表格再由 add_exercise_info 新增。張數不足可用 exercise_shortage 檢查。
+    """
     try:
-        conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
-        
-        # 補齊客戶ID到12位
-        db_cusid_length = 12
-        cus_id_padded = cus_id.ljust(db_cusid_length)
-        
-        # 查詢該客戶的現有契約
-        sql_query = f"""
-            SELECT 
-                CUSID,
-                PRDID,
-                CBCODE,
-                STORQTY,
-                TRDATE,
-                PERRATE,
-                CBTPPRI,
-                CBTPDT
-            FROM FSPFLIB.ASPROD 
-            WHERE CUSID = '{cus_id_padded}' 
-            AND CBCODE = '{cb_code}' 
-            AND STORQTY > 0
-        """
-        
-        df_contracts = strip_whitespace(pd.read_sql(sql_query, conn))
+        df_requests = _exercise_request_frame(requests)
+        if df_requests.empty:
+            return pd.DataFrame(columns=EXERCISE_RESULT_COLUMNS)
+
+        # 補齊客戶ID到12位，所有客戶的庫存一次查回，再只保留有需求的 (客戶ID, CB代號)
+        cusid_padded = [cus_id.ljust(12) for cus_id in df_requests['客戶ID'].unique()]
+        df_contracts = strip_whitespace(bulk_lookup(
+            f"SELECT {', '.join(ASPROD_EXERCISE_COLUMNS)} FROM FSPFLIB.ASPROD WHERE STORQTY > 0 AND CUSID IN ({{in_list}})",
+            cusid_padded,
+            columns=ASPROD_EXERCISE_COLUMNS
+        ))
         df_contracts.columns = ['客戶ID', '原單契約編號', 'CB代號', '庫存張數', '成交日期', '原利率', '賣回價', '賣回日']
-        
+        df_contracts['客戶ID'] = df_contracts['客戶ID'].astype(str).str.strip()
+        df_contracts['CB代號'] = df_contracts['CB代號'].astype(str).str.strip()
+        wanted = pd.MultiIndex.from_frame(df_requests[EXERCISE_KEYS])
+        df_contracts = df_contracts[pd.MultiIndex.from_frame(df_contracts[EXERCISE_KEYS]).isin(wanted)]
         if df_contracts.empty:
-            conn.close()
-            return pd.DataFrame()
-        
-        # 獲取客戶名稱
-        df_cusname = strip_whitespace(pd.read_sql(f"SELECT CUSID, CUSNAME FROM FSPFLIB.FSPCS0M WHERE CUSID = '{cus_id_padded}'", conn))
-        
-        # 獲取CB名稱和相關資訊
-        cb_info = df_quote[df_quote['CB代號'] == cb_code]
+            return pd.DataFrame(columns=EXERCISE_RESULT_COLUMNS)
+
+        # 客戶名稱、CB名稱各查一次
+        df_cusname = strip_whitespace(bulk_lookup(
+            "SELECT CUSID, CUSNAME FROM FSPFLIB.FSPCS0M WHERE CUSID IN ({in_list})",
+            [cus_id.ljust(12) for cus_id in df_contracts['客戶ID'].unique()],
+            columns=['CUSID', 'CUSNAME']
+        ))
+        names = df_cusname.drop_duplicates('CUSID').set_index('CUSID')['CUSNAME']
+        df_contracts['客戶名稱'] = df_contracts['客戶ID'].map(names).fillna('')
+        cb_names = df_quote.drop_duplicates('CB代號').set_index('CB代號')['CB名稱'] if df_quote is not None else pd.Series(dtype=object)
+        df_contracts['CB名稱'] = df_contracts['CB代號'].map(cb_names).fillna('')
 
-        conn.close()
-        
-        # 合併資料
-        if not df_cusname.empty:
-            df_contracts = pd.merge(df_contracts, df_cusname[['CUSID', 'CUSNAME']], left_on='客戶ID', right_on='CUSID', how='left')
-            df_contracts['客戶名稱'] = df_contracts['CUSNAME']
-        else:
-            df_contracts['客戶名稱'] = ''
-        
-        if not cb_info.empty:
-            df_contracts['CB名稱'] = cb_info.iloc[0]['CB名稱']
-        else:
-            df_contracts['CB名稱'] = ''
-        
         # 數據類型轉換
         df_contracts['原利率'] = pd.to_numeric(df_contracts['原利率'], errors='coerce').fillna(0)
         df_contracts['庫存張數'] = pd.to_numeric(df_contracts['庫存張數'], errors='coerce').fillna(0).astype(int)
         df_contracts['賣回價'] = pd.to_numeric(df_contracts['賣回價'], errors='coerce').fillna(100)
-        
-        # 轉換日期格式
         df_contracts['成交日期'] = pd.to_datetime(df_contracts['成交日期'], format='%Y%m%d', errors='coerce')
         df_contracts['賣回日'] = pd.to_datetime(df_contracts['賣回日'], format='%Y%m%d', errors='coerce')
-        
-        # 智能排序：原利率(高→低)、成交日期(早→晚)、庫存張數(少→多)
-        df_contracts_sorted = df_contracts.sort_values(
-            by=['原利率', '成交日期', '庫存張數'], 
-            ascending=[False, True, True]
-        ).reset_index(drop=True)
-        
-        # 創建 df_exe 進行履約分配
-        df_exe = create_exercise_allocation(df_contracts_sorted, exercise_qty, settlement_date)
-        
-        # 檢查是否有庫存不足的情況
-        total_exercised = df_exe['此契約履約張數'].sum() if not df_exe.empty else 0
-        shortage = exercise_qty - total_exercised
-        if shortage > 0:
-            QMessageBox.warning(None, "注意", f"客戶可履約張數不足，缺少 {shortage} 張")
-        
+
+        # 智能排序：同客戶同CB內 原利率(高→低)、成交日期(早→晚)、庫存張數(少→多)，整批分配
+        df_exe = allocate_exercise(sort_exercise_contracts(df_contracts), df_requests)
+
         # 轉換為顯示格式
-        df_exe['客戶ID'] = cus_id
-        df_exe['CB代號'] = cb_code
         df_exe['履約張數'] = df_exe['此契約履約張數']
         df_exe['交易日期'] = datetime.now().strftime('%Y%m%d')
-        df_exe['交割日期'] = settlement_date.strftime('%Y%m%d')
+        df_exe['交割日期'] = df_requests['交割日期'].dt.strftime('%Y%m%d').to_numpy()[df_exe['請求序號'].to_numpy()]
         df_exe['賣出金額'] = (df_exe['履約價'] * df_exe['此契約履約張數'] * 1000).astype(int)
-        df_exe['履約後剩餘張數'] = df_exe['原庫存張數'] - df_exe['此契約履約張數']
-        df_exe = df_exe[['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '原單契約編號', '原利率', '交易日期', '交割日期', '成交日期', '履約價', '賣出金額', '原庫存張數', '今日賣出張數', '履約張數', '履約後剩餘張數', '解約類別', '履約方式']]
+        return df_exe[EXERCISE_RESULT_COLUMNS]
 
-        return df_exe
-        
     except Exception as e:
-        print(f"查詢履約契約時發生錯誤: {e}")
-        if 'conn' in locals():
-            conn.close()
-        return pd.DataFrame()
+        print(f"批次查詢履約契約時發生錯誤: {e}")
+        return pd.DataFrame(columns=EXERCISE_RESULT_COLUMNS)
 
 
-def create_exercise_allocation(df_contracts_sorted, exercise_qty, settlement_date):
-    """創建 df_exe 進行履約分配"""
-    df_exe = df_contracts_sorted.copy()
-    try:
-        tday = datetime.now().strftime('%Y%m%d')
-        df_had_sold = pd.read_excel(rf"\\10.72.228.83\CBAS_Logs\{tday}\AfterClose\ASCCSV02.csv")
-        df_exe = pd.merge(df_exe, df_had_sold, left_on='原單契約編號', right_on='PRDID', how='left')
-        df_exe['今日賣出張數'] = df_exe['DEUQTY']
-    except Exception as e:
-        print(f"讀取已賣出資料時發生錯誤: {e}")
-        df_exe['今日賣出張數'] = 0
-
-    # 添加履約相關欄位
-    df_exe['此契約履約張數'] = 0
-    df_exe['原庫存張數'] = df_exe['庫存張數'].copy()
-    df_exe['剩餘張數'] = df_exe['庫存張數'].copy() - df_exe['今日賣出張數']
-    df_exe['履約價'] = 0.0
-    df_exe['年期'] = 0.0
-    
-    remaining_qty = exercise_qty
-    today = datetime.now().strftime('%Y%m%d')
-    
-    for idx, row in df_exe.iterrows():
-        if remaining_qty <= 0:
-            break
-        
-        available_qty = int(row['庫存張數'])
-        exercise_this_contract = min(remaining_qty, available_qty)
-        
-        # 更新履約張數
-        df_exe.at[idx, '此契約履約張數'] = exercise_this_contract
-        remaining_contract_qty = available_qty - exercise_this_contract
-        df_exe.at[idx, '剩餘張數'] = remaining_contract_qty
-        df_exe.at[idx, '解約類別'] = '2' if remaining_contract_qty == 0 else '1'
-        df_exe.at[idx, '履約方式'] = '2'
-        
-        # 計算年期 = (賣回日 - 交割日) / 365
-        if pd.notna(row['賣回日']):
-            years = ((row['賣回日'] - settlement_date).days + 1)/ 365
-            df_exe.at[idx, '年期'] = max(years, 0)  # 確保年期不為負
-        else:
-            df_exe.at[idx, '年期'] = 0
-        
-        # 計算履約價 = round(賣回價 - (100 * 年期 * 原利率), 2)
-        exercise_price = round(
-            row['賣回價'] - (100 * df_exe.at[idx, '年期'] * row['原利率']/100), 2
-        )
-        df_exe.at[idx, '履約價'] = exercise_price
-        
-        remaining_qty -= exercise_this_contract
-        
-        print(f"契約{idx+1}: 原利率={row['原利率']:.4f}, 可用={available_qty}張, 履約={exercise_this_contract}張, 履約價={exercise_price:.2f}")
-    
-    if remaining_qty > 0:
-        print(f"⚠️  客戶可履約張數不足，缺少 {remaining_qty} 張")
+def exercise_shortage(requests, df_result: pd.DataFrame) -> pd.DataFrame:
+    """各 (客戶ID, CB代號) 需求張數與實際分配張數的差額，只回傳不足的組合（欄位：客戶ID、CB代號、缺少張數）"""
+    df_requests = _exercise_request_frame(requests)
+    requested = df_requests.groupby(EXERCISE_KEYS)['履約張數'].sum()
+    if df_result is None or df_result.empty:
+        allocated = pd.Series(0, index=requested.index)
     else:
-        print(f"✅ 履約分配完成！")
-    
-    # 只返回有履約的契約
-    df_exe_filtered = df_exe[df_exe['此契約履約張數'] > 0].reset_index(drop=True)
+        allocated = pd.to_numeric(df_result['履約張數'], errors='coerce').groupby(
+            [df_result['客戶ID'].astype(str), df_result['CB代號'].astype(str)]).sum()
+    shortage = (requested - allocated.reindex(requested.index).fillna(0)).astype(int)
+    return shortage[shortage > 0].rename('缺少張數').reset_index()
+
+
+def warn_exercise_shortage(parent, requests, result_data: pd.DataFrame):
+    """張數不足時提示（需在 GUI 執行緒呼叫）"""
+    shortage = exercise_shortage(requests, result_data)
+    if shortage.empty:
+        return
+    if len(requests) == 1:
+        QMessageBox.warning(parent, "注意", f"客戶可履約張數不足，缺少 {shortage['缺少張數'].iloc[0]} 張")
+        return
+    lines = [f"{row['客戶ID']} {row['CB代號']}：缺少 {row['缺少張數']} 張" for _, row in shortage.iterrows()]
+    QMessageBox.warning(parent, "注意", "以下客戶可履約張數不足：\n" + "\n".join(lines))
+
+
+def fetch_exercise_contracts(cus_id: str, cb_code: str, exercise_qty: int, settlement_date: datetime, df_quote: pd.DataFrame) -> pd.DataFrame:
+    """從資料庫獲取履約契約資訊並進行智能排序分配（單筆版的 fetch_exercise_contracts_batch）
 
-    return df_exe_filtered
+    會在背景執行緒執行，不顯示任何視窗；張數不足由呼叫端在 GUI 執行緒以 exercise_shortage 檢查後提示。
+    """
+    return fetch_exercise_contracts_batch([(cus_id, cb_code, exercise_qty, settlement_date)], df_quote)
 
 
 def update_exercise_result_table(table_exercise_result, df_result):
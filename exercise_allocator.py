@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from daily_snapshot import sold_qty_by_contract
+from pricing import exercise_price, YEAR_DAYS
+
+# 履約需求與契約的比對 key
+EXERCISE_KEYS = ['客戶ID', 'CB代號']
+EXERCISE_REQUEST_COLUMNS = ['客戶ID', 'CB代號', '履約張數', '交割日期']
+
+
+def sort_exercise_contracts(df_contracts: pd.DataFrame, date_col: str = '成交日期', keys=EXERCISE_KEYS) -> pd.DataFrame:
+    """依履約優先順序排序：同 key 內 原利率(高→低)、成交日期(早→晚)、庫存張數(少→多)"""
+    keys = list(keys)
+    return df_contracts.sort_values(
+        by=keys + ['原利率', date_col, '庫存張數'],
+        ascending=[True] * len(keys) + [False, True, True],
+        kind='stable',
+    ).reset_index(drop=True)
+
+
+def _today_sold(contract_ids: pd.Series) -> np.ndarray:
+    try:
+        return contract_ids.map(sold_qty_by_contract()).fillna(0).to_numpy(dtype=np.int64)
+    except Exception as e:
+        print(f"讀取已賣出資料時發生錯誤: {e}")
+        return np.zeros(len(contract_ids), dtype=np.int64)
+
+
+def _to_timestamp(value) -> pd.Timestamp:
+    if isinstance(value, str):
+        return pd.to_datetime(value, format='%Y%m%d')
+    return pd.Timestamp(value)
+
+
+def _key_columns(df: pd.DataFrame, keys) -> pd.DataFrame:
+    return pd.DataFrame({f"_k{i}": df[key].astype(str).str.strip() for i, key in enumerate(keys)}, index=df.index)
+
+
+def _cumsum_by_key(values: np.ndarray, key_frame: pd.DataFrame) -> np.ndarray:
+    """同 key 內依列順序累加（沒有 key 時整欄累加）"""
+    if key_frame.shape[1] == 0:
+        return np.cumsum(values)
+    by = [key_frame[c].to_numpy() for c in key_frame.columns]
+    return pd.Series(values).groupby(by, sort=False).cumsum().to_numpy()
+
+
+def allocate_exercise(df_contracts: pd.DataFrame, df_requests: pd.DataFrame, keys=EXERCISE_KEYS) -> pd.DataFrame:
+    """把履約張數依優先順序分配到契約（不依賴 Qt，可單獨測試），可一次處理多筆需求。
+
+    - df_contracts 已依履約優先順序排好（sort_exercise_contracts），同 key（客戶ID + CB代號）的契約依序被消耗。
+    - df_requests 每列一筆需求：keys、履約張數、交割日期（YYYYMMDD 或日期）；同 key 的多筆需求依列順序接續消耗同一批庫存。
+    - 可用張數 = 庫存張數 − 今日賣出張數（當日 ASCCSV02）。契約可用張數與需求張數各自分組累加，
+      每個 (需求, 契約) 分到的張數為兩段累加區間的交集，不需逐列迴圈。
+    - 年期 = max(賣回日 − 交割日 + 1, 0) / 365，履約價 = 賣回價 − 原利率 × 年期（定點數四捨五入到 2 位）；
+      分配後剩餘 0 張為全部解約（解約類別 2），否則為部分解約（1）。
+
+    回傳有分到張數的 (需求, 契約) 列，依需求、契約順序排列：契約原欄位 + 請求序號（df_requests 的列位置）、
+    今日賣出張數、此契約履約張數、原庫存張數、剩餘張數、履約後剩餘張數、年期、履約價、解約類別、履約方式。
+    剩餘張數與履約後剩餘張數都是累計到該需求為止（同一契約被多筆需求分用時，後面的列已扣掉前面需求的張數），
+    履約後剩餘張數 = 剩餘張數 + 今日賣出張數（帳上庫存）。
+    """
+    keys = list(keys)
+    df_exe = df_contracts.reset_index(drop=True).copy()
+    df_exe['今日賣出張數'] = _today_sold(df_exe['原單契約編號'])
+    df_exe['原庫存張數'] = df_exe['庫存張數'].copy()
+    stock = pd.to_numeric(df_exe['庫存張數'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    available = np.maximum(stock - df_exe['今日賣出張數'].to_numpy(), 0)
+
+    contracts = _key_columns(df_exe, keys)
+    contracts['_庫存迄'] = _cumsum_by_key(available, contracts)
+    contracts['_契約序'] = np.arange(len(df_exe))
+    contracts['_庫存起'] = contracts['_庫存迄'] - available
+
+    df_requests = df_requests.reset_index(drop=True)
+    requests = _key_columns(df_requests, keys)
+    qty = pd.to_numeric(df_requests['履約張數'], errors='coerce').fillna(0).clip(lower=0).to_numpy(dtype=np.int64)
+    requests['_需求迄'] = _cumsum_by_key(qty, requests)
+    requests['請求序號'] = np.arange(len(requests))
+    requests['_需求起'] = requests['_需求迄'] - qty
+    requests['_交割日'] = [_to_timestamp(v) for v in df_requests['交割日期']]
+
+    key_cols = list(contracts.columns[:len(keys)])
+    pairs = pd.merge(requests, contracts, on=key_cols) if key_cols else pd.merge(requests, contracts, how='cross')
+    end = np.minimum(pairs['_庫存迄'].to_numpy(), pairs['_需求迄'].to_numpy())
+    take = end - np.maximum(pairs['_庫存起'].to_numpy(), pairs['_需求起'].to_numpy())
+    pairs['此契約履約張數'] = take
+    pairs['剩餘張數'] = pairs['_庫存迄'].to_numpy() - end
+    pairs = pairs[take > 0].sort_values(['請求序號', '_契約序'])
+
+    df_alloc = df_exe.iloc[pairs['_契約序'].to_numpy()].reset_index(drop=True)
+    df_alloc.insert(0, '請求序號', pairs['請求序號'].to_numpy())
+    df_alloc['此契約履約張數'] = pairs['此契約履約張數'].to_numpy()
+    df_alloc['剩餘張數'] = pairs['剩餘張數'].to_numpy()
+    df_alloc['履約後剩餘張數'] = df_alloc['剩餘張數'] + df_alloc['今日賣出張數']
+    days = (pd.to_datetime(df_alloc['賣回日']) - pairs['_交割日'].reset_index(drop=True)).dt.days + 1
+    days = days.clip(lower=0).fillna(0).astype(np.int64)
+    df_alloc['年期'] = days / YEAR_DAYS
+    df_alloc['履約價'] = exercise_price(df_alloc['賣回價'], df_alloc['原利率'], days)
+    df_alloc['解約類別'] = np.where(df_alloc['剩餘張數'] == 0, '2', '1')
+    df_alloc['履約方式'] = '2'
+
+    shortage = qty - np.bincount(df_alloc['請求序號'], weights=df_alloc['此契約履約張數'], minlength=len(qty)).astype(np.int64)
+    for i in np.flatnonzero(shortage > 0):
+        label = ' '.join(str(df_requests[key].iloc[i]) for key in keys)
+        print(f"⚠️  {label} 客戶可履約張數不足，缺少 {shortage[i]} 張")
+    if not (shortage > 0).any():
+        print(f"✅ 履約分配完成！")
+    return df_alloc
+
+
+def create_exercise_allocation(df_contracts_sorted: pd.DataFrame, exercise_qty, settlement_date) -> pd.DataFrame:
+    """單一客戶、單一 CB 的履約分配（df_contracts_sorted 已依優先順序排好），只回傳有履約的契約"""
+    try:
+        df_request = pd.DataFrame({'履約張數': [exercise_qty], '交割日期': [settlement_date]})
+        return allocate_exercise(df_contracts_sorted, df_request, keys=[]).drop(columns='請求序號')
+    except Exception as e:
+        print(f"履約分配時發生錯誤: {e}")
+        return pd.DataFrame()
@@ -1,148 +1,182 @@
 import os
 from datetime import datetime
+from io import BytesIO
 from typing import Optional, List, Dict, Any, Tuple
 from db_access import get_clearing_detail
 import pandas as pd
 import numpy as np
 from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, Border, Side, PatternFill
+from openpyxl.styles import Alignment, Font, Border, Side, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.merge import MergedCellRange
 from openpyxl.drawing.image import Image as XLImage
 from openpyxl.drawing.spreadsheet_drawing import OneCellAnchor, AnchorMarker
 from openpyxl.utils.units import pixels_to_EMU
 from openpyxl.drawing.xdr import XDRPositiveSize2D
-import win32com.client
-from envs import trade_notice_dir
+from envs import trade_notice_dir, remote_files
+from pdf_renderer import convert_to_pdf
 
 
 KAI_FONT_NAME = "DFKai-SB"  # 標楷體
 WHITE_FILL = PatternFill("solid", fgColor="FFFFFF")
 LIGHT_BLUE_FILL = PatternFill("solid", fgColor="E6F2FF")
+_THIN_SIDE = Side(border_style="thin", color="000000")
+THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+_CENTER = Alignment(horizontal="center", vertical="center")
+
+NOTICE_COLUMNS = 14
+# 各欄寬度（B 欄放交割總額，直接使用加寬後的 18）
+NOTICE_COLUMN_WIDTHS = {
+    'A': 18, 'B': 18, 'C': 12, 'D': 14, 'E': 16, 'F': 14, 'G': 12,
+    'H': 18, 'I': 16, 'J': 18, 'K': 18,
+    'L': 18,  # L (加宽以容纳"交割總金額"等内容)
+    'M': 14, 'N': 18,
+}
+NOTICE_LOGO_PATH = remote_files['notice_logo']
+NOTICE_LOGO_SIZE = (int(598 * 0.9), int(61 * 0.9))
+NOTICE_LOGO_ROW_HEIGHT = 52
+
+# 交易通知用到的儲存格樣式：每個行程只建一次，每本活頁簿註冊成 NamedStyle 後整組套用
+_NOTICE_STYLE_SPECS = {
+    'notice_section': dict(font=Font(name=KAI_FONT_NAME, bold=True, size=14), fill=WHITE_FILL,
+                           alignment=Alignment(horizontal="left", vertical="center")),
+    'notice_header': dict(font=Font(name=KAI_FONT_NAME, bold=True, size=13), fill=LIGHT_BLUE_FILL,
+                          border=THIN_BORDER, alignment=_CENTER),
+    'notice_header_white': dict(font=Font(name=KAI_FONT_NAME, bold=True, size=13), fill=WHITE_FILL,
+                                border=THIN_BORDER, alignment=_CENTER),
+    'notice_cell': dict(font=Font(name=KAI_FONT_NAME, size=13), fill=WHITE_FILL, border=THIN_BORDER, alignment=_CENTER),
+    'notice_block': dict(font=Font(name=KAI_FONT_NAME, size=12), fill=WHITE_FILL,
+                         alignment=Alignment(wrap_text=True, horizontal="left", vertical="top")),
+}
+
+_logo_cache = {}
+
+
+def mask_customer_name(cus_name: str) -> str:
+    """客戶姓名遮蔽：保留第一個與最後一個字，中間以Ｏ取代"""
+    return cus_name[0] + 'Ｏ' + cus_name[-1]
+
+
+def trade_notice_file_name(tday_str: str, cus_name: str, email: str, ext: str = 'xlsx') -> str:
+    """交易通知檔名（產檔與寄信附件共用，確保兩邊路徑一致）"""
+    cus_email = email[:4] if email else ''
+    return f"{tday_str}_統一證券CBAS成交明細_{mask_customer_name(cus_name)}_{cus_email}.{ext}"
 
 
 def _set_col_widths(ws) -> None:
-    column_widths = {
-        1: 18,   # A
-        2: 12,   # B
-        3: 12,   # C
-        4: 14,   # D
-        5: 16,   # E
-        6: 14,   # F
-        7: 12,   # G
-        8: 18,   # H
-        9: 16,   # I
-        10: 18,  # J
-        11: 18,  # K
-        12: 18,  # L (加宽以容纳"交割總金額"等内容)
-        13: 14,  # M
-        14: 18,  # N
-    }
-    for col_idx, width in column_widths.items():
-        ws.column_dimensions[get_column_letter(col_idx)].width = width
-
-
-def _thin_border() -> Border:
-    thin = Side(border_style="thin", color="000000")
-    return Border(left=thin, right=thin, top=thin, bottom=thin)
+    for col_letter, width in NOTICE_COLUMN_WIDTHS.items():
+        dim = ws.column_dimensions[col_letter]
+        dim.width = width
+        # 欄位預設白底，取代逐格把空白儲存格塗白
+        dim.fill = WHITE_FILL
+
+
+def _text_style(font_size: int, bold: bool = False, alignment: str = "left") -> str:
+    """合併儲存格文字的樣式名稱（第一次用到時建立規格）"""
+    name = f"notice_text_{font_size}{'_bold' if bold else ''}_{alignment}"
+    if name not in _NOTICE_STYLE_SPECS:
+        _NOTICE_STYLE_SPECS[name] = dict(font=Font(name=KAI_FONT_NAME, size=font_size, bold=bold), fill=WHITE_FILL,
+                                         alignment=Alignment(horizontal=alignment, vertical="center", wrap_text=True))
+    return name
+
+
+def _apply_style(cell, name: str) -> None:
+    wb = cell.parent.parent
+    if name not in wb.named_styles:
+        wb.add_named_style(NamedStyle(name=name, **_NOTICE_STYLE_SPECS[name]))
+    cell.style = name
+
+
+def _merge(ws, start_row: int, start_column: int, end_row: int, end_column: int) -> None:
+    """合併儲存格；交易通知的合併區都沒有框線，直接登記範圍，省去 merge_cells 逐格複製框線的成本"""
+    ws.merged_cells.add(MergedCellRange(ws, f"{get_column_letter(start_column)}{start_row}:"
+                                            f"{get_column_letter(end_column)}{end_row}"))
 
 
 def _section_title(ws, row_idx: int, text: str) -> int:
-    ws.merge_cells(start_row=row_idx, start_column=1, end_row=row_idx, end_column=14)
-    cell = ws.cell(row=row_idx, column=1, value=text)
-    cell.font = Font(name=KAI_FONT_NAME, bold=True, size=14)
-    cell.alignment = Alignment(horizontal="left", vertical="center")
-    cell.fill = WHITE_FILL
+    _merge(ws, row_idx, 1, row_idx, NOTICE_COLUMNS)
+    _apply_style(ws.cell(row=row_idx, column=1, value=text), 'notice_section')
     return row_idx + 1
 
 
-def _write_table(ws, start_row: int, headers: List[str], rows: List[List[Any]], header_fill: PatternFill = WHITE_FILL) -> int:
-    border = _thin_border()
-
+def _write_table(ws, start_row: int, headers: List[str], rows: List[List[Any]], header_style: str = 'notice_header_white') -> int:
     # Header
     for col, header in enumerate(headers, start=1):
-        c = ws.cell(row=start_row, column=col, value=header)
-        c.font = Font(name=KAI_FONT_NAME, bold=True, size=13)
-        c.alignment = Alignment(horizontal="center", vertical="center")
-        c.border = border
-        c.fill = header_fill
+        _apply_style(ws.cell(row=start_row, column=col, value=header), header_style)
 
     # Rows
+    if rows:
+        _apply_style(ws.cell(row=start_row + 1, column=1), 'notice_cell')
     for r_offset, data_row in enumerate(rows, start=1):
         for c_offset, value in enumerate(data_row, start=1):
             v = None if (isinstance(value, str) and value == "") else value
-            if isinstance(v, float) and (np.isnan(v)):
-                v = None
-            c = ws.cell(row=start_row + r_offset, column=c_offset, value=v)
-            c.alignment = Alignment(horizontal="center", vertical="center")
-            c.border = border
-            c.font = Font(name=KAI_FONT_NAME, size=13)
-            c.fill = WHITE_FILL
+            ws.cell(row=start_row + r_offset, column=c_offset, value=v).style = 'notice_cell'
 
     return start_row + 1 + len(rows) + 1
 
 
 def _write_merged_cell(ws, row: int, col_start: int, col_end: int, value: str, font_size: int = 11, bold: bool = False, alignment: str = "left") -> None:
     """輔助函數：寫入合併儲存格"""
-    ws.merge_cells(start_row=row, start_column=col_start, end_row=row, end_column=col_end)
-    cell = ws.cell(row=row, column=col_start, value=value)
-    cell.font = Font(name=KAI_FONT_NAME, size=font_size, bold=bold)
-    cell.alignment = Alignment(horizontal=alignment, vertical="center", wrap_text=True)
-    cell.fill = WHITE_FILL
-
-
-def _convert_excel_to_pdf(excel_path: str, pdf_output_path: str) -> Optional[str]:
+    _merge(ws, row, col_start, row, col_end)
+    _apply_style(ws.cell(row=row, column=col_start, value=value), _text_style(font_size, bold, alignment))
+
+
+def _write_text_block(ws, row: int, height: int, text: str) -> None:
+    """寫入跨 height 列、整頁寬的說明文字"""
+    _merge(ws, row, 1, row + height - 1, NOTICE_COLUMNS)
+    _apply_style(ws.cell(row=row, column=1, value=text), 'notice_block')
+
+
+def _format_comma_column(values: np.ndarray) -> np.ndarray:
+    """整欄加千分位（四捨五入到整數）；空值維持 None，無法轉成數字的值保留原值"""
+    numbers = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+    valid = np.isfinite(numbers)
+    result = values.copy()
+    result[valid] = [f"{int(v):,}" for v in np.round(numbers[valid])]
+    return result
+
+
+def _table_rows(df: pd.DataFrame, headers: List[str], comma_columns=(), percent_columns=()) -> List[List[Any]]:
+    """表格資料逐欄格式化後轉成逐列的值：空值→None、指定欄位加千分位或 % 後綴"""
+    columns = []
+    for col in headers:
+        values = df[col].to_numpy(dtype=object).copy()
+        missing = pd.isna(values)
+        values[missing] = None
+        if col in comma_columns:
+            values = _format_comma_column(values)
+        elif col in percent_columns:
+            values[~missing] = [f"{v}%" for v in values[~missing]]
+        columns.append(values)
+    return [list(row) for row in zip(*columns)]
+
+
+def _clearing_amount(df_clearing_money: pd.DataFrame, day: str) -> int:
+    """某交割日的淨交割金額：權利金（付出）＋履約金額＋到期交割金額"""
+    return int(round(
+        -df_clearing_money.loc[df_clearing_money['SETDATE'] == day, 'PREMTOT'].sum() +
+        df_clearing_money.loc[df_clearing_money['SETDAT'] == day, 'Adj_MTHAMT'].sum() +
+        df_clearing_money.loc[df_clearing_money['DUEPAYDT'] == day, 'SETTTOT'].sum()
+    ))
+
+
+def _convert_excel_to_pdf(excel_path: str, pdf_output_path: str, workbook=None) -> Optional[str]:
     """
-    將Excel文件轉換為PDF
+    將Excel文件轉換為PDF（轉檔方式見 envs.pdf_backend）
     
     Args:
         excel_path: Excel文件的完整絕對路徑
         pdf_output_path: PDF輸出目錄的完整絕對路徑
+        workbook: 已組好的 openpyxl Workbook，原生轉檔時直接使用，不必重新讀檔
         
     Returns:
         PDF文件路徑，如果轉換失敗則返回None
     """
-    try:
-        # 從 excel_path 提取文件名，並改為 .pdf 副檔名
-        excel_filename = os.path.basename(excel_path)  # 例如: "filename.xlsx"
-        pdf_filename = os.path.splitext(excel_filename)[0] + '.pdf'  # 例如: "filename.pdf"
-        pdf_path = os.path.join(pdf_output_path, pdf_filename)
-        
-        # 使用絕對路徑
-        excel_path = os.path.abspath(excel_path)
-        pdf_path = os.path.abspath(pdf_path)
-        
-        # 創建Excel應用程序對象
-        excel = win32com.client.Dispatch("Excel.Application")
-        # 某些環境（例如受限權限/服務帳戶）不允許設置 Visible/DisplayAlerts
-        # 改為嘗試設置為整數（0/1），失敗則忽略
-        try:
-            excel.Visible = 0
-        except Exception:
-            pass
-        try:
-            excel.DisplayAlerts = 0
-        except Exception:
-            pass
-        
-        try:
-            # 打開工作簿
-            wb = excel.Workbooks.Open(excel_path)
-            
-            # 保存為PDF (0 = xlTypePDF)
-            wb.ExportAsFixedFormat(0, pdf_path)
-            
-            # 關閉工作簿
-            wb.Close(SaveChanges=False)
-            
-            return pdf_path
-            
-        finally:
-            # 確保Excel應用程序被關閉
-            excel.Quit()
-            
-    except Exception as e:
-        print(f"Excel轉PDF時發生錯誤: {e}")
-        return None
+    # 從 excel_path 提取文件名，並改為 .pdf 副檔名
+    excel_filename = os.path.basename(excel_path)  # 例如: "filename.xlsx"
+    pdf_filename = os.path.splitext(excel_filename)[0] + '.pdf'  # 例如: "filename.pdf"
+    pdf_path = os.path.join(pdf_output_path, pdf_filename)
+    return convert_to_pdf(excel_path, pdf_path, workbook=workbook)
 
 
 def _mask_account_number(account_num: str) -> str:
@@ -162,109 +196,69 @@ def _mask_account_number(account_num: str) -> str:
     return masked
 
 
-def _format_number_with_comma(value) -> str:
-    """
-    将数字格式化为千分位字符串
-    例如: 1234567 -> 1,234,567
+class _CachedImage(XLImage):
+    """以記憶體中的圖檔內容建立的圖片；存檔與轉 PDF 時都直接取用同一份內容（不會因存檔關掉來源而失效）"""
+
+    def __init__(self, content: bytes):
+        super().__init__(BytesIO(content))
+        self._content = content
+
+    def _data(self):
+        return self._content
+
+
+def _logo_layout(logo_path: str):
+    """讀取 Logo 並計算在 A:N 合併儲存格置中的錨點；每個行程只算一次
+
+    Returns:
+        (圖檔內容, 起始欄, 欄內偏移px, 列內偏移px)，圖檔不存在時回傳 None（下次再試）
     """
-    if pd.isna(value) or value is None:
+    if logo_path in _logo_cache:
+        return _logo_cache[logo_path]
+    if not os.path.exists(logo_path):
+        print(f"警告：Logo圖片路徑不存在: {logo_path}")
         return None
-    
-    try:
-        # 尝试转换为数字
-        num = float(value)
-        if np.isnan(num):
-            return None
-        # 转换为整数并格式化
-        return f"{int(round(num)):,}"
-    except (ValueError, TypeError):
-        return value
+    with open(logo_path, 'rb') as f:
+        content = f.read()
+
+    # Excel列寬單位轉換：1個單位約等於7像素（在96 DPI下）；列高1個單位約等於1.33像素
+    width_px, height_px = NOTICE_LOGO_SIZE
+    col_widths_px = [int(round(w * 7)) for w in NOTICE_COLUMN_WIDTHS.values()]
+    x_offset_px = max(0, (sum(col_widths_px) - width_px) // 2)
+    y_offset_px = max(0, (int(round(NOTICE_LOGO_ROW_HEIGHT * 1.33)) - height_px) // 2)
+
+    # 找到起始欄位（從A列開始累積寬度，找到x_offset_px落在哪一列）
+    accum = 0
+    start_col, col_off_px = 1, x_offset_px
+    for col_idx, cw_px in enumerate(col_widths_px, start=1):
+        if accum + cw_px >= x_offset_px:
+            start_col, col_off_px = col_idx, x_offset_px - accum
+            break
+        accum += cw_px
+
+    _logo_cache[logo_path] = (content, start_col, col_off_px, y_offset_px)
+    return _logo_cache[logo_path]
 
 
 def _add_logo(ws, logo_path: str, row: int = 1) -> None:
-    """輔助函數：添加Logo並置中"""
-    # 檢查圖片文件是否存在
-    if not os.path.exists(logo_path):
-        print(f"警告：Logo圖片路徑不存在: {logo_path}")
-        return
-    
+    """輔助函數：添加Logo並置中（第 row 列高度需為 NOTICE_LOGO_ROW_HEIGHT）"""
     try:
-        # 載入圖片
-        img = XLImage(logo_path)
-        scale = 0.9
-        img.width = int(598 * scale)
-        img.height = int(61 * scale)
-        
-        # 優先使用錨點方式實現置中
-        try:
-            # 計算合併儲存格A1:N1的總寬度（像素）
-            # Excel列寬單位轉換：1個單位約等於7像素（在96 DPI下）
-            total_width_px = 0
-            for i in range(1, 15):
-                col_letter = get_column_letter(i)
-                col_width = ws.column_dimensions[col_letter].width
-                if col_width is None:
-                    col_width = 8.43  # Excel默認列寬
-                total_width_px += int(round(col_width * 7))
-            
-            # 計算列高（像素）
-            # Excel行高單位轉換：1個單位約等於1.33像素（在96 DPI下）
-            row_height = ws.row_dimensions[row].height
-            if row_height is None:
-                row_height = 15  # Excel默認行高
-            row_height_px = int(round(row_height * 1.33))
-            
-            # 計算置中偏移（水平居中）
-            x_offset_px = max(0, (total_width_px - img.width) // 2)
-            # 計算置中偏移（垂直居中）
-            y_offset_px = max(0, (row_height_px - img.height) // 2)
-            
-            # 找到起始欄位（從A列開始累積寬度，找到x_offset_px落在哪一列）
-            accum = 0
-            start_col = 1
-            col_off_px = x_offset_px
-            for col_idx in range(1, 15):
-                col_letter = get_column_letter(col_idx)
-                w = ws.column_dimensions[col_letter].width or 8.43
-                cw_px = int(round(w * 7))
-                if accum + cw_px >= x_offset_px:
-                    start_col = col_idx
-                    col_off_px = x_offset_px - accum
-                    break
-                accum += cw_px
-            
-            # 建立置中錨點
-            anchor = OneCellAnchor(
-                _from=AnchorMarker(
-                    col=start_col - 1,
-                    colOff=pixels_to_EMU(col_off_px),
-                    row=row - 1,
-                    rowOff=pixels_to_EMU(y_offset_px),
-                ),
-                ext=XDRPositiveSize2D(pixels_to_EMU(img.width), pixels_to_EMU(img.height))
-            )
-            img.anchor = anchor
-            ws.add_image(img)
-            print(f"成功插入Logo圖片（錨點置中方式）")
+        layout = _logo_layout(logo_path)
+        if layout is None:
             return
-        except Exception as e2:
-            print(f"錨點置中方式失敗: {e2}，嘗試簡單方式...")
-            import traceback
-            traceback.print_exc()
-        
-        # 回退方式：簡單插入（可能無法完全置中）
-        try:
-            # 重新載入圖片
-            img = XLImage(logo_path)
-            img.width = int(598 * 0.9)
-            img.height = int(61 * 0.9)
-            ws.add_image(img, f"A{row}")
-            print(f"成功插入Logo圖片（簡單方式，可能未完全置中）")
-        except Exception as e3:
-            print(f"所有圖片插入方式都失敗: {e3}")
-            import traceback
-            traceback.print_exc()
-                
+        content, start_col, col_off_px, y_offset_px = layout
+        img = _CachedImage(content)
+        img.width, img.height = NOTICE_LOGO_SIZE
+        img.anchor = OneCellAnchor(
+            _from=AnchorMarker(
+                col=start_col - 1,
+                colOff=pixels_to_EMU(col_off_px),
+                row=row - 1,
+                rowOff=pixels_to_EMU(y_offset_px),
+            ),
+            ext=XDRPositiveSize2D(pixels_to_EMU(img.width), pixels_to_EMU(img.height))
+        )
+        ws.add_image(img)
     except Exception as e:
         print(f"插入Logo圖片時發生錯誤: {e}")
         import traceback
@@ -302,9 +296,9 @@ def generate_trade_notice_template(
 
         # === 頁首區域 ===
         # Logo
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=14)
-        ws.row_dimensions[1].height = 52
-        _add_logo(ws, r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\figs\unipsg.png", row=1)
+        _merge(ws, 1, 1, 1, NOTICE_COLUMNS)
+        ws.row_dimensions[1].height = NOTICE_LOGO_ROW_HEIGHT
+        _add_logo(ws, NOTICE_LOGO_PATH, row=1)
 
         # 公司名稱
         ws.row_dimensions[2].height = 24
@@ -333,24 +327,9 @@ def generate_trade_notice_template(
         if not df_buy.empty:
             headers_buy = ["新作契約編號", "交易日", "交割日", "CB代號", "CB名稱", "百元價", 
                           "履約利率", "選擇權到期日", "成交張數", "成交均價", "單位權利金", "權利金總額"]
-            df_buy = df_buy[headers_buy]
-            
             # 格式化数据，对"權利金"列添加千分位，对"履約利率"添加%
-            rows_data = []
-            for row_values in df_buy.values.tolist():
-                formatted_row = []
-                for i, v in enumerate(row_values):
-                    if isinstance(v, float) and np.isnan(v):
-                        formatted_row.append(None)
-                    elif headers_buy[i] == "權利金總額":
-                        formatted_row.append(_format_number_with_comma(v))
-                    elif headers_buy[i] == "履約利率":
-                        formatted_row.append(f"{v}%" if v is not None and not pd.isna(v) else v)
-                    else:
-                        formatted_row.append(v)
-                rows_data.append(formatted_row)
-            
-            row = _write_table(ws, row, headers_buy, rows_data, LIGHT_BLUE_FILL)
+            rows_data = _table_rows(df_buy, headers_buy, comma_columns=["權利金總額"], percent_columns=["履約利率"])
+            row = _write_table(ws, row, headers_buy, rows_data, 'notice_header')
         else:
             _write_merged_cell(ws, row, 1, 14, "無", 13)
             row += 2
@@ -359,8 +338,8 @@ def generate_trade_notice_template(
         row = _section_title(ws, row, "二、資產交換選擇權－提解")
         row += 1
 
-        df_sell = df_today_trade[df_today_trade['解約契約編號'].notna()]
-        df_sell['交割日_賣出'] = df_sell['交割日_賣出'].apply(lambda x: x.strftime('%Y%m%d') if not pd.isna(x) else "")
+        df_sell = df_today_trade[df_today_trade['解約契約編號'].notna()].copy()
+        df_sell['交割日_賣出'] = pd.to_datetime(df_sell['交割日_賣出']).dt.strftime('%Y%m%d').fillna("")
         if not df_sell.empty:
             headers_sell = ["解約契約編號", "交易日_賣出", "交割日_賣出", "CB代號", "CB名稱", "履約方式", 
                            "履約利率_賣出", "履約張數", "剩餘張數", "成交均價_賣出", "履約價", "交割金額", "履約損益", "原單契約編號"]
@@ -374,22 +353,8 @@ def generate_trade_notice_template(
             # 格式化数据，对"交割金額"列添加千分位，对"履約利率"添加%
             headers_sell = ["解約契約編號", "交易日", "交割日", "CB代號", "CB名稱", "履約方式", 
                            "履約利率", "履約張數", "剩餘張數", "成交均價", "履約價", "交割金額", "履約損益", "原單契約編號"]
-            #df_sell = df_sell[headers_sell]
-            rows_data = []
-            for row_values in df_sell.values.tolist():
-                formatted_row = []
-                for i, v in enumerate(row_values):
-                    if isinstance(v, float) and np.isnan(v):
-                        formatted_row.append(None)
-                    elif headers_sell[i] == "交割金額" or headers_sell[i] == "履約損益":
-                        formatted_row.append(_format_number_with_comma(v))
-                    elif headers_sell[i] == "履約利率":
-                        formatted_row.append(f"{v}%" if v is not None and not pd.isna(v) else v)
-                    else:
-                        formatted_row.append(v)
-                rows_data.append(formatted_row)
-            
-            row = _write_table(ws, row, headers_sell, rows_data, LIGHT_BLUE_FILL)
+            rows_data = _table_rows(df_sell, headers_sell, comma_columns=["交割金額", "履約損益"], percent_columns=["履約利率"])
+            row = _write_table(ws, row, headers_sell, rows_data, 'notice_header')
         else:
             _write_merged_cell(ws, row, 1, 14, "無", 13)
             row += 2
@@ -403,45 +368,14 @@ def generate_trade_notice_template(
             headers_bargain = ['單據編號', '成交日', '交割日', 'CB代號', 'CB名稱', '買/賣',	'議價價格',	'議價張數',	'議價金額']
             headers_used = [h for h in headers_bargain if h in df_today_bargain.columns]
             
-            # 格式化数据，对"議價價格"和"議價金額"列添加千分位
-            rows_data = []
-            for row_values in df_today_bargain[headers_used].values.tolist():
-                formatted_row = []
-                for i, v in enumerate(row_values):
-                    if isinstance(v, float) and np.isnan(v):
-                        formatted_row.append(None)
-                    elif headers_used[i] == "議價金額":
-                        formatted_row.append(_format_number_with_comma(v))
-                    else:
-                        formatted_row.append(v)
-                rows_data.append(formatted_row)
-            
-            row = _write_table(ws, row, headers_used, rows_data, LIGHT_BLUE_FILL)
+            # 格式化数据，对"議價金額"列添加千分位
+            rows_data = _table_rows(df_today_bargain, headers_used, comma_columns=["議價金額"])
+            row = _write_table(ws, row, headers_used, rows_data, 'notice_header')
         else:
             _write_merged_cell(ws, row, 1, 14, "無", 13)
             row += 2
         
         # === 交割資訊 ===
-        print(df_today_clearing_money)
-        # 计算三个日期的交割金额
-        tday_clearing_money = int(round(
-            -df_today_clearing_money[(df_today_clearing_money['SETDATE'] == tday_str)]['PREMTOT'].sum() + 
-            df_today_clearing_money[(df_today_clearing_money['SETDAT'] == tday_str)]['Adj_MTHAMT'].sum() +
-            df_today_clearing_money[(df_today_clearing_money['DUEPAYDT'] == tday_str)]['SETTTOT'].sum()
-        ))
-        
-        tday_plus_1_clearing_money = int(round(
-            -df_today_clearing_money[(df_today_clearing_money['SETDATE'] == tday_plus_1)]['PREMTOT'].sum() + 
-            df_today_clearing_money[(df_today_clearing_money['SETDAT'] == tday_plus_1)]['Adj_MTHAMT'].sum() +
-            df_today_clearing_money[(df_today_clearing_money['DUEPAYDT'] == tday_plus_1)]['SETTTOT'].sum()
-        ))
-        
-        tday_plus_2_clearing_money = int(round(
-            -df_today_clearing_money[(df_today_clearing_money['SETDATE'] == tday_plus_2)]['PREMTOT'].sum() + 
-            df_today_clearing_money[(df_today_clearing_money['SETDAT'] == tday_plus_2)]['Adj_MTHAMT'].sum() +
-            df_today_clearing_money[(df_today_clearing_money['DUEPAYDT'] == tday_plus_2)]['SETTTOT'].sum()
-        ))
-
         # 日期格式转换函数：20251002 -> 2025/10/02
         def format_date(date_str):
             if len(date_str) == 8:
@@ -450,37 +384,19 @@ def generate_trade_notice_template(
 
         row = _section_title(ws, row, "交割資訊如下")
         
-        # 构建交割资讯行（可能有1-3行）
+        # 构建交割资讯行（T日、T+1日、T+2日，金額為 0 的日期不列，可能有1-3行）
         settle_rows = []
-        
-        # T日
-        if tday_clearing_money != 0:
-            if tday_clearing_money > 0:
-                settle_rows.append([format_date(tday_str), f"{abs(tday_clearing_money):,}", "客戶收款", ""])
-            else:
-                payment_method = "自動扣款" if ifbankok == 'Y' else "客戶匯款"
-                settle_rows.append([format_date(tday_str), f"{abs(tday_clearing_money):,}", "客戶付款", payment_method])
-        
-        # T+1日
-        if tday_plus_1_clearing_money != 0:
-            if tday_plus_1_clearing_money > 0:
-                settle_rows.append([format_date(tday_plus_1), f"{abs(tday_plus_1_clearing_money):,}", "客戶收款", ""])
-            else:
-                payment_method = "自動扣款" if ifbankok == 'Y' else "客戶匯款"
-                settle_rows.append([format_date(tday_plus_1), f"{abs(tday_plus_1_clearing_money):,}", "客戶付款", payment_method])
-        
-        # T+2日
-        if tday_plus_2_clearing_money != 0:
-            if tday_plus_2_clearing_money > 0:
-                settle_rows.append([format_date(tday_plus_2), f"{abs(tday_plus_2_clearing_money):,}", "客戶收款", ""])
+        for settle_day in (tday_str, tday_plus_1, tday_plus_2):
+            clearing_money = _clearing_amount(df_today_clearing_money, settle_day)
+            if clearing_money == 0:
+                continue
+            if clearing_money > 0:
+                settle_rows.append([format_date(settle_day), f"{abs(clearing_money):,}", "客戶收款", ""])
             else:
                 payment_method = "自動扣款" if ifbankok == 'Y' else "客戶匯款"
-                settle_rows.append([format_date(tday_plus_2), f"{abs(tday_plus_2_clearing_money):,}", "客戶付款", payment_method])
+                settle_rows.append([format_date(settle_day), f"{abs(clearing_money):,}", "客戶付款", payment_method])
         
-        row = _write_table(ws, row, ["交割日期", "交割總額", "收付", "交割方式"], settle_rows, LIGHT_BLUE_FILL)
-        
-        # 加大"交割總額"列的寬度（B列，第2列）
-        ws.column_dimensions['B'].width = 18
+        row = _write_table(ws, row, ["交割日期", "交割總額", "收付", "交割方式"], settle_rows, 'notice_header')
 
         # 建立交割資訊DataFrame（包含客戶ID和客戶名稱）
         df_clearing_money_consolidate = pd.DataFrame(settle_rows, columns=["交割日期", "交割總額", "收付", "交割方式"])
@@ -500,11 +416,7 @@ def generate_trade_notice_template(
             "自行匯款到統一證券交割銀行。\n"
             "交割方式為『匯款』者，請於交割日前一個營業日上午 10:00 前，使用客戶戶交易銀行自行匯款到統一證券交割銀行。\n\n"
         )
-        ws.merge_cells(start_row=row, start_column=1, end_row=row + 3, end_column=14)
-        cell = ws.cell(row=row, column=1, value=notes)
-        cell.alignment = Alignment(wrap_text=True, horizontal="left", vertical="top")
-        cell.font = Font(name=KAI_FONT_NAME, size=12)
-        cell.fill = WHITE_FILL
+        _write_text_block(ws, row, 4, notes)
         row += 2
         
         # 空白行
@@ -519,11 +431,7 @@ def generate_trade_notice_template(
             "交割集保帳號： 統一綜合證券\n"
             "               585T8888881\n\n"
         )
-        ws.merge_cells(start_row=row, start_column=1, end_row=row + 7, end_column=14)
-        cell = ws.cell(row=row, column=1, value=psc_info)
-        cell.alignment = Alignment(wrap_text=True, horizontal="left", vertical="top")
-        cell.font = Font(name=KAI_FONT_NAME, size=12)
-        cell.fill = WHITE_FILL
+        _write_text_block(ws, row, 8, psc_info)
         row += 8
 
         # 客戶交割資訊
@@ -545,11 +453,7 @@ def generate_trade_notice_template(
             except Exception as e:
                 print(f"客戶交割資訊錯誤: {e}")
         
-        ws.merge_cells(start_row=row, start_column=1, end_row=row + 7, end_column=14)
-        cell = ws.cell(row=row, column=1, value=cus_info_text)
-        cell.alignment = Alignment(wrap_text=True, horizontal="left", vertical="top")
-        cell.font = Font(name=KAI_FONT_NAME, size=12)
-        cell.fill = WHITE_FILL
+        _write_text_block(ws, row, 8, cus_info_text)
         row += 8
 
         # === Footer ===
@@ -561,24 +465,10 @@ def generate_trade_notice_template(
             "Line ID：@psc.cbas\n"
             "統一綜合證券祝您投資順利！"
         )
-        ws.merge_cells(start_row=footer_row, start_column=1, end_row=footer_row, end_column=14)
-        cell = ws.cell(row=footer_row, column=1, value=footer)
-        cell.font = Font(name=KAI_FONT_NAME, size=12)
-        cell.alignment = Alignment(wrap_text=True, horizontal="left", vertical="center")
-        cell.fill = WHITE_FILL
+        _write_merged_cell(ws, footer_row, 1, 14, footer, 12)
         ws.row_dimensions[footer_row].height = 80
+        # 全頁白色背景由欄位預設樣式（_set_col_widths）與各儲存格樣式提供，淺藍表頭保留
 
-        # === 全頁白色背景（保留淺藍表頭）===
-        for r in range(1, ws.max_row + 1):
-            for c in range(1, 15):
-                cell = ws.cell(row=r, column=c)
-                if cell.fill and getattr(cell.fill, 'fgColor', None):
-                    if cell.fill.fgColor.rgb in (LIGHT_BLUE_FILL.fgColor.rgb, 'E6F2FF'):
-                        continue
-                cell.fill = WHITE_FILL
-
-        yyyymmdd = datetime.today().strftime('%Y%m%d')
-        
         # 正確處理客戶姓名
         if isinstance(cus_info, pd.DataFrame) and not cus_info.empty:
             cusname_full = cus_info.iloc[0].get('CUSNAME', '')
@@ -587,13 +477,8 @@ def generate_trade_notice_template(
             cusname_full = ''
             cusemail_full = ''
         
-        # 姓名遮蔽處理
-
-        cusName = cusname_full[0] + 'Ｏ' + cusname_full[-1]
-
-        
-        cusEmail = cusemail_full[:4] if cusemail_full else ''
-        fileName = f"{yyyymmdd}_統一證券CBAS成交明細_{cusName}_{cusEmail}.xlsx"
+        # 姓名遮蔽處理（檔名以交易日 tday_str 命名，重跑同一天會得到相同路徑）
+        fileName = trade_notice_file_name(tday_str, cusname_full, cusemail_full)
         
         # 建立目錄路徑
         excel_dir = os.path.join(trade_notice_dir, tday_str, 'Excel')
@@ -605,7 +490,7 @@ def generate_trade_notice_template(
         wb.save(excel_output_path)
         
         # 轉換為PDF
-        pdf_file_path = _convert_excel_to_pdf(excel_output_path, pdf_dir)
+        pdf_file_path = _convert_excel_to_pdf(excel_output_path, pdf_dir, workbook=wb)
         
         return excel_output_path, pdf_file_path, df_clearing_money_consolidate
         
@@ -1,57 +1,166 @@
 import pandas as pd
 import os
-from format_utils import strip_trailing_zeros
+import threading
+from openpyxl import load_workbook
+from format_utils import strip_trailing_zeros_column
 from db_access import get_cbas_customers
+from envs import remote_files
+from remote_cache import cached_path, get_remote_cache, remote_path
+from daily_snapshot import load_asccsv02, load_buy_match, sold_qty_by_contract
+from csv_loader import load_csv, VIP_LIST_SCHEMA, VIP_QUOTE_SCHEMA, CUSTOMER_LIST_SCHEMA, PENALTY_SETTINGS_SCHEMA
+
+
+QUOTE_FILE_PATH = remote_files['quote']
+QUOTE_COLUMNS = ['CB代號', 'CB名稱', '選擇權到期日', '賣回日', '賣回價', '百元報價', '履約利率', '低百元報價', '低履約利率', '波動度']
+QUOTE_NUMERIC_COLUMNS = ['賣回價', '百元報價', '履約利率', '低百元報價', '低履約利率', '波動度']
+
+
+def _format_date_to_yyyymmdd(date_val):
+    """處理日期格式：轉換為YYYYMMDD格式"""
+    try:
+        if pd.isna(date_val):
+            return ''
+        if isinstance(date_val, str):
+            # 如果已經是字符串，嘗試解析
+            if len(date_val) == 8 and date_val.isdigit():
+                return date_val  # 已經是YYYYMMDD格式
+            date_val = pd.to_datetime(date_val)
+        elif isinstance(date_val, (int, float)):
+            # 如果是數字，可能是Excel的序列日期
+            date_val = pd.to_datetime(date_val, origin='1899-12-30', unit='D')
+        else:
+            # 其他情況，直接轉換
+            date_val = pd.to_datetime(date_val)
+
+        # 轉換為YYYYMMDD格式
+        return date_val.strftime('%Y%m%d')
+    except:
+        return str(date_val) if not pd.isna(date_val) else ''
+
+
+def _sheet_to_frame(rows, header_row: int, max_col: int = None) -> pd.DataFrame:
+    """把 openpyxl 的 values_only 列轉成 DataFrame（對應 pd.read_excel 的 header / usecols，去掉尾端空白列）"""
+    header = None
+    data = []
+    for i, row in enumerate(rows):
+        if max_col is not None:
+            row = row[:max_col]
+        if i < header_row:
+            continue
+        if i == header_row:
+            header = [f'Unnamed: {j}' if v is None else v for j, v in enumerate(row)]
+            continue
+        data.append(list(row) + [None] * (len(header) - len(row)))
+    if header is None:
+        return pd.DataFrame()
+    while data and all(v is None or v == '' for v in data[-1]):
+        data.pop()
+    # 重複欄名只保留第一個（pd.read_excel 會把後面的改名為 X.1）
+    df = pd.DataFrame(data, columns=header)
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+def _parse_quote_sheet(df_quote: pd.DataFrame) -> pd.DataFrame:
+    df_quote = df_quote[QUOTE_COLUMNS].copy()
+    # pd.read_excel 會把可轉為數字的欄位推斷為數值型別，這裡比照處理
+    for col in QUOTE_NUMERIC_COLUMNS:
+        try:
+            df_quote[col] = pd.to_numeric(df_quote[col])
+        except (ValueError, TypeError):
+            pass
+
+    # 過濾掉"元富專用報價"以下的資料
+    if not df_quote[df_quote['CB名稱'] == '元富專用報價'].empty:
+        cutoff_idx = df_quote[df_quote['CB名稱'] == '元富專用報價'].index[0]
+        df_quote = df_quote.iloc[:cutoff_idx].reset_index(drop=True)
+    df_quote = df_quote.dropna().reset_index(drop=True)
+
+    df_quote['選擇權到期日'] = df_quote['選擇權到期日'].apply(_format_date_to_yyyymmdd)
+    df_quote['賣回日'] = df_quote['賣回日'].apply(_format_date_to_yyyymmdd)
+
+    # 將履約利率乘以100並保留兩位小數
+    df_quote['履約利率'] = df_quote['履約利率'].apply(lambda x: round(float(x)*100, 2))
+    df_quote['低履約利率'] = df_quote['低履約利率'].apply(lambda x: round(float(x)*100, 2))
+
+    numeric_columns = ['百元報價', '低百元報價', '波動度']  # 移除已處理的利率欄位
+    for col in numeric_columns:
+        df_quote[col] = df_quote[col].round(2)
+
+    df_quote['CB代號'] = strip_trailing_zeros_column(df_quote['CB代號']).astype(str)
+
+    # 去除完全重複的記錄，保留第一筆
+    df_quote = df_quote.drop_duplicates(keep='first')
+    return df_quote
+
+
+class QuoteStore:
+    """報價表快取：一次 openpyxl read-only 讀取 'aso報價' 與 '彙整CB基本資料' 兩個工作表，
+    以檔案的 mtime/size 作為快取鍵，檔案沒變動就直接回傳已解析的結果。
+    """
+
+    def __init__(self, file_path: str = QUOTE_FILE_PATH):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._df_quote = None
+        self._df_cbinfo = None
+
+    def signature(self):
+        st = os.stat(self.file_path)
+        return (st.st_mtime_ns, st.st_size)
+
+    @property
+    def cached_signature(self):
+        """目前快取資料對應的檔案簽章（尚未載入則為 None）"""
+        return self._signature
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = None
+
+    def _parse(self):
+        # get() 已依遠端簽章判定檔案有變動，本機副本一定要重新比對，不能用 REMOTE_STAT_TTL 內的舊副本
+        wb = load_workbook(cached_path(self.file_path, revalidate=True), read_only=True, data_only=True, keep_links=False)
+        try:
+            df_quote = _parse_quote_sheet(
+                _sheet_to_frame(wb['aso報價'].iter_rows(values_only=True), header_row=2, max_col=35)  # usecols='A:AI'
+            )
+            df_cbinfo = _sheet_to_frame(wb['彙整CB基本資料'].iter_rows(values_only=True), header_row=4)
+        finally:
+            wb.close()
+        df_cbinfo = df_cbinfo[['CB代號', 'CB名稱']].copy()
+        df_cbinfo['CB代號'] = strip_trailing_zeros_column(df_cbinfo['CB代號']).astype(str)
+        return df_quote, df_cbinfo
+
+    def get(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """回傳 (df_quote, df_cbinfo)；檔案有變動才重新解析。回傳副本，呼叫端可自由修改"""
+        with self._lock:
+            signature = self.signature()
+            if signature != self._signature:
+                self._df_quote, self._df_cbinfo = self._parse()
+                # 解析期間檔案被覆寫時以解析前的簽章為準，下次呼叫會再重讀
+                self._signature = signature
+            return self._df_quote.copy(), self._df_cbinfo.copy()
+
+
+_quote_stores = {}
+_quote_stores_lock = threading.Lock()
+
+
+def get_quote_store(file_path: str = None) -> QuoteStore:
+    """取得指定報價表路徑共用的 QuoteStore"""
+    file_path = QUOTE_FILE_PATH if file_path is None else file_path
+    with _quote_stores_lock:
+        if file_path not in _quote_stores:
+            _quote_stores[file_path] = QuoteStore(file_path)
+        return _quote_stores[file_path]
 
 
 def read_quote_excel(file_path: str = None) -> pd.DataFrame:
     """讀取CBAS報價表Excel檔案"""
-    if file_path is None:
-        file_path = r"\\10.72.228.112\cbas業務公用區\統一證CBAS報價表_內部.xlsm"
-    
     try:
-        df_quote = pd.read_excel(file_path, sheet_name='aso報價', header=[2], usecols='A:AI')
-        df_quote = df_quote[['CB代號', 'CB名稱', '選擇權到期日', '賣回日', '賣回價', '百元報價', '履約利率', '低百元報價', '低履約利率', '波動度']]
-
-        # 過濾掉"元富專用報價"以下的資料
-        if not df_quote[df_quote['CB名稱'] == '元富專用報價'].empty:
-            cutoff_idx = df_quote[df_quote['CB名稱'] == '元富專用報價'].index[0]
-            df_quote = df_quote.iloc[:cutoff_idx].reset_index(drop=True)
-        df_quote = df_quote.dropna().reset_index(drop=True)
-
-        # 處理日期格式：轉換為YYYYMMDD格式
-        def format_date_to_yyyymmdd(date_val):
-            try:
-                if pd.isna(date_val):
-                    return ''
-                if isinstance(date_val, str):
-                    if len(date_val) == 8 and date_val.isdigit():
-                        return date_val  # 已經是YYYYMMDD格式
-                    date_val = pd.to_datetime(date_val)
-                elif isinstance(date_val, (int, float)):
-                    date_val = pd.to_datetime(date_val, origin='1899-12-30', unit='D')
-                else:
-                    date_val = pd.to_datetime(date_val)
-                return date_val.strftime('%Y%m%d')
-            except:
-                return str(date_val) if not pd.isna(date_val) else ''
-
-        df_quote['選擇權到期日'] = df_quote['選擇權到期日'].apply(format_date_to_yyyymmdd)
-        df_quote['賣回日'] = df_quote['賣回日'].apply(format_date_to_yyyymmdd)
-
-        # 將履約利率乘以100並保留兩位小數
-        df_quote['履約利率'] = df_quote['履約利率'].apply(lambda x: round(float(x)*100, 2))
-        df_quote['低履約利率'] = df_quote['低履約利率'].apply(lambda x: round(float(x)*100, 2))
-
-        numeric_columns = ['百元報價', '低百元報價', '波動度']
-        for col in numeric_columns:
-            df_quote[col] = df_quote[col].round(2)
-
-        df_quote['CB代號'] = df_quote['CB代號'].apply(strip_trailing_zeros).astype(str)
-
-        # 去除完全重複的記錄，保留第一筆
-        df_quote = df_quote.drop_duplicates(keep='first')
-        
+        df_quote, _ = get_quote_store(file_path).get()
+
         # 檢查重複的CB代號
         duplicate_cb = df_quote[df_quote.duplicated(subset=['CB代號'], keep=False)]
         if not duplicate_cb.empty:
@@ -62,67 +171,34 @@ def read_quote_excel(file_path: str = None) -> pd.DataFrame:
         return df_quote
     except Exception as e:
         print(f"讀取報價表時發生錯誤: {e}")
-        return pd.DataFrame(columns=['CB代號', 'CB名稱', '選擇權到期日', '賣回日', '賣回價', '百元報價', '履約利率', '低百元報價', '低履約利率', '波動度'])
+        return pd.DataFrame(columns=QUOTE_COLUMNS)
 
 def read_vip_list(file_path: str = None) -> pd.DataFrame:
     """讀取VIP名單CSV檔案"""
     if file_path is None:
-        file_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_List.csv"
+        file_path = remote_path('vip_list')
 
     try:
-        # 嘗試多種編碼讀取
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_vip_list = pd.read_csv(file_path, encoding=encoding)
-                if '80元手續費' not in df_vip_list.columns:
-                    df_vip_list['80元手續費'] = ''
-                return df_vip_list
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-
-        print(f"無法讀取 {file_path}，將創建空的 VIP 名單")
-        return pd.DataFrame(columns=['客戶ID', '客戶名稱', '不限張數低手續費', '不限張數低利率', '80元手續費'])
+        return load_csv(cached_path(file_path), VIP_LIST_SCHEMA)
     except Exception as e:
         print(f"讀取VIP名單時發生錯誤: {e}")
-        return pd.DataFrame(columns=['客戶ID', '客戶名稱', '不限張數低手續費', '不限張數低利率', '80元手續費'])
-
-VIP_QUOTE_COLUMNS = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '利率%', '手續費', '張數', '短約', '備註']
+        return VIP_LIST_SCHEMA.empty()
 
 def read_vip_quote(file_path: str = None) -> pd.DataFrame:
     """讀取VIP特殊報價CSV檔案"""
     if file_path is None:
-        file_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_Quote.csv"
-
-    def _ensure_columns(df):
-        if '張數' not in df.columns:
-            df['張數'] = ''
-        if '短約' not in df.columns:
-            df['短約'] = 'N'
-        else:
-            df['短約'] = df['短約'].fillna('N').astype(str).replace({'': 'N', 'nan': 'N'})
-        if '備註' not in df.columns:
-            df['備註'] = ''
-        return df[VIP_QUOTE_COLUMNS]
+        file_path = remote_path('vip_quote')
 
     try:
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_vip_quote = pd.read_csv(file_path, encoding=encoding, dtype=str)
-                return _ensure_columns(df_vip_quote)
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-
-        print(f"無法讀取 {file_path}，將創建空的 VIP 報價")
-        return pd.DataFrame(columns=VIP_QUOTE_COLUMNS)
+        return load_csv(cached_path(file_path), VIP_QUOTE_SCHEMA)
     except Exception as e:
         print(f"讀取VIP報價時發生錯誤: {e}")
-        return pd.DataFrame(columns=VIP_QUOTE_COLUMNS)
+        return VIP_QUOTE_SCHEMA.empty()
 
 def read_today_trade_buy(tday, settle_date, csv_path: str = None) -> pd.DataFrame:
         tdaystr = tday.strftime('%Y%m%d')
-        csv_path_buy = rf"\\10.72.228.83\CBAS_Logs\{tdaystr}\AfterClose\BuyMatch.csv"
-        #csv_path_buy = r"\\10.72.228.83\CBAS_Logs\20250909\AfterClose\BuyMatch.csv"
-        df_csv_buy = pd.read_csv(csv_path_buy, encoding='utf-8-sig')  # 使用 utf-8-sig 以支援 BOM
+        df_csv_buy = load_buy_match(tdaystr)  # CBCODE 已 strip_trailing_zeros
+        #df_csv_buy = load_buy_match('20250909')
         
         df_csv_buy_groupby = df_csv_buy.groupby(['CUSID', 'CBCODE', 'SRC'], dropna=False).agg({
             'MATCHQTY': 'sum',
@@ -133,7 +209,6 @@ def read_today_trade_buy(tday, settle_date, csv_path: str = None) -> pd.DataFram
         df_cusname = get_cbas_customers()
         
         df_buy = df_csv_buy_groupby.merge(df_cusname, left_on='CUSID', right_on='CUSID', how='left', suffixes=('', '_name'))
-        df_buy['CBCODE'] = df_buy['CBCODE'].apply(lambda x: strip_trailing_zeros(x)).astype(str)
         df_buy['成交張數'] = (df_buy['MATCHQTY'] / 1000).astype(int)
         df_buy['成交均價'] = df_buy['MATCHAMT'] / df_buy['MATCHQTY']
         df_buy = df_buy.rename(columns={
@@ -151,16 +226,8 @@ def read_today_trade_buy(tday, settle_date, csv_path: str = None) -> pd.DataFram
 
 def read_today_trade_sell(tday, settle_date, csv_path: str = None) -> pd.DataFrame:
         tdaystr = tday.strftime('%Y%m%d')
-        csv_path_sell = rf"\\10.72.228.83\CBAS_Logs\{tdaystr}\AfterClose\ASCCSV02.csv"
-        #csv_path_sell = r"\\10.72.228.83\CBAS_Logs\20250909\AfterClose\ASCCSV02.csv"
-        df_csv_sell = pd.read_csv(csv_path_sell, encoding='utf-8-sig')  # 使用 utf-8-sig 以支援 BOM
-        
-        # 你指定的欄位名稱（不含解約契約編號）
-        user_columns_sell = [
-            '原單契約編號', '客戶ID', 'CB代號', '交易日期', '交割日期', '解約類別', '履約方式',
-            '履約張數', '成交均價', '履約利率', '賣回日', '賣回價', '選擇權到期日', '提前履約賠償金', '履約價', '選擇權交割單價', '交割總金額', '錄音時間'
-        ]
-        df_csv_sell.columns = user_columns_sell  # 只改欄位名稱，不動內容
+        df_csv_sell = load_asccsv02(tdaystr)  # 欄位名稱為 ASCCSV02_COLUMNS（不含解約契約編號）
+        #df_csv_sell = load_asccsv02('20250909')
         df_csv_sell['來自'] = '盤面交易'
 
         return df_csv_sell
@@ -168,90 +235,29 @@ def read_today_trade_sell(tday, settle_date, csv_path: str = None) -> pd.DataFra
 def read_customer_list(file_path: str = None) -> pd.DataFrame:
     """讀取客戶清單CSV檔案"""
     if file_path is None:
-        file_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Customer_List.csv"
+        file_path = remote_path('customer_list')
 
     try:
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_customer = pd.read_csv(file_path, encoding=encoding)
-                return df_customer
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-
-        print(f"無法讀取 {file_path}，將創建空的客戶清單")
-        return pd.DataFrame(columns=['客戶ID', '客戶名稱'])
+        return load_csv(cached_path(file_path), CUSTOMER_LIST_SCHEMA)
     except Exception as e:
         print(f"讀取客戶清單時發生錯誤: {e}")
-        return pd.DataFrame(columns=['客戶ID', '客戶名稱'])
-
-PENALTY_SETTINGS_COLUMNS = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '賠償金張數', '提前履約賠償金', '備註']
+        return CUSTOMER_LIST_SCHEMA.empty()
 
 def read_penalty_settings(file_path: str = None) -> pd.DataFrame:
     """讀取罰金設定CSV檔案"""
     if file_path is None:
-        file_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Penalty_Settings.csv"
+        file_path = remote_path('penalty_settings')
 
     try:
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_penalty = pd.read_csv(file_path, encoding=encoding, dtype=str)
-                for col in PENALTY_SETTINGS_COLUMNS:
-                    if col not in df_penalty.columns:
-                        df_penalty[col] = ''
-                return df_penalty[PENALTY_SETTINGS_COLUMNS]
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-
-        print(f"無法讀取 {file_path}，將創建空的罰金設定")
-        return pd.DataFrame(columns=PENALTY_SETTINGS_COLUMNS)
+        return load_csv(cached_path(file_path), PENALTY_SETTINGS_SCHEMA)
     except Exception as e:
         print(f"讀取罰金設定時發生錯誤: {e}")
-        return pd.DataFrame(columns=PENALTY_SETTINGS_COLUMNS)
+        return PENALTY_SETTINGS_SCHEMA.empty()
 
 def load_vip_data() -> tuple[pd.DataFrame, pd.DataFrame]:
     """讀取VIP資料並返回兩個DataFrame"""
-    vip_list_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_List.csv"
-    vip_quote_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_Quote.csv"
-    
-    # 嘗試多種編碼讀取 VIP_List.csv
-    df_vip_list = None
-    for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-        try:
-            df_vip_list = pd.read_csv(vip_list_path, encoding=encoding)
-            break
-        except (UnicodeDecodeError, FileNotFoundError):
-            continue
-    
-    # 嘗試多種編碼讀取 VIP_Quote.csv
-    df_vip_quote = None
-    for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-        try:
-            df_vip_quote = pd.read_csv(vip_quote_path, encoding=encoding, dtype=str)
-            break
-        except (UnicodeDecodeError, FileNotFoundError):
-            continue
-
-    # 如果檔案不存在，創建空的 DataFrame
-    if df_vip_list is None:
-        print(f"無法讀取 {vip_list_path}，將創建空的 VIP 名單")
-        df_vip_list = pd.DataFrame(columns=['客戶ID', '客戶名稱', '不限張數低手續費', '不限張數低利率', '80元手續費'])
-    elif '80元手續費' not in df_vip_list.columns:
-        df_vip_list['80元手續費'] = ''
-
-    if df_vip_quote is None:
-        print(f"無法讀取 {vip_quote_path}，將創建空的 VIP 報價")
-        df_vip_quote = pd.DataFrame(columns=VIP_QUOTE_COLUMNS)
-    else:
-        if '張數' not in df_vip_quote.columns:
-            df_vip_quote['張數'] = ''
-        if '短約' not in df_vip_quote.columns:
-            df_vip_quote['短約'] = 'N'
-        else:
-            df_vip_quote['短約'] = df_vip_quote['短約'].fillna('N').astype(str).replace({'': 'N', 'nan': 'N'})
-        if '備註' not in df_vip_quote.columns:
-            df_vip_quote['備註'] = ''
-        df_vip_quote = df_vip_quote[VIP_QUOTE_COLUMNS]
-
+    df_vip_list = load_csv(cached_path(remote_path('vip_list')), VIP_LIST_SCHEMA)
+    df_vip_quote = load_csv(cached_path(remote_path('vip_quote')), VIP_QUOTE_SCHEMA)
     return df_vip_list, df_vip_quote
 
 def get_daily_bond_rate() -> str:
@@ -282,19 +288,10 @@ def read_expired_trade_data():
     from datetime import datetime
     try:
         tdaystr = datetime.now().strftime('%Y%m%d')
-        csv_path_sell = rf"\\10.72.228.83\CBAS_Logs\{tdaystr}\AfterClose\ASCCSV02.csv"
-        df_sell = pd.read_csv(csv_path_sell, encoding='utf-8-sig')
-
-        user_columns_sell = [
-            '原單契約編號', '客戶ID', 'CB代號', '交易日期', '交割日期', '解約類別', '履約方式',
-            '履約張數', '成交均價', '履約利率', '賣回日', '賣回價', '選擇權到期日', '提前履約賠償金', '履約價', '選擇權交割單價', '交割總金額', '錄音時間'
-        ]
-        df_sell.columns = user_columns_sell  # 只改欄位名稱，不動內容
-        #df_sell['選擇權到期日'] = df_sell['選擇權到期日'].astype(str)
-
-        # 篩選指定日期到期的交易，並按原單契約編號統計已賣出張數
-        #df_sell_today = df_sell[df_sell['選擇權到期日'] == target_date]
-        df_sell_summary = df_sell.groupby('原單契約編號').agg({'履約張數': 'sum'}).reset_index()
+        csv_path_sell = remote_path('asccsv02', tday=tdaystr)
+
+        # 按原單契約編號統計已賣出張數
+        df_sell_summary = sold_qty_by_contract(tdaystr).reset_index()
         df_sell_summary.rename(columns={'履約張數': '今日賣出張數_ASCCSV02'}, inplace=True)
 
         return df_sell_summary
@@ -312,65 +309,17 @@ def read_expired_trade_data():
         return df_sell_summary
     
 def load_quote(): #讀取報價表
-        #df_cbinfo = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\統一證CBAS報價表_內部.xlsm', sheet_name='彙整CB基本資料', header=[4])
-        df_quote = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\統一證CBAS報價表_內部.xlsm', sheet_name='aso報價', header=[2], usecols='A:AI')
-        df_quote = df_quote[['CB代號', 'CB名稱', '選擇權到期日', '賣回日', '賣回價', '百元報價', '履約利率', '低百元報價', '低履約利率', '波動度']]
-
-        # 過濾掉"元富專用報價"以下的資料
-        if not df_quote[df_quote['CB名稱'] == '元富專用報價'].empty:
-            cutoff_idx = df_quote[df_quote['CB名稱'] == '元富專用報價'].index[0]
-            df_quote = df_quote.iloc[:cutoff_idx].reset_index(drop=True)
-        df_quote = df_quote.dropna().reset_index(drop=True)
-
-        # 處理日期格式：轉換為YYYYMMDD格式
-        def format_date_to_yyyymmdd(date_val):
-            try:
-                if pd.isna(date_val):
-                    return ''
-                if isinstance(date_val, str):
-                    # 如果已經是字符串，嘗試解析
-                    if len(date_val) == 8 and date_val.isdigit():
-                        return date_val  # 已經是YYYYMMDD格式
-                    date_val = pd.to_datetime(date_val)
-                elif isinstance(date_val, (int, float)):
-                    # 如果是數字，可能是Excel的序列日期
-                    date_val = pd.to_datetime(date_val, origin='1899-12-30', unit='D')
-                else:
-                    # 其他情況，直接轉換
-                    date_val = pd.to_datetime(date_val)
-                
-                # 轉換為YYYYMMDD格式
-                return date_val.strftime('%Y%m%d')
-            except:
-                return str(date_val) if not pd.isna(date_val) else ''
-
-        df_quote['選擇權到期日'] = df_quote['選擇權到期日'].apply(format_date_to_yyyymmdd)
-        df_quote['賣回日'] = df_quote['賣回日'].apply(format_date_to_yyyymmdd)
-
-        # 將履約利率乘以100並保留兩位小數
-        df_quote['履約利率'] = df_quote['履約利率'].apply(lambda x: round(float(x)*100, 2))
-        df_quote['低履約利率'] = df_quote['低履約利率'].apply(lambda x: round(float(x)*100, 2))
-
-        numeric_columns = ['百元報價', '低百元報價', '波動度']  # 移除已處理的利率欄位
-        for col in numeric_columns:
-            df_quote[col] = df_quote[col].round(2)
-
-        df_quote['CB代號'] = df_quote['CB代號'].apply(strip_trailing_zeros).astype(str)
-
-        # 去除完全重複的記錄，保留第一筆
-        df_quote = df_quote.drop_duplicates(keep='first')
+        df_quote, df_cbinfo = get_quote_store().get()
         # 檢查重複的CB代號
         duplicate_cb = df_quote[df_quote.duplicated(subset=['CB代號'], keep=False)]
-        df_cbinfo = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\統一證CBAS報價表_內部.xlsm', sheet_name='彙整CB基本資料', header=[4])
-        df_cbinfo = df_cbinfo[['CB代號', 'CB名稱']]
-        df_cbinfo['CB代號'] = df_cbinfo['CB代號'].apply(strip_trailing_zeros).astype(str)
-        
         return df_quote, duplicate_cb, df_cbinfo
 
 def save_trading_statement(df_bargaining):
     df_bargaining = df_bargaining[['成交日期', '交割日期', 'T+?交割', '錄音時間', '單據編號', '買/賣', '客戶ID', '客戶名稱', 'CB名稱', 'CB代號', '議價張數', '議價價格', '議價金額', '參考價', '備註']]
     df_bargaining['T+?交割'] = df_bargaining['T+?交割'].astype(str)
     df_bargaining['備註二'] = df_bargaining['客戶名稱'].astype(str) + 'T+' + df_bargaining['T+?交割'].astype(str)
-    df = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\議價明細.xlsx')
+    detail_path = remote_path('bargain_detail')
+    df = pd.read_excel(cached_path(detail_path, revalidate=True))
     df = pd.concat([df, df_bargaining])
-    df.to_excel(r'\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\議價明細.xlsx', index=False)
+    df.to_excel(detail_path, index=False)
+    get_remote_cache().invalidate(detail_path)
@@ -2,13 +2,46 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, date
 import calendar
+import bisect
+import threading
+import time
 from decimal import Decimal
-import pyodbc
+from pricing import exercise_price, YEAR_DAYS
 
-def strip_whitespace(df: pd.DataFrame) -> pd.DataFrame:
+def strip_string_columns(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """只處理文字欄位，以 .str.strip() 整欄去除前後空白，回傳 (新的 DataFrame, 處理的欄位數)
+
+    數值、日期等欄位原樣保留；object 欄位混有非字串值（數字、None、bytes...）時只處理其中的字串。
+    """
     if df is None or df.empty:
-        return df
-    return df.map(lambda x: x.strip() if isinstance(x, str) else x)
+        return df, 0
+    df = df.copy(deep=False)
+    processed = 0
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if isinstance(col.dtype, pd.StringDtype):
+            df.isetitem(i, col.str.strip())
+        elif col.dtype == object:
+            kind = pd.api.types.infer_dtype(col, skipna=True)
+            if kind == 'string':
+                df.isetitem(i, col.str.strip())
+            elif kind.startswith('mixed'):
+                is_str = np.fromiter((isinstance(v, str) for v in col), dtype=bool, count=len(col))
+                if not is_str.any():
+                    continue
+                col = col.copy()
+                col[is_str] = col[is_str].str.strip()
+                df.isetitem(i, col)
+            else:
+                continue
+        else:
+            continue
+        processed += 1
+    return df, processed
+
+def strip_whitespace(df: pd.DataFrame) -> pd.DataFrame:
+    """去除所有文字欄位的前後空白（AS/400 CHAR 欄位的補位空白）"""
+    return strip_string_columns(df)[0]
 
 def format_date(date_str: str) -> str:
     if not date_str or len(str(date_str)) != 8:
@@ -42,6 +75,98 @@ def strip_trailing_zeros(val):
     except (ValueError, TypeError):
         return str(val)
 
+
+def _format_floats(values: np.ndarray, decimals: int) -> list:
+    """整批以固定小數位數格式化（與 f"{v:.{decimals}f}" 相同）"""
+    fmt = f"{{:.{decimals}f}}".format
+    return [fmt(v) for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def _trim_zeros(texts) -> list:
+    """整批去除尾端的 0 與小數點（同 s.rstrip('0').rstrip('.')）"""
+    return [t.rstrip('0').rstrip('.') for t in texts]
+
+
+def _by_unique(values: np.ndarray, convert) -> np.ndarray:
+    """相同的數值只轉換一次：convert 接收不重複的 float64 陣列並回傳同長度的 object 陣列
+
+    以位元比對去重，-0.0 與 0.0（格式化結果不同）分開處理。
+    """
+    bits, inverse = np.unique(np.ascontiguousarray(values, dtype=np.float64).view(np.int64), return_inverse=True)
+    return convert(bits.view(np.float64))[inverse.ravel()]
+
+
+def _strip_floats(values: np.ndarray) -> np.ndarray:
+    return np.array(_trim_zeros(_format_floats(values, 12)), dtype=object)
+
+
+def _type_mask(values: np.ndarray, types) -> np.ndarray:
+    return np.fromiter((isinstance(v, types) for v in values), dtype=bool, count=len(values))
+
+
+def strip_trailing_zeros_column(values) -> pd.Series:
+    """整欄版的 strip_trailing_zeros，輸出與逐格呼叫完全相同
+
+    數值欄整批格式化後去尾零；object 欄依元素型別分組處理，只有看起來可能是數字的字串才逐一以 Decimal 解析。
+    """
+    col = values if isinstance(values, pd.Series) else pd.Series(values)
+    out = np.empty(len(col), dtype=object)
+    if len(col) == 0:
+        return pd.Series(out, index=col.index, dtype=object)
+    kind = col.dtype.kind if isinstance(col.dtype, np.dtype) else 'O'
+    if kind in 'biu':
+        out[:] = col.to_numpy().astype(np.int64 if kind == 'b' else col.dtype).astype(str)
+        return pd.Series(out, index=col.index, dtype=object)
+    if kind == 'f':
+        arr = col.to_numpy()
+        na = np.isnan(arr)
+        out[na] = ""
+        out[~na] = _by_unique(arr[~na], _strip_floats)
+        return pd.Series(out, index=col.index, dtype=object)
+
+    arr = col.to_numpy(dtype=object)
+    na = col.isna().to_numpy()
+    out[na] = ""
+    rest = ~na
+    is_int = rest & _type_mask(arr, (int, np.integer))
+    is_float = rest & ~is_int & _type_mask(arr, (float, np.floating))
+    is_str = rest & _type_mask(arr, str)
+    if is_int.any():
+        out[is_int] = [str(int(v)) for v in arr[is_int]]
+    if is_float.any():
+        out[is_float] = _by_unique(arr[is_float].astype(np.float64), _strip_floats)
+    if is_str.any():
+        # Decimal 只接受含數字或 NaN/Infinity 的字串，其餘原樣保留
+        text = pd.Series(arr[is_str])
+        maybe_number = text.str.contains(r'\d|[nN]', regex=True).to_numpy()
+        converted = text.to_numpy(dtype=object)
+        converted[maybe_number] = [strip_trailing_zeros(v) for v in converted[maybe_number]]
+        out[is_str] = converted
+    other = rest & ~is_int & ~is_float & ~is_str
+    if other.any():
+        out[other] = [strip_trailing_zeros(v) for v in arr[other]]
+    return pd.Series(out, index=col.index, dtype=object)
+
+
+def strip_trailing_zeros_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """整張表逐欄套用 strip_trailing_zeros_column（取代 df.map(strip_trailing_zeros)）"""
+    return pd.DataFrame({i: strip_trailing_zeros_column(df.iloc[:, i]) for i in range(df.shape[1])},
+                        index=df.index).set_axis(df.columns, axis=1)
+
+
+def _numeric_array(col: pd.Series):
+    """欄位全為數值（或缺值）時回傳 float64 陣列，否則回傳 None"""
+    if isinstance(col.dtype, np.dtype) and col.dtype.kind in 'biuf':
+        return col.to_numpy().astype(np.float64)
+    if col.dtype == object and pd.api.types.infer_dtype(col, skipna=True) in ('floating', 'integer', 'mixed-integer-float'):
+        values = col.to_numpy(dtype=object).copy()
+        values[col.isna().to_numpy()] = np.nan
+        try:
+            return values.astype(np.float64)
+        except OverflowError:
+            return None
+    return None
+
 def convert_to_chinese_amount(amount) -> str:
     chinese_numbers = ['零', '壹', '貳', '參', '肆', '伍', '陸', '柒', '捌', '玖']
 
@@ -129,56 +254,250 @@ def float_to_str_maxlen(val, maxlen=11):
         return str(val)
 
 
-def read_holiday_list():
-    connSQL = pyodbc.connect(driver='ODBC Driver 18 for SQL Server', server='10.72.228.139', user='sa', password='Self@pscnet', database='CBAS', TrustServerCertificate='yes')
-    df_holiday = pd.read_sql("SELECT * FROM HolidayList", connSQL)
-    connSQL.close()
-    return df_holiday
+_POW10 = 10.0 ** np.arange(1, 16)
+# 整批計算位數的上限；超過時 float 的整數部分已不精確，交給純量版本
+_VECTOR_LIMIT = 1e15
 
-def next_business_day(start_date: datetime, days: int) -> datetime:
-    """計算指定日期後的第N個工作日"""
-    df_holiday = read_holiday_list()
+
+def _integer_digits(values: np.ndarray) -> np.ndarray:
+    """整數部分的位數（同 len(str(int(abs(v))))，|v| < _VECTOR_LIMIT）"""
+    return np.searchsorted(_POW10, np.floor(np.abs(values)), side='right') + 1
+
+
+def _maxlen_floats(f: np.ndarray, maxlen: int) -> np.ndarray:
+    negative = f < 0
+    int_len = _integer_digits(f)
+    dot = (np.mod(f, 1) != 0).astype(int)
+    decimals = maxlen - negative.astype(int) - int_len - dot
+    result = np.empty(len(f), dtype=object)
+    too_long = decimals < 0
+    if too_long.any():
+        # 整數部分已超過長度：保留符號後截斷整數位數
+        result[too_long] = [('-' if v < 0 else '') + str(int(abs(v)))[:maxlen - (v < 0)]
+                            for v in f[too_long].tolist()]
+    for d in np.unique(decimals[~too_long]):
+        idx = np.flatnonzero((decimals == d) & ~too_long)
+        texts = _format_floats(f[idx], int(d))
+        if d > 0:
+            texts = _trim_zeros(texts)
+        result[idx] = [t[:maxlen] for t in texts]
+    return result
+
+
+def float_to_str_maxlen_column(values, maxlen=11) -> pd.Series:
+    """整欄版的 float_to_str_maxlen，輸出與逐格呼叫完全相同
+
+    依整數位數算出每個值可保留的小數位數，同位數的值一次格式化；非數值欄或 NaN/inf 交給純量版本。
+    """
+    col = values if isinstance(values, pd.Series) else pd.Series(values)
+    arr = _numeric_array(col)
+    if arr is None:
+        return pd.Series([float_to_str_maxlen(v, maxlen) for v in col], index=col.index, dtype=object)
+    out = np.empty(len(arr), dtype=object)
+    vector = np.abs(arr) < _VECTOR_LIMIT
+    if (~vector).any():
+        # NaN、inf 與極大值
+        originals = col.to_numpy(dtype=object)
+        out[~vector] = [float_to_str_maxlen(v, maxlen) for v in originals[~vector]]
+    if vector.any():
+        out[vector] = _by_unique(arr[vector], lambda f: _maxlen_floats(f, maxlen))
+    return pd.Series(out, index=col.index, dtype=object)
+
+
+def read_holiday_list(conn=None):
+    """讀取 HolidayList 假日表；conn 為呼叫端提供的連線（例如測試用的 sqlite3），不提供時向 db_access.pool_631 借用"""
+    if conn is not None:
+        return pd.read_sql("SELECT * FROM HolidayList", conn)
+    # db_access 匯入時會載入本模組，因此在函式內才匯入連線池
+    from db_access import pool_631
+    with pool_631.connection() as connSQL:
+        return pd.read_sql("SELECT * FROM HolidayList", connSQL)
+
+
+def _parse_holiday_dates(df_holiday: pd.DataFrame) -> set:
+    """將 HolidayList 的 Date 欄位轉為 date 集合（支援 2024/6/10 或 2024-06-10）"""
     holiday_set = set()
+    if df_holiday is None or 'Date' not in df_holiday.columns:
+        return holiday_set
     for date_str in df_holiday['Date']:
         if isinstance(date_str, str):
-            # 支援 2024/6/10 或 2024-06-10
             date_str = date_str.replace('-', '/')
             parts = date_str.split('/')
             if len(parts) == 3:
                 y, m, d = map(int, parts)
-                holiday_set.add(datetime(y, m, d).date())
-    
-    current = start_date
-    added = 0
-    while added < days:
-        current += pd.Timedelta(days=1)
-        if current.weekday() < 5 and current.date() not in holiday_set:
-            added += 1
-    return current 
+                holiday_set.add(date(y, m, d))
+    return holiday_set
+
+
+class BusinessCalendar:
+    """工作日曆：假日表只讀一次（逾時 ttl_seconds 後或呼叫 reload 才重讀），
+    並預先算好排序後的工作日序數（date.toordinal），T+n / T-n 以 bisect 查詢。
+    """
+
+    def __init__(self, loader=read_holiday_list, ttl_seconds: float = 12 * 60 * 60, pad_years: int = 5):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.pad_years = pad_years
+        self._lock = threading.Lock()
+        self._holidays = set()
+        self._ordinals = np.empty(0, dtype=np.int64)
+        self._ordinal_list = []
+        self._first = None
+        self._last = None
+        self._loaded_at = None
+
+    def reload(self) -> None:
+        """重新讀取假日表並重建工作日陣列"""
+        with self._lock:
+            self._load_locked()
+
+    def _load_locked(self) -> None:
+        holidays = _parse_holiday_dates(self._loader())
+        years = [d.year for d in holidays] + [date.today().year]
+        self._holidays = holidays
+        self._build_locked(date(min(years) - self.pad_years, 1, 1), date(max(years) + self.pad_years, 12, 31))
+        self._loaded_at = time.monotonic()
+
+    def _build_locked(self, first: date, last: date) -> None:
+        days = np.arange(first.toordinal(), last.toordinal() + 1, dtype=np.int64)
+        # date.toordinal() 的 1 是星期一，(ordinal - 1) % 7 < 5 即週一至週五
+        weekday_mask = (days - 1) % 7 < 5
+        holiday_ordinals = np.fromiter((d.toordinal() for d in self._holidays), dtype=np.int64, count=len(self._holidays))
+        business = days[weekday_mask & ~np.isin(days, holiday_ordinals)]
+        self._ordinals = business
+        self._ordinal_list = business.tolist()
+        self._first = first.toordinal()
+        self._last = last.toordinal()
+
+    def _ensure(self, lo_ordinal: int = None, hi_ordinal: int = None) -> list:
+        """確認假日表已載入且未逾時，並讓工作日陣列涵蓋 [lo, hi]（含前後緩衝）"""
+        with self._lock:
+            expired = self._loaded_at is None or (
+                self.ttl_seconds is not None and time.monotonic() - self._loaded_at > self.ttl_seconds
+            )
+            if expired:
+                try:
+                    self._load_locked()
+                except Exception as e:
+                    if self._loaded_at is None:
+                        raise
+                    print(f"重新讀取假日表失敗，沿用舊資料: {e}")
+                    self._loaded_at = time.monotonic()
+            # 查詢區間超出預算範圍時往外擴（T+n 最多用到 n 個工作日，緩衝一年足夠常見用途）
+            margin = 366
+            need_lo = self._first if lo_ordinal is None else min(self._first, lo_ordinal - margin)
+            need_hi = self._last if hi_ordinal is None else max(self._last, hi_ordinal + margin)
+            if need_lo < self._first or need_hi > self._last:
+                self._build_locked(date.fromordinal(need_lo), date.fromordinal(need_hi))
+            return self._ordinal_list
+
+    def is_business_day(self, day) -> bool:
+        ordinal = pd.Timestamp(day).toordinal()
+        ordinals = self._ensure(ordinal, ordinal)
+        idx = bisect.bisect_left(ordinals, ordinal)
+        return idx < len(ordinals) and ordinals[idx] == ordinal
+
+    def offset_ordinal(self, ordinal: int, days: int) -> int:
+        """回傳 ordinal 之後（days>0）或之前（days<0）第 |days| 個工作日的序數；days=0 原值返回"""
+        if days == 0:
+            return ordinal
+        while True:
+            ordinals = self._ensure(ordinal, ordinal)
+            if days > 0:
+                idx = bisect.bisect_right(ordinals, ordinal) + days - 1
+            else:
+                idx = bisect.bisect_left(ordinals, ordinal) + days
+            if 0 <= idx < len(ordinals):
+                return ordinals[idx]
+            # 超出目前範圍：擴大涵蓋區間後再查
+            self._ensure(ordinal - abs(days) * 2, ordinal + abs(days) * 2)
+
+    def next_business_day(self, start_date: datetime, days: int) -> datetime:
+        """計算指定日期後的第N個工作日（保留原本的時間與型別）"""
+        if days <= 0:
+            return start_date
+        ordinal = start_date.toordinal()
+        return start_date + pd.Timedelta(days=self.offset_ordinal(ordinal, days) - ordinal)
+
+    def prev_business_day(self, start_date: datetime, days: int) -> datetime:
+        """計算指定日期前的第N個工作日（保留原本的時間與型別）"""
+        if days <= 0:
+            return start_date
+        ordinal = start_date.toordinal()
+        return start_date + pd.Timedelta(days=self.offset_ordinal(ordinal, -days) - ordinal)
+
+    def business_days_between(self, start_date, end_date) -> int:
+        """從 start_date 逐日 T+1 推進到 >= end_date 所需的工作日數（start >= end 時為 0）"""
+        start_ord = pd.Timestamp(start_date).toordinal()
+        end_ord = pd.Timestamp(end_date).toordinal()
+        if start_ord >= end_ord:
+            return 0
+        ordinals = self._ensure(start_ord, end_ord)
+        return bisect.bisect_left(ordinals, end_ord) - bisect.bisect_right(ordinals, start_ord) + 1
+
+    def offset_series(self, dates, offsets) -> pd.Series:
+        """向量化 T+n / T-n：dates 為日期 Series，offsets 為 Series 或純量，回傳 Timestamp Series（已去除時間）。
+
+        offsets > 0 往後、< 0 往前、= 0 原日期；無法解析的日期或位移回傳 NaT。
+        """
+        dt = pd.to_datetime(pd.Series(dates), errors='coerce')
+        if isinstance(offsets, pd.Series):
+            off = pd.to_numeric(offsets, errors='coerce').set_axis(dt.index)
+        else:
+            off = pd.Series(offsets, index=dt.index, dtype='float64')
+        valid = (dt.notna() & off.notna()).to_numpy()
+        result = np.full(len(dt), np.datetime64('NaT'), dtype='datetime64[ns]')
+        if valid.any():
+            # datetime64[D] 的 0 為 1970-01-01，換算成 date.toordinal() 序數
+            epoch = date(1970, 1, 1).toordinal()
+            start_ord = dt[valid].to_numpy().astype('datetime64[D]').astype(np.int64) + epoch
+            off_int = off[valid].to_numpy().astype(np.int64)
+            span = int(np.abs(off_int).max()) * 2
+            self._ensure(int(start_ord.min()) - span, int(start_ord.max()) + span)
+            with self._lock:
+                ordinals = self._ordinals
+            pos = np.where(
+                off_int > 0,
+                np.searchsorted(ordinals, start_ord, side='right') + off_int - 1,
+                np.searchsorted(ordinals, start_ord, side='left') + off_int,
+            )
+            pos = np.clip(pos, 0, len(ordinals) - 1)
+            target = np.where(off_int == 0, start_ord, ordinals[pos])
+            result[valid] = (target - epoch).astype('datetime64[D]').astype('datetime64[ns]')
+        return pd.Series(result, index=dt.index)
+
+    def next_business_days(self, dates, days) -> pd.Series:
+        """next_business_day 的向量化版本（days <= 0 回傳原日期）"""
+        days = days.clip(lower=0) if isinstance(days, pd.Series) else max(days, 0)
+        return self.offset_series(dates, days)
+
+    def prev_business_days(self, dates, days) -> pd.Series:
+        """prev_business_day 的向量化版本（days <= 0 回傳原日期）"""
+        days = -days.clip(lower=0) if isinstance(days, pd.Series) else -max(days, 0)
+        return self.offset_series(dates, days)
+
+
+_business_calendar = BusinessCalendar()
+
+
+def get_business_calendar() -> BusinessCalendar:
+    """取得全程式共用的工作日曆"""
+    return _business_calendar
+
+
+def next_business_day(start_date: datetime, days: int) -> datetime:
+    """計算指定日期後的第N個工作日"""
+    return _business_calendar.next_business_day(start_date, days)
+
 
 def prev_business_day(start_date: datetime, days: int) -> datetime:
     """計算指定日期前的第N個工作日"""
-    df_holiday = read_holiday_list()
-    holiday_set = set()
-    for date_str in df_holiday['Date']:
-        if isinstance(date_str, str):
-            date_str = date_str.replace('-', '/')
-            parts = date_str.split('/')
-            if len(parts) == 3:
-                y, m, d = map(int, parts)
-                holiday_set.add(datetime(y, m, d).date())
-    current = start_date
-    deducted = 0
-    while deducted < days:
-        current -= pd.Timedelta(days=1)
-        if current.weekday() < 5 and current.date() not in holiday_set:
-            deducted += 1
-    return current
+    return _business_calendar.prev_business_day(start_date, days)
 
 
 def calculate_expired_exercise_price(sellback_price: float, year_period: float, exercise_rate: float) -> float:
-    """計算到期履約價"""
-    return round(sellback_price - (100 * year_period * exercise_rate / 100), 2)
+    """計算到期履約價（年期為 計息天數/365，換回天數後以定點數四捨五入到 2 位）"""
+    return exercise_price(sellback_price, exercise_rate, round(year_period * YEAR_DAYS))
 
 
 def calculate_expired_year_period(sellback_date: str, settlement_date: str) -> float:
@@ -220,14 +539,10 @@ def format_expired_contract_data(df_expired: pd.DataFrame, target_date: str, df_
         df_final['提前履約賠償金'] = '0'
 
         # 計算年期和履約價
-        df_final['年期'] = df_final['賣回日'].apply(
-            lambda x: calculate_expired_year_period(x, settle_date.strftime('%Y%m%d'))
-        )
-        df_final['履約價'] = df_final.apply(
-            lambda row: calculate_expired_exercise_price(
-                float(row['賣回價']), row['年期'], float(row['履約利率'])
-            ), axis=1
-        )
+        sellback = pd.to_datetime(df_final['賣回日'], format='%Y%m%d', errors='coerce')
+        days = ((sellback - pd.Timestamp(settle_date.date())).dt.days + 1).clip(lower=0).fillna(0).astype(int)
+        df_final['年期'] = days / YEAR_DAYS
+        df_final['履約價'] = exercise_price(df_final['賣回價'], df_final['履約利率'], days)
 
         df_final['成交均價'] = df_final['履約價']
         df_final['選擇權交割單價'] = df_final['成交均價'] - df_final['履約價']
@@ -293,3 +608,47 @@ def format_number_to_11(value, max_length=11):
     
     return str(int(round(float_val)))
 
+
+def _number_to_11_floats(f: np.ndarray, max_length: int) -> np.ndarray:
+    result = np.empty(len(f), dtype=object)
+    whole = f == np.trunc(f)
+    result[whole] = [str(int(v)) for v in f[whole].tolist()]
+    # 整數部分長度（同 len(str(int(v)))，v <= -1 時含負號）
+    int_length = _integer_digits(f) + (f <= -1)
+    max_decimals = max_length - int_length - 1
+    pending = ~whole & (max_decimals > 0)
+    resolved = whole.copy()
+    start = np.minimum(max_decimals, 9)
+    for decimals in range(9, -1, -1):
+        idx = np.flatnonzero(pending & (start >= decimals))
+        if not len(idx):
+            continue
+        texts = _trim_zeros(_format_floats(f[idx], decimals))
+        fits = np.fromiter((len(t) <= max_length for t in texts), dtype=bool, count=len(texts))
+        result[idx[fits]] = np.array(texts, dtype=object)[fits]
+        pending[idx[fits]] = False
+        resolved[idx[fits]] = True
+    # 整數部分太長或各種小數位數都超長：四捨五入成整數
+    result[~resolved] = [str(int(round(v))) for v in f[~resolved]]
+    return result
+
+
+def format_number_to_11_column(values, max_length=11) -> pd.Series:
+    """整欄版的 format_number_to_11，輸出與逐格呼叫完全相同（缺值原樣保留）
+
+    小數位數由多到少一次處理一批：每一輪把該位數下長度合格的值定案，只有剩下的值進入下一輪。
+    """
+    col = values if isinstance(values, pd.Series) else pd.Series(values)
+    arr = _numeric_array(col)
+    if arr is None:
+        return pd.Series([format_number_to_11(v, max_length) for v in col], index=col.index, dtype=object)
+    out = col.to_numpy(dtype=object).copy()
+    vector = np.abs(arr) < _VECTOR_LIMIT
+    large = ~vector & ~np.isnan(arr)
+    if large.any():
+        # inf 與極大值
+        out[large] = [format_number_to_11(v, max_length) for v in out[large]]
+    if vector.any():
+        out[vector] = _by_unique(arr[vector], lambda f: _number_to_11_floats(f, max_length))
+    return pd.Series(out, index=col.index, dtype=object)
+
@@ -1,5 +1,4 @@
 import pandas as pd
-import pyodbc
 from PyQt5.QtWidgets import QApplication, QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget, QPushButton, QFileDialog, QMessageBox, QTabWidget, QHBoxLayout, QInputDialog, QLabel, QDateEdit, QLineEdit, QComboBox, QTextEdit, QStyledItemDelegate, QGroupBox, QFrame, QRadioButton, QButtonGroup
 import sys
 from datetime import datetime, timedelta
@@ -7,19 +6,25 @@ import numpy as np
 from PyQt5.QtGui import QColor, QFont, QIntValidator
 import warnings
 import os
+import threading
 from PyQt5.QtCore import QDate, Qt, QObject, QEvent, QObject, QEvent
 
 #===============自訂模組======================
-from bargaining import process_bargain_records, generate_settlement_voucher, generate_trading_slip, calculate_new_trade_batch, bargain_sell, generate_bargain_upload_file
-from db_access import get_contracts_from_sell_table, get_631_Monitor_Fill, get_customer_bank_and_email, get_trust_info
-from format_utils import strip_trailing_zeros, float_to_str_maxlen, next_business_day, strip_whitespace, edate, cusid_to_padded, format_number_to_11
-from file_reader import get_daily_bond_rate, load_quote, save_trading_statement, read_today_trade_buy, read_today_trade_sell
+from bargaining import process_bargain_records, calculate_new_trade_batch, bargain_sell, generate_bargain_upload_file
+from bargain_documents import generate_bargain_documents
+from db_access import get_contracts_from_sell_table, get_631_Monitor_Fill, get_customer_bank_and_email, get_trust_info, get_400_conn
+from format_utils import strip_trailing_zeros_column, strip_trailing_zeros_frame, float_to_str_maxlen_column, next_business_day, strip_whitespace, edate, cusid_to_padded, format_number_to_11_column
+from file_reader import get_daily_bond_rate, load_quote, save_trading_statement, read_today_trade_buy, read_today_trade_sell, read_customer_list
 from execution import (setup_exercise_input_search,
-                      query_exercise_info, fetch_exercise_contracts,
+                      fetch_exercise_contracts, fetch_exercise_contracts_batch, parse_exercise_requests, warn_exercise_shortage,
                       update_exercise_result_table, add_exercise_info, add_exercise_to_sell)
 from expired import query_expired_contracts, add_expired_to_sell
 from quote_calculator import QuoteCalculatorWindow
 from quote_table import QuoteTableWindow
+from quote_watcher import QuoteWatcher
+from task_runner import get_task_runner
+from penalty_allocator import allocate_penalty, parse_penalty_rules
+from table_model import BackgroundRules, DataFrameTableView, fill_table_widget, read_table_widget, sync_table_widget, table_headers, cell_text, set_cell_text, selected_rows, LIGHT_BLUE, LIGHT_GREEN
 from option_renewal import (query_renewal_contracts, add_renewal_contract, 
                            update_renewal_table, transfer_renewal_data)
 from envs import trade_notice_dir
@@ -28,6 +33,8 @@ from backend_process import (send_today_trade_email, send_bargain_trade_email,
                              send_control_table_email, send_customer_positions_email,
                              clear_output_window, send_customer_detail_email)
 from envs import i_realized_file_path, upload_file_path
+from remote_cache import cached_path, get_remote_cache, remote_path
+from csv_loader import csv_encoding, read_csv_file, VIP_QUOTE_SCHEMA, PENALTY_SETTINGS_SCHEMA
 #=============================================
 
 warnings.filterwarnings('ignore')  # 忽略所有警告
@@ -40,10 +47,30 @@ pd.set_option('display.width', None)         # 不限制顯示寬度
 pd.set_option('display.max_colwidth', None)  # 不限制列寬度
 pd.set_option('display.expand_frame_repr', False)  # 不換行顯示
 
-print("讀取資料啟動中")
+# 日指標公債利率：第一次使用時才查詢並沿用。不在匯入時查詢，
+# 今日交易明細的行程池子行程（spawn）會重新匯入本模組，匯入時不能有 WCF 查詢等副作用
+_risk_free_rate = None
+_risk_free_rate_lock = threading.Lock()
+
+
+def get_risk_free_rate() -> str:
+    """取得日指標公債利率（殖利率字串）"""
+    global _risk_free_rate
+    with _risk_free_rate_lock:
+        if _risk_free_rate is None:
+            _risk_free_rate = get_daily_bond_rate()
+        return _risk_free_rate
+
+# 表格底色規則：淺藍色為主要輸入/確認欄位，議價交易另以淺綠色標示原始輸入欄位
+BUY_REFRESH_KEY_PREFIX = 'refresh|'  # 刷新資料產生的買進列鍵前綴（差異更新只處理這些列）
+BUY_BACKGROUND_RULES = BackgroundRules.for_columns(LIGHT_BLUE, ['交易類型', '權利金百元價', '履約利率%', '手續費(業務單位)', '成交張數', '成交均價'])
+SELL_BACKGROUND_RULES = BackgroundRules.for_columns(LIGHT_BLUE, ['原單契約編號', '履約張數', '成交均價', '履約利率'])
+BARGAIN_BACKGROUND_RULES = BackgroundRules(columns={
+    **{col: LIGHT_BLUE for col in ['交割日期', '客戶名稱', 'CB名稱', '議價金額', '銀行', '分行', '銀行帳號', '集保帳號', '通訊地址']},
+    **{col: LIGHT_GREEN for col in ['成交日期', '錄音時間', '單據編號', 'T+?交割', '買/賣', '客戶ID', 'CB代號', '議價張數', '議價價格', '參考價']},
+})
+VIP_LIST_BACKGROUND_RULES = BackgroundRules(cells=[('80元手續費', lambda text: text.strip().upper() == 'Y', LIGHT_BLUE)])
 
-# 讀取日指標公債利率（全域變數，供所有函數使用）
-rf = get_daily_bond_rate()
 tday = datetime.now()
 
 class CustomerIDComboBoxDelegate(QStyledItemDelegate):
@@ -205,11 +232,6 @@ class PenaltyCustomerDelegate(QStyledItemDelegate):
         self.target = target
         self.allow_all = allow_all
 
-    def _get_table(self):
-        if self.parent is None:
-            return None
-        return getattr(self.parent, f'table_{self.target}', None)
-
     def _get_col(self, name):
         if self.parent is None:
             return None
@@ -244,20 +266,20 @@ class PenaltyCustomerDelegate(QStyledItemDelegate):
                 if lookup_name is not None:
                     cus_name = lookup_name
 
+        # 同一列的另一欄經由 model 寫入（QTableWidget 與 DataFrameTableView 皆可）
         row = index.row()
-        table = self._get_table()
         if self.mode == 'id':
             model.setData(index, cus_id)
-            if table is not None and cus_name:
+            if cus_name:
                 name_col = self._get_col('客戶名稱')
                 if name_col is not None:
-                    table.setItem(row, name_col, QTableWidgetItem(cus_name))
+                    model.setData(model.index(row, name_col), cus_name)
         else:
             model.setData(index, cus_name)
-            if table is not None and cus_id:
+            if cus_id:
                 id_col = self._get_col('客戶ID')
                 if id_col is not None:
-                    table.setItem(row, id_col, QTableWidgetItem(cus_id))
+                    model.setData(model.index(row, id_col), cus_id)
 
 class PenaltyCBDelegate(QStyledItemDelegate):
     """CB代號/CB名稱下拉式選單委託類（雙向自動代出）
@@ -272,11 +294,6 @@ class PenaltyCBDelegate(QStyledItemDelegate):
         self.target = target
         self.fill_rate_col = fill_rate_col
 
-    def _get_table(self):
-        if self.parent is None:
-            return None
-        return getattr(self.parent, f'table_{self.target}', None)
-
     def _get_col(self, name):
         if self.parent is None:
             return None
@@ -309,30 +326,30 @@ class PenaltyCBDelegate(QStyledItemDelegate):
                 if lookup_name is not None:
                     cb_name = lookup_name
 
+        # 同一列的另一欄經由 model 寫入（QTableWidget 與 DataFrameTableView 皆可）
         row = index.row()
-        table = self._get_table()
         if self.mode == 'code':
             model.setData(index, cb_code)
-            if table is not None and cb_name:
+            if cb_name:
                 name_col = self._get_col('CB名稱')
                 if name_col is not None:
-                    table.setItem(row, name_col, QTableWidgetItem(cb_name))
+                    model.setData(model.index(row, name_col), cb_name)
         else:
             model.setData(index, cb_name)
-            if table is not None and cb_code:
+            if cb_code:
                 code_col = self._get_col('CB代號')
                 if code_col is not None:
-                    table.setItem(row, code_col, QTableWidgetItem(cb_code))
+                    model.setData(model.index(row, code_col), cb_code)
 
         # 取得 CB 後若需要，順便代入低履約利率
-        if self.fill_rate_col and table is not None and cb_code and self.parent is not None:
+        if self.fill_rate_col and cb_code and self.parent is not None:
             rate = self.parent.lookup_cb_rate(cb_code)
             if rate is not None:
                 rate_col = self._get_col(self.fill_rate_col)
                 if rate_col is not None:
-                    cur = table.item(row, rate_col)
-                    if cur is None or not cur.text().strip():
-                        table.setItem(row, rate_col, QTableWidgetItem(str(rate)))
+                    cur = model.index(row, rate_col).data()
+                    if cur is None or not str(cur).strip():
+                        model.setData(model.index(row, rate_col), str(rate))
 
 class YesNoComboBoxDelegate(QStyledItemDelegate):
     """Y/N 下拉式選單委託類，預設 'N'"""
@@ -360,6 +377,8 @@ class TableEditor(QWidget):
 
     def __init__(self):
         super().__init__()
+        # 資料庫查詢、產檔等耗時工作在背景執行緒執行，介面保持可操作
+        self.task_runner = get_task_runner()
         self.setWindowTitle("CBAS 交易資料編輯器")
         self.resize(2000, 800)
         self.tabs = QTabWidget()
@@ -542,10 +561,8 @@ class TableEditor(QWidget):
         recording_btn_frame.setLayout(recording_btn_layout)
         
         # 錄音表格
-        self.table_recording = TableWidgetWithDelete()
         recording_columns = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '買進張數', '賣出張數', '成交均價', 'CELLPHONE', '被授權人', '被授權人電話', '錄音時間', '錄音人員']
-        self.table_recording.setColumnCount(len(recording_columns))
-        self.table_recording.setHorizontalHeaderLabels(recording_columns)
+        self.table_recording = DataFrameTableView(recording_columns, na_rep=None)
         self.table_recording.setSortingEnabled(True)  # 啟用欄位排序
         
         # 設定錄音人員欄位的編輯器（第12欄，索引11）
@@ -587,10 +604,8 @@ class TableEditor(QWidget):
         vip_list_btn_frame.setLayout(vip_list_btn_layout)
         
         # VIP名單表格
-        self.table_vip_list = TableWidgetWithDelete()
         vip_list_columns = ['客戶ID', '客戶名稱', '不限張數低手續費', '不限張數低利率', '80元手續費']
-        self.table_vip_list.setColumnCount(len(vip_list_columns))
-        self.table_vip_list.setHorizontalHeaderLabels(vip_list_columns)
+        self.table_vip_list = DataFrameTableView(vip_list_columns, background_rules=VIP_LIST_BACKGROUND_RULES)
         
         # 添加到主布局
         vip_list_layout.addWidget(vip_list_btn_frame)
@@ -753,11 +768,9 @@ class TableEditor(QWidget):
         self.vip_quote_help_text.setVisible(False)
         
         # 特殊報價表格
-        self.table_vip_quote = TableWidgetWithDelete()
         vip_quote_columns = ['客戶ID', '客戶名稱', 'CB代號', 'CB名稱', '利率%', '手續費', '張數', '短約', '備註']
         self._vip_quote_columns = vip_quote_columns
-        self.table_vip_quote.setColumnCount(len(vip_quote_columns))
-        self.table_vip_quote.setHorizontalHeaderLabels(vip_quote_columns)
+        self.table_vip_quote = DataFrameTableView(vip_quote_columns, na_rep=None)
 
         # 欄位自動代出 delegate
         self.table_vip_quote.setItemDelegateForColumn(0, PenaltyCustomerDelegate(self, mode='id', target='vip_quote', allow_all=False))
@@ -870,11 +883,12 @@ class TableEditor(QWidget):
         # 查詢按鈕
         self.btn_query_exercise = QPushButton("查詢履約資訊")
         self.btn_query_exercise.setFixedSize(120, 30)
-        self.btn_query_exercise.clicked.connect(lambda: query_exercise_info(
-            self.input_cus_id, self.input_cb_code, self.input_exercise_qty, 
-            self.input_settlement_date, self.df_quote, self.table_exercise_result, 
-            fetch_exercise_contracts
-        ))
+        self.btn_query_exercise.clicked.connect(self.query_exercise_info)
+        
+        # 批次查詢按鈕（貼上整天的履約清單）
+        self.btn_query_exercise_batch = QPushButton("批次查詢履約")
+        self.btn_query_exercise_batch.setFixedSize(120, 30)
+        self.btn_query_exercise_batch.clicked.connect(self.query_exercise_batch)
         
         # 新增履約資訊按鈕
         self.btn_add_exercise = QPushButton("新增履約資訊")
@@ -907,6 +921,7 @@ class TableEditor(QWidget):
         input_layout.addWidget(self.label_settlement_date)
         input_layout.addWidget(self.input_settlement_date)
         input_layout.addWidget(self.btn_query_exercise)
+        input_layout.addWidget(self.btn_query_exercise_batch)
         input_layout.addWidget(self.btn_add_exercise)
         input_layout.addWidget(self.btn_add_to_sell)
         input_layout.addWidget(self.btn_delete_exercise)
@@ -1149,10 +1164,8 @@ class TableEditor(QWidget):
         customer_btn_frame.setLayout(customer_btn_layout)
         
         # 常用客戶維護表格
-        self.table_customer = TableWidgetWithDelete()
         customer_columns = ['客戶ID', '客戶名稱']
-        self.table_customer.setColumnCount(len(customer_columns))
-        self.table_customer.setHorizontalHeaderLabels(customer_columns)
+        self.table_customer = DataFrameTableView(customer_columns, na_rep=None)
         
         # 添加到主布局
         customer_layout.addWidget(customer_btn_frame)
@@ -1309,7 +1322,7 @@ class TableEditor(QWidget):
         self.btn_generate_today_detail = QPushButton("產檔：今日交易明細")
         self.btn_generate_today_detail.setFixedSize(200, 50)
         self.btn_generate_today_detail.setStyleSheet("QPushButton { text-align: left; padding-left: 10px; }")
-        self.btn_generate_today_detail.clicked.connect(lambda: generate_today_detail(self.output_text_edit, self))
+        self.btn_generate_today_detail.clicked.connect(lambda: generate_today_detail(self.output_text_edit, self, button=self.btn_generate_today_detail))
         
         self.btn_generate_trade_confirmation = QPushButton("產檔：交易確認書")
         self.btn_generate_trade_confirmation.setFixedSize(200, 50)
@@ -1420,6 +1433,11 @@ class TableEditor(QWidget):
         # 初始化報價表資料，在程式啟動時讀取一次
         self.df_quote, self.duplicate_cb, self.df_cbinfo = load_quote()
         self.examin_quote_duplicate(self.duplicate_cb)
+        # 背景監看報價表，存檔後自動重新載入
+        self.quote_watcher = QuoteWatcher(parent=self)
+        self.quote_watcher.quote_reloaded.connect(self.on_quote_reloaded)
+        self.quote_watcher.reload_failed.connect(self.on_quote_reload_failed)
+        self.quote_watcher.start()
         
         
         
@@ -1430,6 +1448,12 @@ class TableEditor(QWidget):
         # 為所有表格安裝鍵盤刪除事件過濾器
         self.setup_table_keyboard_delete()
 
+    def closeEvent(self, event):
+        """關閉視窗時取消尚未完成的背景工作並停止監看報價表"""
+        self.task_runner.cancel_all()
+        self.quote_watcher.stop()
+        super().closeEvent(event)
+
 #====================AP功能區====================
 
     def loading_vips(self):
@@ -1445,24 +1469,9 @@ class TableEditor(QWidget):
         # 使用 file_reader 模組讀取VIP資料
         df_vip_list, df_vip_quote = load_vip_data()
 
-        # 更新VIP名單表格
-        light_blue = QColor(204, 229, 255)
-        self.table_vip_list.setRowCount(len(df_vip_list))
-        for i, row in df_vip_list.iterrows():
-            for j, col in enumerate(df_vip_list.columns):
-                val = row[col]
-                text = '' if pd.isna(val) else str(val)
-                item = QTableWidgetItem(text)
-                if col == '80元手續費' and text.strip().upper() == 'Y':
-                    item.setBackground(light_blue)
-                self.table_vip_list.setItem(i, j, item)
-
-        # 更新特殊報價資料表格
-        self.table_vip_quote.setRowCount(len(df_vip_quote))
-        for i, row in df_vip_quote.iterrows():
-            for j, col in enumerate(df_vip_quote.columns):
-                item = QTableWidgetItem(str(row[col]))
-                self.table_vip_quote.setItem(i, j, item)
+        # 更新VIP名單、特殊報價表格
+        self.table_vip_list.set_dataframe(df_vip_list)
+        self.table_vip_quote.set_dataframe(df_vip_quote)
     
     def get_vip_quote(self, vip_id):
         # 使用 get_table_data 方法讀取表格中的所有資料
@@ -1505,25 +1514,26 @@ class TableEditor(QWidget):
         row_count = table.rowCount()
         table.insertRow(row_count)
 
-        # 為每個欄位設定預設值
-        for col in range(table.columnCount()):
-            item = QTableWidgetItem("")
-            table.setItem(row_count, col, item)
+        # QTableWidget 為每個欄位建立空白 item（DataFrameTableView 插入的就是空白列）
+        if isinstance(table, QTableWidget):
+            for col in range(table.columnCount()):
+                item = QTableWidgetItem("")
+                table.setItem(row_count, col, item)
 
         # 罰金設定預設值：提前履約賠償金 = 0.25
         if tab_name == "罰金設定":
             penalty_amt_col = self.tab_col('penalty', '提前履約賠償金')
             if penalty_amt_col is not None:
-                table.setItem(row_count, penalty_amt_col, QTableWidgetItem("0.25"))
+                set_cell_text(table, row_count, penalty_amt_col, "0.25")
 
         # 特殊報價預設值：手續費 = 100、短約 = N
         if tab_name == "特殊報價":
             fee_col = self.tab_col('vip_quote', '手續費')
             if fee_col is not None:
-                table.setItem(row_count, fee_col, QTableWidgetItem("100"))
+                set_cell_text(table, row_count, fee_col, "100")
             short_col = self.tab_col('vip_quote', '短約')
             if short_col is not None:
-                table.setItem(row_count, short_col, QTableWidgetItem("N"))
+                set_cell_text(table, row_count, short_col, "N")
         
         # 議價交易分頁的特殊處理
         if tab_name == "議價交易":
@@ -1578,13 +1588,10 @@ class TableEditor(QWidget):
         
         table = self.table_customer
         for row in range(table.rowCount()):
-            customer_id_item = table.item(row, 0)
-            customer_name_item = table.item(row, 1)
-            if customer_id_item and customer_name_item:
-                customer_id = customer_id_item.text().strip()
-                customer_name = customer_name_item.text().strip()
-                if customer_id and customer_name:
-                    customers.append(f"{customer_id} - {customer_name}")
+            customer_id = cell_text(table, row, 0).strip()
+            customer_name = cell_text(table, row, 1).strip()
+            if customer_id and customer_name:
+                customers.append(f"{customer_id} - {customer_name}")
         return customers
 
     # ===== 罰金設定 / 特殊報價 等表格的 helpers =====
@@ -1655,12 +1662,8 @@ class TableEditor(QWidget):
         if hasattr(self, 'table_customer'):
             t = self.table_customer
             for r in range(t.rowCount()):
-                id_item = t.item(r, 0)
-                name_item = t.item(r, 1)
-                if not id_item or not name_item:
-                    continue
-                cid = id_item.text().strip()
-                cname = name_item.text().strip()
+                cid = cell_text(t, r, 0).strip()
+                cname = cell_text(t, r, 1).strip()
                 if by == 'id' and cid == value:
                     return (cid, cname)
                 if by == 'name' and cname == value:
@@ -1699,7 +1702,8 @@ class TableEditor(QWidget):
     def loading_penalty_settings(self):
         """載入罰金設定資料"""
         try:
-            from file_reader import read_penalty_settings, PENALTY_SETTINGS_COLUMNS
+            from file_reader import read_penalty_settings
+            from csv_loader import PENALTY_SETTINGS_COLUMNS
         except ImportError:
             return
         df_penalty = read_penalty_settings()
@@ -1716,179 +1720,25 @@ class TableEditor(QWidget):
         """儲存罰金設定到 CSV"""
         try:
             df = self.get_table_data(self.table_penalty)
-            penalty_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Penalty_Settings.csv"
+            penalty_path = remote_path('penalty_settings')
             # 即使資料為空也允許儲存（清空檔案）
             if df.empty:
-                from file_reader import PENALTY_SETTINGS_COLUMNS
+                from csv_loader import PENALTY_SETTINGS_COLUMNS
                 df = pd.DataFrame(columns=PENALTY_SETTINGS_COLUMNS)
             df.to_csv(penalty_path, index=False, encoding='utf-8-sig', header=True)
+            get_remote_cache().invalidate(penalty_path)
             QMessageBox.information(self, "儲存成功", f"罰金設定已儲存至：\n{penalty_path}")
         except Exception as e:
             QMessageBox.critical(self, "儲存失敗", f"發生錯誤：{e}")
 
     def apply_penalty_settings(self, df_buy):
-        """將罰金設定套用到計算完畢的買進資料。
-
-        - 比對 key：客戶ID + CB代號（特定客戶優先於 ALL）。
-        - 短約=Y 的列不套罰金（保留原值）。
-        - 同 key 的多筆 buy row（拆單後）依優先順序消耗賠償金張數：
-            1) 特殊報價非短約 (VIP報價張數>0 且 _短約!='Y')
-            2) 一般計算 (VIP報價張數==0)
-        - 賠償金張數為空 → 視為無上限，所有非短約 row 全套。
-        - 拆單時「成交金額」「權利金總額」按比例重算，其他單價/比率不動。
-        - 在每筆 row 標記 `罰金套用張數` 供日後扣減 CSV 使用。
-        """
+        """將罰金設定表格的規則套用到計算完畢的買進資料（規則與拆單邏輯見 penalty_allocator.allocate_penalty）。"""
         try:
             if df_buy is None or df_buy.empty:
                 return df_buy
 
             df_penalty = self.get_table_data(self.table_penalty)
-            if df_penalty.empty:
-                if '罰金套用張數' not in df_buy.columns:
-                    df_buy = df_buy.copy()
-                    df_buy['罰金套用張數'] = 0
-                return df_buy
-
-            # 整理罰金規則：建立 (客戶ID, CB代號) → 規則 的查表
-            rules = {}
-            for _, prow in df_penalty.iterrows():
-                cus_id = str(prow.get('客戶ID', '')).strip()
-                cb_code = str(prow.get('CB代號', '')).strip()
-                if not cus_id or not cb_code:
-                    continue
-                qty_raw = str(prow.get('賠償金張數', '')).strip()
-                amt_raw = str(prow.get('提前履約賠償金', '')).strip()
-                try:
-                    qty = int(float(qty_raw)) if qty_raw else None
-                except (ValueError, TypeError):
-                    qty = None
-                try:
-                    amt = float(amt_raw) if amt_raw else 0.0
-                except (ValueError, TypeError):
-                    amt = 0.0
-                rules[(cus_id, cb_code)] = {'qty': qty, 'amt': amt}
-
-            if not rules:
-                if '罰金套用張數' not in df_buy.columns:
-                    df_buy = df_buy.copy()
-                    df_buy['罰金套用張數'] = 0
-                return df_buy
-
-            df_buy = df_buy.copy().reset_index(drop=True)
-            if '罰金套用張數' not in df_buy.columns:
-                df_buy['罰金套用張數'] = 0
-
-            def _split_row(base_row, new_qty, total_qty, penalty_value, penalty_used_qty):
-                r = base_row.copy()
-                r['成交張數'] = new_qty
-                for col in ('成交金額', '權利金總額'):
-                    if col in r.index:
-                        try:
-                            old = float(r[col])
-                            r[col] = int(round(old * new_qty / total_qty))
-                        except (ValueError, TypeError):
-                            pass
-                if 'VIP報價張數' in r.index:
-                    try:
-                        old_vip = int(float(r['VIP報價張數']))
-                        if total_qty > 0:
-                            r['VIP報價張數'] = int(round(old_vip * new_qty / total_qty))
-                    except (ValueError, TypeError):
-                        pass
-                r['提前履約賠償金'] = str(penalty_value)
-                r['罰金套用張數'] = int(penalty_used_qty)
-                return r
-
-            def _is_short(r):
-                v = r.get('_短約')
-                if v is None or (isinstance(v, float) and pd.isna(v)):
-                    v = r.get('短契約')
-                return str(v).strip().upper() == 'Y' if v is not None else False
-
-            def _is_vip_n(r):
-                """特殊報價（非短約）：VIP報價張數>0 且 不是短約Y"""
-                try:
-                    vq = int(float(r.get('VIP報價張數', 0)))
-                except (ValueError, TypeError):
-                    vq = 0
-                return vq > 0 and not _is_short(r)
-
-            def _is_general(r):
-                """一般計算：VIP報價張數==0 且 不是短約Y"""
-                try:
-                    vq = int(float(r.get('VIP報價張數', 0)))
-                except (ValueError, TypeError):
-                    vq = 0
-                return vq == 0 and not _is_short(r)
-
-            # 依 (客戶ID, CB代號) 分組
-            # 為了維持原本順序，記錄每個 row 的 original index
-            df_buy['_orig_idx'] = range(len(df_buy))
-            output_rows = []  # (orig_idx, row)
-            grouped = df_buy.groupby(['客戶ID', 'CB代號'], sort=False)
-
-            for (cus_id, cb_code), group_df in grouped:
-                cus_id = str(cus_id).strip()
-                cb_code = str(cb_code).strip()
-                rule = rules.get((cus_id, cb_code)) or rules.get(('ALL', cb_code))
-
-                if rule is None:
-                    for _, r in group_df.iterrows():
-                        output_rows.append((r['_orig_idx'], r))
-                    continue
-
-                penalty_qty_budget = rule['qty']  # None = 無上限
-                penalty_amt = rule['amt']
-
-                # 先把短約Y 的列原樣放回（不套罰金）
-                for _, r in group_df.iterrows():
-                    if _is_short(r):
-                        output_rows.append((r['_orig_idx'], r))
-
-                # 依優先順序處理：特殊報價非短約 → 一般
-                vip_n_rows = [r for _, r in group_df.iterrows() if _is_vip_n(r)]
-                general_rows = [r for _, r in group_df.iterrows() if _is_general(r)]
-
-                remaining_budget = None if penalty_qty_budget is None else max(0, int(penalty_qty_budget))
-
-                for priority_list in (vip_n_rows, general_rows):
-                    for r in priority_list:
-                        try:
-                            row_qty = int(float(r.get('成交張數', 0)))
-                        except (ValueError, TypeError):
-                            row_qty = 0
-                        if row_qty <= 0:
-                            output_rows.append((r['_orig_idx'], r))
-                            continue
-
-                        if remaining_budget is None:
-                            r2 = r.copy()
-                            r2['提前履約賠償金'] = str(penalty_amt)
-                            r2['罰金套用張數'] = row_qty
-                            output_rows.append((r['_orig_idx'], r2))
-                        elif remaining_budget >= row_qty:
-                            r2 = r.copy()
-                            r2['提前履約賠償金'] = str(penalty_amt)
-                            r2['罰金套用張數'] = row_qty
-                            output_rows.append((r['_orig_idx'], r2))
-                            remaining_budget -= row_qty
-                        elif remaining_budget > 0:
-                            take = remaining_budget
-                            rest = row_qty - take
-                            rp = _split_row(r, take, row_qty, penalty_amt, take)
-                            rr = _split_row(r, rest, row_qty, 0, 0)
-                            output_rows.append((r['_orig_idx'], rp))
-                            output_rows.append((r['_orig_idx'] + 0.5, rr))
-                            remaining_budget = 0
-                        else:
-                            output_rows.append((r['_orig_idx'], r))
-
-            # 依原始順序輸出
-            output_rows.sort(key=lambda x: x[0])
-            result = pd.DataFrame([r for _, r in output_rows]).reset_index(drop=True)
-            if '_orig_idx' in result.columns:
-                result = result.drop(columns=['_orig_idx'])
-            return result
+            return allocate_penalty(df_buy, parse_penalty_rules(df_penalty))
 
         except Exception as e:
             print(f"套用罰金設定時發生錯誤：{e}")
@@ -2050,32 +1900,27 @@ class TableEditor(QWidget):
         else:
             return
         
-        # 獲取選定的行
-        selected_rows = set()
-        selected_items = table.selectedItems()
+        # 獲取選定的行（QTableWidget 與 DataFrameTableView 皆以選取範圍的列號為準）
+        rows_to_delete = selected_rows(table)
         
-        if not selected_items:
+        if not rows_to_delete:
             QMessageBox.warning(self, "警告", f"請先選擇要刪除的行！（{tab_name}分頁）")
             return
         
-        # 收集所有選定項目的行號
-        for item in selected_items:
-            selected_rows.add(item.row())
-        
         # 確認刪除
-        if len(selected_rows) == 1:
-            reply = QMessageBox.question(self, "確認刪除", f"確定要刪除{tab_name}分頁第 {min(selected_rows)+1} 行嗎？",
+        if len(rows_to_delete) == 1:
+            reply = QMessageBox.question(self, "確認刪除", f"確定要刪除{tab_name}分頁第 {min(rows_to_delete)+1} 行嗎？",
                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         else:
-            reply = QMessageBox.question(self, "確認刪除", f"確定要刪除{tab_name}分頁選定的 {len(selected_rows)} 行嗎？",
+            reply = QMessageBox.question(self, "確認刪除", f"確定要刪除{tab_name}分頁選定的 {len(rows_to_delete)} 行嗎？",
                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
             # 按照從高到低的順序刪除行（避免索引變化問題）
-            for row in sorted(selected_rows, reverse=True):
+            for row in sorted(rows_to_delete, reverse=True):
                 table.removeRow(row)
             
-            QMessageBox.information(self, "刪除成功", f"已刪除{tab_name}分頁 {len(selected_rows)} 行資料")
+            QMessageBox.information(self, "刪除成功", f"已刪除{tab_name}分頁 {len(rows_to_delete)} 行資料")
 
     def generate_buy_upload_file(self):
         """產生新作買進上傳檔"""
@@ -2100,8 +1945,8 @@ class TableEditor(QWidget):
             
             # 重新排列欄位順序
             df_upload = df[upload_columns]
-            df_upload['成交均價'] = df_upload['成交均價'].apply(lambda x: format_number_to_11(x, 11))
-            df_upload['單位權利金'] = df_upload['單位權利金'].apply(lambda x: format_number_to_11(x, 11))
+            df_upload['成交均價'] = format_number_to_11_column(df_upload['成交均價'], 11)
+            df_upload['單位權利金'] = format_number_to_11_column(df_upload['單位權利金'], 11)
             
             market_qty = len(df[df['來自'] == '盤面交易'])
             bargain_qty = len(df[df['來自'] == '議價交易'])
@@ -2112,31 +1957,50 @@ class TableEditor(QWidget):
                                        QMessageBox.Yes | QMessageBox.No)
             if reply == QMessageBox.No:
                 return
-            
-            # 儲存檔案（不含標題行
-            history_folder = os.path.join(upload_file_path, f'歷史上傳檔\{today}')
-            os.makedirs(history_folder, exist_ok=True)
-            df_upload.to_csv(os.path.join(upload_file_path, "新作上傳檔.csv"), index=False, encoding='cp950', header=False)
-            df.to_excel(os.path.join(history_folder, f"新作上傳檔_{today}.xlsx"), index=False)
-
-            # 產檔成功後扣減 VIP_Quote 張數
-            try:
-                self._deduct_vip_quote_after_upload(df, today)
-            except Exception as dedu_err:
-                print(f"扣減 VIP_Quote 張數失敗：{dedu_err}")
-
-            # 產檔成功後扣減 Penalty_Settings 張數
-            try:
-                self._deduct_penalty_after_upload(df, today)
-            except Exception as dedu_err:
-                print(f"扣減 Penalty_Settings 張數失敗：{dedu_err}")
 
-            QMessageBox.information(self, "產生成功", f"新作買進上傳檔已產生：\n{os.path.join(upload_file_path, f'新作上傳檔.csv')}")
+            # 寫檔與扣減張數都在網路磁碟上，改在背景執行
+            self.task_runner.submit(
+                self.write_buy_upload_file, df, df_upload, today,
+                name="產生新作上傳檔",
+                on_result=self.on_buy_upload_file_written,
+                on_error=lambda message: QMessageBox.critical(self, "產生失敗", f"發生錯誤：{message}"),
+                disable=[self.btn_buy_generate],
+            )
 
         except Exception as e:
             QMessageBox.critical(self, "產生失敗", f"發生錯誤：{e}")
 
-    def _deduct_vip_quote_after_upload(self, df_buy, today_str):
+    def write_buy_upload_file(self, df, df_upload, today):
+        """（背景執行）儲存新作上傳檔與歷史檔，並扣減 VIP_Quote / Penalty_Settings 張數"""
+        # 儲存檔案（不含標題行
+        history_folder = os.path.join(upload_file_path, f'歷史上傳檔\{today}')
+        os.makedirs(history_folder, exist_ok=True)
+        df_upload.to_csv(os.path.join(upload_file_path, "新作上傳檔.csv"), index=False, encoding='cp950', header=False)
+        df.to_excel(os.path.join(history_folder, f"新作上傳檔_{today}.xlsx"), index=False)
+
+        # 產檔成功後扣減 VIP_Quote 張數
+        try:
+            self._deduct_vip_quote_after_upload(df, today, reload_ui=False)
+        except Exception as dedu_err:
+            print(f"扣減 VIP_Quote 張數失敗：{dedu_err}")
+
+        # 產檔成功後扣減 Penalty_Settings 張數
+        try:
+            self._deduct_penalty_after_upload(df, today, reload_ui=False)
+        except Exception as dedu_err:
+            print(f"扣減 Penalty_Settings 張數失敗：{dedu_err}")
+
+        return os.path.join(upload_file_path, '新作上傳檔.csv')
+
+    def on_buy_upload_file_written(self, output_path):
+        # 扣減後的 VIP / 罰金設定重新載入到畫面（loading_vips 會一併載入罰金設定）
+        try:
+            self.loading_vips()
+        except Exception as refresh_err:
+            print(f"刷新VIP資料失敗：{refresh_err}")
+        QMessageBox.information(self, "產生成功", f"新作買進上傳檔已產生：\n{output_path}")
+
+    def _deduct_vip_quote_after_upload(self, df_buy, today_str, reload_ui=True):
         """產檔成功後依 VIP報價張數 扣減 VIP_Quote.csv 的張數並追加備註"""
         if 'VIP報價張數' not in df_buy.columns:
             return
@@ -2149,23 +2013,14 @@ class TableEditor(QWidget):
         df_vip_used['CB代號'] = df_vip_used['CB代號'].astype(str).str.strip()
         consumed = df_vip_used.groupby(['客戶ID', 'CB代號'], dropna=False)['VIP報價張數'].sum().to_dict()
 
-        vip_quote_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_Quote.csv"
-        df_vip_quote = None
-        used_encoding = 'utf-8-sig'
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_vip_quote = pd.read_csv(vip_quote_path, encoding=encoding, dtype=str)
-                used_encoding = encoding
-                break
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-        if df_vip_quote is None:
+        vip_quote_path = remote_path('vip_quote')
+        try:
+            local_path = cached_path(vip_quote_path, revalidate=True)
+            df_vip_quote = read_csv_file(local_path, VIP_QUOTE_SCHEMA)
+            used_encoding = csv_encoding(local_path)
+        except (UnicodeDecodeError, FileNotFoundError):
             print(f"無法讀取 {vip_quote_path}，跳過 VIP_Quote 扣減")
             return
-        if '張數' not in df_vip_quote.columns:
-            df_vip_quote['張數'] = ''
-        if '備註' not in df_vip_quote.columns:
-            df_vip_quote['備註'] = ''
 
         df_vip_quote['客戶ID'] = df_vip_quote['客戶ID'].astype(str).str.strip()
         df_vip_quote['CB代號'] = df_vip_quote['CB代號'].astype(str).str.strip()
@@ -2202,13 +2057,16 @@ class TableEditor(QWidget):
             df_vip_quote = df_vip_quote.drop(index=rows_to_drop).reset_index(drop=True)
 
         df_vip_quote.to_csv(vip_quote_path, index=False, encoding=used_encoding, header=True)
+        get_remote_cache().invalidate(vip_quote_path)
+        if not reload_ui:
+            return
         # 刷新UI
         try:
             self.loading_vips()
         except Exception as refresh_err:
             print(f"刷新VIP資料失敗：{refresh_err}")
 
-    def _deduct_penalty_after_upload(self, df_buy, today_str):
+    def _deduct_penalty_after_upload(self, df_buy, today_str, reload_ui=True):
         """產檔成功後依 罰金套用張數 扣減 Penalty_Settings.csv 的張數並追加備註。
 
         - 對每筆 buy row 的 (客戶ID, CB代號)，先嘗試在 CSV 找特定客戶設定；找不到再找 ALL。
@@ -2226,23 +2084,15 @@ class TableEditor(QWidget):
         df_used['CB代號'] = df_used['CB代號'].astype(str).str.strip()
         consumed = df_used.groupby(['客戶ID', 'CB代號'], dropna=False)['罰金套用張數'].sum().to_dict()
 
-        penalty_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Penalty_Settings.csv"
-        df_penalty = None
-        used_encoding = 'utf-8-sig'
-        for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-            try:
-                df_penalty = pd.read_csv(penalty_path, encoding=encoding, dtype=str)
-                used_encoding = encoding
-                break
-            except (UnicodeDecodeError, FileNotFoundError):
-                continue
-        if df_penalty is None:
+        penalty_path = remote_path('penalty_settings')
+        try:
+            local_path = cached_path(penalty_path, revalidate=True)
+            df_penalty = read_csv_file(local_path, PENALTY_SETTINGS_SCHEMA)
+            used_encoding = csv_encoding(local_path)
+        except (UnicodeDecodeError, FileNotFoundError):
             print(f"無法讀取 {penalty_path}，跳過 Penalty_Settings 扣減")
             return
 
-        for col_name in ('賠償金張數', '備註'):
-            if col_name not in df_penalty.columns:
-                df_penalty[col_name] = ''
         df_penalty['客戶ID'] = df_penalty['客戶ID'].astype(str).str.strip()
         df_penalty['CB代號'] = df_penalty['CB代號'].astype(str).str.strip()
 
@@ -2291,6 +2141,9 @@ class TableEditor(QWidget):
             df_penalty = df_penalty.drop(index=rows_to_drop).reset_index(drop=True)
 
         df_penalty.to_csv(penalty_path, index=False, encoding=used_encoding, header=True)
+        get_remote_cache().invalidate(penalty_path)
+        if not reload_ui:
+            return
         try:
             self.loading_penalty_settings()
         except Exception as refresh_err:
@@ -2319,8 +2172,8 @@ class TableEditor(QWidget):
             # 重新排列欄位順序
             df_upload = df[upload_columns]
 
-            df_upload['成交均價'] = df_upload['成交均價'].apply(lambda x: format_number_to_11(x, 11))
-            df_upload['選擇權交割單價'] = df_upload['選擇權交割單價'].apply(lambda x: format_number_to_11(x, 11))
+            df_upload['成交均價'] = format_number_to_11_column(df_upload['成交均價'], 11)
+            df_upload['選擇權交割單價'] = format_number_to_11_column(df_upload['選擇權交割單價'], 11)
 
 
             market_qty = len(df[df['來自'] == '盤面交易'])
@@ -2350,7 +2203,7 @@ class TableEditor(QWidget):
     def open_upload_folder(self):
         """打開上傳檔資料夾"""
         try:
-            folder_path = r'\\10.72.228.112\cbas業務公用區\CBAS上傳檔'
+            folder_path = upload_file_path
             if os.path.exists(folder_path):
                 os.startfile(folder_path)
             else:
@@ -2368,13 +2221,15 @@ class TableEditor(QWidget):
             
             # 產生錄音檔
             df_rec.insert(0, 'Date', datetime.now().strftime('%Y%m%d'))
-            if os.path.exists(r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\錄音檔.xlsx"):
-                df_rec_existing = pd.read_excel(r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\錄音檔.xlsx")
+            recording_path = remote_path('recording')
+            if os.path.exists(recording_path):
+                df_rec_existing = pd.read_excel(cached_path(recording_path, revalidate=True))
             else:
                 df_rec_existing = pd.DataFrame(columns=df_rec.columns)
             
             df_rec_final = pd.concat([df_rec_existing, df_rec])
-            df_rec_final.to_excel(r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\錄音檔.xlsx", index=False)
+            df_rec_final.to_excel(recording_path, index=False)
+            get_remote_cache().invalidate(recording_path)
             
             # 將錄音時間填回買進和賣出表格
             self.fill_recording_time_back(df_rec)
@@ -2615,27 +2470,16 @@ class TableEditor(QWidget):
     def update_recording_table(self, df_recording):
         """更新錄音表格顯示"""
         try:
-            self.table_recording.setSortingEnabled(False)
-            self.table_recording.setRowCount(len(df_recording))
+            # 依表頭對應欄位，DataFrame 沒有的欄位留空
+            df_show = df_recording.reindex(columns=table_headers(self.table_recording), fill_value='')
+            df_show = df_show.astype(object).where(df_show.notna(), '')
 
-            # 獲取表格的列名
-            recording_columns = [self.table_recording.horizontalHeaderItem(i).text() for i in range(self.table_recording.columnCount())]
-
-            for i, row in df_recording.iterrows():
-                for j, col_name in enumerate(recording_columns):
-                    # 如果DataFrame中有這個列，使用DataFrame的值；否則使用空字串
-                    if col_name in df_recording.columns:
-                        value = row[col_name] if pd.notna(row[col_name]) else ''
-                    else:
-                        value = ''
+            # 錄音人員為空時設置默認值為"蔡睿"
+            if '錄音人員' in df_show.columns:
+                is_blank = df_show['錄音人員'].map(lambda v: not v)
+                df_show.loc[is_blank, '錄音人員'] = '蔡睿'
 
-                    # 如果是錄音人員列且值為空，設置默認值為"蔡睿"
-                    if col_name == '錄音人員' and (not value or value == ''):
-                        value = '蔡睿'
-
-                    item = QTableWidgetItem(str(value))
-                    self.table_recording.setItem(i, j, item)
-            self.table_recording.setSortingEnabled(True)
+            self.table_recording.set_dataframe(df_show)
         except Exception as e:
             print(f"更新錄音表格時發生錯誤：{e}")
             import traceback
@@ -2652,10 +2496,11 @@ class TableEditor(QWidget):
                 return
             
             # VIP名單檔案路徑
-            vip_list_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_List.csv"
+            vip_list_path = remote_path('vip_list')
             
             # 儲存檔案
             df.to_csv(vip_list_path, index=False, encoding='utf-8-sig', header=True)
+            get_remote_cache().invalidate(vip_list_path)
             
             QMessageBox.information(self, "儲存成功", f"VIP名單已儲存至：\n{vip_list_path}")
             
@@ -2673,10 +2518,11 @@ class TableEditor(QWidget):
                 return
             
             # 特殊報價檔案路徑
-            vip_quote_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\VIP_Quote.csv"
+            vip_quote_path = remote_path('vip_quote')
             
             # 儲存檔案
             df.to_csv(vip_quote_path, index=False, encoding='utf-8-sig', header=True)
+            get_remote_cache().invalidate(vip_quote_path)
             
             QMessageBox.information(self, "儲存成功", f"特殊報價已儲存至：\n{vip_quote_path}")
             
@@ -2694,10 +2540,11 @@ class TableEditor(QWidget):
                 return
             
             # 常用客戶檔案路徑
-            customer_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Customer_List.csv"
+            customer_path = remote_path('customer_list')
             
             # 儲存檔案
             df.to_csv(customer_path, index=False, encoding='utf-8-sig', header=True)
+            get_remote_cache().invalidate(customer_path)
             
             QMessageBox.information(self, "儲存成功", f"常用客戶資料已儲存至：\n{customer_path}")
             
@@ -2707,28 +2554,11 @@ class TableEditor(QWidget):
     def load_customer_list(self):
         """讀取常用客戶資料"""
         try:
-            customer_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\Customer_List.csv"
-            
-            # 嘗試多種編碼讀取
-            df_customer = None
-            for encoding in ['utf-8-sig', 'utf-8', 'big5', 'gbk', 'cp950']:
-                try:
-                    df_customer = pd.read_csv(customer_path, encoding=encoding)
-                    break
-                except (UnicodeDecodeError, FileNotFoundError):
-                    continue
-            
-            # 如果檔案不存在，創建空的 DataFrame
-            if df_customer is None:
-                print(f"無法讀取 {customer_path}，將創建空的常用客戶名單")
-                df_customer = pd.DataFrame(columns=['客戶ID', '客戶名稱'])
+            # 檔案不存在時為空的客戶清單
+            df_customer = read_customer_list()
             
             # 更新常用客戶表格
-            self.table_customer.setRowCount(len(df_customer))
-            for i, row in df_customer.iterrows():
-                for j, col in enumerate(df_customer.columns):
-                    item = QTableWidgetItem(str(row[col]))
-                    self.table_customer.setItem(i, j, item)
+            self.table_customer.set_dataframe(df_customer)
             
             print("常用客戶資料已載入完成")
             
@@ -2747,7 +2577,7 @@ class TableEditor(QWidget):
         """暫存所有交易處理分頁的資料"""
         try:
             # 確保temp資料夾存在
-            temp_dir = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\temp"
+            temp_dir = remote_path('temp_dir')
             if not os.path.exists(temp_dir):
                 os.makedirs(temp_dir)
             
@@ -2800,7 +2630,7 @@ class TableEditor(QWidget):
     def temp_load_all(self):
         """讀取暫存的所有資料"""
         try:
-            temp_file_path = r"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\temp\temp.csv"
+            temp_file_path = os.path.join(remote_path('temp_dir'), 'temp.csv')
             
             if not os.path.exists(temp_file_path):
                 QMessageBox.warning(self, "警告", "暫存檔案不存在！")
@@ -2829,34 +2659,11 @@ class TableEditor(QWidget):
                 print(f"處理表格: {table_name}")
                 if not df.empty:
                     # 抓該表格欄位名稱（來自 header）
-                    table_columns = [
-                        table.horizontalHeaderItem(i).text()
-                        if table.horizontalHeaderItem(i) else f"Column{i}"
-                        for i in range(table.columnCount())
-                    ]
-
-                    was_sorting = table.isSortingEnabled()
-                    table.setSortingEnabled(False)
-                    table.setRowCount(len(df))
+                    table_columns = table_headers(table)
                     df = df[table_columns].reset_index(drop=True)
                     print(df)
                     # 將資料填入 QTableWidget 中
-                    for i, row in df.iterrows():
-                        for j, col in enumerate(df.columns):
-                            val = row[col]
-                            # 格式化數字：如果是整數就去掉 .0，如果是小數保留
-                            if pd.notna(val) and isinstance(val, (int, float)):
-                                if val == int(val):  # 如果是整數
-                                    text = str(int(val))
-                                else:  # 如果是小數
-                                    text = str(val)
-                            else:
-                                text = str(val) if pd.notna(val) else ""
-
-                            item = QTableWidgetItem(text)
-                            # 可加背景色：item.setBackground(QColor(230, 255, 230))
-                            table.setItem(i, j, item)
-                    table.setSortingEnabled(was_sorting)
+                    fill_table_widget(table, df, na_rep='', formatter=self._format_temp_cell)
 
             # 讀取後套用與「報價確認」/「張數確認」相同的上色結果
             try:
@@ -2875,6 +2682,13 @@ class TableEditor(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "讀取失敗", f"發生錯誤：{e}")
  
+    @staticmethod
+    def _format_temp_cell(val):
+        """格式化暫存檔數字：如果是整數就去掉 .0，如果是小數保留"""
+        if pd.notna(val) and isinstance(val, (int, float)) and val == int(val):
+            return str(int(val))
+        return str(val)
+
     def save_one(self):
         """儲存當前分頁資料（保留原有方法以相容性）"""
         current_tab = self.tabs.currentIndex()
@@ -2891,7 +2705,7 @@ class TableEditor(QWidget):
         elif tab_name == "議價交易":
             # 議價交易保存為 CSV
             today = datetime.now().strftime('%Y%m%d')
-            today_dir = rf"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\{today}"
+            today_dir = remote_path('daily_dir', tday=today)
             if not os.path.exists(today_dir):
                 os.makedirs(today_dir)
             
@@ -2905,7 +2719,7 @@ class TableEditor(QWidget):
         elif tab_name == "實物履約":
             # 實物履約保存為 CSV
             today = datetime.now().strftime('%Y%m%d')
-            today_dir = rf"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\{today}"
+            today_dir = remote_path('daily_dir', tday=today)
             if not os.path.exists(today_dir):
                 os.makedirs(today_dir)
             
@@ -2919,7 +2733,7 @@ class TableEditor(QWidget):
         elif tab_name == "合約到期":
             # 合約到期保存為 CSV
             today = datetime.now().strftime('%Y%m%d')
-            today_dir = rf"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\{today}"
+            today_dir = remote_path('daily_dir', tday=today)
             if not os.path.exists(today_dir):
                 os.makedirs(today_dir)
             
@@ -2933,7 +2747,7 @@ class TableEditor(QWidget):
         elif tab_name == "選擇權續期":
             # 選擇權續期保存為 CSV
             today = datetime.now().strftime('%Y%m%d')
-            today_dir = rf"\\10.72.228.112\cbas業務公用區\CBAS_Trading_Maker\{today}"
+            today_dir = remote_path('daily_dir', tday=today)
             if not os.path.exists(today_dir):
                 os.makedirs(today_dir)
             
@@ -3354,18 +3168,15 @@ class TableEditor(QWidget):
                 QMessageBox.warning(self, "警告", "新作買進分頁沒有資料！")
                 return
             
-            # 嘗試多種編碼讀取CSV文件
+            # 讀取申報文件（自動判斷編碼）
             tday_str = datetime.now().strftime('%Y%m%d')
             tmonth_str = datetime.now().strftime('%Y%m')
-            csv_path = rf'\\10.72.228.112\cbas業務公用區\稽核\{tmonth_str}月內稽\CBOQTA{tday_str}.csv'
-            df_report = None
-            for encoding in ['utf-8-sig', 'utf-8', 'big5', 'cp950', 'gbk']:
-                try:
-                    df_report = pd.read_csv(csv_path, encoding=encoding)
-                    break
-                except (UnicodeDecodeError, UnicodeError):
-                    continue
-            
+            csv_path = remote_path('audit_quota', tmonth=tmonth_str, tday=tday_str)
+            try:
+                df_report = read_csv_file(csv_path)
+            except UnicodeError:
+                df_report = None
+
             if df_report is None:
                 QMessageBox.critical(self, "錯誤", "無法讀取申報文件，請檢查文件編碼")
                 return
@@ -3433,7 +3244,7 @@ class TableEditor(QWidget):
     def add_asw_to_buy_table(self):
         tday = datetime.now()
         tdaystr = tday.strftime('%Y%m%d')
-        df_asw_buy = pd.read_excel(r'\\10.72.228.112\cbas業務公用區\CLN\ASW\新作上傳檔-ASW-B.xlsx')
+        df_asw_buy = pd.read_excel(cached_path(remote_path('asw_buy')))
         df_asw_buy['交易日'] = df_asw_buy['交易日'].astype(str)
         df_asw_buy['價格事件'] = df_asw_buy['價格事件'].astype(str).str.replace(r"\.0$", "", regex=True)
         df_asw_buy = df_asw_buy[df_asw_buy['交易日'] == tdaystr]
@@ -3456,7 +3267,7 @@ class TableEditor(QWidget):
             if col not in df_asw_buy.columns:
                 df_asw_buy[col] = ''
         df_asw_buy = df_asw_buy[buy_columns]
-        df_asw_buy = df_asw_buy.map(lambda x: strip_trailing_zeros(x) if pd.notna(x) else '').astype(str)
+        df_asw_buy = strip_trailing_zeros_frame(df_asw_buy).astype(str)
         # 將 df_asw_buy 逐行加入到 buy_table 裡面
         self.table_buy.setSortingEnabled(False)
         for idx, row in df_asw_buy.iterrows():
@@ -3480,7 +3291,13 @@ class TableEditor(QWidget):
 
 #====================買進賣出====================
 
-    def show_buy_table(self, df_buy_calculated):
+    def show_buy_table(self, df_buy_calculated, incremental=False):
+        """整理買進資訊並顯示
+
+        incremental=False：接在現有表格資料後面，整表重新編號後重填。
+        incremental=True（刷新資料使用）：以 客戶ID+CB代號+SRC+拆單段 為列鍵和畫面上的刷新列比對，
+        只新增/更新/刪除有變動的列，其餘列（含使用者修改、手動或其他來源加入的列）不動。
+        """
         try:
             # 定義 tday 變數
             tday = datetime.now()
@@ -3529,7 +3346,7 @@ class TableEditor(QWidget):
                 df_buy_calculated['標的波動率'] = df_buy_calculated['波動度']
             else:
                 df_buy_calculated['標的波動率'] = '0'
-            df_buy_calculated['無風險利率'] = rf
+            df_buy_calculated['無風險利率'] = get_risk_free_rate()
             df_buy_calculated['資金成本'] = '1.8'
             df_buy_calculated['轉債面額'] = '100000'
             df_buy_calculated['選擇權型態'] = 'C'
@@ -3577,15 +3394,20 @@ class TableEditor(QWidget):
             df_buy_final = df_buy_calculated[required_columns_order]
             
             # 轉換為字串格式
-            df_buy_final = df_buy_final.map(lambda x: strip_trailing_zeros(x) if pd.notna(x) else '').astype(str)
-            
-            # 取得現有表格資料並合併
-            df_exist = self.get_table_data(self.table_buy)
+            df_buy_final = strip_trailing_zeros_frame(df_buy_final).astype(str)
+
+            if incremental:
+                self.sync_buy_table(df_buy_final.reset_index(drop=True), self.buy_refresh_keys(df_buy_calculated), tdaystr)
+                return
+
+            # 取得現有表格資料並合併（保留既有列的列鍵，之後刷新仍可差異更新）
+            df_exist, exist_tags = read_table_widget(self.table_buy, with_tags=True)
+            row_tags = exist_tags + [None] * len(df_buy_final)
             
             if not df_exist.empty:
                 df_buy_final = pd.concat([df_exist, df_buy_final], ignore_index=True)
             
-            conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
+            conn = get_400_conn()
             df_buy_seq = strip_whitespace(pd.read_sql("SELECT * FROM FSPFLIB.ASPROD ORDER BY PRDID DESC LIMIT 10", conn))
             conn.close()
             
@@ -3596,15 +3418,7 @@ class TableEditor(QWidget):
 
 
 
-            self.table_buy.setSortingEnabled(False)
-            self.table_buy.setRowCount(len(df_buy_final))
-            blue_columns = ['交易類型', '權利金百元價', '履約利率%', '手續費(業務單位)', '成交張數', '成交均價']
-            for i, row in df_buy_final.iterrows():
-                for j, col in enumerate(df_buy_final.columns):
-                    item = QTableWidgetItem(str(row[col]))
-                    if col in blue_columns:
-                        item.setBackground(QColor(204, 229, 255))  # 淺藍色
-                    self.table_buy.setItem(i, j, item)
+            fill_table_widget(self.table_buy, df_buy_final, background_rules=BUY_BACKGROUND_RULES, row_tags=row_tags)
             self.table_buy.setSortingEnabled(True)
             
         except Exception as e:
@@ -3613,18 +3427,71 @@ class TableEditor(QWidget):
             traceback.print_exc()
             return pd.DataFrame()
 
+    @staticmethod
+    def buy_refresh_keys(df_buy_calculated) -> list:
+        """刷新列的列鍵：客戶ID + CB代號 + SRC + 同組內第幾段（特殊報價/罰金拆單後依序編號）"""
+        df_key = pd.DataFrame({
+            '客戶ID': df_buy_calculated['客戶ID'].astype(str).str.strip(),
+            'CB代號': df_buy_calculated['CB代號'].astype(str).str.strip(),
+            'SRC': (df_buy_calculated['SRC'].fillna('').astype(str).str.strip()
+                    if 'SRC' in df_buy_calculated.columns else ''),
+        }, index=df_buy_calculated.index)
+        segment = df_key.groupby(['客戶ID', 'CB代號', 'SRC'], sort=False).cumcount().astype(str)
+        keys = BUY_REFRESH_KEY_PREFIX + df_key['客戶ID'] + '|' + df_key['CB代號'] + '|' + df_key['SRC'] + '|' + segment
+        return keys.tolist()
+
+    def sync_buy_table(self, df_buy_final, row_keys, tdaystr):
+        """差異更新買進表格：既有列保留原本的新作契約編號/上傳序號，只有新增的列接續編號"""
+        df_exist, exist_tags = read_table_widget(self.table_buy, with_tags=True)
+        on_screen = {tag[0] for tag in exist_tags if tag is not None}
+        is_new = np.array([key not in on_screen for key in row_keys], dtype=bool)
+
+        if is_new.any():
+            conn = get_400_conn()
+            df_buy_seq = strip_whitespace(pd.read_sql("SELECT * FROM FSPFLIB.ASPROD ORDER BY PRDID DESC LIMIT 10", conn))
+            conn.close()
+
+            # 新增列接續編號：資料庫最後一號與畫面上已編的號碼取大者
+            contract_prefix = f"ASOP{tdaystr[2:4]}{tdaystr[4:6]}"
+            upload_prefix = f"A{tdaystr}"
+            last_number_buy = int(str(df_buy_seq.iloc[0]['PRDID'])[-4:])
+            last_upload = 0
+            if not df_exist.empty:
+                shown = df_exist['新作契約編號'].astype(str)
+                shown = pd.to_numeric(shown[shown.str.startswith(contract_prefix)].str[-4:], errors='coerce').dropna()
+                if not shown.empty:
+                    last_number_buy = max(last_number_buy, int(shown.max()))
+                shown = df_exist['上傳序號'].astype(str)
+                shown = pd.to_numeric(shown[shown.str.startswith(upload_prefix)].str[len(upload_prefix):], errors='coerce').dropna()
+                if not shown.empty:
+                    last_upload = int(shown.max())
+
+            n_new = int(is_new.sum())
+            df_buy_final.loc[is_new, '新作契約編號'] = [f"{contract_prefix}{last_number_buy + i + 1:04d}" for i in range(n_new)]
+            df_buy_final.loc[is_new, '上傳序號'] = [f"{upload_prefix}{last_upload + i + 1:03d}" for i in range(n_new)]
+
+        counts = sync_table_widget(
+            self.table_buy, df_buy_final, row_keys,
+            key_prefix=BUY_REFRESH_KEY_PREFIX,
+            keep_columns=['新作契約編號', '上傳序號'],
+            background_rules=BUY_BACKGROUND_RULES,
+        )
+        self.table_buy.setSortingEnabled(True)
+        print(f"買進表格差異更新：新增 {counts['inserted']} 筆、更新 {counts['updated']} 筆、"
+              f"刪除 {counts['removed']} 筆、未變動 {counts['unchanged']} 筆")
+
     def renumber_buy_table(self):
         """重新編號買進表格的新作契約編號和上傳序號"""
         try:
             # 讀取現有表格資料
-            df_buy = self.get_table_data(self.table_buy)
+            df_buy, row_tags = read_table_widget(self.table_buy, with_tags=True)
             
             if df_buy.empty:
                 QMessageBox.warning(self, "警告", "買進表格沒有資料！")
                 return
             
             # 從數據庫獲取最後一個編號
-            conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
+            conn = get_400_conn()
             df_buy_seq = strip_whitespace(pd.read_sql("SELECT * FROM FSPFLIB.ASPROD ORDER BY PRDID DESC LIMIT 10", conn))
             conn.close()
             
@@ -3646,19 +3513,7 @@ class TableEditor(QWidget):
             df_buy['上傳序號'] = [f"A{tdaystr}{i+1:03d}" for i in range(len(df_buy))]
             
             # 更新表格顯示
-            buy_columns = [self.table_buy.horizontalHeaderItem(i).text() for i in range(self.table_buy.columnCount())]
-            self.table_buy.setSortingEnabled(False)
-            self.table_buy.setRowCount(len(df_buy))
-
-            blue_columns = ['交易類型', '權利金百元價', '履約利率%', '手續費(業務單位)', '成交張數', '成交均價']
-            for i, row in df_buy.iterrows():
-                for j, col in enumerate(df_buy.columns):
-                    if col in buy_columns:
-                        col_idx = buy_columns.index(col)
-                        item = QTableWidgetItem(str(row[col]))
-                        if col in blue_columns:
-                            item.setBackground(QColor(204, 229, 255))  # 淺藍色
-                        self.table_buy.setItem(i, col_idx, item)
+            fill_table_widget(self.table_buy, df_buy, by_header=True, background_rules=BUY_BACKGROUND_RULES, row_tags=row_tags)
             self.table_buy.setSortingEnabled(True)
             
             QMessageBox.information(self, "成功", f"已重新編號 {len(df_buy)} 筆買進資料！")
@@ -3679,7 +3534,7 @@ class TableEditor(QWidget):
                 return
             
             # 從數據庫獲取最後一個編號
-            conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
+            conn = get_400_conn()
             df_sell_seq = strip_whitespace(pd.read_sql("SELECT * FROM FSPFLIB.ASSURR ORDER BY SEQNO DESC LIMIT 10", conn))
             conn.close()
             
@@ -3700,16 +3555,7 @@ class TableEditor(QWidget):
             df_sell['解約契約編號'] = [f"ASCP{yy}{mm}{last_number + i + 1:04d}" for i in range(len(df_sell))]
             
             # 更新表格顯示
-            sell_columns = [self.table_sell.horizontalHeaderItem(i).text() for i in range(self.table_sell.columnCount())]
-            self.table_sell.setSortingEnabled(False)
-            self.table_sell.setRowCount(len(df_sell))
-
-            for i, row in df_sell.iterrows():
-                for j, col in enumerate(df_sell.columns):
-                    if col in sell_columns:
-                        col_idx = sell_columns.index(col)
-                        item = QTableWidgetItem(str(row[col]))
-                        self.table_sell.setItem(i, col_idx, item)
+            fill_table_widget(self.table_sell, df_sell, by_header=True)
             self.table_sell.setSortingEnabled(True)
             
             QMessageBox.information(self, "成功", f"已重新編號 {len(df_sell)} 筆賣出資料！")
@@ -3747,8 +3593,14 @@ class TableEditor(QWidget):
     
     def show_sell_table(self, df_sell_data, from_where=None):
         """整理賣出資訊，並合併現有資料"""
+        df_sell = self.build_sell_rows(df_sell_data, from_where)
+        if df_sell is not None:
+            self.append_sell_rows(df_sell)
+
+    def build_sell_rows(self, df_sell_data, from_where=None):
+        """查詢原契約/客戶名稱並計算賣出欄位（不操作表格，可在背景執行緒執行）；發生錯誤時回傳 None"""
         try:
-            conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
+            conn = get_400_conn()
             df_cusname = strip_whitespace(pd.read_sql("SELECT CUSID, CUSNAME FROM FSPFLIB.FSPCS0M WHERE CBASCODE = 'Y'", conn))
             df_prdid = df_sell_data['原單契約編號'].unique()
             prdid_values = "', '".join(df_prdid)
@@ -3797,7 +3649,7 @@ class TableEditor(QWidget):
                 df_sell_copy = df_sell_copy.merge(df_cusname[['CUSID', 'CUSNAME']], left_on='客戶ID', right_on='CUSID', how='left')
                 df_sell_copy.rename(columns={'CUSNAME': '客戶名稱'}, inplace=True)
             if 'CB名稱' not in df_sell_copy.columns:
-                df_sell_copy['CB代號'] = df_sell_copy['CB代號'].apply(lambda x: strip_trailing_zeros(x)).astype(str)
+                df_sell_copy['CB代號'] = strip_trailing_zeros_column(df_sell_copy['CB代號']).astype(str)
                 df_sell_copy = df_sell_copy.merge(self.df_cbinfo[['CB代號', 'CB名稱']], left_on='CB代號', right_on='CB代號', how='left')
 
             df_sell = df_sell_copy[[
@@ -3813,13 +3665,25 @@ class TableEditor(QWidget):
                 df_sell['交割總金額'] = df_sell['履約張數'].astype(float).astype(int) * df_sell['選擇權交割單價'].astype(float) * 1000
             
             df_sell['交割總金額'] = np.round(pd.to_numeric(df_sell['交割總金額'], errors='coerce')).astype(int)
-            df_sell['選擇權交割單價'] = df_sell['選擇權交割單價'].apply(lambda x: float_to_str_maxlen(x, 11))
-            df_sell['成交均價'] = df_sell['成交均價'].apply(lambda x: float_to_str_maxlen(x, 11))
+            df_sell['選擇權交割單價'] = float_to_str_maxlen_column(df_sell['選擇權交割單價'], 11)
+            df_sell['成交均價'] = float_to_str_maxlen_column(df_sell['成交均價'], 11)
+            conn.close()
+            return df_sell
+        except Exception as e:
+            print(f"顯示賣出表格時發生錯誤: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
 
+    def append_sell_rows(self, df_sell):
+        """將整理好的賣出資料接在現有表格後面，重新編號後顯示"""
+        try:
             df_exist = self.get_table_data(self.table_sell)
             df_sell = pd.concat([df_exist, df_sell], ignore_index=True)
             
+            conn = get_400_conn()
             df_sell_seq = strip_whitespace(pd.read_sql("SELECT * FROM FSPFLIB.ASSURR ORDER BY SEQNO DESC LIMIT 10", conn)) #取解約契約編號
+            conn.close()
             first_seqno = df_sell_seq.iloc[0]['SEQNO']
             last_number = int(str(first_seqno)[-4:])
             tday = datetime.now()
@@ -3829,7 +3693,7 @@ class TableEditor(QWidget):
             new_seqnos_sell = [f"ASCP{yy}{mm}{last_number + i + 1:04d}" for i in range(len(df_sell))]
             #df_sell.insert(0, '解約契約編號', new_seqnos_sell)
             df_sell['解約契約編號'] = new_seqnos_sell
-            df_sell_final = df_sell.map(lambda x: strip_trailing_zeros(x)).astype(str)
+            df_sell_final = strip_trailing_zeros_frame(df_sell).astype(str)
             # 檢查成交均價是否都大於履約價
             try:
                 price_check = pd.to_numeric(df_sell_final['成交均價'], errors='coerce') > pd.to_numeric(df_sell_final['履約價'], errors='coerce')
@@ -3842,17 +3706,8 @@ class TableEditor(QWidget):
             except Exception as e:
                 print(f"價格檢查時發生錯誤: {e}")
 
-            self.table_sell.setSortingEnabled(False)
-            self.table_sell.setRowCount(len(df_sell_final))
-            blue_columns = ['原單契約編號', '履約張數', '成交均價', '履約利率']
-            for i, row in df_sell_final.iterrows():
-                for j, col in enumerate(df_sell_final.columns):
-                    item = QTableWidgetItem(str(row[col]))
-                    if col in blue_columns:
-                        item.setBackground(QColor(204, 229, 255))  # 淺藍色
-                    self.table_sell.setItem(i, j, item)
+            fill_table_widget(self.table_sell, df_sell_final, background_rules=SELL_BACKGROUND_RULES)
             self.table_sell.setSortingEnabled(True)
-            conn.close()
         except Exception as e:
             print(f"顯示賣出表格時發生錯誤: {e}")
             import traceback
@@ -3876,30 +3731,63 @@ class TableEditor(QWidget):
             self.loading_vips()
             settle_qdate = self.dateedit_settle.date()
             settle_date = datetime(settle_qdate.year(), settle_qdate.month(), settle_qdate.day())
-            tday = datetime.now()
-            df_buy = read_today_trade_buy(tday, settle_date)
-            df_sell = read_today_trade_sell(tday, settle_date)
-            df_buy = calculate_new_trade_batch(df_buy, settle_date, default_fee=self.get_default_fee())
-            df_buy = self.apply_penalty_settings(df_buy)
-            self.show_buy_table(df_buy)
-            self.show_sell_table(df_sell)
-            QMessageBox.information(self, "刷新成功", "資料已重新載入！")
+            # 罰金規則在 GUI 執行緒先讀好，背景工作不碰表格
+            penalty_rules = parse_penalty_rules(self.get_table_data(self.table_penalty))
+            self.task_runner.submit(
+                self.load_today_trades, settle_date, self.get_default_fee(), penalty_rules,
+                name="讀取今日買賣",
+                on_result=self.on_today_trades_loaded,
+                on_error=lambda message: QMessageBox.critical(self, "刷新失敗", f"發生錯誤：{message}"),
+                disable=[self.btn_refresh],
+            )
         except Exception as e:
             QMessageBox.critical(self, "刷新失敗", f"發生錯誤：{e}")
 
+    def load_today_trades(self, settle_date, default_fee, penalty_rules):
+        """（背景執行）讀取今日買賣、計算新作並查好賣出需要的契約資料"""
+        tday = datetime.now()
+        df_buy = read_today_trade_buy(tday, settle_date)
+        df_sell = read_today_trade_sell(tday, settle_date)
+        df_buy = calculate_new_trade_batch(df_buy, settle_date, default_fee=default_fee)
+        if df_buy is not None and not df_buy.empty:
+            try:
+                df_buy = allocate_penalty(df_buy, penalty_rules)
+            except Exception as e:
+                print(f"套用罰金設定時發生錯誤：{e}")
+        return df_buy, self.build_sell_rows(df_sell)
+
+    def on_today_trades_loaded(self, result):
+        df_buy, df_sell = result
+        self.show_buy_table(df_buy, incremental=True)
+        if df_sell is not None:
+            self.append_sell_rows(df_sell)
+        QMessageBox.information(self, "刷新成功", "資料已重新載入！")
+
     def refresh_quote(self):
-        """重新載入報價表"""
-        try:
-            self.df_quote, self.duplicate_cb, self.df_cbinfo = load_quote()
+        """重新載入報價表（在背景解析，完成後由 on_quote_reloaded 更新）"""
+        self.quote_watcher.request_reload()
+
+    def on_quote_reloaded(self, df_quote, duplicate_cb, df_cbinfo, manual):
+        """報價表背景解析完成：一次替換報價資料，並更新已開啟的報價表/計算機窗口"""
+        self.df_quote, self.duplicate_cb, self.df_cbinfo = df_quote, duplicate_cb, df_cbinfo
+        if self.quote_window is not None:
+            self.quote_window.update_quote(self.df_quote.copy())
+        if getattr(self, 'calculator_window', None) is not None:
+            self.calculator_window.update_quote(self.df_quote.copy())
+        print("報價表已重新載入完成")
+        self.examin_quote_duplicate(duplicate_cb)
+        if manual:
             QMessageBox.information(self, "重新載入成功", "報價表已重新載入完成！")
-            print("報價表已重新載入完成")
-        except Exception as e:
-            QMessageBox.critical(self, "載入失敗", f"無法載入報價表：{e}")
+
+    def on_quote_reload_failed(self, message, manual):
+        print(message)
+        if manual:
+            QMessageBox.critical(self, "載入失敗", message)
 
     def open_quote_file(self):
         """打開報價表Excel文件"""
         try:
-            quote_file_path = r'\\10.72.228.112\cbas業務公用區\統一證CBAS報價表_內部.xlsm'
+            quote_file_path = remote_path('quote')
             if os.path.exists(quote_file_path):
                 os.startfile(quote_file_path)
             else:
@@ -3949,16 +3837,7 @@ class TableEditor(QWidget):
 
     def get_table_data(self, table):
         """從表格中讀取所有資料並轉換為 DataFrame"""
-        data = []
-        headers = [table.horizontalHeaderItem(i).text() for i in range(table.columnCount())]
-        for row in range(table.rowCount()):
-            row_data = []
-            for col in range(table.columnCount()):
-                item = table.item(row, col)
-                row_data.append(item.text() if item else "")
-            if any(cell.strip() for cell in row_data):
-                data.append(row_data)
-        return pd.DataFrame(data, columns=headers) if data else pd.DataFrame(columns=headers)
+        return read_table_widget(table)
 
     def process_bargain(self):
         """處理議價交易資料"""
@@ -3983,21 +3862,8 @@ class TableEditor(QWidget):
         if df_bargain_processed.empty:
             return
         
-        self.table_bargain.setRowCount(len(df_bargain_processed))
-        
-        #light_yellow = QColor(255, 255, 224)
-        light_green = QColor(204, 255, 204)
-        light_blue = QColor(204, 229, 255)
-        for i, row in df_bargain_processed.iterrows():
-            for j, col in enumerate(df_bargain_processed.columns):
-                item = QTableWidgetItem(str(row[col]))
-                if col in ['交割日期', '客戶名稱', 'CB名稱', '議價金額', '銀行', '分行', '銀行帳號', '集保帳號', '通訊地址']:
-                    item.setBackground(light_blue)
-
-                if col in ['成交日期', '錄音時間', '單據編號', 'T+?交割', '買/賣', '客戶ID', 'CB代號', '議價張數', '議價價格', '參考價', '錄音時間']:
-                    item.setBackground(light_green)
-
-                self.table_bargain.setItem(i, j, item)
+        fill_table_widget(self.table_bargain, df_bargain_processed.reset_index(drop=True),
+                          background_rules=BARGAIN_BACKGROUND_RULES)
 
     def generate_tickets(self):
         """產給付憑證及買賣成交單"""
@@ -4007,16 +3873,18 @@ class TableEditor(QWidget):
                 QMessageBox.warning(self, "警告", "議價交易分頁沒有資料！")
                 return
             
-            for index, row in bargain_data.iterrows():
-                if any(cell.strip() for cell in row if isinstance(cell, str)):
-                    row_dict = row.to_dict()
-                    generate_settlement_voucher(row_dict)
-                    generate_trading_slip(row_dict)
+            # 範本只讀一次，整批單據平行產生（使用 Excel 轉檔時每個執行緒共用一個 Excel）
+            df_manifest = generate_bargain_documents(bargain_data)
 
             generate_bargain_upload_file(bargain_data)
             save_trading_statement(bargain_data)
             
-            QMessageBox.information(self, "生成成功", f"已生成 {len(bargain_data)} 筆交易的給付憑證及成交單！\n\n已將議價交易資料儲存至議價明細.xlsx")
+            message = f"已生成 {len(bargain_data)} 筆交易的給付憑證及成交單！\n\n已將議價交易資料儲存至議價明細.xlsx"
+            df_failed = df_manifest[df_manifest['狀態'] != '成功']
+            if not df_failed.empty:
+                failed_list = '\n'.join(f"{r['文件']} {r['單據編號']}：{r['錯誤']}" for r in df_failed.to_dict('records'))
+                message += f"\n\n以下 {len(df_failed)} 份單據產生失敗：\n{failed_list}"
+            QMessageBox.information(self, "生成成功", message)
         except Exception as e:
             QMessageBox.critical(self, "生成失敗", f"發生錯誤：{e}")
 
@@ -4098,29 +3966,83 @@ class TableEditor(QWidget):
                 QMessageBox.warning(self, "輸入錯誤", "履約張數必須是整數！")
                 return
             
-            # 查詢資料庫獲取相關契約資訊
-            result_data = fetch_exercise_contracts(cus_id, cb_code, exercise_qty_int, settlement_date, self.df_quote)
+            # 查詢資料庫獲取相關契約資訊（背景執行）
+            self.task_runner.submit(
+                fetch_exercise_contracts, cus_id, cb_code, exercise_qty_int, settlement_date, self.df_quote,
+                name="查詢履約資訊",
+                on_result=lambda result_data: self.on_exercise_contracts_fetched(
+                    [(cus_id, cb_code, exercise_qty_int, settlement_date)], result_data),
+                on_error=lambda message: QMessageBox.critical(self, "查詢失敗", f"發生錯誤：{message}"),
+                disable=[self.btn_query_exercise],
+            )
             
-            if result_data.empty:
-                QMessageBox.information(self, "查詢結果", "沒有找到符合條件的契約資料！")
-                self.table_exercise_result.setRowCount(0)
+        except Exception as e:
+            QMessageBox.critical(self, "查詢失敗", f"發生錯誤：{e}")
+
+    def on_exercise_contracts_fetched(self, requests, result_data):
+        # 檢查是否有庫存不足的情況（查無契約時只顯示查無資料）
+        if not result_data.empty:
+            warn_exercise_shortage(self, requests, result_data)
+        if result_data.empty:
+            QMessageBox.information(self, "查詢結果", "沒有找到符合條件的契約資料！")
+            self.table_exercise_result.setRowCount(0)
+            return
+        
+        # 更新結果表格
+        update_exercise_result_table(self.table_exercise_result, result_data)
+        
+        QMessageBox.information(self, "查詢成功", f"找到 {len(result_data)} 筆符合條件的契約！")
+
+    def query_exercise_batch(self):
+        """批次查詢履約資訊：貼上多筆 (客戶ID, CB代號, 履約張數, 交割日)，一次查詢並分配"""
+        try:
+            text, ok = QInputDialog.getMultiLineText(
+                self, "批次查詢履約",
+                "每行一筆：客戶ID、CB代號、履約張數、交割日(YYYYMMDD，可省略)\n可直接從 Excel 貼上；省略交割日時使用上方的交割日",
+            )
+            if not ok or not text.strip():
                 return
-            
-            # 更新結果表格
-            update_exercise_result_table(self.table_exercise_result, result_data)
-            
-            QMessageBox.information(self, "查詢成功", f"找到 {len(result_data)} 筆符合條件的契約！")
-            
+            settlement_qdate = self.input_settlement_date.date()
+            settlement_date = datetime(settlement_qdate.year(), settlement_qdate.month(), settlement_qdate.day())
+            requests, errors = parse_exercise_requests(text, settlement_date)
+            if errors:
+                QMessageBox.warning(self, "輸入錯誤", "\n".join(errors))
+                return
+            if not requests:
+                QMessageBox.warning(self, "輸入錯誤", "請輸入履約清單！")
+                return
+
+            self.task_runner.submit(
+                fetch_exercise_contracts_batch, requests, self.df_quote,
+                name="批次查詢履約",
+                on_result=lambda result_data: self.on_exercise_batch_fetched(requests, result_data),
+                on_error=lambda message: QMessageBox.critical(self, "查詢失敗", f"發生錯誤：{message}"),
+                disable=[self.btn_query_exercise, self.btn_query_exercise_batch],
+            )
         except Exception as e:
             QMessageBox.critical(self, "查詢失敗", f"發生錯誤：{e}")
+
+    def on_exercise_batch_fetched(self, requests, result_data):
+        warn_exercise_shortage(self, requests, result_data)
+        if result_data.empty:
+            QMessageBox.information(self, "查詢結果", "沒有找到符合條件的契約資料！")
+            self.table_exercise_result.setRowCount(0)
+            return
+
+        update_exercise_result_table(self.table_exercise_result, result_data)
+        QMessageBox.information(self, "查詢成功", f"{len(requests)} 筆履約需求共分配到 {len(result_data)} 筆契約！")
     
 #====================選擇權續期====================
 
     def query_renewal_contracts(self):
-        """查詢續期合約資料並進行聚合"""
+        """查詢續期合約資料並進行聚合（資料庫查詢在背景執行）"""
         cus_id_text = self.input_renewal_cus_id.currentText().strip()
         cb_code_text = self.input_renewal_cb_code.currentText().strip()
-        self.df_original_contracts = query_renewal_contracts(cus_id_text, cb_code_text, self.df_quote, self.table_renewal_query)
+        query_renewal_contracts(cus_id_text, cb_code_text, self.df_quote, self.table_renewal_query,
+                                on_loaded=self.on_renewal_contracts_loaded, button=self.btn_query_renewal)
+
+    def on_renewal_contracts_loaded(self, df_original_contracts):
+        self.df_original_contracts = df_original_contracts
 
             
     #def update_renewal_table(self, table, df, columns):
@@ -4130,6 +4052,11 @@ class TableEditor(QWidget):
 
 
 if __name__ == "__main__":
+    # 今日交易明細以行程池產檔，打包成執行檔時子行程需要 freeze_support
+    import multiprocessing
+    multiprocessing.freeze_support()
+    print("讀取資料啟動中")
+    get_risk_free_rate()
     app = QApplication(sys.argv)
     editor = TableEditor()
     # 不自動讀資料，啟動時不呼叫 get_today_trade_buy/get_today_trade_sell
@@ -1,201 +1,217 @@
 import pandas as pd
-import pyodbc
+from db_access import get_400_conn
 from PyQt5.QtWidgets import QTableWidgetItem, QMessageBox
 from PyQt5.QtGui import QColor
 from PyQt5.QtCore import Qt
 from datetime import datetime
 import numpy as np
-from format_utils import strip_trailing_zeros, next_business_day
+from format_utils import strip_trailing_zeros_column, next_business_day
 from format_utils import strip_whitespace
+from task_runner import get_task_runner
+from remote_cache import remote_path
+from daily_snapshot import load_asccsv02, sold_qty_by_contract
+from pricing import exercise_price
 
 
-def query_renewal_contracts(cus_id_text, cb_code_text, df_quote, table_renewal_query):
-    """查詢續期合約資料並進行聚合"""
+def query_renewal_contracts(cus_id_text, cb_code_text, df_quote, table_renewal_query, on_loaded=None, button=None):
+    """查詢續期合約資料並進行聚合
+
+    資料庫查詢與聚合在背景執行，完成後更新表格並以 on_loaded(df_original_contracts) 回傳原始合約資料
+    （查無資料或失敗時為 None）；查詢期間停用 button。
+    """
+    def _loaded(df_original_contracts):
+        if on_loaded is not None:
+            on_loaded(df_original_contracts)
+
+    # 從ComboBox中提取客戶ID和CB代號
+    cus_id = cus_id_text.split(" - ")[0] if " - " in cus_id_text else cus_id_text
+    cb_code = cb_code_text.split(" - ")[0] if " - " in cb_code_text else cb_code_text
+    
+    # 驗證輸入（客戶ID和CB代號至少要輸入一個）
+    if not cus_id and not cb_code:
+        QMessageBox.warning(None, "輸入錯誤", "請至少輸入客戶ID或CB代號！")
+        _loaded(None)
+        return
+
+    def _on_result(result):
+        df_original_contracts, df_aggregated = result
+        if df_original_contracts is None:
+            QMessageBox.information(None, "查詢結果", "沒有找到符合條件的合約資料！")
+            table_renewal_query.setRowCount(0)
+            _loaded(None)
+            return
+        update_renewal_query_table(table_renewal_query, df_aggregated)
+        QMessageBox.information(None, "查詢完成", f"找到 {len(df_aggregated)} 筆聚合的客戶+標的組合！")
+        _loaded(df_original_contracts)
+
+    def _on_error(message):
+        QMessageBox.critical(None, "查詢失敗", f"發生錯誤：{message}")
+        print(f"查詢續期合約錯誤：{message}")
+        _loaded(None)
+
+    get_task_runner().submit(
+        fetch_renewal_contracts, cus_id, cb_code, df_quote,
+        name="續期查詢", on_result=_on_result, on_error=_on_error, disable=[button],
+    )
+
+
+def fetch_renewal_contracts(cus_id, cb_code, df_quote):
+    """從資料庫查詢續期合約並依 客戶+標的 聚合（不操作介面，可在背景執行緒執行）
+
+    Returns:
+        (df_original_contracts, df_aggregated)；查無資料時為 (None, 空 DataFrame)
+    """
+    # 從資料庫查詢合約資料
+    conn = get_400_conn()
+    
+    # 建構查詢條件
+    where_conditions = ["a.STORQTY > 0"]
+    
+    if cus_id:
+        # 補齊客戶ID到12位
+        db_cusid_length = 12
+        cus_id_padded = cus_id.ljust(db_cusid_length)
+        where_conditions.append(f"a.CUSID = '{cus_id_padded}'")
+    
+    if cb_code:
+        where_conditions.append(f"a.CBCODE = '{cb_code}'")
+    
+    where_clause = " AND ".join(where_conditions)
+    
+    # 保持原SQL不變，取得所有個別契約資料
+    sql_query = f"""
+        SELECT 
+            a.PRDID,
+            a.CUSID,
+            c.CUSNAME,
+            a.CBCODE,
+            a.STORQTY,
+            a.PERRATE,
+            a.CBTCOST,
+            a.TRDATE,
+            a.CBTPDT,
+            a.CBTPPRI,
+            a.OPTEXDT
+        FROM FSPFLIB.ASPROD a 
+        LEFT JOIN FSPFLIB.FSPCS0M c ON a.CUSID = c.CUSID 
+        WHERE {where_clause}
+        ORDER BY a.PRDID DESC
+    """
+    
+    # 使用pd.read_sql直接取得DataFrame
     try:
-        # 從ComboBox中提取客戶ID和CB代號
-        cus_id = cus_id_text.split(" - ")[0] if " - " in cus_id_text else cus_id_text
-        cb_code = cb_code_text.split(" - ")[0] if " - " in cb_code_text else cb_code_text
-        
-        # 驗證輸入（客戶ID和CB代號至少要輸入一個）
-        if not cus_id and not cb_code:
-            QMessageBox.warning(None, "輸入錯誤", "請至少輸入客戶ID或CB代號！")
-            return None
-        
-        # 從資料庫查詢合約資料
-        conn = pyodbc.connect('DSN=PSCDB', UID='FSP631', PWD='FSP631')
-        
-        # 建構查詢條件
-        where_conditions = ["a.STORQTY > 0"]
-        
-        if cus_id:
-            # 補齊客戶ID到12位
-            db_cusid_length = 12
-            cus_id_padded = cus_id.ljust(db_cusid_length)
-            where_conditions.append(f"a.CUSID = '{cus_id_padded}'")
-        
-        if cb_code:
-            where_conditions.append(f"a.CBCODE = '{cb_code}'")
-        
-        where_clause = " AND ".join(where_conditions)
-        
-        # 保持原SQL不變，取得所有個別契約資料
-        sql_query = f"""
-            SELECT 
-                a.PRDID,
-                a.CUSID,
-                c.CUSNAME,
-                a.CBCODE,
-                a.STORQTY,
-                a.PERRATE,
-                a.CBTCOST,
-                a.TRDATE,
-                a.CBTPDT,
-                a.CBTPPRI,
-                a.OPTEXDT
-            FROM FSPFLIB.ASPROD a 
-            LEFT JOIN FSPFLIB.FSPCS0M c ON a.CUSID = c.CUSID 
-            WHERE {where_clause}
-            ORDER BY a.PRDID DESC
-        """
-        
-        # 使用pd.read_sql直接取得DataFrame
         df_contracts = pd.read_sql(sql_query, conn)
+    finally:
         conn.close()
-        
-        if df_contracts.empty:
-            QMessageBox.information(None, "查詢結果", "沒有找到符合條件的合約資料！")
-            table_renewal_query.setRowCount(0)
-            return None
-        
-        # 保存原始合約資料供後續使用
-        df_original_contracts = df_contracts.copy()
-        
-        df_contracts = strip_whitespace(df_contracts)
-        
-        # 重新命名欄位為中文
-        df_contracts.rename(columns={
-            'PRDID': '新作契約編號',
-            'CUSID': '客戶ID', 
-            'CUSNAME': '客戶名稱',
-            'CBCODE': 'CB代號',
-            'STORQTY': '原庫存張數',
-            'PERRATE': '原履約利率',
-            'CBTCOST': '成交均價',
-            'TRDATE': '原交易日期',
-            'CBTPDT': '賣回日',
-            'CBTPPRI': '賣回價',
-            'OPTEXDT': '選擇權到期日'
-        }, inplace=True)
-        
-        # 合併CB名稱
-        df_contracts['CB代號'] = df_contracts['CB代號'].apply(lambda x: strip_trailing_zeros(x)).astype(str)
-        df_contracts = df_contracts.merge(df_quote[['CB代號', 'CB名稱']], on='CB代號', how='left')
-        
-        # 讀取ASCCSV02.csv取得今日賣出張數
-        try:
-            tday = datetime.now().strftime('%Y%m%d')
-            csv_path_sell = rf"\\10.72.228.83\CBAS_Logs\{tday}\AfterClose\ASCCSV02.csv"
-            df_sell = pd.read_csv(csv_path_sell, encoding='utf-8-sig')
-            
-            # 設定欄位名稱（根據你提供的結構）
-            sell_columns_map = {
-                df_sell.columns[0]: 'PRDID',   # 契約編號
-                df_sell.columns[1]: 'CUSID',   # 客戶ID  
-                df_sell.columns[2]: 'CBCODE',  # CB代號
-                df_sell.columns[7]: 'DEUQTY'   # 賣出張數 (第8欄，索引7)
-            }
-            df_sell = df_sell.rename(columns=sell_columns_map)
-            
-            # 聚合賣出資料
-            df_sell_agg = df_sell.groupby(['CUSID', 'CBCODE'])['DEUQTY'].sum().reset_index()
-            df_sell_agg.rename(columns={'DEUQTY': '今賣出張數'}, inplace=True)
-            # 確保數據類型一致
-            df_sell_agg['CUSID'] = df_sell_agg['CUSID'].astype(str).str.strip()
-            df_sell_agg['CBCODE'] = df_sell_agg['CBCODE'].apply(lambda x: strip_trailing_zeros(x)).astype(str)
-            
-        except FileNotFoundError:
-            print(f"今日交易檔案不存在：{csv_path_sell}")
-            # 如果沒有賣出檔案，今賣出張數設為0
-            df_sell_agg = pd.DataFrame(columns=['CUSID', 'CBCODE', '今賣出張數'])
-        
-        # 聚合合約資料 GROUP BY 客戶ID, 客戶名稱, CB名稱, CB代號
-        df_aggregated = df_contracts.groupby(['客戶ID', '客戶名稱', 'CB代號', 'CB名稱']).agg({
-            '原庫存張數': 'sum'
-        }).reset_index()
-        
-        # 確保merge欄位的數據類型一致
-        df_aggregated['原庫存張數'] = df_aggregated['原庫存張數'].astype(int)
-        df_aggregated['客戶ID'] = df_aggregated['客戶ID'].astype(str).str.strip()
-        df_aggregated['CB代號'] = df_aggregated['CB代號'].astype(str)
-        
-        # 合併今日賣出張數
-        df_aggregated = df_aggregated.merge(
-            df_sell_agg, 
-            left_on=['客戶ID', 'CB代號'], 
-            right_on=['CUSID', 'CBCODE'], 
-            how='left'
-        )
-        df_aggregated['今賣出張數'] = df_aggregated['今賣出張數'].fillna(0).astype(int)
-        df_aggregated.drop(['CUSID', 'CBCODE'], axis=1, errors='ignore', inplace=True)
-        
-        # 計算今剩餘張數
-        df_aggregated['今剩餘張數'] = (df_aggregated['原庫存張數'] - df_aggregated['今賣出張數']).astype(int)
-        
-        # 添加今履約利率（從報價表取得）
-        # 確保兩個DataFrame的CB代號都是字符串類型
-        df_aggregated['CB代號'] = df_aggregated['CB代號'].astype(str)
-        df_quote_for_merge = df_quote[['CB代號', '履約利率']].copy()
-        df_quote_for_merge['CB代號'] = df_quote_for_merge['CB代號'].astype(str)
-        
-        df_aggregated = df_aggregated.merge(df_quote_for_merge, on='CB代號', how='left')
-        df_aggregated.rename(columns={'履約利率': '今履約利率'}, inplace=True)
-        df_aggregated['今履約利率'] = pd.to_numeric(df_aggregated['今履約利率'], errors='coerce').fillna(0)
-        
-        # 新增空白欄位供用戶輸入
-        df_aggregated['續期張數'] = ''
-        df_aggregated['今成交均價'] = ''
-        
-        # 確保欄位順序
-        final_columns = ['客戶ID', '客戶名稱', 'CB名稱', 'CB代號', '原庫存張數', '今賣出張數', '今剩餘張數', '續期張數', '今履約利率', '今成交均價']
-        df_aggregated = df_aggregated[final_columns]
-        
-        # 更新上方查詢結果表格
-        table_renewal_query.setRowCount(len(df_aggregated))
-        for i, row in df_aggregated.iterrows():
-            # 第一欄：添加checkbox
-            checkbox = QTableWidgetItem()
-            checkbox.setFlags(checkbox.flags() | Qt.ItemIsUserCheckable)
-            checkbox.setCheckState(Qt.Unchecked)
-            table_renewal_query.setItem(i, 0, checkbox)
+    
+    if df_contracts.empty:
+        return None, pd.DataFrame()
+    
+    # 保存原始合約資料供後續使用
+    df_original_contracts = df_contracts.copy()
+    
+    df_contracts = strip_whitespace(df_contracts)
+    
+    # 重新命名欄位為中文
+    df_contracts.rename(columns={
+        'PRDID': '新作契約編號',
+        'CUSID': '客戶ID', 
+        'CUSNAME': '客戶名稱',
+        'CBCODE': 'CB代號',
+        'STORQTY': '原庫存張數',
+        'PERRATE': '原履約利率',
+        'CBTCOST': '成交均價',
+        'TRDATE': '原交易日期',
+        'CBTPDT': '賣回日',
+        'CBTPPRI': '賣回價',
+        'OPTEXDT': '選擇權到期日'
+    }, inplace=True)
+    
+    # 合併CB名稱
+    df_contracts['CB代號'] = strip_trailing_zeros_column(df_contracts['CB代號']).astype(str)
+    df_contracts = df_contracts.merge(df_quote[['CB代號', 'CB名稱']], on='CB代號', how='left')
+    
+    # 讀取ASCCSV02.csv取得今日賣出張數
+    try:
+        # 客戶ID 已去空白、CB代號 已 strip_trailing_zeros
+        df_sell = load_asccsv02()
+
+        # 聚合賣出資料
+        df_sell_agg = df_sell.groupby(['客戶ID', 'CB代號'])['履約張數'].sum().reset_index()
+        df_sell_agg.rename(columns={'客戶ID': 'CUSID', 'CB代號': 'CBCODE', '履約張數': '今賣出張數'}, inplace=True)
+
+    except FileNotFoundError:
+        print(f"今日交易檔案不存在：{remote_path('asccsv02', tday=datetime.now().strftime('%Y%m%d'))}")
+        # 如果沒有賣出檔案，今賣出張數設為0
+        df_sell_agg = pd.DataFrame(columns=['CUSID', 'CBCODE', '今賣出張數'])
+    
+    # 聚合合約資料 GROUP BY 客戶ID, 客戶名稱, CB名稱, CB代號
+    df_aggregated = df_contracts.groupby(['客戶ID', '客戶名稱', 'CB代號', 'CB名稱']).agg({
+        '原庫存張數': 'sum'
+    }).reset_index()
+    
+    # 確保merge欄位的數據類型一致
+    df_aggregated['原庫存張數'] = df_aggregated['原庫存張數'].astype(int)
+    df_aggregated['客戶ID'] = df_aggregated['客戶ID'].astype(str).str.strip()
+    df_aggregated['CB代號'] = df_aggregated['CB代號'].astype(str)
+    
+    # 合併今日賣出張數
+    df_aggregated = df_aggregated.merge(
+        df_sell_agg, 
+        left_on=['客戶ID', 'CB代號'], 
+        right_on=['CUSID', 'CBCODE'], 
+        how='left'
+    )
+    df_aggregated['今賣出張數'] = df_aggregated['今賣出張數'].fillna(0).astype(int)
+    df_aggregated.drop(['CUSID', 'CBCODE'], axis=1, errors='ignore', inplace=True)
+    
+    # 計算今剩餘張數
+    df_aggregated['今剩餘張數'] = (df_aggregated['原庫存張數'] - df_aggregated['今賣出張數']).astype(int)
+    
+    # 添加今履約利率（從報價表取得）
+    # 確保兩個DataFrame的CB代號都是字符串類型
+    df_aggregated['CB代號'] = df_aggregated['CB代號'].astype(str)
+    df_quote_for_merge = df_quote[['CB代號', '履約利率']].copy()
+    df_quote_for_merge['CB代號'] = df_quote_for_merge['CB代號'].astype(str)
+    
+    df_aggregated = df_aggregated.merge(df_quote_for_merge, on='CB代號', how='left')
+    df_aggregated.rename(columns={'履約利率': '今履約利率'}, inplace=True)
+    df_aggregated['今履約利率'] = pd.to_numeric(df_aggregated['今履約利率'], errors='coerce').fillna(0)
+    
+    # 新增空白欄位供用戶輸入
+    df_aggregated['續期張數'] = ''
+    df_aggregated['今成交均價'] = ''
+    
+    # 確保欄位順序
+    final_columns = ['客戶ID', '客戶名稱', 'CB名稱', 'CB代號', '原庫存張數', '今賣出張數', '今剩餘張數', '續期張數', '今履約利率', '今成交均價']
+    df_aggregated = df_aggregated[final_columns]
+    return df_original_contracts, df_aggregated
+
+
+def update_renewal_query_table(table_renewal_query, df_aggregated):
+    """更新上方查詢結果表格（第一欄為勾選框）"""
+    table_renewal_query.setRowCount(len(df_aggregated))
+    for i, row in df_aggregated.iterrows():
+        # 第一欄：添加checkbox
+        checkbox = QTableWidgetItem()
+        checkbox.setFlags(checkbox.flags() | Qt.ItemIsUserCheckable)
+        checkbox.setCheckState(Qt.Unchecked)
+        table_renewal_query.setItem(i, 0, checkbox)
+        
+        # 其他欄位：從第二欄開始
+        for j, col in enumerate(df_aggregated.columns):
+            value = str(row[col]) if pd.notna(row[col]) else ""
+            item = QTableWidgetItem(value)
             
-            # 其他欄位：從第二欄開始
-            for j, col in enumerate(df_aggregated.columns):
-                value = str(row[col]) if pd.notna(row[col]) else ""
-                item = QTableWidgetItem(value)
-                
-                # 設定可編輯的欄位
-                if col in ['續期張數', '今履約利率', '今成交均價']:
-                    item.setFlags(item.flags() | Qt.ItemIsEditable)
-                    item.setBackground(QColor(255, 255, 224))  # 淺黃色表示可編輯
+            # 設定可編輯的欄位
+            if col in ['續期張數', '今履約利率', '今成交均價']:
+                item.setFlags(item.flags() | Qt.ItemIsEditable)
+                item.setBackground(QColor(255, 255, 224))  # 淺黃色表示可編輯
 
-                elif col in ['客戶名稱', 'CB名稱', '今剩餘張數']:
-                    item.setBackground(QColor(204, 229, 255))  # 淺綠色
-                
-                table_renewal_query.setItem(i, j + 1, item)  # j+1 因為第0欄是checkbox
-        
-        QMessageBox.information(None, "查詢完成", f"找到 {len(df_aggregated)} 筆聚合的客戶+標的組合！")
-        
-        return df_original_contracts
-        
-    except Exception as e:
-        QMessageBox.critical(None, "查詢失敗", f"發生錯誤：{e}")
-        print(f"查詢續期合約錯誤：{e}")
-        try:
-            if 'conn' in locals() and conn:
-                conn.close()
-        except:
-            pass  # 忽略連接關閉錯誤
-        return None
+            elif col in ['客戶名稱', 'CB名稱', '今剩餘張數']:
+                item.setBackground(QColor(204, 229, 255))  # 淺綠色
+            
+            table_renewal_query.setItem(i, j + 1, item)  # j+1 因為第0欄是checkbox
 
 
 def add_renewal_contract(table_renewal_query, table_renewal_buy, table_renewal_sell, df_original_contracts, df_quote):
@@ -267,7 +283,7 @@ def add_renewal_contract(table_renewal_query, table_renewal_buy, table_renewal_s
             # 從原始合約資料中找到該客戶該標的的所有契約
             cus_contracts = df_original_contracts[
                 (df_original_contracts['CUSID'].astype(str).str.strip() == str(cus_id).strip()) & 
-                (df_original_contracts['CBCODE'].apply(lambda x: strip_trailing_zeros(x)).astype(str) == str(cb_code))
+                (strip_trailing_zeros_column(df_original_contracts['CBCODE']).astype(str) == str(cb_code))
             ].copy()
             
             if cus_contracts.empty:
@@ -278,13 +294,7 @@ def add_renewal_contract(table_renewal_query, table_renewal_buy, table_renewal_s
             
             # 讀取ASCCSV02.csv檢查已賣出張數
             try:
-                tday = datetime.now().strftime('%Y%m%d')
-                csv_path_sell = rf"\\10.72.228.83\CBAS_Logs\{tday}\AfterClose\ASCCSV02.csv"
-                df_sell = pd.read_csv(csv_path_sell, encoding='utf-8-sig')
-                # 使用用戶修正的欄位位置
-                prdid_col = df_sell.columns[0]
-                qty_col = df_sell.columns[7]  # 用戶修正為第8欄（索引7）
-                df_sell_lookup = df_sell.set_index(prdid_col)[qty_col].to_dict()
+                df_sell_lookup = sold_qty_by_contract().to_dict()
             except:
                 df_sell_lookup = {}
             
@@ -436,8 +446,9 @@ def transfer_renewal_data(table_renewal_buy, table_renewal_sell, df_original_con
             sell_data['錄音時間'] = ''
             
             # 計算履約價（需要從賣回價和利率計算）
-            sell_data['年期'] = ((pd.to_datetime(sell_data['賣回日'], format='%Y%m%d') - pd.to_datetime(sell_data['交割日期'], format='%Y%m%d')).dt.days + 1) / 365
-            sell_data['履約價'] = round(pd.to_numeric(sell_data['賣回價'], errors='coerce').fillna(0) - sell_data['年期'] * pd.to_numeric(sell_data['履約利率'], errors='coerce').fillna(0), 2)
+            days = (pd.to_datetime(sell_data['賣回日'], format='%Y%m%d') - pd.to_datetime(sell_data['交割日期'], format='%Y%m%d')).dt.days + 1
+            sell_data['年期'] = days / 365
+            sell_data['履約價'] = exercise_price(pd.to_numeric(sell_data['賣回價'], errors='coerce').fillna(0), pd.to_numeric(sell_data['履約利率'], errors='coerce').fillna(0), days)
             sell_data['選擇權交割單價'] = pd.to_numeric(sell_data['成交均價'], errors='coerce') - sell_data['履約價']
             sell_data['交割總金額'] = sell_data['履約張數'] * sell_data['選擇權交割單價']
             sell_data['來自'] = '續期'
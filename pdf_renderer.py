@@ -0,0 +1,782 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Optional
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string, range_boundaries
+from openpyxl.utils.cell import coordinate_from_string
+from envs import pdf_backend, pdf_font_path
+
+
+class PdfRenderer:
+    """Excel 轉 PDF 的共用介面
+
+    render(excel_path, pdf_path, workbook=None) 產生 PDF 並回傳 pdf_path，失敗回傳 None。
+    workbook 為呼叫端已組好的 openpyxl Workbook（與存成 excel_path 的內容相同），
+    可省去重新讀檔；不提供時由 excel_path 載入。
+    """
+
+    name = ''
+
+    def render(self, excel_path: str, pdf_path: str, workbook=None) -> Optional[str]:
+        raise NotImplementedError
+
+
+# 同一個 Excel 連續轉檔幾個檔案後重開一次，避免長時間執行累積記憶體或卡住
+EXCEL_RECYCLE_AFTER = 50
+
+
+def _dispatch_excel():
+    import win32com.client
+
+    # 創建獨立的Excel應用程序對象（DispatchEx 不共用已開啟的 Excel，多個行程同時轉檔時 Quit 不會互相關掉）
+    excel = win32com.client.DispatchEx("Excel.Application")
+    # 某些環境（例如受限權限/服務帳戶）不允許設置 Visible/DisplayAlerts
+    # 改為嘗試設置為整數（0/1），失敗則忽略
+    try:
+        excel.Visible = 0
+    except Exception:
+        pass
+    try:
+        excel.DisplayAlerts = 0
+    except Exception:
+        pass
+    return excel
+
+
+class ExcelComSession:
+    """一次啟動 Excel、連續轉換多個檔案的批次轉檔器
+
+    Excel 在第一次 export 時才啟動；每轉 recycle_after 個檔案或轉檔失敗時關掉重開，
+    失敗的檔案會在新的 Excel 上再試一次。app_factory 可換成 MockExcelApplication 在沒有 Excel 的環境測試流程。
+
+    用法：
+        with ExcelComSession() as session:
+            for excel_path, pdf_path in files:
+                session.export(excel_path, pdf_path)
+    """
+
+    def __init__(self, recycle_after: int = EXCEL_RECYCLE_AFTER, app_factory=None):
+        self.recycle_after = max(1, recycle_after)
+        self.app_factory = app_factory or _dispatch_excel
+        self.launches = 0
+        self._app = None
+        self._converted = 0
+
+    def _application(self):
+        if self._app is None:
+            self._app = self.app_factory()
+            self.launches += 1
+            self._converted = 0
+        return self._app
+
+    def recycle(self):
+        """關閉目前的 Excel，下一個檔案會重新啟動"""
+        if self._app is None:
+            return
+        try:
+            self._app.Quit()
+        except Exception as e:
+            print(f"關閉 Excel 時發生錯誤: {e}")
+        self._app = None
+
+    def export(self, excel_path: str, pdf_path: str) -> Optional[str]:
+        excel_path = os.path.abspath(excel_path)
+        pdf_path = os.path.abspath(pdf_path)
+        for attempt in range(2):
+            try:
+                wb = self._application().Workbooks.Open(excel_path)
+                try:
+                    # 保存為PDF (0 = xlTypePDF)
+                    wb.ExportAsFixedFormat(0, pdf_path)
+                finally:
+                    wb.Close(SaveChanges=False)
+            except Exception as e:
+                print(f"Excel轉PDF時發生錯誤: {e}")
+                # Excel 可能已卡住或當掉，換一個新的 Excel 再試
+                self.recycle()
+                continue
+            self._converted += 1
+            if self._converted >= self.recycle_after:
+                self.recycle()
+            return pdf_path
+        return None
+
+    def export_many(self, files) -> list:
+        """files 為 (excel_path, pdf_path) 序列，回傳對應的 PDF 路徑（失敗為 None）"""
+        return [self.export(excel_path, pdf_path) for excel_path, pdf_path in files]
+
+    def close(self):
+        self.recycle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class MockExcelApplication:
+    """Excel.Application 的替身（只實作批次轉檔用到的部分），在 Linux 等沒有 Excel 的環境測試用
+
+    ExportAsFixedFormat 只寫出一個最小的 PDF 檔；exported 記錄轉過的 (excel_path, pdf_path)，
+    fail_on 中的 Excel 檔名在 Open 時拋出例外，用來模擬 Excel 當掉。
+    """
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.exported = []
+        self.quit_called = False
+        self.Workbooks = self
+
+    def Open(self, excel_path):
+        if self.quit_called:
+            raise RuntimeError("Excel 已關閉")
+        if os.path.basename(excel_path) in self.fail_on:
+            raise RuntimeError(f"模擬 Excel 開檔失敗: {excel_path}")
+        return _MockWorkbook(self, excel_path)
+
+    def Quit(self):
+        self.quit_called = True
+
+
+class _MockWorkbook:
+    def __init__(self, app, excel_path):
+        self.app = app
+        self.excel_path = excel_path
+
+    def ExportAsFixedFormat(self, file_type, pdf_path):
+        with open(pdf_path, 'wb') as f:
+            f.write(b"%PDF-1.4\n%%EOF\n")
+        self.app.exported.append((self.excel_path, pdf_path))
+
+    def Close(self, SaveChanges=False):
+        pass
+
+
+_excel_batch = threading.local()
+
+
+def current_excel_session() -> Optional[ExcelComSession]:
+    """目前執行緒在 excel_batch() 區塊內時回傳共用的 ExcelComSession，否則回傳 None"""
+    return getattr(_excel_batch, 'session', None)
+
+
+@contextmanager
+def excel_batch(recycle_after: int = EXCEL_RECYCLE_AFTER, app_factory=None):
+    """區塊內所有經由 Excel 轉的 PDF 共用同一個 Excel（只在真的需要 Excel 轉檔時才啟動）
+
+    以執行緒為單位；巢狀使用時沿用外層的 session。
+    """
+    outer = current_excel_session()
+    if outer is not None:
+        yield outer
+        return
+    session = ExcelComSession(recycle_after=recycle_after, app_factory=app_factory)
+    _excel_batch.session = session
+    try:
+        yield session
+    finally:
+        _excel_batch.session = None
+        session.close()
+
+
+class ExcelComRenderer(PdfRenderer):
+    """透過 Excel COM（ExportAsFixedFormat）轉檔，需安裝 Excel 與 pywin32
+
+    在 excel_batch() 區塊內時共用同一個 Excel，否則每個檔案各自啟動、關閉一次。
+    """
+
+    name = 'excel'
+
+    def render(self, excel_path: str, pdf_path: str, workbook=None) -> Optional[str]:
+        session = current_excel_session()
+        if session is not None:
+            return session.export(excel_path, pdf_path)
+        with ExcelComSession() as session:
+            return session.export(excel_path, pdf_path)
+
+
+# ---- reportlab 原生轉檔 ----
+
+# Excel 字型名稱 → Windows 字型檔；其他字型（Calibri 等）與找不到字型檔時依序改用 FALLBACK_FONT_FILES
+# （envs.pdf_font_path 指定字型檔時一律優先使用該字型）
+FONT_FILES = {
+    'DFKai-SB': ('kaiu.ttf',),
+    '標楷體': ('kaiu.ttf',),
+    'PMingLiU': ('mingliu.ttc',),
+    '新細明體': ('mingliu.ttc',),
+    'MingLiU': ('mingliu.ttc',),
+    '細明體': ('mingliu.ttc',),
+    'Microsoft JhengHei': ('msjh.ttc', 'msjh.ttf'),
+    '微軟正黑體': ('msjh.ttc', 'msjh.ttf'),
+}
+FALLBACK_FONT_FILES = ('mingliu.ttc', 'msjh.ttc', 'msjh.ttf', 'kaiu.ttf',
+                       # Linux 常見的 CJK 字型（Noto CJK、文泉驛、AR PL、Droid）
+                       'NotoSansCJK-Regular.ttc', 'NotoSerifCJK-Regular.ttc',
+                       'wqy-microhei.ttc', 'wqy-zenhei.ttc', 'uming.ttc', 'ukai.ttc', 'DroidSansFallbackFull.ttf')
+
+# openpyxl paperSize → (寬, 高) pt，未列出的一律視為 A4
+PAPER_SIZES = {
+    1: (612.0, 792.0),      # Letter
+    8: (841.89, 1190.55),   # A3
+    9: (595.28, 841.89),    # A4
+    11: (419.53, 595.28),   # A5
+}
+
+BORDER_WIDTHS = {
+    'hair': 0.25, 'thin': 0.5, 'dotted': 0.5, 'dashed': 0.5, 'dashDot': 0.5, 'dashDotDot': 0.5,
+    'medium': 1.0, 'mediumDashed': 1.0, 'mediumDashDot': 1.0, 'mediumDashDotDot': 1.0, 'slantDashDot': 1.0,
+    'thick': 1.5, 'double': 1.5,
+}
+
+# 欄寬單位（openpyxl width）→ 像素，與 file_generator._add_logo 的換算相同
+PIXELS_PER_WIDTH = 7
+EMU_PER_POINT = 12700
+CELL_PADDING = 2.0
+
+_registered_fonts = {}
+_font_index = None
+
+
+def _font_dirs() -> list:
+    dirs = []
+    if pdf_font_path and os.path.isdir(pdf_font_path):
+        dirs.append(pdf_font_path)
+    if os.name == 'nt':
+        dirs += [os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'),
+                 os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts')]
+    else:
+        dirs += ['/usr/share/fonts', '/usr/local/share/fonts',
+                 os.path.expanduser('~/.fonts'), os.path.expanduser('~/.local/share/fonts')]
+    return dirs
+
+
+def _font_files() -> dict:
+    """字型檔名（小寫）→ 路徑；Linux 字型目錄有多層子目錄，只在第一次使用時掃描一次"""
+    global _font_index
+    if _font_index is None:
+        index = {}
+        for font_dir in _font_dirs():
+            for root, _, files in os.walk(font_dir):
+                for file_name in files:
+                    index.setdefault(file_name.lower(), os.path.join(root, file_name))
+        _font_index = index
+    return _font_index
+
+
+def _resolve_font(font_name) -> str:
+    """Excel 字型名稱 → 已註冊的 reportlab 字型名稱（每個字型只註冊一次）
+
+    一律使用 TrueType 中文字型並內嵌；reportlab 內建的 CID 字型需要閱讀器另外安裝亞洲字型包，
+    這裡不使用。找不到任何中文字型時拋出 ValueError，交由呼叫端改用 Excel 轉檔。
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    key = font_name if font_name in FONT_FILES else None
+    if key in _registered_fonts:
+        return _registered_fonts[key]
+
+    candidates = []
+    if pdf_font_path and os.path.isfile(pdf_font_path):
+        candidates.append(pdf_font_path)
+    font_files = _font_files()
+    candidates += [font_files[name.lower()] for name in FONT_FILES.get(key, ()) + FALLBACK_FONT_FILES
+                   if name.lower() in font_files]
+    for path in candidates:
+        alias = f"xl-{os.path.splitext(os.path.basename(path))[0]}"
+        try:
+            if alias not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont(alias, path, subfontIndex=0))
+        except Exception as e:
+            # 例如 CFF 外框的 OpenType 字型 reportlab 無法內嵌，改試下一個
+            print(f"註冊字型 {path} 時發生錯誤: {e}")
+            continue
+        _registered_fonts[key] = alias
+        return alias
+    raise ValueError(f"找不到可用的中文字型: {font_name}")
+
+
+def _rgb(color):
+    """openpyxl Color → (r, g, b) 0~1；主題色/索引色等無法直接取得 RGB 的回傳 None"""
+    if color is None or getattr(color, 'type', None) != 'rgb' or not isinstance(color.rgb, str):
+        return None
+    value = color.rgb[-6:]
+    try:
+        return tuple(int(value[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+# ---- 儲存格值 ----
+
+_CELL_REF = re.compile(r"^\$?([A-Z]{1,3})\$?(\d+)$")
+_SUM = re.compile(r"^SUM\((.+)\)$", re.IGNORECASE)
+
+
+def _evaluate(ws, value, depth=0):
+    """計算範本中常見的簡單公式（=TODAY()、=A1、=SUM(A1:A5)）；其餘公式拋出 ValueError"""
+    if not (isinstance(value, str) and value.startswith('=')):
+        return value
+    if depth > 20:
+        raise ValueError(f"公式參照過深: {value}")
+    formula = value[1:].strip().replace('$', '')
+    if formula.upper() == 'TODAY()':
+        return date.today()
+    if _CELL_REF.match(formula):
+        return _evaluate(ws, ws[formula].value, depth + 1)
+    match = _SUM.match(formula)
+    if match:
+        total = 0
+        for part in match.group(1).split(','):
+            part = part.strip()
+            if not re.match(r"^[A-Z]{1,3}\d+(:[A-Z]{1,3}\d+)?$", part):
+                raise ValueError(f"不支援的公式: {value}")
+            min_col, min_row, max_col, max_row = range_boundaries(part)
+            for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+                for cell in row:
+                    v = _evaluate(ws, cell.value, depth + 1)
+                    if isinstance(v, (int, float)) and not isinstance(v, bool):
+                        total += v
+                    elif isinstance(v, str):
+                        # 與 Excel 不同：範本常把金額以文字寫入，這裡仍視為數字加總
+                        try:
+                            total += float(v.replace(',', ''))
+                        except ValueError:
+                            pass
+        return int(total) if float(total).is_integer() else total
+    raise ValueError(f"不支援的公式: {value}")
+
+
+def _format_date(value, number_format: str) -> str:
+    fmt = re.sub(r"\[[^\]]*\]|\\|\"", '', number_format or '').lower()
+    if not re.search(r"[ymd]", fmt):
+        return value.strftime('%Y/%m/%d')
+    for token, code in (('yyyy', '%Y'), ('yy', '%y'), ('mm', '%m'), ('dd', '%d')):
+        fmt = fmt.replace(token, code)
+    fmt = re.sub(r"(?<!%)\bm\b", str(value.month), fmt)
+    fmt = re.sub(r"(?<!%)\bd\b", str(value.day), fmt)
+    return value.strftime(fmt)
+
+
+def _format_number(value, number_format: str) -> str:
+    """依 Excel 數字格式的常見寫法（千分位、小數位數、百分比、正/負/零區段）輸出文字"""
+    if not number_format or number_format == 'General':
+        return str(int(value)) if float(value).is_integer() else f"{value:.10g}"
+    sections = number_format.split(';')
+    section = sections[0]
+    if value < 0 and len(sections) >= 2:
+        section, value = sections[1], -value
+    elif value == 0 and len(sections) >= 3:
+        section = sections[2]
+
+    # 先保留引號內與跳脫的文字，再去掉顏色/地區代碼、空白佔位(_x)、填滿(*x)
+    literals = []
+
+    def _keep(match):
+        literals.append(match.group(1) if match.group(1) is not None else match.group(2))
+        # 以私用區字元當佔位，避免被下面的數字格式比對到
+        return chr(0xE000 + len(literals) - 1)
+
+    section = re.sub(r"\"([^\"]*)\"|\\(.)", _keep, section)
+    section = re.sub(r"\[[^\]]*\]", '', section)
+    section = re.sub(r"_.", ' ', section)
+    section = re.sub(r"\*.", '', section)
+
+    digits = re.search(r"[#0?,]+(\.[#0?]+)?", section)
+    if digits:
+        pattern = digits.group(0)
+        decimals = len(digits.group(1)) - 1 if digits.group(1) else 0
+        number = value * 100 if '%' in section else value
+        text = f"{number:,.{decimals}f}" if ',' in pattern else f"{number:.{decimals}f}"
+        if number == 0 and '0' not in pattern:
+            # 只有 #/? 佔位時 0 不顯示數字（例如會計格式零值區段的 "-"??）
+            text = ''
+        section = section[:digits.start()] + text + section[digits.end():]
+    elif section.strip() == '@' or 'General' in section:
+        section = section.replace('@', str(value)).replace('General', _format_number(value, 'General'))
+    return re.sub("[\ue000-\uf8ff]", lambda m: literals[ord(m.group(0)) - 0xE000], section).strip()
+
+
+def _display_text(ws, cell) -> str:
+    value = _evaluate(ws, cell.value)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (datetime, date)):
+        return _format_date(value, cell.number_format)
+    if isinstance(value, (int, float)):
+        return _format_number(value, cell.number_format)
+    return str(value)
+
+
+def _wrap_lines(text: str, font: str, size: float, max_width: float) -> list:
+    """依可用寬度逐字換行（中文沒有空白可斷）"""
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for ch in paragraph:
+            if line and stringWidth(line + ch, font, size) > max_width:
+                lines.append(line)
+                line = ch
+            else:
+                line += ch
+        lines.append(line)
+    return lines
+
+
+# ---- 版面 ----
+
+class _SheetLayout:
+    """把工作表換算成以 pt 為單位的欄位/列座標（由上往下），供逐頁繪製"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.min_col, self.min_row, self.max_col, self.max_row = self._print_range(ws)
+
+        self.merged = {}
+        self.covered = set()
+        self.merged_bounds = {}
+        self.row_block_start = {}
+        for rng in ws.merged_cells.ranges:
+            self.merged[(rng.min_row, rng.min_col)] = (rng.max_row, rng.max_col)
+            for r in range(rng.min_row, rng.max_row + 1):
+                for c in range(rng.min_col, rng.max_col + 1):
+                    self.merged_bounds[(r, c)] = rng.bounds
+                    if (r, c) != (rng.min_row, rng.min_col):
+                        self.covered.add((r, c))
+                if r > rng.min_row:
+                    self.row_block_start[r] = min(self.row_block_start.get(r, r), rng.min_row)
+
+        self.col_x = {}
+        x = 0.0
+        widths = self._column_widths(ws)
+        for c in range(self.min_col, self.max_col + 2):
+            self.col_x[c] = x
+            x += widths.get(c, 0.0)
+        self.width = self.col_x[self.max_col + 1]
+
+        self.row_y = {}
+        y = 0.0
+        for r in range(self.min_row, self.max_row + 2):
+            self.row_y[r] = y
+            if r <= self.max_row:
+                y += self._row_height(r)
+        self.height = self.row_y[self.max_row + 1]
+
+    @staticmethod
+    def _print_range(ws):
+        area = ws.print_area
+        if area:
+            first = area.split(',')[0].split('!')[-1].replace('$', '')
+            min_col, min_row, max_col, max_row = range_boundaries(first)
+            # 整欄/整列的列印範圍（例如 A:I）沒有列號或欄號，以實際使用範圍補上
+            return (min_col or 1, min_row or 1,
+                    max_col or max(ws.max_column, 1), max_row or max(ws.max_row, 1))
+        return 1, 1, max(ws.max_column, 1), max(ws.max_row, 1)
+
+    def _column_widths(self, ws) -> dict:
+        default = ws.sheet_format.defaultColWidth or (ws.sheet_format.baseColWidth or 8) + 1.14
+        widths = {c: default for c in range(self.min_col, self.max_col + 1)}
+        for key, dim in ws.column_dimensions.items():
+            start = dim.min or column_index_from_string(key)
+            end = dim.max or start
+            for c in range(max(start, self.min_col), min(end, self.max_col) + 1):
+                if dim.hidden:
+                    widths[c] = 0
+                elif dim.width:
+                    widths[c] = dim.width
+        return {c: w * PIXELS_PER_WIDTH * 0.75 for c, w in widths.items()}
+
+    def _row_height(self, r) -> float:
+        dim = self.ws.row_dimensions[r] if r in self.ws.row_dimensions else None
+        if dim is not None and dim.hidden:
+            return 0.0
+        if dim is not None and dim.height is not None:
+            return float(dim.height)
+        # 未指定列高時，依該列最大字型與自動換行的行數估算（與 Excel 自動列高相近）
+        height = float(self.ws.sheet_format.defaultRowHeight or 15)
+        for c in range(self.min_col, self.max_col + 1):
+            if (r, c) in self.covered:
+                continue
+            cell = self.ws.cell(row=r, column=c)
+            if cell.value is None:
+                continue
+            size = float(cell.font.sz or 11)
+            lines = 1
+            if cell.alignment.wrap_text and (r, c) not in self.merged:
+                try:
+                    text = _display_text(self.ws, cell)
+                    width = self.col_x[c + 1] - self.col_x[c] - CELL_PADDING * 2
+                    lines = len(_wrap_lines(text, _resolve_font(cell.font.name), size, max(width, size)))
+                except ValueError:
+                    pass
+            height = max(height, lines * size * 1.3)
+        return height
+
+    def pages(self, page_height: float) -> list:
+        """依可列印高度（sheet pt）把列切成多頁；合併儲存格不跨頁，手動分頁符號優先"""
+        manual = {brk.id for brk in self.ws.row_breaks.brk}
+        pages = []
+        start = self.min_row
+        r = self.min_row
+        while r <= self.max_row:
+            bottom = self.row_y[r + 1] - self.row_y[start]
+            if r > start and bottom > page_height:
+                cut = self.row_block_start.get(r, r)
+                if cut <= start:
+                    cut = r
+                pages.append((start, cut - 1))
+                start = r = cut
+                continue
+            if r in manual and r < self.max_row:
+                pages.append((start, r))
+                start = r + 1
+            r += 1
+        if start <= self.max_row:
+            pages.append((start, self.max_row))
+        return pages
+
+
+class ReportLabRenderer(PdfRenderer):
+    """以 reportlab 直接在本行程內把 openpyxl 工作表畫成 PDF，不需要開 Excel
+
+    支援範本用到的版面要素：欄寬/列高、合併儲存格、底色、框線、字型大小/粗體/顏色、
+    對齊與自動換行、數字/日期格式、列印範圍、紙張方向/縮放/邊界、圖片。
+    工作表中若有無法計算的公式（例如 WORKDAY），拋出 ValueError 交由呼叫端改用 Excel 轉檔。
+    """
+
+    name = 'reportlab'
+
+    def render(self, excel_path: str, pdf_path: str, workbook=None) -> Optional[str]:
+        try:
+            from reportlab.pdfgen import canvas
+
+            if workbook is None:
+                workbook = load_workbook(excel_path)
+            pdf_path = os.path.abspath(pdf_path)
+            pdf = canvas.Canvas(pdf_path, pageCompression=1)
+            for ws in workbook.worksheets:
+                if ws.sheet_state != 'visible':
+                    continue
+                self._draw_sheet(pdf, ws)
+            pdf.save()
+            return pdf_path
+        except Exception as e:
+            print(f"reportlab 轉PDF時發生錯誤: {e}")
+            return None
+
+    def _draw_sheet(self, pdf, ws):
+        layout = _SheetLayout(ws)
+        setup = ws.page_setup
+        paper_w, paper_h = PAPER_SIZES.get(int(setup.paperSize or 9), PAPER_SIZES[9])
+        if setup.orientation == 'landscape':
+            paper_w, paper_h = paper_h, paper_w
+        margins = ws.page_margins
+        left, right = margins.left * 72, margins.right * 72
+        top, bottom = margins.top * 72, margins.bottom * 72
+        usable_w, usable_h = paper_w - left - right, paper_h - top - bottom
+
+        scale = (setup.scale or 100) / 100
+        fit = ws.sheet_properties.pageSetUpPr
+        if fit is not None and fit.fitToPage:
+            scale = usable_w / layout.width if layout.width else 1.0
+            if setup.fitToHeight == 1 and layout.height:
+                scale = min(scale, usable_h / layout.height)
+        # 超出紙寬時縮小到剛好一頁寬（Excel 會另起一頁列印右半部，這裡統一縮放）
+        if layout.width * scale > usable_w:
+            scale = usable_w / layout.width
+
+        h_offset = 0.0
+        if ws.print_options.horizontalCentered:
+            h_offset = (usable_w - layout.width * scale) / 2
+
+        for first_row, last_row in layout.pages(usable_h / scale):
+            pdf.setPageSize((paper_w, paper_h))
+            pdf.saveState()
+            pdf.translate(left + h_offset, paper_h - top)
+            pdf.scale(scale, scale)
+            pdf.translate(0, layout.row_y[first_row])
+            self._draw_rows(pdf, layout, first_row, last_row)
+            self._draw_images(pdf, layout, first_row, last_row)
+            pdf.restoreState()
+            pdf.showPage()
+
+    @staticmethod
+    def _cell_box(layout, r, c):
+        end_r, end_c = layout.merged.get((r, c), (r, c))
+        end_r, end_c = min(end_r, layout.max_row), min(end_c, layout.max_col)
+        x0, x1 = layout.col_x[c], layout.col_x[end_c + 1]
+        y0, y1 = layout.row_y[r], layout.row_y[end_r + 1]
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _draw_rows(self, pdf, layout, first_row, last_row):
+        ws = layout.ws
+        cells = [(r, c) for r in range(first_row, last_row + 1)
+                 for c in range(layout.min_col, layout.max_col + 1)]
+        anchors = [(r, c) for r, c in cells if (r, c) not in layout.covered]
+
+        # 底色 → 框線 → 文字，避免後畫的底色蓋掉鄰格框線
+        for r, c in anchors:
+            cell = ws.cell(row=r, column=c)
+            if cell.fill is None or cell.fill.fill_type != 'solid':
+                continue
+            color = _rgb(cell.fill.fgColor)
+            if color is None:
+                continue
+            x, y, w, h = self._cell_box(layout, r, c)
+            pdf.setFillColorRGB(*color)
+            pdf.rect(x, -y - h, w, h, stroke=0, fill=1)
+
+        for r, c in cells:
+            border = ws.cell(row=r, column=c).border
+            if border is None:
+                continue
+            x0, x1 = layout.col_x[c], layout.col_x[c + 1]
+            y0, y1 = layout.row_y[r], layout.row_y[r + 1]
+            # 合併儲存格內部的框線不畫，只畫外框
+            min_c, min_r, max_c, max_r = layout.merged_bounds.get((r, c), (c, r, c, r))
+            inner = {'left': c > min_c, 'right': c < max_c, 'top': r > min_r, 'bottom': r < max_r}
+            for side, (ax, ay, bx, by) in (('left', (x0, y0, x0, y1)), ('right', (x1, y0, x1, y1)),
+                                           ('top', (x0, y0, x1, y0)), ('bottom', (x0, y1, x1, y1))):
+                edge = getattr(border, side)
+                if inner[side]:
+                    continue
+                if edge is None or not edge.style:
+                    continue
+                pdf.setStrokeColorRGB(*(_rgb(edge.color) or (0, 0, 0)))
+                pdf.setLineWidth(BORDER_WIDTHS.get(edge.style, 0.5))
+                pdf.setDash([1, 1] if edge.style in ('dotted', 'hair') else [3, 2] if 'ash' in edge.style else [])
+                pdf.line(ax, -ay, bx, -by)
+        pdf.setDash([])
+
+        for r, c in anchors:
+            cell = ws.cell(row=r, column=c)
+            if cell.value is None:
+                continue
+            text = _display_text(ws, cell)
+            if text:
+                self._draw_text(pdf, cell, text, *self._cell_box(layout, r, c))
+
+    @staticmethod
+    def _draw_text(pdf, cell, text, x, y, w, h):
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+
+        font = _resolve_font(cell.font.name)
+        size = float(cell.font.sz or 11)
+        align = cell.alignment
+        usable = max(w - CELL_PADDING * 2, size)
+        lines = _wrap_lines(text, font, size, usable) if align.wrap_text else text.split('\n')
+        if align.shrink_to_fit and not align.wrap_text:
+            widest = max(stringWidth(line, font, size) for line in lines)
+            if widest > usable:
+                size *= usable / widest
+
+        leading = size * 1.2
+        total = leading * len(lines)
+        vertical = align.vertical or 'bottom'
+        if vertical == 'top':
+            start = y + CELL_PADDING
+        elif vertical in ('center', 'justify', 'distributed'):
+            start = y + (h - total) / 2
+        else:
+            start = y + h - total - CELL_PADDING / 2
+
+        horizontal = align.horizontal
+        if horizontal is None or horizontal == 'general':
+            horizontal = 'right' if isinstance(cell.value, (int, float)) and not isinstance(cell.value, bool) else 'left'
+
+        pdf.setFillColorRGB(*(_rgb(cell.font.color) or (0, 0, 0)))
+        text_obj = pdf.beginText()
+        text_obj.setFont(font, size)
+        if cell.font.b:
+            # TrueType 中文字型多半沒有粗體字檔，以描邊加粗
+            text_obj.setTextRenderMode(2)
+            pdf.setStrokeColorRGB(*(_rgb(cell.font.color) or (0, 0, 0)))
+            pdf.setLineWidth(size * 0.03)
+        for i, line in enumerate(lines):
+            width = stringWidth(line, font, size)
+            if horizontal in ('center', 'centerContinuous'):
+                lx = x + (w - width) / 2
+            elif horizontal == 'right':
+                lx = x + w - CELL_PADDING - width
+            else:
+                lx = x + CELL_PADDING
+            baseline = start + i * leading + size * 0.95
+            text_obj.setTextOrigin(lx, -baseline)
+            text_obj.textOut(line)
+        pdf.drawText(text_obj)
+
+    @staticmethod
+    def _draw_images(pdf, layout, first_row, last_row):
+        from io import BytesIO
+        from reportlab.lib.utils import ImageReader
+
+        for img in getattr(layout.ws, '_images', []):
+            try:
+                anchor = img.anchor
+                if isinstance(anchor, str):
+                    col_letter, row = coordinate_from_string(anchor)
+                    col, x_off, y_off = column_index_from_string(col_letter), 0.0, 0.0
+                else:
+                    marker = anchor._from
+                    col, row = marker.col + 1, marker.row + 1
+                    x_off, y_off = marker.colOff / EMU_PER_POINT, marker.rowOff / EMU_PER_POINT
+                if not (first_row <= row <= last_row) or col not in layout.col_x:
+                    continue
+                ext = getattr(anchor, 'ext', None)
+                if ext is not None:
+                    width, height = ext.width / EMU_PER_POINT, ext.height / EMU_PER_POINT
+                else:
+                    width, height = img.width * 0.75, img.height * 0.75
+                x = layout.col_x[col] + x_off
+                y = layout.row_y[row] + y_off
+                pdf.drawImage(ImageReader(BytesIO(img._data())), x, -y - height, width, height, mask='auto')
+            except Exception as e:
+                print(f"PDF 插入圖片時發生錯誤: {e}")
+
+
+PDF_RENDERERS = {
+    ExcelComRenderer.name: ExcelComRenderer,
+    ReportLabRenderer.name: ReportLabRenderer,
+}
+
+_pdf_renderers = {}
+
+
+def reportlab_available() -> bool:
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_pdf_renderer(name: str = None) -> PdfRenderer:
+    """取得指定的轉檔方式（'excel' / 'reportlab'）；None 或 'auto' 時有 reportlab 就用原生轉檔，否則用 Excel"""
+    name = name or pdf_backend
+    if name == 'auto':
+        name = ReportLabRenderer.name if reportlab_available() else ExcelComRenderer.name
+    if name not in PDF_RENDERERS:
+        raise ValueError(f"未知的 PDF 轉檔方式: {name}")
+    if name not in _pdf_renderers:
+        _pdf_renderers[name] = PDF_RENDERERS[name]()
+    return _pdf_renderers[name]
+
+
+def convert_to_pdf(excel_path: str, pdf_path: str, workbook=None, backend: str = None) -> Optional[str]:
+    """把 Excel 檔轉成 PDF；auto 模式下原生轉檔失敗（例如有不支援的公式）時改用 Excel 再試一次"""
+    backend = backend or pdf_backend
+    renderer = get_pdf_renderer(backend)
+    result = renderer.render(excel_path, pdf_path, workbook=workbook)
+    if result is None and backend == 'auto' and renderer.name != ExcelComRenderer.name:
+        print(f"改用 Excel 轉檔: {os.path.basename(excel_path)}")
+        result = get_pdf_renderer(ExcelComRenderer.name).render(excel_path, pdf_path)
+    return result
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_int(value, default=0):
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_float_or_none(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_penalty_rules(df_penalty: pd.DataFrame) -> dict:
+    """整理罰金規則：建立 (客戶ID, CB代號) → {'qty': 賠償金張數(None=無上限), 'amt': 提前履約賠償金} 的查表"""
+    rules = {}
+    if df_penalty is None or df_penalty.empty:
+        return rules
+    for prow in df_penalty.to_dict('records'):
+        cus_id = str(prow.get('客戶ID', '')).strip()
+        cb_code = str(prow.get('CB代號', '')).strip()
+        if not cus_id or not cb_code:
+            continue
+        qty_raw = str(prow.get('賠償金張數', '')).strip()
+        amt_raw = str(prow.get('提前履約賠償金', '')).strip()
+        try:
+            qty = int(float(qty_raw)) if qty_raw else None
+        except (ValueError, TypeError):
+            qty = None
+        try:
+            amt = float(amt_raw) if amt_raw else 0.0
+        except (ValueError, TypeError):
+            amt = 0.0
+        rules[(cus_id, cb_code)] = {'qty': qty, 'amt': amt}
+    return rules
+
+
+def _short_flags(df_buy: pd.DataFrame) -> np.ndarray:
+    """_短約 為空時改看 短契約，等於 Y 視為短約"""
+    flag = df_buy['_短約'] if '_短約' in df_buy.columns else pd.Series(None, index=df_buy.index, dtype=object)
+    if '短契約' in df_buy.columns:
+        flag = flag.where(flag.notna(), df_buy['短契約'])
+    return flag.map(lambda v: v is not None and str(v).strip().upper() == 'Y').to_numpy(dtype=bool)
+
+
+def _split_values(df_part: pd.DataFrame, new_qty: np.ndarray, total_qty: np.ndarray) -> pd.DataFrame:
+    """拆單列：成交張數改為 new_qty，成交金額/權利金總額/VIP報價張數 按比例重算（無法轉數字的值不動）"""
+    df_part['成交張數'] = new_qty
+    for col in ('成交金額', '權利金總額', 'VIP報價張數'):
+        if col not in df_part.columns:
+            continue
+        if col == 'VIP報價張數':
+            old = df_part[col].map(lambda v: _to_int(v, None))
+        else:
+            old = df_part[col].map(lambda v: _to_float_or_none(v))
+        valid = old.notna().to_numpy()
+        if valid.any():
+            scaled = np.round(old[valid].to_numpy(dtype=float) * new_qty[valid] / total_qty[valid]).astype(np.int64)
+            values = df_part[col].to_numpy(dtype=object).copy()
+            values[valid] = scaled
+            df_part[col] = values
+    return df_part
+
+
+def allocate_penalty(df_buy: pd.DataFrame, rules: dict) -> pd.DataFrame:
+    """將罰金規則套用到買進資料（不依賴 Qt，可單獨測試）。
+
+    - 比對 key：客戶ID + CB代號（特定客戶優先於 ALL）。
+    - 短約=Y 的列不套罰金（保留原值）。
+    - 同 key 的多筆 buy row 依優先順序消耗賠償金張數：特殊報價非短約 (VIP報價張數>0) → 一般計算 (VIP報價張數==0)。
+      以排序鍵排好後做分組累加，完全吃得下的列整列套用，只有跨越額度邊界的那一列拆成兩列。
+    - 賠償金張數為空 → 視為無上限，所有非短約 row 全套。
+    - 拆單時「成交金額」「權利金總額」按比例重算，其他單價/比率不動。
+    - 在每筆 row 標記 `罰金套用張數` 供日後扣減 CSV 使用。
+    """
+    if df_buy is None or df_buy.empty:
+        return df_buy
+    if not rules:
+        if '罰金套用張數' not in df_buy.columns:
+            df_buy = df_buy.copy()
+            df_buy['罰金套用張數'] = 0
+        return df_buy
+
+    df_buy = df_buy.copy().reset_index(drop=True)
+    if '罰金套用張數' not in df_buy.columns:
+        df_buy['罰金套用張數'] = 0
+    n = len(df_buy)
+
+    cus_ids = df_buy['客戶ID'].map(lambda v: str(v).strip())
+    cb_codes = df_buy['CB代號'].map(lambda v: str(v).strip())
+    # 規則查表：特定客戶優先，其次 ALL
+    rule_keys = [(c, b) if (c, b) in rules else ('ALL', b) for c, b in zip(cus_ids, cb_codes)]
+    matched = [rules.get(k) for k in rule_keys]
+    has_rule = np.array([r is not None for r in matched], dtype=bool)
+    budget = np.array([np.inf if r is None or r['qty'] is None else max(0, int(r['qty'])) for r in matched], dtype=float)
+    amt_text = np.array(['' if r is None else str(r['amt']) for r in matched], dtype=object)
+
+    short = _short_flags(df_buy)
+    vip_qty = (df_buy['VIP報價張數'].map(_to_int).to_numpy(dtype=np.int64)
+               if 'VIP報價張數' in df_buy.columns else np.zeros(n, dtype=np.int64))
+    row_qty = df_buy['成交張數'].map(_to_int).to_numpy(dtype=np.int64) if '成交張數' in df_buy.columns else np.zeros(n, dtype=np.int64)
+    eligible = has_rule & ~short & (vip_qty >= 0) & (row_qty > 0)
+
+    # 排序鍵：(客戶ID+CB代號 分組, 優先順序, 原始順序)；分組累加求每列套用前已消耗的張數
+    group_id = df_buy.groupby(['客戶ID', 'CB代號'], sort=False, dropna=False).ngroup().to_numpy()
+    priority = np.where(vip_qty > 0, 0, 1)
+    pos = np.flatnonzero(eligible)
+    pos = pos[np.lexsort((pos, priority[pos], group_id[pos]))]
+    qty_sorted = row_qty[pos].astype(float)
+    consumed_after = pd.Series(qty_sorted).groupby(group_id[pos]).cumsum().to_numpy()
+    consumed_before = consumed_after - qty_sorted
+    grp_budget = budget[pos]
+
+    full = pos[consumed_after <= grp_budget]
+    boundary_mask = (consumed_before < grp_budget) & (consumed_after > grp_budget)
+    boundary = pos[boundary_mask]
+    take = (grp_budget[boundary_mask] - consumed_before[boundary_mask]).astype(np.int64)
+
+    if '提前履約賠償金' not in df_buy.columns:
+        df_buy['提前履約賠償金'] = np.nan
+    penalty_col = df_buy['提前履約賠償金'].to_numpy(dtype=object).copy()
+    used_col = df_buy['罰金套用張數'].to_numpy(dtype=object).copy()
+    penalty_col[full] = amt_text[full]
+    used_col[full] = row_qty[full]
+    df_buy['提前履約賠償金'] = penalty_col
+    df_buy['罰金套用張數'] = used_col
+
+    if len(boundary) == 0:
+        return df_buy
+
+    # 邊界列拆成「套罰金」與「剩餘不套」兩列，剩餘列緊接在原列之後
+    total = row_qty[boundary]
+    df_take = _split_values(df_buy.iloc[boundary].copy(), take, total)
+    df_take['提前履約賠償金'] = amt_text[boundary]
+    df_take['罰金套用張數'] = take
+    df_rest = _split_values(df_buy.iloc[boundary].copy(), total - take, total)
+    df_rest['提前履約賠償金'] = '0'
+    df_rest['罰金套用張數'] = 0
+
+    keep = np.ones(n, dtype=bool)
+    keep[boundary] = False
+    order_pos = np.concatenate([np.flatnonzero(keep), boundary, boundary])
+    order_sub = np.concatenate([np.zeros(keep.sum()), np.zeros(len(boundary)), np.ones(len(boundary))])
+    result = pd.concat([df_buy[keep], df_take, df_rest], ignore_index=True)
+    result = result.iloc[np.lexsort((order_sub, order_pos))].reset_index(drop=True)
+    return result
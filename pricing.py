@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# 定點數：價格、利率以 1e-6 為單位存成 int64
+PRICE_DECIMALS = 6
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+# 年期 = 計息天數 / 365
+YEAR_DAYS = 365
+
+
+def to_fixed(values) -> tuple[np.ndarray, np.ndarray]:
+    """轉成 1e-6 單位的 int64，回傳 (units, 缺值遮罩)；缺值或無法轉數字的位置 units 為 0
+
+    價格、利率、手續費最多 6 位小數，乘上 PRICE_SCALE 後取最接近的整數即為其十進位值（同 Decimal(str(x))）。
+    """
+    x = np.asarray(pd.to_numeric(values, errors='coerce'), dtype=np.float64)
+    na = ~np.isfinite(x)
+    units = np.rint(np.where(na, 0.0, x) * PRICE_SCALE).astype(np.int64)
+    return units, na
+
+
+def _to_days(days) -> tuple[np.ndarray, np.ndarray]:
+    d = np.asarray(pd.to_numeric(days, errors='coerce'), dtype=np.float64)
+    na = np.isnan(d)
+    return np.where(na, 0, d).astype(np.int64), na
+
+
+def _div_half_up(numerator: np.ndarray, denominator: int) -> np.ndarray:
+    """整數除法並四捨五入（ROUND_HALF_UP：剛好 .5 時遠離 0）"""
+    q = (np.abs(numerator) * 2 + denominator) // (denominator * 2)
+    return np.where(numerator < 0, -q, q)
+
+
+def _to_float(units: np.ndarray, decimals: int, na: np.ndarray):
+    """10^-decimals 單位的整數轉回 float（缺值為 NaN）；純量輸入回傳 float"""
+    result = np.where(na, np.nan, units / 10 ** decimals)
+    return float(result) if result.ndim == 0 else result
+
+
+def quantize_half_up(values, decimals: int = 2):
+    """整批四捨五入到 decimals 位（同 float(Decimal(str(x)).quantize(..., ROUND_HALF_UP))）"""
+    units, na = to_fixed(values)
+    return _to_float(_div_half_up(units, 10 ** (PRICE_DECIMALS - decimals)), decimals, na)
+
+
+def premium_per_hundred(rate, days, sellback_price, fee=0, decimals: int = 2):
+    """權利金百元價 = 利率 × 天數 / 365 − (賣回價 − 100) + 手續費 / 1000，四捨五入到 decimals 位
+
+    利息以 (利率 × 天數) / 365 的分數精確計算，只在最後四捨五入一次，不受浮點誤差影響。
+    """
+    r, r_na = to_fixed(rate)
+    s, s_na = to_fixed(sellback_price)
+    f, f_na = to_fixed(np.asarray(pd.to_numeric(fee, errors='coerce'), dtype=np.float64) / 1000)
+    d, d_na = _to_days(days)
+    numerator = r * d - (s - 100 * PRICE_SCALE) * YEAR_DAYS + f * YEAR_DAYS
+    units = _div_half_up(numerator, YEAR_DAYS * 10 ** (PRICE_DECIMALS - decimals))
+    return _to_float(units, decimals, r_na | s_na | f_na | d_na)
+
+
+def exercise_price(sellback_price, rate, days, decimals: int = 2):
+    """履約價 = 賣回價 − 利率 × 天數 / 365，四捨五入到 decimals 位"""
+    s, s_na = to_fixed(sellback_price)
+    r, r_na = to_fixed(rate)
+    d, d_na = _to_days(days)
+    numerator = s * YEAR_DAYS - r * d
+    units = _div_half_up(numerator, YEAR_DAYS * 10 ** (PRICE_DECIMALS - decimals))
+    return _to_float(units, decimals, s_na | r_na | d_na)
@@ -2,6 +2,7 @@ import pandas as pd
 from datetime import datetime
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QLineEdit, QPushButton
 from format_utils import next_business_day
+from pricing import premium_per_hundred
 
 
 class QuoteCalculatorWindow(QWidget):
@@ -111,6 +112,19 @@ class QuoteCalculatorWindow(QWidget):
         layout.addStretch()
         self.setLayout(layout)
     
+    def update_quote(self, df_quote):
+        """主程式重新載入報價表後更新下拉選單，保留目前選擇的CB"""
+        self.df_quote = df_quote
+        current_text = self.cb_combo.currentText()
+        self.cb_combo.blockSignals(True)
+        self.cb_combo.clear()
+        for _, row in self.df_quote.iterrows():
+            cb_text = f"{row['CB代號']} - {row['CB名稱']}"
+            self.cb_combo.addItem(cb_text, row['CB代號'])
+        self.cb_combo.setCurrentText(current_text)
+        self.cb_combo.blockSignals(False)
+        self.on_cb_changed(current_text)
+
     def on_cb_changed(self, text):
         """當CB標的改變時，更新相關欄位"""
         try:
@@ -140,7 +154,7 @@ class QuoteCalculatorWindow(QWidget):
             # 計算年期
             due_date = pd.to_datetime(due_date_str, format='%Y%m%d')
             t_plus_2 = pd.Timestamp(next_business_day(datetime.now(), 2).date())
-            year_period = ((due_date - t_plus_2).days + 1) / 365
+            days = (due_date - t_plus_2).days + 1
 
             # 獲取賣回價
             matching_rows = self.df_quote[self.df_quote['CB代號'] == cb_code]
@@ -150,7 +164,7 @@ class QuoteCalculatorWindow(QWidget):
                 sellback_price = 100  # 預設值
             
             # 計算百元報價
-            hundred_price = round(rate * year_period - (sellback_price - 100), 2) + fee / 1000
+            hundred_price = premium_per_hundred(rate, days, sellback_price) + fee / 1000
             price_total = qty * price * 1000
             premium_per = price - 100 + hundred_price
             premium_total = premium_per * qty * 1000
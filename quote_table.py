@@ -1,7 +1,17 @@
-import pandas as pd
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QTableView, QMessageBox
 from PyQt5.QtGui import QFont, QColor
 from PyQt5.QtCore import Qt
+from table_model import BackgroundRules, DataFrameTableModel
+
+# 關鍵欄位的背景色
+QUOTE_BACKGROUND_RULES = BackgroundRules(columns={
+    'CB代號': QColor(230, 255, 230),  # 淺綠色
+    'CB名稱': QColor(230, 255, 230),
+    '履約利率': QColor(255, 255, 224),  # 淺黃色
+    '低履約利率': QColor(255, 255, 224),
+    '賣回價': QColor(204, 229, 255),  # 淺藍色
+    '賣回日': QColor(204, 229, 255),
+})
 
 
 class QuoteTableWindow(QWidget):
@@ -43,7 +53,9 @@ class QuoteTableWindow(QWidget):
         layout.addWidget(search_frame)
         
         # 報價表格
-        self.table = QTableWidget()
+        self.model = DataFrameTableModel(background_rules=QUOTE_BACKGROUND_RULES, parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.setup_table()
         layout.addWidget(self.table)
         
@@ -58,23 +70,7 @@ class QuoteTableWindow(QWidget):
         if self.df_quote.empty:
             return
             
-        self.table.setRowCount(len(self.df_quote))
-        self.table.setColumnCount(len(self.df_quote.columns))
-        self.table.setHorizontalHeaderLabels(self.df_quote.columns.tolist())
-        
-        # 填入資料
-        for i, (index, row) in enumerate(self.df_quote.iterrows()):
-            for j, col in enumerate(self.df_quote.columns):
-                value = str(row[col]) if pd.notna(row[col]) else ""
-                item = QTableWidgetItem(value)
-                # 設置關鍵欄位的背景色
-                if col in ['CB代號', 'CB名稱']:
-                    item.setBackground(QColor(230, 255, 230))  # 淺綠色
-                elif col in ['履約利率', '低履約利率']:
-                    item.setBackground(QColor(255, 255, 224))  # 淺黃色
-                elif col in ['賣回價', '賣回日']:
-                    item.setBackground(QColor(204, 229, 255))  # 淺藍色
-                self.table.setItem(i, j, item)
+        self.model.set_dataframe(self.df_quote)
         
         # 調整欄位寬度
         self.table.resizeColumnsToContents()
@@ -93,27 +89,20 @@ class QuoteTableWindow(QWidget):
                 self.df_quote['CB名稱'].astype(str).str.upper().str.contains(search_text, na=False)
             ]
         
-        # 更新表格
-        self.table.setRowCount(len(filtered_df))
-        for i, (index, row) in enumerate(filtered_df.iterrows()):
-            for j, col in enumerate(filtered_df.columns):
-                value = str(row[col]) if pd.notna(row[col]) else ""
-                item = QTableWidgetItem(value)
-                # 設置關鍵欄位的背景色
-                if col in ['CB代號', 'CB名稱']:
-                    item.setBackground(QColor(230, 255, 230))  # 淺綠色
-                elif col in ['履約利率', '低履約利率']:
-                    item.setBackground(QColor(255, 255, 224))  # 淺黃色
-                elif col in ['賣回價', '賣回日']:
-                    item.setBackground(QColor(204, 229, 255))  # 淺藍色
-                self.table.setItem(i, j, item)
+        # 更新表格（整表替換模型資料）
+        self.model.set_dataframe(filtered_df)
         
         self.status_label.setText(f"顯示 {len(filtered_df)} / {len(self.df_quote)} 筆資料")
         
+    def update_quote(self, df_quote):
+        """主程式重新載入報價表後更新此窗口（保留目前的搜尋條件）"""
+        self.df_quote = df_quote
+        self.filter_table()
+
     def refresh_data(self):
         """重新整理報價表資料"""
         try:
-            # 這裡需要重新載入報價表資料
-            QMessageBox.information(self, "提示", "請在主程式中重新載入報價表後再開啟此視窗")
+            # 主程式偵測到報價表存檔後會自動更新此窗口，這裡只重新套用目前資料
+            self.filter_table()
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"重新整理失敗：{e}") 
\ No newline at end of file
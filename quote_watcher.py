@@ -0,0 +1,93 @@
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+from file_reader import get_quote_store
+
+
+class QuoteWatcher(QObject):
+    """背景監看報價表：定期檢查檔案 mtime/size，有變動時在背景執行緒解析，
+    通過檢查後以 quote_reloaded 信號把新資料送回 GUI 執行緒，解析過程不會卡住介面。
+
+    報價表放在網路磁碟（SMB），無法使用 inotify 類的檔案通知，因此採輪詢；
+    檔案簽章需連續兩次輪詢相同才重新載入，避免讀到存檔到一半的檔案。
+    """
+
+    # (df_quote, duplicate_cb, df_cbinfo, manual)
+    quote_reloaded = pyqtSignal(object, object, object, bool)
+    # (錯誤訊息, manual)
+    reload_failed = pyqtSignal(str, bool)
+
+    def __init__(self, file_path: str = None, interval_seconds: float = 5.0, parent=None):
+        super().__init__(parent)
+        self.store = get_quote_store(file_path)
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._manual = False
+        self._thread = None
+        self._loaded_signature = None
+        self._pending_signature = None
+
+    def start(self, loaded_signature=None):
+        """開始監看；loaded_signature 為目前 GUI 已載入版本的簽章（None 表示以 QuoteStore 目前快取的版本為準）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if loaded_signature is None:
+            loaded_signature = self.store.cached_signature
+        self._loaded_signature = loaded_signature
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='QuoteWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def request_reload(self):
+        """手動要求立即重新載入（不論檔案是否變動）"""
+        self._manual = True
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            manual = self._manual
+            self._manual = False
+            try:
+                if manual:
+                    self.store.invalidate()
+                    self._reload(self.store.signature(), manual=True)
+                else:
+                    self._poll()
+            except Exception as e:
+                print(f"監看報價表時發生錯誤: {e}")
+                if manual:
+                    self.reload_failed.emit(str(e), True)
+            self._wake_event.wait(self.interval_seconds)
+
+    def _poll(self):
+        signature = self.store.signature()
+        if signature == self._loaded_signature:
+            self._pending_signature = None
+            return
+        if signature != self._pending_signature:
+            # 第一次看到新簽章，等下一輪確認檔案已存完
+            self._pending_signature = signature
+            return
+        self._reload(signature, manual=False)
+
+    def _reload(self, signature, manual: bool):
+        try:
+            df_quote, df_cbinfo = self.store.get()
+        except Exception as e:
+            # 解析失敗（例如檔案被鎖住）時保留原資料，下一輪再試
+            self.reload_failed.emit(f"無法載入報價表：{e}", manual)
+            return
+        if df_quote.empty:
+            self.reload_failed.emit("報價表解析結果為空，保留原本的報價資料", manual)
+            self._loaded_signature = signature
+            return
+        # 檢查重複的CB代號
+        duplicate_cb = df_quote[df_quote.duplicated(subset=['CB代號'], keep=False)]
+        self._loaded_signature = signature
+        self._pending_signature = None
+        self.quote_reloaded.emit(df_quote, duplicate_cb, df_cbinfo, manual)
@@ -0,0 +1,171 @@
+import glob
+import hashlib
+import os
+import shutil
+import threading
+import time
+from envs import remote_files, local_cache_dir
+
+# 同一個檔案在這段時間內重複讀取時不再向網路磁碟查 mtime/size（同一個動作常會讀好幾次）
+REMOTE_STAT_TTL = 2.0
+# 背景更新的輪詢間隔（秒）：讀過的檔案在網路磁碟上變動時先在背景複製好，下次讀取直接用本機檔
+REMOTE_REFRESH_INTERVAL = 30.0
+
+
+def remote_path(name: str, **fields) -> str:
+    """依 envs.remote_files 設定表取得網路磁碟上的路徑，例如 remote_path('asccsv02', tday='20250909')"""
+    return remote_files[name].format(**fields)
+
+
+class RemoteFileCache:
+    """網路磁碟（SMB）檔案的本機鏡像快取
+
+    讀取時先比對遠端檔案的 mtime/size，本機已有同一版本就直接回傳本機路徑，否則複製一份到 cache_dir
+    （檔名含路徑雜湊 + mtime + size，程式重開後仍可沿用）。讀過的檔案由背景執行緒定期檢查，
+    遠端更新時先複製好新版本；網路磁碟暫時無法連線時改用最後一份本機副本。
+    寫入仍直接寫遠端檔案，寫完呼叫 invalidate() 讓下一次讀取重新比對。
+    """
+
+    def __init__(self, cache_dir: str = local_cache_dir, stat_ttl: float = REMOTE_STAT_TTL,
+                 refresh_interval: float = REMOTE_REFRESH_INTERVAL):
+        self.cache_dir = cache_dir
+        self.stat_ttl = stat_ttl
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        # 遠端路徑 -> (簽章, 本機路徑, 檢查時間)
+        self._entries = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return hashlib.sha1(os.path.normcase(path).encode('utf-8')).hexdigest()[:16]
+
+    def _local_file(self, path: str, signature) -> str:
+        ext = os.path.splitext(path)[1]
+        return os.path.join(self.cache_dir, f"{self._key(path)}_{signature[0]}_{signature[1]}{ext}")
+
+    def _path_lock(self, path: str):
+        with self._lock:
+            if path not in self._path_locks:
+                self._path_locks[path] = threading.Lock()
+            return self._path_locks[path]
+
+    def _latest_copy(self, path: str):
+        """本機最後一份副本（網路磁碟無法連線時使用）"""
+        copies = glob.glob(os.path.join(self.cache_dir, f"{self._key(path)}_*"))
+        copies = [c for c in copies if not c.endswith('.tmp')]
+        return max(copies, key=os.path.getmtime) if copies else None
+
+    def _copy(self, path: str, signature) -> str:
+        local = self._local_file(path, signature)
+        if not os.path.exists(local):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{local}.{threading.get_ident()}.tmp"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, local)
+            # 清掉同一檔案的舊版本
+            for old in glob.glob(os.path.join(self.cache_dir, f"{self._key(path)}_*")):
+                if old != local and not old.endswith('.tmp'):
+                    try:
+                        os.remove(old)
+                    except OSError:
+                        pass
+        return local
+
+    def _sync(self, path: str) -> str:
+        """比對遠端簽章，必要時複製，回傳本機路徑"""
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        local = self._copy(path, signature)
+        with self._lock:
+            self._entries[path] = (signature, local, time.monotonic())
+        return local
+
+    def local_path(self, path: str, revalidate: bool = False) -> str:
+        """回傳可讀取的本機路徑
+
+        revalidate=True 時一定重新比對遠端簽章（讀出來要改寫回去的檔案使用）。
+
+        遠端檔案不存在時回傳原路徑，讓呼叫端照舊收到 FileNotFoundError；
+        其他錯誤（網路斷線、複製失敗）時改用最後一份本機副本，沒有副本則回傳原路徑直接讀遠端。
+        revalidate=True 時不使用舊副本而是直接拋出錯誤，避免把過期內容寫回遠端蓋掉較新的檔案。
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+        if not revalidate and entry is not None and time.monotonic() - entry[2] < self.stat_ttl and os.path.exists(entry[1]):
+            return entry[1]
+        with self._path_lock(path):
+            try:
+                local = self._sync(path)
+            except FileNotFoundError:
+                return path
+            except OSError as e:
+                if revalidate:
+                    raise
+                local = entry[1] if entry is not None and os.path.exists(entry[1]) else self._latest_copy(path)
+                if local is None:
+                    print(f"快取網路磁碟檔案時發生錯誤: {e}")
+                    return path
+                print(f"無法連線 {path}，改用本機副本: {e}")
+                return local
+        self._ensure_refresher()
+        return local
+
+    def invalidate(self, path: str = None):
+        """遠端檔案被本程式寫入後呼叫，下一次讀取會重新比對（path 為 None 時全部）"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def prefetch(self, paths):
+        """在背景先複製指定檔案（例如程式啟動時）"""
+        paths = list(paths)
+        threading.Thread(target=lambda: [self.local_path(p) for p in paths],
+                         name='RemoteFilePrefetch', daemon=True).start()
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='RemoteFileCache', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            with self._lock:
+                paths = list(self._entries)
+            for path in paths:
+                if self._stop_event.is_set():
+                    break
+                try:
+                    with self._path_lock(path):
+                        self._sync(path)
+                except OSError:
+                    # 檔案暫時不存在或無法連線，下一輪再試
+                    pass
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_remote_cache = None
+_remote_cache_lock = threading.Lock()
+
+
+def get_remote_cache() -> RemoteFileCache:
+    """取得共用的 RemoteFileCache"""
+    global _remote_cache
+    with _remote_cache_lock:
+        if _remote_cache is None:
+            _remote_cache = RemoteFileCache()
+        return _remote_cache
+
+
+def cached_path(path: str, revalidate: bool = False) -> str:
+    """網路磁碟檔案的本機副本路徑（讀取用）"""
+    return get_remote_cache().local_path(path, revalidate)
@@ -0,0 +1,437 @@
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QColor
+from PyQt5.QtWidgets import QTableView, QTableWidgetItem
+
+LIGHT_BLUE = QColor(204, 229, 255)
+LIGHT_GREEN = QColor(204, 255, 204)
+LIGHT_YELLOW = QColor(255, 255, 224)
+
+# 列鍵/列簽章記錄在每列第一格的 item data（不顯示），排序時會跟著列移動
+ROW_KEY_ROLE = Qt.UserRole
+ROW_SIGNATURE_ROLE = Qt.UserRole + 1
+
+_to_str = np.frompyfunc(str, 1, 1)
+
+
+def frame_to_text(df: pd.DataFrame, na_rep='', formatter=None) -> np.ndarray:
+    """DataFrame 一次轉成顯示用的字串陣列 (rows x cols, dtype=object)
+
+    Args:
+        na_rep: 缺值顯示的文字；None 表示與 str(value) 相同（缺值顯示為 'nan'/'None'）
+        formatter: 自訂的逐格轉字串函式，預設為 str
+    """
+    values = df.to_numpy(dtype=object)
+    if values.size == 0:
+        return values.reshape(len(df), len(df.columns))
+    convert = _to_str if formatter is None else np.frompyfunc(formatter, 1, 1)
+    texts = convert(values)
+    if na_rep is not None:
+        texts[pd.isna(values)] = na_rep
+    return texts.astype(object)
+
+
+class BackgroundRules:
+    """底色規則
+
+    Args:
+        columns: {欄位名稱: QColor}，整欄上色
+        cells: [(欄位名稱, 條件(text) -> bool, QColor)]，依儲存格文字上色，優先於整欄規則
+    """
+
+    def __init__(self, columns=None, cells=None):
+        self.columns = dict(columns or {})
+        self.cells = list(cells or [])
+
+    @classmethod
+    def for_columns(cls, color, column_names):
+        return cls(columns={col: color for col in column_names})
+
+    def color_for(self, column, text):
+        for col, condition, color in self.cells:
+            if col == column and condition(text):
+                return color
+        return self.columns.get(column)
+
+    def __bool__(self):
+        return bool(self.columns or self.cells)
+
+
+class DataFrameTableModel(QAbstractTableModel):
+    """以 DataFrame 為資料來源的表格模型，給 QTableView 使用
+
+    載入資料時只做一次整表字串轉換（set_dataframe），不需逐格建立 QTableWidgetItem；
+    顯示/底色在 data() 依需要計算，讀回資料直接取 dataframe()。
+    報價表（唯讀）與 VIP名單/特殊報價/常用客戶/錄音等可編輯的表（DataFrameTableView）使用。
+    """
+
+    def __init__(self, df: pd.DataFrame = None, background_rules: BackgroundRules = None,
+                 editable=False, na_rep='', parent=None):
+        super().__init__(parent)
+        self.background_rules = background_rules or BackgroundRules()
+        self.editable = editable
+        self.na_rep = na_rep
+        self._brushes = {}
+        self._columns = []
+        self._texts = np.empty((0, 0), dtype=object)
+        self.set_dataframe(df if df is not None else pd.DataFrame())
+
+    # ---- 資料存取 ----
+    def set_dataframe(self, df: pd.DataFrame):
+        """整表替換資料"""
+        self.beginResetModel()
+        self._columns = [str(col) for col in df.columns]
+        self._texts = frame_to_text(df, na_rep=self.na_rep)
+        self.endResetModel()
+
+    def dataframe(self) -> pd.DataFrame:
+        """目前表格內容（全部為字串，與 get_table_data 讀 QTableWidget 的結果相同格式）"""
+        return pd.DataFrame(self._texts.copy(), columns=self._columns)
+
+    def columns(self):
+        return list(self._columns)
+
+    # ---- QAbstractTableModel ----
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._texts.shape[0]
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        text = self._texts[index.row(), index.column()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return text
+        if role == Qt.BackgroundRole and self.background_rules:
+            color = self.background_rules.color_for(self._columns[index.column()], text)
+            if color is not None:
+                key = color.rgba()
+                if key not in self._brushes:
+                    self._brushes[key] = QBrush(color)
+                return self._brushes[key]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section] if section < len(self._columns) else None
+        return str(section + 1)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if self.editable and index.isValid():
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not self.editable or not index.isValid() or role != Qt.EditRole:
+            return False
+        self._texts[index.row(), index.column()] = '' if value is None else str(value)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole, Qt.BackgroundRole])
+        return True
+
+    def insertRows(self, row, count, parent=QModelIndex()):
+        """在 row 之前插入 count 列空白列"""
+        if parent.isValid() or count <= 0 or not 0 <= row <= self._texts.shape[0]:
+            return False
+        self.beginInsertRows(QModelIndex(), row, row + count - 1)
+        blank = np.full((count, len(self._columns)), '', dtype=object)
+        self._texts = np.concatenate([self._texts[:row], blank, self._texts[row:]])
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid() or count <= 0 or row < 0 or row + count > self._texts.shape[0]:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        self._texts = np.delete(self._texts, np.s_[row:row + count], axis=0)
+        self.endRemoveRows()
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """欄位可全部轉成數字時依數值排序，否則依文字排序（空白一律排最後）"""
+        if column < 0 or column >= len(self._columns) or self._texts.shape[0] == 0:
+            return
+        texts = pd.Series(self._texts[:, column]).astype(str).str.strip()
+        blank = (texts == '').to_numpy()
+        numbers = pd.to_numeric(texts, errors='coerce')
+        keys = numbers if numbers[~blank].notna().all() else texts
+        order_index = keys.sort_values(ascending=(order == Qt.AscendingOrder), kind='stable').index.to_numpy()
+        order_index = np.concatenate([order_index[~blank[order_index]], order_index[blank[order_index]]])
+        self.layoutAboutToBeChanged.emit()
+        self._texts = self._texts[order_index]
+        self.layoutChanged.emit()
+
+
+class DataFrameTableView(QTableView):
+    """可編輯的 QTableView + DataFrameTableModel，取代逐格建立 QTableWidgetItem 的 QTableWidget
+
+    欄位固定為建立時的 columns；提供與 QTableWidget 同名的列操作（rowCount/insertRow/removeRow/setRowCount），
+    Delete/Backspace 刪除選取的列。讀寫儲存格用 cell_text/set_cell_text，整表讀回用 read_table_widget。
+    """
+
+    def __init__(self, columns, background_rules: BackgroundRules = None, na_rep='', parent=None):
+        super().__init__(parent)
+        self.table_model = DataFrameTableModel(pd.DataFrame(columns=list(columns)), background_rules=background_rules,
+                                               editable=True, na_rep=na_rep, parent=self)
+        self.setModel(self.table_model)
+
+    def set_dataframe(self, df: pd.DataFrame):
+        """整表替換資料（依表頭名稱對應欄位，DataFrame 沒有的欄位留空）；有啟用排序時依目前的排序欄重排"""
+        self.table_model.set_dataframe(df.reindex(columns=self.table_model.columns(), fill_value=''))
+        if self.isSortingEnabled():
+            header = self.horizontalHeader()
+            self.table_model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+
+    def dataframe(self) -> pd.DataFrame:
+        return self.table_model.dataframe()
+
+    def rowCount(self):
+        return self.table_model.rowCount()
+
+    def columnCount(self):
+        return self.table_model.columnCount()
+
+    def insertRow(self, row):
+        self.table_model.insertRows(row, 1)
+
+    def removeRow(self, row):
+        self.table_model.removeRows(row, 1)
+
+    def setRowCount(self, rows):
+        current = self.rowCount()
+        if rows < current:
+            self.table_model.removeRows(rows, current - rows)
+        elif rows > current:
+            self.table_model.insertRows(current, rows - current)
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Delete, Qt.Key_Backspace) and self.state() != QTableView.EditingState:
+            rows = selected_rows(self)
+            if rows:
+                for row in reversed(rows):
+                    self.removeRow(row)
+                return
+        super().keyPressEvent(event)
+
+
+def cell_text(table, row, col) -> str:
+    """讀取儲存格文字（QTableWidget 與 DataFrameTableView 皆可），沒有值時為空字串"""
+    value = table.model().index(row, col).data()
+    return '' if value is None else str(value)
+
+
+def set_cell_text(table, row, col, text):
+    """寫入儲存格文字（QTableWidget 沒有 item 時由 model 自動建立）"""
+    model = table.model()
+    model.setData(model.index(row, col), text)
+
+
+def selected_rows(table) -> list:
+    """選取範圍涵蓋的列號（由小到大）"""
+    return sorted({index.row() for index in table.selectionModel().selectedIndexes()})
+
+
+def _frame_model(table):
+    model = table.model()
+    return model if isinstance(model, DataFrameTableModel) else None
+
+
+def table_headers(table):
+    """取得表格（QTableWidget 或 DataFrameTableView）的欄位名稱"""
+    model = _frame_model(table)
+    if model is not None:
+        return model.columns()
+    return [
+        table.horizontalHeaderItem(i).text() if table.horizontalHeaderItem(i) else f"Column{i}"
+        for i in range(table.columnCount())
+    ]
+
+
+def _suspend(table):
+    """暫停排序/重繪/信號，回傳恢復用的狀態"""
+    was_sorting = table.isSortingEnabled()
+    table.setSortingEnabled(False)
+    table.setUpdatesEnabled(False)
+    blocked = table.blockSignals(True)
+    return was_sorting, blocked
+
+
+def _resume(table, state):
+    was_sorting, blocked = state
+    table.blockSignals(blocked)
+    table.setUpdatesEnabled(True)
+    table.setSortingEnabled(was_sorting)
+
+
+def _set_row(table, row, texts, columns, rules, column_indexes):
+    for j in column_indexes:
+        text = texts[j]
+        item = QTableWidgetItem(text)
+        color = rules.color_for(columns[j], text)
+        if color is not None:
+            item.setBackground(color)
+        table.setItem(row, j, item)
+
+
+def fill_table_widget(table, df: pd.DataFrame, by_header=False, background_rules: BackgroundRules = None,
+                      na_rep=None, formatter=None, row_tags=None):
+    """把 DataFrame 一次填入 QTableWidget
+
+    先整表轉字串、依規則算好底色，填入期間暫停排序/重繪/信號，避免每放一格就觸發一次排序與重繪。
+
+    只給仍需要 item 層級狀態的 QTableWidget 使用：新作買進/提解賣出（sync_table_widget 記在第一格的列鍵/簽章、
+    報價/張數確認逐格上色）、議價交易（新增列的底色）以及與它們一起暫存/讀回的履約、到期、續期表。
+    沒有這類依賴的表改用 DataFrameTableView。
+
+    Args:
+        by_header: True 時依表頭名稱對應 DataFrame 欄位（表格有但 DataFrame 沒有的欄位留空），
+            False 時依 DataFrame 欄位順序直接填入
+        na_rep: 缺值顯示的文字；None 與原本 str(value) 相同
+        row_tags: 每列的 (列鍵, 簽章)（None 表示不記錄），通常來自 read_table_widget(with_tags=True)，
+            重新填表時保留 sync_table_widget 需要的列鍵
+    """
+    if by_header:
+        df = df.reindex(columns=table_headers(table), fill_value='')
+    texts = frame_to_text(df, na_rep=na_rep, formatter=formatter)
+    columns = [str(col) for col in df.columns]
+    rules = background_rules or BackgroundRules()
+
+    state = _suspend(table)
+    try:
+        table.setRowCount(len(texts))
+        for j, col in enumerate(columns):
+            if j >= table.columnCount():
+                break
+            column_color = rules.columns.get(col)
+            has_cell_rule = any(rule_col == col for rule_col, _, _ in rules.cells)
+            for i, text in enumerate(texts[:, j]):
+                item = QTableWidgetItem(text)
+                color = rules.color_for(col, text) if has_cell_rule else column_color
+                if color is not None:
+                    item.setBackground(color)
+                table.setItem(i, j, item)
+        if row_tags is not None and len(columns) > 0:
+            for i, tag in enumerate(row_tags):
+                item = table.item(i, 0)
+                if tag is not None and item is not None:
+                    item.setData(ROW_KEY_ROLE, tag[0])
+                    item.setData(ROW_SIGNATURE_ROLE, tag[1])
+    finally:
+        _resume(table, state)
+
+
+def row_key(table, row):
+    item = table.item(row, 0)
+    return item.data(ROW_KEY_ROLE) if item is not None else None
+
+
+def _row_tag(table, row):
+    item = table.item(row, 0)
+    if item is None or item.data(ROW_KEY_ROLE) is None:
+        return None
+    return item.data(ROW_KEY_ROLE), item.data(ROW_SIGNATURE_ROLE)
+
+
+def read_table_widget(table, drop_blank_rows=True, with_tags=False):
+    """從 QTableWidget 讀出所有資料（全部為字串），預設略過整列空白的列
+
+    DataFrameTableView 直接取 model 的內容，不逐格讀取（沒有列標記，列標記一律為 None）。
+    with_tags=True 時回傳 (DataFrame, 列標記 list)，列標記 (列鍵, 簽章) 與 DataFrame 的列一一對應
+    """
+    model = _frame_model(table)
+    if model is not None:
+        df = model.dataframe()
+        if drop_blank_rows and not df.empty:
+            df = df[df.apply(lambda col: col.astype(str).str.strip() != '').any(axis=1)].reset_index(drop=True)
+        return (df, [None] * len(df)) if with_tags else df
+    headers = table_headers(table)
+    n_cols = table.columnCount()
+    data = []
+    tags = []
+    for row in range(table.rowCount()):
+        row_data = [item.text() if item else "" for item in (table.item(row, col) for col in range(n_cols))]
+        if not drop_blank_rows or any(cell.strip() for cell in row_data):
+            data.append(row_data)
+            tags.append(_row_tag(table, row))
+    df = pd.DataFrame(data, columns=headers) if data else pd.DataFrame(columns=headers)
+    return (df, tags) if with_tags else df
+
+
+def sync_table_widget(table, df: pd.DataFrame, row_keys, key_prefix='', keep_columns=(),
+                      background_rules: BackgroundRules = None) -> dict:
+    """依列鍵把新計算結果差異更新到 QTableWidget（只動有變化的列）
+
+    - 表格上列鍵以 key_prefix 開頭、但新結果沒有的列 → 刪除
+    - 兩邊都有且計算內容（簽章）與上次寫入時相同 → 不動，保留使用者在該列的修改
+    - 兩邊都有但內容不同 → 只覆寫計算值有變的格子（keep_columns 的欄位一律保留畫面上的值）
+    - 新結果才有的列 → 新增在表格最後
+    列鍵為 None 或不是 key_prefix 開頭的列（手動輸入、其他來源加入的列）一律不動。
+
+    Args:
+        df: 新計算結果，依表頭名稱對應欄位
+        row_keys: df 每列的列鍵（需以 key_prefix 開頭且不重複）
+
+    Returns:
+        {'inserted': n, 'updated': n, 'removed': n, 'unchanged': n}
+    """
+    headers = table_headers(table)
+    df = df.reindex(columns=headers, fill_value='')
+    texts = frame_to_text(df)
+    rules = background_rules or BackgroundRules()
+    keep_idx = {headers.index(col) for col in keep_columns if col in headers}
+    update_idx = [j for j in range(len(headers)) if j not in keep_idx]
+    all_idx = list(range(len(headers)))
+    signatures = ['\x1f'.join(row[update_idx]) for row in texts]
+    new_keys = list(row_keys)
+    new_key_set = set(new_keys)
+
+    counts = {'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    state = _suspend(table)
+    try:
+        # 由下往上刪除已不存在的列，避免列號位移
+        for row in range(table.rowCount() - 1, -1, -1):
+            key = row_key(table, row)
+            if key is not None and str(key).startswith(key_prefix) and key not in new_key_set:
+                table.removeRow(row)
+                counts['removed'] += 1
+
+        on_screen = {}
+        for row in range(table.rowCount()):
+            key = row_key(table, row)
+            if key is not None:
+                on_screen[key] = row
+
+        for i, key in enumerate(new_keys):
+            row = on_screen.get(key)
+            if row is not None:
+                old_signature = table.item(row, 0).data(ROW_SIGNATURE_ROLE)
+                if old_signature == signatures[i]:
+                    counts['unchanged'] += 1
+                    continue
+                changed_idx = update_idx
+                old_values = old_signature.split('\x1f') if old_signature is not None else []
+                if len(old_values) == len(update_idx):
+                    # 只覆寫計算值有變的格子，計算值沒變的格子保留畫面上（可能被使用者修改過）的值
+                    changed_idx = [j for j, old in zip(update_idx, old_values) if texts[i][j] != old]
+                _set_row(table, row, texts[i], headers, rules, changed_idx)
+                counts['updated'] += 1
+            else:
+                row = table.rowCount()
+                table.insertRow(row)
+                _set_row(table, row, texts[i], headers, rules, all_idx)
+                counts['inserted'] += 1
+            item = table.item(row, 0)
+            if item is None:
+                # 第一欄沒有 item 時補一個空白 item 來記錄列鍵
+                item = QTableWidgetItem('')
+                table.setItem(row, 0, item)
+            item.setData(ROW_KEY_ROLE, key)
+            item.setData(ROW_SIGNATURE_ROLE, signatures[i])
+    finally:
+        _resume(table, state)
+    return counts
@@ -0,0 +1,148 @@
+import threading
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class TaskCancelled(Exception):
+    """工作已被取消（由 Task.check_cancelled 拋出）"""
+
+
+class TaskSignals(QObject):
+    """背景工作的信號；在 GUI 執行緒建立，因此連接的槽一律在 GUI 執行緒執行"""
+
+    # (進度百分比 0-100，-1 表示只有訊息, 訊息)
+    progress = pyqtSignal(int, str)
+    # 回傳值
+    result = pyqtSignal(object)
+    # (錯誤訊息, traceback)
+    error = pyqtSignal(str, str)
+    cancelled = pyqtSignal()
+    # 不論成功、失敗或取消都會送出
+    finished = pyqtSignal()
+
+
+class Task(QRunnable):
+    """在 QThreadPool 執行的單一工作
+
+    fn 在背景執行緒執行，不可直接操作任何 Qt 元件；需要回報進度或檢查取消時，
+    以 pass_task=True 送出，fn 會收到 task=<Task> 參數，可呼叫 task.report() / task.check_cancelled()。
+    """
+
+    def __init__(self, fn, args=(), kwargs=None, name=None, pass_task=False):
+        super().__init__()
+        # Python 端持有此物件直到 finished，不讓 Qt 在執行完畢後自行刪除
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = dict(kwargs or {})
+        self.name = name or getattr(fn, '__name__', 'task')
+        self.pass_task = pass_task
+        self.signals = TaskSignals()
+        self._cancel_event = threading.Event()
+
+    # ---- 給 GUI 執行緒使用 ----
+    def cancel(self):
+        """要求取消；尚未開始的工作不會執行，執行中的工作在下一次 check_cancelled 時中止"""
+        self._cancel_event.set()
+
+    # ---- 給背景工作使用 ----
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise TaskCancelled(self.name)
+
+    def report(self, percent=-1, message=''):
+        self.signals.progress.emit(int(percent), str(message))
+
+    def run(self):
+        try:
+            self.check_cancelled()
+            if self.pass_task:
+                result = self.fn(*self.args, task=self, **self.kwargs)
+            else:
+                result = self.fn(*self.args, **self.kwargs)
+            self.check_cancelled()
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            print(f"{self.name} 發生錯誤: {e}")
+            self.signals.error.emit(str(e), traceback.format_exc())
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+class TaskRunner(QObject):
+    """以 QThreadPool 執行資料庫查詢、產檔等耗時工作，讓介面保持可操作
+
+    用法：
+        runner.submit(fn, arg1, arg2,
+                      on_result=lambda result: ...,   # GUI 執行緒收到回傳值
+                      on_error=lambda message: ...,   # GUI 執行緒收到錯誤訊息
+                      disable=[button])               # 執行期間停用的元件，結束後恢復
+    多個工作可同時執行（上限為 max_workers），各自的結果依完成順序送回。
+    """
+
+    def __init__(self, max_workers=4, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, on_finished=None,
+               on_cancelled=None, disable=(), name=None, pass_task=False, **kwargs) -> Task:
+        task = Task(fn, args, kwargs, name=name, pass_task=pass_task)
+        if on_result is not None:
+            task.signals.result.connect(on_result)
+        if on_error is not None:
+            task.signals.error.connect(lambda message, tb: on_error(message))
+        if on_progress is not None:
+            task.signals.progress.connect(on_progress)
+        if on_cancelled is not None:
+            task.signals.cancelled.connect(on_cancelled)
+
+        widgets = [w for w in disable if w is not None]
+        for widget in widgets:
+            widget.setEnabled(False)
+
+        def _finished():
+            for widget in widgets:
+                widget.setEnabled(True)
+            with self._lock:
+                self._active.discard(task)
+            if on_finished is not None:
+                on_finished()
+
+        task.signals.finished.connect(_finished)
+        with self._lock:
+            self._active.add(task)
+        self.pool.start(task)
+        return task
+
+    def active_tasks(self) -> list:
+        with self._lock:
+            return list(self._active)
+
+    def cancel_all(self):
+        for task in self.active_tasks():
+            task.cancel()
+
+    def wait_for_done(self, msecs=-1) -> bool:
+        """等待所有工作結束（關閉程式時使用）"""
+        return self.pool.waitForDone(msecs)
+
+
+_task_runner = None
+
+
+def get_task_runner() -> TaskRunner:
+    """取得共用的 TaskRunner（需在 QApplication 建立後、於 GUI 執行緒呼叫）"""
+    global _task_runner
+    if _task_runner is None:
+        _task_runner = TaskRunner()
+    return _task_runner
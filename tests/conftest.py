@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 專案模組都放在根目錄（平鋪），測試從 tests/ 匯入時需要把根目錄加入路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+"""ConnectionPool 借出/歸還、逾時、健康檢查與統計，以 sqlite3 代替 pyodbc 連線（不需要資料庫）"""
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+from format_utils import BusinessCalendar, read_holiday_list
+
+
+def sqlite_factory(created):
+    def factory():
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        created.append(conn)
+        return conn
+    return factory
+
+
+def make_pool(created=None, **kwargs):
+    created = [] if created is None else created
+    kwargs.setdefault('ping_interval', 60)
+    return ConnectionPool(sqlite_factory(created), name='sqlite', **kwargs)
+
+
+def test_acquire_release_reuses_connection():
+    created = []
+    pool = make_pool(created, max_size=2)
+    with pool.connection() as conn:
+        assert conn.execute('SELECT 1').fetchall() == [(1,)]
+        assert pool.stats()['in_use'] == 1
+    with pool.connection() as conn:
+        assert conn.raw is created[0]
+
+    stats = pool.stats()
+    assert len(created) == 1
+    assert stats['created'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    assert stats['waits'] == 0
+
+
+def test_close_is_idempotent():
+    pool = make_pool(max_size=1)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.stats()['in_use'] == 0
+    assert pool.stats()['idle'] == 1
+
+
+def test_checkout_timeout_when_pool_exhausted():
+    pool = make_pool(max_size=1)
+    held = pool.acquire()
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    assert time.monotonic() - start >= 0.05
+
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['wait_seconds'] >= 0.05
+    assert stats['in_use'] == 1
+    held.close()
+    with pool.connection():
+        pass
+    assert pool.stats()['created'] == 1
+
+
+def test_waiter_gets_connection_released_by_other_thread():
+    created = []
+    pool = make_pool(created, max_size=1)
+    held = pool.acquire()
+    got = []
+
+    def borrow():
+        with pool.connection(timeout=5) as conn:
+            got.append(conn.raw)
+
+    worker = threading.Thread(target=borrow)
+    worker.start()
+    time.sleep(0.05)
+    held.close()
+    worker.join(5)
+
+    assert got == [created[0]]
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['checkouts'] == 2
+    assert stats['created'] == 1
+
+
+def test_broken_connection_is_discarded():
+    created = []
+    pool = make_pool(created, max_size=1)
+    conn = pool.acquire()
+    # rollback 失敗（連線已斷）時歸還即丟棄
+    conn.raw.close()
+    conn.close()
+    stats = pool.stats()
+    assert stats['closed'] == 1
+    assert stats['idle'] == 0
+
+    with pool.connection() as conn:
+        assert conn.raw is created[1]
+
+
+def test_ping_failure_recreates_connection():
+    created = []
+    pool = make_pool(created, max_size=1, ping_interval=0)
+    with pool.connection():
+        pass
+    # 閒置中的連線被伺服器端切斷
+    created[0].close()
+    with pool.connection() as conn:
+        assert conn.execute('SELECT 1').fetchall() == [(1,)]
+
+    stats = pool.stats()
+    assert stats['ping_failures'] == 1
+    assert stats['created'] == 2
+    assert stats['closed'] == 1
+
+
+def test_idle_connections_evicted_down_to_min_size():
+    pool = make_pool(min_size=1, max_size=3, idle_timeout=0)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        conn.close()
+    pool.evict_idle()
+    stats = pool.stats()
+    assert stats['idle'] == 1
+    assert stats['closed'] == 2
+
+
+def holiday_connection():
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute('CREATE TABLE HolidayList (Date TEXT, Name TEXT)')
+    conn.executemany('INSERT INTO HolidayList VALUES (?, ?)', [('2025/1/1', '元旦'), ('2025-01-02', '補假')])
+    conn.commit()
+    return conn
+
+
+def test_read_holiday_list_with_injected_connection():
+    conn = holiday_connection()
+    df = read_holiday_list(conn)
+    assert df['Date'].tolist() == ['2025/1/1', '2025-01-02']
+
+    calendar = BusinessCalendar(loader=lambda: read_holiday_list(conn))
+    assert not calendar.is_business_day(date(2025, 1, 2))
+    assert calendar.next_business_day(date(2024, 12, 31), 1) == date(2025, 1, 3)
+
+
+def test_read_holiday_list_borrows_from_pool_631(monkeypatch):
+    pytest.importorskip("pyodbc")
+    import db_access
+
+    pool = ConnectionPool(holiday_connection, name='SQL631', max_size=1)
+    monkeypatch.setattr(db_access, 'pool_631', pool)
+    assert len(read_holiday_list()) == 2
+    stats = pool.stats()
+    assert stats['checkouts'] == 1
+    assert stats['in_use'] == 0
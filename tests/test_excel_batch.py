@@ -0,0 +1,52 @@
+"""excel_batch / ExcelComSession 的批次轉檔流程，以 MockExcelApplication 代替 Excel（不需要 Excel 與 pywin32）"""
+import os
+
+from pdf_renderer import ExcelComRenderer, MockExcelApplication, current_excel_session, excel_batch
+
+
+def make_factory(apps, fail_on=()):
+    def factory():
+        app = MockExcelApplication(fail_on=fail_on)
+        apps.append(app)
+        return app
+    return factory
+
+
+def test_excel_batch_recycles_and_retries(tmp_path):
+    names = ['a.xlsx', 'b.xlsx', 'bad.xlsx', 'c.xlsx', 'd.xlsx', 'e.xlsx']
+    files = [(str(tmp_path / n), str(tmp_path / n.replace('.xlsx', '.pdf'))) for n in names]
+    apps = []
+    renderer = ExcelComRenderer()
+
+    with excel_batch(recycle_after=2, app_factory=make_factory(apps, fail_on={'bad.xlsx'})) as session:
+        assert current_excel_session() is session
+        results = [renderer.render(excel_path, pdf_path) for excel_path, pdf_path in files]
+    assert current_excel_session() is None
+
+    # a,b 共用第 1 個 Excel；bad 失敗後重開再試一次（第 2、3 個）；c,d 第 4 個；e 第 5 個
+    assert session.launches == 5
+    assert len(apps) == 5
+    assert all(app.quit_called for app in apps)
+    assert [[os.path.basename(x) for x, _ in app.exported] for app in apps] == [
+        ['a.xlsx', 'b.xlsx'], [], [], ['c.xlsx', 'd.xlsx'], ['e.xlsx'],
+    ]
+
+    exported = [pair for app in apps for pair in app.exported]
+    assert exported == [pair for pair in files if not pair[0].endswith('bad.xlsx')]
+    assert results == [None if excel_path.endswith('bad.xlsx') else pdf_path for excel_path, pdf_path in files]
+    for pdf_path in filter(None, results):
+        with open(pdf_path, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+
+
+def test_nested_excel_batch_reuses_outer_session(tmp_path):
+    apps = []
+    with excel_batch(recycle_after=10, app_factory=make_factory(apps)) as outer:
+        with excel_batch(recycle_after=1, app_factory=make_factory(apps)) as inner:
+            assert inner is outer
+            inner.export(str(tmp_path / 'a.xlsx'), str(tmp_path / 'a.pdf'))
+        # 內層結束不會關掉外層的 Excel
+        assert current_excel_session() is outer
+        outer.export(str(tmp_path / 'b.xlsx'), str(tmp_path / 'b.pdf'))
+    assert outer.launches == 1
+    assert len(apps[0].exported) == 2
@@ -0,0 +1,79 @@
+"""allocate_exercise 多筆需求分用同一契約時的累計剩餘張數（不依賴 Qt、資料庫）"""
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyodbc")
+import exercise_allocator
+from exercise_allocator import allocate_exercise, sort_exercise_contracts
+
+
+@pytest.fixture
+def sold_today(monkeypatch):
+    sold = {}
+    monkeypatch.setattr(exercise_allocator, 'sold_qty_by_contract', lambda: sold)
+    return sold
+
+
+def contracts(rows):
+    df = pd.DataFrame(rows, columns=['客戶ID', 'CB代號', '原單契約編號', '庫存張數', '原利率', '成交日期', '賣回價', '賣回日'])
+    df['成交日期'] = pd.to_datetime(df['成交日期'], format='%Y%m%d')
+    df['賣回日'] = pd.to_datetime(df['賣回日'], format='%Y%m%d')
+    return sort_exercise_contracts(df)
+
+
+def requests(rows):
+    return pd.DataFrame(rows, columns=['客戶ID', 'CB代號', '履約張數', '交割日期'])
+
+
+def test_two_requests_share_one_contract(sold_today):
+    df_contracts = contracts([
+        ('A123456789', '12345', 'P1', 10, 2.0, '20250101', 101.0, '20271231'),
+        ('A123456789', '12345', 'P2', 15, 1.5, '20250201', 101.0, '20271231'),
+    ])
+    df_requests = requests([
+        ('A123456789', '12345', 4, '20260105'),
+        ('A123456789', '12345', 20, '20260105'),
+    ])
+
+    result = allocate_exercise(df_contracts, df_requests)
+
+    assert result[['請求序號', '原單契約編號', '此契約履約張數']].values.tolist() == [
+        [0, 'P1', 4], [1, 'P1', 6], [1, 'P2', 14]]
+    # 第二筆需求把 P1 用完：剩餘張數、履約後剩餘張數、解約類別一致
+    assert result['剩餘張數'].tolist() == [6, 0, 1]
+    assert result['履約後剩餘張數'].tolist() == [6, 0, 1]
+    assert result['解約類別'].tolist() == ['1', '2', '1']
+    assert result['原庫存張數'].tolist() == [10, 10, 15]
+
+
+def test_remaining_includes_today_sold(sold_today):
+    sold_today['P1'] = 3
+    df_contracts = contracts([('A123456789', '12345', 'P1', 10, 2.0, '20250101', 101.0, '20271231')])
+    df_requests = requests([
+        ('A123456789', '12345', 2, '20260105'),
+        ('A123456789', '12345', 9, '20260105'),
+    ])
+
+    result = allocate_exercise(df_contracts, df_requests)
+
+    # 可用 7 張：第一筆 2 張、第二筆只分到 5 張；帳上仍有今日賣出的 3 張
+    assert result['此契約履約張數'].tolist() == [2, 5]
+    assert result['剩餘張數'].tolist() == [5, 0]
+    assert result['履約後剩餘張數'].tolist() == [8, 3]
+    assert result['解約類別'].tolist() == ['1', '2']
+
+
+def test_requests_for_other_keys_do_not_share_stock(sold_today):
+    df_contracts = contracts([
+        ('A123456789', '12345', 'P1', 10, 2.0, '20250101', 101.0, '20271231'),
+        ('B223456789', '12345', 'P9', 10, 2.0, '20250101', 101.0, '20271231'),
+    ])
+    df_requests = requests([
+        ('A123456789', '12345', 4, '20260105'),
+        ('B223456789', '12345', 10, '20260105'),
+    ])
+
+    result = allocate_exercise(df_contracts, df_requests)
+
+    assert result[['原單契約編號', '此契約履約張數', '履約後剩餘張數', '解約類別']].values.tolist() == [
+        ['P1', 4, 6, '1'], ['P9', 10, 0, '2']]
@@ -0,0 +1,125 @@
+"""FEE_RATE_RULES 規則表與原本逐列迴圈的結果比對（不依賴 Qt）"""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyodbc")
+from bargaining import SPECIAL_FEE_IDS, apply_fee_rate_rules
+
+
+def reference_fee_rate_loop(df_trade, vip_list_dict, default_fee):
+    """改寫前 calculate_new_trade_batch 的 VIP名單 → 特殊ID → 基礎規則 逐列迴圈（保留作為比對基準）"""
+    special_ids = ['H122699830', 'H123326603', 'P220839691']
+
+    # 2. 檢查VIP名單
+    if vip_list_dict:
+        for idx, row in df_trade.iterrows():
+            cus_id = str(row['客戶ID'])
+            if pd.isna(df_trade.loc[idx, '最終利率']) or pd.isna(df_trade.loc[idx, '最終手續費']):
+                if cus_id in vip_list_dict:
+                    vip_info = vip_list_dict[cus_id]
+                    if pd.isna(df_trade.loc[idx, '最終利率']) and vip_info.get('不限張數低利率') == 'Y':
+                        df_trade.loc[idx, '最終利率'] = row['低履約利率']
+                    if pd.isna(df_trade.loc[idx, '最終手續費']):
+                        if vip_info.get('80元手續費') == 'Y':
+                            df_trade.loc[idx, '最終手續費'] = 80
+                        elif vip_info.get('不限張數低手續費') == 'Y':
+                            df_trade.loc[idx, '最終手續費'] = 100
+
+    # 3. 檢查特殊ID
+    for idx, row in df_trade.iterrows():
+        cus_id = str(row['客戶ID'])
+        need_process = (pd.isna(df_trade.loc[idx, '最終利率']) or pd.isna(df_trade.loc[idx, '最終手續費']) or str(df_trade.loc[idx, '最終手續費']) == 'nan' or str(df_trade.loc[idx, '最終手續費']) == '')
+        if need_process and cus_id in special_ids:
+            if pd.isna(df_trade.loc[idx, '最終利率']):
+                df_trade.loc[idx, '最終利率'] = row['低履約利率']
+            if (pd.isna(df_trade.loc[idx, '最終手續費']) or str(df_trade.loc[idx, '最終手續費']) == 'nan' or str(df_trade.loc[idx, '最終手續費']) == ''):
+                df_trade.loc[idx, '最終手續費'] = 60
+
+    # 4. 基礎規則
+    for idx, row in df_trade.iterrows():
+        if pd.isna(df_trade.loc[idx, '最終利率']):
+            df_trade.loc[idx, '最終利率'] = row['低履約利率'] if row['STORQTY'] >= 200 else row['履約利率']
+        if pd.isna(df_trade.loc[idx, '最終手續費']):
+            if row['STORQTY'] >= 200 or row['成交張數'] >= 10:
+                df_trade.loc[idx, '最終手續費'] = 100
+            elif row.get('SRC', '') == 'E':
+                df_trade.loc[idx, '最終手續費'] = 110
+            else:
+                df_trade.loc[idx, '最終手續費'] = default_fee
+    return df_trade
+
+
+VIP_LIST = {
+    'VIP_ALL': {'不限張數低手續費': 'Y', '不限張數低利率': 'Y', '80元手續費': 'Y'},
+    'VIP_RATE': {'不限張數低手續費': 'N', '不限張數低利率': 'Y', '80元手續費': 'N'},
+    'VIP_FEE': {'不限張數低手續費': 'Y', '不限張數低利率': 'N', '80元手續費': 'N'},
+    'VIP_80': {'不限張數低手續費': 'N', '不限張數低利率': 'N', '80元手續費': 'Y'},
+    'VIP_NONE': {'不限張數低手續費': 'N', '不限張數低利率': 'N', '80元手續費': 'N'},
+    # 舊版 VIP 名單沒有 80元手續費 欄位
+    'VIP_OLD': {'不限張數低手續費': 'Y', '不限張數低利率': 'Y'},
+}
+
+CUSTOMERS = list(VIP_LIST) + SPECIAL_FEE_IDS + ['A123456789', 'B223456789']
+
+
+def make_trades(n, seed, with_src=True):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        '客戶ID': rng.choice(CUSTOMERS, n),
+        '成交張數': rng.choice([1, 5, 9, 10, 30], n),
+        'STORQTY': rng.choice([0.0, 50.0, 199.0, 200.0, 500.0], n),
+        '履約利率': rng.choice([1.5, 1.75, 2.0], n),
+        '低履約利率': rng.choice([1.0, 1.25], n),
+        '最終利率': np.nan,
+        '最終手續費': np.nan,
+    })
+    if with_src:
+        df['SRC'] = rng.choice(['E', 'M', ''], n)
+    # 特殊報價在拆單時已先填入部分列，規則表不得覆蓋
+    prefilled = rng.random(n) < 0.2
+    df.loc[prefilled, '最終利率'] = 0.5
+    df.loc[rng.random(n) < 0.2, '最終手續費'] = 50
+    return df
+
+
+def assert_same_fee_rate(df_trade, vip_list_dict, default_fee):
+    expected = reference_fee_rate_loop(df_trade.copy(), vip_list_dict, default_fee)
+    result = apply_fee_rate_rules(df_trade.copy(), vip_list_dict, default_fee)
+    for col in ['最終利率', '最終手續費']:
+        np.testing.assert_array_equal(
+            pd.to_numeric(result[col], errors='coerce').to_numpy(dtype=float),
+            pd.to_numeric(expected[col], errors='coerce').to_numpy(dtype=float),
+            err_msg=col,
+        )
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vip_special_and_default_rules(seed):
+    assert_same_fee_rate(make_trades(200, seed), VIP_LIST, default_fee=150)
+
+
+@pytest.mark.parametrize('default_fee', [120, 150])
+def test_empty_vip_list_uses_special_and_default_rules(default_fee):
+    assert_same_fee_rate(make_trades(200, 42), {}, default_fee)
+
+
+def test_without_src_column():
+    assert_same_fee_rate(make_trades(100, 7, with_src=False), VIP_LIST, default_fee=150)
+
+
+def test_representative_rows():
+    df = pd.DataFrame({
+        '客戶ID': ['VIP_80', 'VIP_ALL', 'H122699830', 'H122699830', 'A123456789', 'A123456789', 'A123456789', 'A123456789'],
+        '成交張數': [1, 1, 1, 1, 1, 10, 1, 1],
+        'STORQTY': [0.0, 0.0, 0.0, 0.0, 200.0, 0.0, 0.0, 0.0],
+        '履約利率': [1.75] * 8,
+        '低履約利率': [1.25] * 8,
+        '最終利率': [np.nan, np.nan, np.nan, 0.5, np.nan, np.nan, np.nan, np.nan],
+        '最終手續費': [np.nan, np.nan, np.nan, 50, np.nan, np.nan, np.nan, np.nan],
+        'SRC': ['', '', '', '', '', '', 'E', ''],
+    })
+    result = apply_fee_rate_rules(df.copy(), VIP_LIST, default_fee=150)
+    assert result['最終利率'].tolist() == [1.75, 1.25, 1.25, 0.5, 1.25, 1.75, 1.75, 1.75]
+    assert result['最終手續費'].tolist() == [80, 80, 60, 50, 100, 100, 110, 150]
+    assert_same_fee_rate(df, VIP_LIST, default_fee=150)
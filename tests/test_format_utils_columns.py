@@ -0,0 +1,84 @@
+"""整欄格式化函式與逐格純量版本的輸出逐字元比對（property-based）"""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("hypothesis")
+from hypothesis import given, settings, strategies as st
+
+from format_utils import (
+    strip_trailing_zeros, strip_trailing_zeros_column,
+    float_to_str_maxlen, float_to_str_maxlen_column,
+    format_number_to_11, format_number_to_11_column,
+)
+
+# 邊界值：NaN、±0、四捨五入的 .5 / 2.5、1e11 附近（11 位長度上限）、浮點誤差
+SPECIAL_FLOATS = [
+    math.nan, 0.0, -0.0, 0.5, -0.5, 1.5, 2.5, -2.5, 0.125, 0.045, 26.380000000000003,
+    99999999999.0, 99999999999.5, 1e11, 1e11 - 0.5, 1e11 + 0.5, -1e11, 123456789.125,
+    9999999999.95, 1e15, -1e15, 1e16,
+]
+NEAR_1E11 = st.floats(min_value=-1.5e11, max_value=1.5e11).filter(lambda v: abs(v) >= 5e10)
+
+finite_floats = st.one_of(
+    st.sampled_from(SPECIAL_FLOATS),
+    NEAR_1E11,
+    st.floats(min_value=-1e6, max_value=1e6),
+    st.floats(allow_nan=True, allow_infinity=False),
+)
+all_floats = st.one_of(finite_floats, st.sampled_from([math.inf, -math.inf]))
+ints = st.one_of(st.integers(min_value=-10 ** 12, max_value=10 ** 12), st.sampled_from([0, -1, 10 ** 11]))
+strings = st.one_of(
+    st.sampled_from(['', 'abc', '1.500', '2.50', '-0.0', '0', '1e5', 'NaN', 'Infinity', ' 12.30 ', '12,000', 'A123456789']),
+    st.from_regex(r'-?\d{1,12}(\.\d{0,8})?', fullmatch=True),
+    st.text(max_size=6),
+)
+
+
+def assert_identical(column_result, scalars):
+    """逐格比對：型別與內容都必須相同（缺值視為相同）"""
+    assert len(column_result) == len(scalars)
+    for got, expected in zip(column_result.tolist(), scalars):
+        assert type(got) is type(expected), (got, expected)
+        if isinstance(expected, float) and math.isnan(expected):
+            assert math.isnan(got)
+        else:
+            assert got == expected, (got, expected)
+
+
+def float_columns(elements):
+    return st.lists(elements, max_size=40).map(lambda v: pd.Series(v, dtype=np.float64))
+
+
+int_columns = st.lists(ints, max_size=40).map(lambda v: pd.Series(v, dtype=np.int64))
+numeric_object_columns = st.lists(st.one_of(finite_floats, ints, st.none()), max_size=40).map(
+    lambda v: pd.Series(v, dtype=object))
+mixed_object_columns = st.lists(st.one_of(all_floats, ints, strings, st.none()), max_size=40).map(
+    lambda v: pd.Series(v, dtype=object))
+
+
+@settings(max_examples=300, deadline=None)
+@given(st.one_of(float_columns(all_floats), int_columns, numeric_object_columns, mixed_object_columns))
+def test_strip_trailing_zeros_column(col):
+    assert_identical(strip_trailing_zeros_column(col), [strip_trailing_zeros(v) for v in col])
+
+
+@settings(max_examples=300, deadline=None)
+@given(st.one_of(float_columns(all_floats), int_columns, numeric_object_columns, mixed_object_columns),
+       st.sampled_from([6, 8, 11]))
+def test_float_to_str_maxlen_column(col, maxlen):
+    assert_identical(float_to_str_maxlen_column(col, maxlen), [float_to_str_maxlen(v, maxlen) for v in col])
+
+
+@settings(max_examples=300, deadline=None)
+@given(st.one_of(float_columns(finite_floats), int_columns, numeric_object_columns), st.sampled_from([8, 11]))
+def test_format_number_to_11_column(col, max_length):
+    # 純量版本遇到 inf 會拋出 OverflowError，只比對有限值與缺值
+    assert_identical(format_number_to_11_column(col, max_length), [format_number_to_11(v, max_length) for v in col])
+
+
+def test_format_number_to_11_column_keeps_strings():
+    col = pd.Series(['1.2345678901234', '0.5', '2.5', '99999999999.5'], dtype=object)
+    assert_identical(format_number_to_11_column(col), [format_number_to_11(v) for v in col])
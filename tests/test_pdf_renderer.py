@@ -0,0 +1,62 @@
+"""ReportLabRenderer 字型搜尋與產檔（不需要 Excel）"""
+import os
+import shutil
+
+import pytest
+
+reportlab = pytest.importorskip("reportlab")
+from openpyxl import Workbook
+
+import pdf_renderer
+from pdf_renderer import ReportLabRenderer
+
+# reportlab 內附的 TrueType 字型，代替測試機上不一定有的中文字型
+VERA_TTF = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+
+
+@pytest.fixture
+def fresh_fonts(monkeypatch):
+    monkeypatch.setattr(pdf_renderer, '_registered_fonts', {})
+    monkeypatch.setattr(pdf_renderer, '_font_index', None)
+
+
+def one_cell_workbook(path):
+    wb = Workbook()
+    wb.active['A1'] = 'CBAS 12345'
+    wb.save(path)
+    return wb
+
+
+def assert_pdf(path):
+    assert os.path.exists(path)
+    with open(path, 'rb') as f:
+        assert f.read(5) == b'%PDF-'
+
+
+def test_render_with_configured_font_file(tmp_path, monkeypatch, fresh_fonts):
+    monkeypatch.setattr(pdf_renderer, 'pdf_font_path', VERA_TTF)
+    excel_path = tmp_path / 'one_cell.xlsx'
+    wb = one_cell_workbook(excel_path)
+
+    pdf_path = str(tmp_path / 'one_cell.pdf')
+    assert ReportLabRenderer().render(str(excel_path), pdf_path) == pdf_path
+    assert_pdf(pdf_path)
+    # 呼叫端傳入已組好的 workbook 時不重新讀檔
+    pdf_path2 = str(tmp_path / 'from_workbook.pdf')
+    assert ReportLabRenderer().render(str(excel_path), pdf_path2, workbook=wb) == pdf_path2
+    assert_pdf(pdf_path2)
+
+
+def test_render_finds_cjk_font_in_configured_directory(tmp_path, monkeypatch, fresh_fonts):
+    # Linux 字型目錄有子目錄，依 FALLBACK_FONT_FILES 的檔名找到字型
+    font_dir = tmp_path / 'fonts' / 'truetype' / 'wqy'
+    font_dir.mkdir(parents=True)
+    shutil.copy(VERA_TTF, font_dir / 'wqy-microhei.ttc')
+    monkeypatch.setattr(pdf_renderer, 'pdf_font_path', str(tmp_path / 'fonts'))
+
+    excel_path = tmp_path / 'one_cell.xlsx'
+    one_cell_workbook(excel_path)
+    pdf_path = str(tmp_path / 'one_cell.pdf')
+    assert ReportLabRenderer().render(str(excel_path), pdf_path) == pdf_path
+    assert_pdf(pdf_path)
+    assert pdf_renderer._resolve_font('新細明體') == 'xl-wqy-microhei'
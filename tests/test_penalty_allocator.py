@@ -0,0 +1,207 @@
+"""allocate_penalty 與原本 apply_penalty_settings 逐列迴圈的結果比對（不依賴 Qt）"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from penalty_allocator import allocate_penalty, parse_penalty_rules
+
+
+def reference_penalty_loop(df_buy, rules):
+    """改寫前 TableEditor.apply_penalty_settings 的分組逐列迴圈（保留作為比對基準）"""
+    df_buy = df_buy.copy().reset_index(drop=True)
+    if '罰金套用張數' not in df_buy.columns:
+        df_buy['罰金套用張數'] = 0
+
+    def _split_row(base_row, new_qty, total_qty, penalty_value, penalty_used_qty):
+        r = base_row.copy()
+        r['成交張數'] = new_qty
+        for col in ('成交金額', '權利金總額'):
+            if col in r.index:
+                try:
+                    old = float(r[col])
+                    r[col] = int(round(old * new_qty / total_qty))
+                except (ValueError, TypeError):
+                    pass
+        if 'VIP報價張數' in r.index:
+            try:
+                old_vip = int(float(r['VIP報價張數']))
+                if total_qty > 0:
+                    r['VIP報價張數'] = int(round(old_vip * new_qty / total_qty))
+            except (ValueError, TypeError):
+                pass
+        r['提前履約賠償金'] = str(penalty_value)
+        r['罰金套用張數'] = int(penalty_used_qty)
+        return r
+
+    def _is_short(r):
+        v = r.get('_短約')
+        if v is None or (isinstance(v, float) and pd.isna(v)):
+            v = r.get('短契約')
+        return str(v).strip().upper() == 'Y' if v is not None else False
+
+    def _vip_qty(r):
+        try:
+            return int(float(r.get('VIP報價張數', 0)))
+        except (ValueError, TypeError):
+            return 0
+
+    df_buy['_orig_idx'] = range(len(df_buy))
+    output_rows = []
+    for (cus_id, cb_code), group_df in df_buy.groupby(['客戶ID', 'CB代號'], sort=False):
+        cus_id = str(cus_id).strip()
+        cb_code = str(cb_code).strip()
+        rule = rules.get((cus_id, cb_code)) or rules.get(('ALL', cb_code))
+        if rule is None:
+            for _, r in group_df.iterrows():
+                output_rows.append((r['_orig_idx'], r))
+            continue
+
+        for _, r in group_df.iterrows():
+            if _is_short(r):
+                output_rows.append((r['_orig_idx'], r))
+        vip_n_rows = [r for _, r in group_df.iterrows() if _vip_qty(r) > 0 and not _is_short(r)]
+        general_rows = [r for _, r in group_df.iterrows() if _vip_qty(r) == 0 and not _is_short(r)]
+        remaining_budget = None if rule['qty'] is None else max(0, int(rule['qty']))
+
+        for priority_list in (vip_n_rows, general_rows):
+            for r in priority_list:
+                try:
+                    row_qty = int(float(r.get('成交張數', 0)))
+                except (ValueError, TypeError):
+                    row_qty = 0
+                if row_qty <= 0:
+                    output_rows.append((r['_orig_idx'], r))
+                elif remaining_budget is None or remaining_budget >= row_qty:
+                    r2 = r.copy()
+                    r2['提前履約賠償金'] = str(rule['amt'])
+                    r2['罰金套用張數'] = row_qty
+                    output_rows.append((r['_orig_idx'], r2))
+                    if remaining_budget is not None:
+                        remaining_budget -= row_qty
+                elif remaining_budget > 0:
+                    take = remaining_budget
+                    output_rows.append((r['_orig_idx'], _split_row(r, take, row_qty, rule['amt'], take)))
+                    output_rows.append((r['_orig_idx'] + 0.5, _split_row(r, row_qty - take, row_qty, 0, 0)))
+                    remaining_budget = 0
+                else:
+                    output_rows.append((r['_orig_idx'], r))
+
+    output_rows.sort(key=lambda x: x[0])
+    result = pd.DataFrame([r for _, r in output_rows]).reset_index(drop=True)
+    return result.drop(columns=['_orig_idx'])
+
+
+def normalize(df):
+    """數值欄位轉 float、其餘轉字串，消除 object/int64 等 dtype 差異後再比對"""
+    out = {}
+    for col in df.columns:
+        values = df[col].to_numpy(dtype=object)
+        numeric = pd.to_numeric(pd.Series(values), errors='coerce')
+        if numeric.notna().sum() == pd.Series(values).notna().sum():
+            out[col] = numeric.to_numpy(dtype=float)
+        else:
+            out[col] = np.array(['' if v is None or (isinstance(v, float) and np.isnan(v)) else str(v) for v in values])
+    return out
+
+
+def assert_same_penalty(df_buy, rules):
+    expected = normalize(reference_penalty_loop(df_buy, rules))
+    result = normalize(allocate_penalty(df_buy, rules))
+    assert list(result) == list(expected)
+    for col in expected:
+        np.testing.assert_array_equal(result[col], expected[col], err_msg=col)
+
+
+PENALTY_TABLE = pd.DataFrame({
+    '客戶ID': ['C1', 'ALL', 'C2', 'ALL', ''],
+    'CB代號': ['11111', '11111', '22222', '33333', '44444'],
+    '賠償金張數': ['7', '3', '', '12', '5'],
+    '提前履約賠償金': ['5000', '3000', '2500.5', 'abc', '100'],
+})
+
+
+def make_buy(n, seed):
+    rng = np.random.default_rng(seed)
+    qty = rng.choice([0, 1, 2, 3, 5, 8], n)
+    return pd.DataFrame({
+        '客戶ID': rng.choice(['C1', 'C2', 'C3'], n),
+        'CB代號': rng.choice(['11111', '22222', '33333', '55555'], n),
+        '成交張數': qty,
+        'VIP報價張數': rng.choice([0, 0, 1, 3], n),
+        '_短約': rng.choice(np.array(['Y', 'N', None], dtype=object), n),
+        '短契約': rng.choice(['Y', 'N', 'N'], n),
+        '成交金額': qty * 100750.0,
+        '權利金總額': qty * 3333,
+        '提前履約賠償金': '',
+    })
+
+
+def test_parse_penalty_rules():
+    rules = parse_penalty_rules(PENALTY_TABLE)
+    assert rules == {
+        ('C1', '11111'): {'qty': 7, 'amt': 5000.0},
+        ('ALL', '11111'): {'qty': 3, 'amt': 3000.0},
+        ('C2', '22222'): {'qty': None, 'amt': 2500.5},
+        ('ALL', '33333'): {'qty': 12, 'amt': 0.0},
+    }
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_reference_loop(seed):
+    assert_same_penalty(make_buy(300, seed), parse_penalty_rules(PENALTY_TABLE))
+
+
+def test_priority_and_boundary_split():
+    rules = {('C1', '11111'): {'qty': 5, 'amt': 5000.0}}
+    df = pd.DataFrame({
+        '客戶ID': ['C1'] * 4,
+        'CB代號': ['11111'] * 4,
+        '成交張數': [4, 3, 2, 6],
+        'VIP報價張數': [0, 3, 0, 0],
+        '_短約': [None, 'N', 'Y', None],
+        '短契約': ['N', 'N', 'N', 'N'],
+        '成交金額': [400000.0, 300000.0, 200000.0, 600000.0],
+        '權利金總額': [40001, 30000, 20000, 60000],
+        '提前履約賠償金': ['', '', '', ''],
+    })
+    result = allocate_penalty(df, rules)
+    # 特殊報價列 (3 張) 先吃額度，剩 2 張由第一筆一般列拆出；短約列不動，最後一筆一般列已無額度
+    assert result['成交張數'].tolist() == [2, 2, 3, 2, 6]
+    assert result['罰金套用張數'].tolist() == [2, 0, 3, 0, 0]
+    assert result['提前履約賠償金'].tolist() == ['5000.0', '0', '5000.0', '', '']
+    assert result['成交金額'].tolist() == [200000, 200000, 300000.0, 200000.0, 600000.0]
+    assert result['權利金總額'].tolist() == [20000, 20000, 30000, 20000, 60000]
+    assert_same_penalty(df, rules)
+
+
+def test_unlimited_budget_applies_all_non_short_rows():
+    rules = {('ALL', '22222'): {'qty': None, 'amt': 800.0}}
+    df = make_buy(50, 11).assign(CB代號='22222')
+    result = allocate_penalty(df, rules)
+    assert len(result) == len(df)
+    assert_same_penalty(df, rules)
+
+
+def test_nan_keys_and_negative_vip_rows_are_kept():
+    rules = {('C1', '11111'): {'qty': 2, 'amt': 5000.0}}
+    df = pd.DataFrame({
+        '客戶ID': ['C1', None, 'C1'],
+        'CB代號': ['11111', '11111', '11111'],
+        '成交張數': [1, 4, 5],
+        'VIP報價張數': [0, 0, -1],
+        '短契約': ['N', 'N', 'N'],
+        '提前履約賠償金': ['', '', ''],
+    })
+    result = allocate_penalty(df, rules)
+    # 舊迴圈會丟掉 NaN key 與負 VIP報價張數 的列，新版保留原值不套罰金
+    assert len(reference_penalty_loop(df, rules)) == 1
+    assert result['成交張數'].tolist() == [1, 4, 5]
+    assert result['罰金套用張數'].tolist() == [1, 0, 0]
+    assert result['提前履約賠償金'].tolist() == ['5000.0', '', '']
+
+
+def test_no_rules_marks_zero_usage():
+    df = make_buy(10, 3)
+    result = allocate_penalty(df, {})
+    assert (result['罰金套用張數'] == 0).all()
+    assert '罰金套用張數' not in df.columns
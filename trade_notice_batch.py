@@ -0,0 +1,126 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import math
+import pandas as pd
+from file_generator import generate_trade_notice_template
+from pdf_renderer import excel_batch
+
+# 同時產生交易通知的行程數（每個行程各自開一個 Excel 轉 PDF）
+NOTICE_MAX_WORKERS = 4
+# 每個行程一次處理的客戶數上限；同一批共用一個 Excel，批次越大啟動 Excel 的次數越少，但進度回報越粗
+NOTICE_CHUNK_SIZE = 10
+
+SUMMARY_COLUMNS = ['客戶ID', '狀態', 'Excel', 'PDF', '錯誤']
+
+
+def _partition(df: pd.DataFrame, key: str) -> dict:
+    """依 key 欄位一次切成 {值: 子表}，取代逐客戶的布林篩選"""
+    if df is None or df.empty or key not in df.columns:
+        return {}
+    return {k: g for k, g in df.groupby(key, sort=False)}
+
+
+def build_notice_jobs(cusid_list, df_today_trade, df_today_bargain, df_today_clearing_money,
+                      cus_info_all, df_each01, tday_str, tday_plus_1, tday_plus_2) -> list:
+    """把今日成交明細的輸入依客戶分組，組成每位客戶一份的產檔參數（順序同 cusid_list）"""
+    trade_parts = _partition(df_today_trade, '客戶ID')
+    bargain_parts = _partition(df_today_bargain, '客戶ID')
+    clearing_parts = _partition(df_today_clearing_money, 'CUSID')
+    info_parts = _partition(cus_info_all, 'CUSID')
+    ifbankok = {}
+    if df_each01 is not None and not df_each01.empty:
+        # 同一客戶有多筆時取第一筆，與原本 values[0] 相同
+        ifbankok = df_each01.drop_duplicates('CUSID').set_index('CUSID')['IFBANKOK'].to_dict()
+
+    jobs = []
+    for who in cusid_list:
+        jobs.append({
+            'cus_id': who,
+            'cus_info': info_parts.get(who, cus_info_all.iloc[0:0]),
+            'df_today_trade': trade_parts.get(who, df_today_trade.iloc[0:0]),
+            'df_today_clearing_money': clearing_parts.get(who, df_today_clearing_money.iloc[0:0]),
+            'tday_str': tday_str,
+            'df_today_bargain': bargain_parts.get(who, df_today_bargain.iloc[0:0]),
+            'tday_plus_1': tday_plus_1,
+            'tday_plus_2': tday_plus_2,
+            # 如果找不到該客戶，使用預設值 'N'
+            'ifbankok': ifbankok.get(who, 'N'),
+        })
+    return jobs
+
+
+def _failed_result(job, error) -> dict:
+    return {'客戶ID': job['cus_id'], '狀態': '失敗', 'Excel': None, 'PDF': None,
+            '錯誤': str(error), 'clearing_info': pd.DataFrame()}
+
+
+def render_notice(job) -> dict:
+    """產生單一客戶的交易通知（在子行程執行，回傳值需可 pickle）"""
+    try:
+        excel_path, pdf_path, df_clearing_info = generate_trade_notice_template(**job)
+    except Exception as e:
+        return _failed_result(job, e)
+    if excel_path is None:
+        error = '產生交易通知失敗'
+    elif pdf_path is None:
+        error = 'PDF 轉檔失敗'
+    else:
+        error = ''
+    return {'客戶ID': job['cus_id'], '狀態': '失敗' if error else '成功', 'Excel': excel_path, 'PDF': pdf_path,
+            '錯誤': error, 'clearing_info': df_clearing_info}
+
+
+def render_notice_chunk(jobs) -> list:
+    """在同一個行程依序產生一批客戶的交易通知，需要 Excel 轉 PDF 時整批只啟動一次 Excel"""
+    with excel_batch():
+        return [render_notice(job) for job in jobs]
+
+
+def render_trade_notices(jobs, max_workers=NOTICE_MAX_WORKERS, progress=None, is_cancelled=None) -> tuple:
+    """以行程池平行產生所有客戶的交易通知
+
+    Args:
+        progress: progress(完成數, 總數, 單筆結果) 每完成一位客戶呼叫一次
+        is_cancelled: 回傳 True 時停止送出尚未開始的客戶
+
+    Returns:
+        (df_summary, df_clearing_info)：df_summary 依 jobs 順序列出每位客戶的成功/失敗與輸出路徑，
+        df_clearing_info 為所有成功客戶的交割資訊合併（同樣依 jobs 順序）
+    """
+    results = {}
+    total = len(jobs)
+
+    def _collect(index, result):
+        results[index] = result
+        if progress is not None:
+            progress(len(results), total, result)
+
+    if max_workers <= 1 or total <= 1:
+        with excel_batch():
+            for index, job in enumerate(jobs):
+                if is_cancelled is not None and is_cancelled():
+                    break
+                _collect(index, render_notice(job))
+    else:
+        workers = min(max_workers, total)
+        chunk_size = max(1, min(NOTICE_CHUNK_SIZE, math.ceil(total / workers)))
+        chunks = [range(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render_notice_chunk, [jobs[i] for i in chunk]): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_results = future.result()
+                except Exception as e:
+                    # 子行程異常結束（例如 Excel 當掉）時只記錄該批客戶失敗
+                    chunk_results = [_failed_result(jobs[i], e) for i in chunk]
+                for index, result in zip(chunk, chunk_results):
+                    _collect(index, result)
+                if is_cancelled is not None and is_cancelled():
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    break
+
+    ordered = [results[i] for i in sorted(results)]
+    df_summary = pd.DataFrame([{col: r[col] for col in SUMMARY_COLUMNS} for r in ordered], columns=SUMMARY_COLUMNS)
+    clearing = [r['clearing_info'] for r in ordered if r['clearing_info'] is not None and not r['clearing_info'].empty]
+    df_clearing_info = pd.concat(clearing, ignore_index=True) if clearing else pd.DataFrame()
+    return df_summary, df_clearing_info